@@ -1,323 +1,414 @@
 #!/usr/bin/env python3
 """
-Qwen Image Generator Benchmark Script
+Qwen Image Generator Benchmark Suite
 
-Compares generation times across different models, resolutions, and modes.
-Run with: python benchmark.py
+Times every generator path of simple_generator (Qwen lightning/normal,
+Z-Image, edit, LTX/Hunyuan/Wan video, ACE audio, Hunyuan3D) end to end on a
+running ComfyUI, with the exact workflows the web UI queues.
+
+Each case starts from a cold ComfyUI (models unloaded, caches cleared), so
+its first run measures model loading; the following warm runs use fixed,
+distinct seeds. Execution time comes from ComfyUI's history timestamps,
+per-node times from its websocket events, and peak RAM/VRAM from sampling
+/system_stats while the case runs. Results are written to JSON, and
+--compare diffs them against a baseline to flag regressions.
 
 Usage:
-  python benchmark.py                    # Run all benchmarks
-  python benchmark.py --quick            # Quick test (512x512 only)
-  python benchmark.py --model Q6_K       # Test specific model
-  python benchmark.py --compare          # Compare Q4 vs Q6 (if both available)
+  python benchmark.py                            # Run every case, write benchmark_<timestamp>.json
+  python benchmark.py --quick                    # One case per model family
+  python benchmark.py --only image video/ltx     # Cases whose name starts with a prefix
+  python benchmark.py --runs 5 --output base.json
+  python benchmark.py --compare base.json        # Run, then flag regressions against base.json
+  python benchmark.py --compare base.json new.json   # Compare two result files without running
+  python benchmark.py --list                     # Show the cases
 """
 
-import requests
-import json
-import time
 import argparse
+import base64
+import json
 import os
+import statistics
+import struct
+import subprocess
+import sys
+import threading
+import time
+import zlib
 from datetime import datetime
 
+import simple_generator
+from simple_generator import workflow_templates
+
 COMFYUI_URL = "http://127.0.0.1:8188"
-OUTPUT_DIR = "./output"
 
-# Test configurations
-RESOLUTIONS = [
-    ("512x512", 512, 512),
-    ("768x768", 768, 768),
-    ("1024x1024", 1024, 1024),
+TEST_PROMPT = "A red apple on a white table, studio lighting, professional photography"
+AUDIO_TAGS = "lofi hip hop, mellow piano, vinyl crackle, 80 bpm"
+
+# Run i of every case uses BASE_SEED + i, so results are reproducible and
+# warm runs never hit ComfyUI's output cache for the whole graph
+BASE_SEED = 1234
+MEMORY_SAMPLE_INTERVAL = 0.25
+# Seconds to let ComfyUI release memory after /free
+FREE_SETTLE = 2.0
+# Relative change that counts as a regression in --compare
+DEFAULT_THRESHOLD = 0.10
+COMPARED_METRICS = ('cold_seconds', 'warm_median_seconds', 'peak_ram_mb', 'peak_vram_mb')
+
+INPUT_IMAGE = "input_image"
+
+# name, workflow template, structural arguments, slot values (seed is added per run),
+# timeout in seconds. INPUT_IMAGE is replaced by a generated test image uploaded to ComfyUI.
+CASES = [
+    ("image/qwen-lightning-512", 'qwen', {'mode': 'lightning', 'resolution': 512, 'aspect': 'square'},
+     {'prompt': TEST_PROMPT}, 600),
+    ("image/qwen-lightning-1024", 'qwen', {'mode': 'lightning', 'resolution': 1024, 'aspect': 'square'},
+     {'prompt': TEST_PROMPT}, 600),
+    ("image/qwen-lightning-1024-wide", 'qwen', {'mode': 'lightning', 'resolution': 1024, 'aspect': 'landscape'},
+     {'prompt': TEST_PROMPT}, 600),
+    ("image/qwen-normal-512", 'qwen', {'mode': 'normal', 'resolution': 512, 'aspect': 'square'},
+     {'prompt': TEST_PROMPT}, 1200),
+    ("image/zimage-1024", 'zimage', {'resolution': 1024, 'aspect': 'square'},
+     {'prompt': TEST_PROMPT}, 600),
+    ("edit/qwen-edit", 'edit', {'use_angles_lora': False, 'use_upscale_lora': False},
+     {'prompt': "Make the background blue", 'image': INPUT_IMAGE}, 900),
+    ("video/ltx-t2v-480p", 'ltx', {'resolution': '480p'},
+     {'prompt': TEST_PROMPT, 'length': 81}, 1800),
+    ("video/hunyuan-t2v-480p", 'hunyuan', {'mode': 't2v', 'resolution': '480p'},
+     {'prompt': TEST_PROMPT, 'length': 81}, 3600),
+    ("video/wan-t2v-480p", 'wan', {'mode': 't2v', 'resolution': '480p'},
+     {'prompt': TEST_PROMPT, 'length': 81}, 3600),
+    ("video/wan-i2v-480p", 'wan', {'mode': 'i2v', 'resolution': '480p'},
+     {'prompt': TEST_PROMPT, 'length': 81, 'image': INPUT_IMAGE}, 3600),
+    ("audio/ace-30s", 'audio', {'format': 'flac'},
+     {'tags': AUDIO_TAGS, 'lyrics': '', 'seconds': 30.0}, 900),
+    ("3d/hunyuan3d-256", '3d', {'resolution': 256},
+     {'image': INPUT_IMAGE, 'algorithm': 'surface net', 'threshold': 0.6}, 900),
 ]
 
-QUICK_RESOLUTIONS = [
-    ("512x512", 512, 512),
-]
+QUICK_CASES = ("image/qwen-lightning-512", "image/zimage-1024", "video/ltx-t2v-480p",
+               "audio/ace-30s", "3d/hunyuan3d-256")
 
-TEST_PROMPT = "A red apple on a white table, studio lighting, professional photography"
 
-def check_comfyui():
-    """Check if ComfyUI is running"""
-    try:
-        r = requests.get(f"{COMFYUI_URL}/system_stats", timeout=5)
-        return r.status_code == 200
-    except:
-        return False
-
-def get_current_model():
-    """Get the currently configured model from workflow"""
-    # This would need to read from the app config
-    # For now, check what's in models/unet
-    unet_dir = "./models/unet"
-    if os.path.exists(unet_dir):
-        models = [f for f in os.listdir(unet_dir) if f.endswith('.gguf') and 'edit' not in f.lower()]
-        return models
-    return []
-
-def build_workflow(width, height, prompt, lightning=True, steps=4, cfg=1.0, seed=-1):
-    """Build a ComfyUI workflow for benchmarking"""
-    if seed == -1:
-        import random
-        seed = random.randint(0, 2**32 - 1)
-
-    workflow = {
-        "3": {
-            "class_type": "CLIPLoaderGGUF",
-            "inputs": {
-                "clip_name": "Qwen2.5-VL-7B-Instruct-abliterated.Q6_K.gguf",
-                "type": "qwen_image"
-            }
-        },
-        "4": {
-            "class_type": "CLIPTextEncode",
-            "inputs": {
-                "text": prompt,
-                "clip": ["3", 0]
-            }
-        },
-        "5": {
-            "class_type": "UnetLoaderGGUF",
-            "inputs": {
-                "unet_name": "qwen-image-Q6_K.gguf"  # Will be replaced
-            }
-        },
-        "6": {
-            "class_type": "VAELoader",
-            "inputs": {
-                "vae_name": "qwen_image_vae.safetensors"
-            }
-        },
-        "7": {
-            "class_type": "EmptyLatentImage",
-            "inputs": {
-                "width": width,
-                "height": height,
-                "batch_size": 1
-            }
-        },
-        "9": {
-            "class_type": "CLIPTextEncode",
-            "inputs": {
-                "text": "",
-                "clip": ["3", 0]
-            }
-        },
-        "10": {
-            "class_type": "VAEDecode",
-            "inputs": {
-                "samples": ["8", 0],
-                "vae": ["6", 0]
-            }
-        },
-        "11": {
-            "class_type": "SaveImage",
-            "inputs": {
-                "filename_prefix": "benchmark",
-                "images": ["10", 0]
-            }
-        }
-    }
-
-    if lightning:
-        # Lightning mode with LoRA
-        workflow["8"] = {
-            "class_type": "KSampler",
-            "inputs": {
-                "model": ["12", 0],
-                "positive": ["4", 0],
-                "negative": ["9", 0],
-                "latent_image": ["7", 0],
-                "seed": seed,
-                "steps": 4,
-                "cfg": 1.0,
-                "sampler_name": "euler",
-                "scheduler": "simple",
-                "denoise": 1.0
-            }
-        }
-        workflow["12"] = {
-            "class_type": "LoraLoaderModelOnly",
-            "inputs": {
-                "model": ["5", 0],
-                "lora_name": "Qwen-Image-Lightning-4steps-V1.0.safetensors",
-                "strength_model": 1.0
-            }
-        }
-    else:
-        # Normal mode
-        workflow["8"] = {
-            "class_type": "KSampler",
-            "inputs": {
-                "model": ["5", 0],
-                "positive": ["4", 0],
-                "negative": ["9", 0],
-                "latent_image": ["7", 0],
-                "seed": seed,
-                "steps": steps,
-                "cfg": cfg,
-                "sampler_name": "euler",
-                "scheduler": "normal",
-                "denoise": 1.0
-            }
-        }
-
-    return workflow
-
-def queue_prompt(workflow):
-    """Queue a prompt and return the prompt_id"""
-    payload = {"prompt": workflow}
+def test_image_png(size=512):
+    """A deterministic RGB gradient PNG (stdlib only) for edit / i2v / 3D cases"""
+    rows = b''.join(
+        b'\x00' + bytes(v for x in range(size) for v in (x * 255 // size, y * 255 // size, 128))
+        for y in range(size)
+    )
+
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    header = struct.pack('>IIBBBBB', size, size, 8, 2, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) + chunk(b'IDAT', zlib.compress(rows, 9)) + chunk(b'IEND', b'')
+
+
+def comfyui_stats():
     try:
-        r = requests.post(f"{COMFYUI_URL}/prompt", json=payload, timeout=10)
-        if r.status_code == 200:
-            return r.json().get("prompt_id")
-    except Exception as e:
-        print(f"Error queuing prompt: {e}")  # noqa: T201
-    return None
-
-def wait_for_completion(prompt_id, timeout=300):
-    """Wait for prompt to complete, return elapsed time"""
-    start = time.time()
-    while time.time() - start < timeout:
-        try:
-            r = requests.get(f"{COMFYUI_URL}/history/{prompt_id}", timeout=5)
-            if r.status_code == 200:
-                history = r.json()
-                if prompt_id in history:
-                    return time.time() - start
-        except:
-            pass
+        return simple_generator.comfy_client.get_json("/system_stats", timeout=5)
+    except Exception:
+        return None
+
+
+def memory_used(stats):
+    """(RAM, VRAM) in use on the ComfyUI machine, in MB"""
+    system = stats.get('system', {})
+    ram = (system.get('ram_total', 0) - system.get('ram_free', 0)) / 1048576
+    vram = sum(d.get('vram_total', 0) - d.get('vram_free', 0) for d in stats.get('devices', [])) / 1048576
+    return ram, vram
+
+
+class MemorySampler:
+    """Polls /system_stats in the background and keeps the peak usage"""
+
+    def __init__(self, interval=MEMORY_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.peak_ram = 0.0
+        self.peak_vram = 0.0
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            stats = comfyui_stats()
+            if stats is not None:
+                ram, vram = memory_used(stats)
+                self.peak_ram = max(self.peak_ram, ram)
+                self.peak_vram = max(self.peak_vram, vram)
+                self.samples += 1
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def free_comfyui():
+    """Unload every model and clear ComfyUI's caches, then wait for it to settle"""
+    client = simple_generator.comfy_client
+    client.post_json("/free", {"unload_models": True, "free_memory": True}, timeout=10)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        queue_info = client.get_json("/queue", timeout=5)
+        if not queue_info.get('queue_running') and not queue_info.get('queue_pending'):
+            break
         time.sleep(0.5)
-    return None
-
-def run_benchmark(resolutions, lightning=True, runs=3):
-    """Run benchmarks and return results"""
-    results = []
-    mode = "Lightning" if lightning else "Normal"
-
-    for res_name, width, height in resolutions:
-        print(f"\n  Testing {res_name} ({mode})...")  # noqa: T201
-        times = []
-
-        for run in range(runs):
-            workflow = build_workflow(width, height, TEST_PROMPT, lightning=lightning)
-            prompt_id = queue_prompt(workflow)
-
-            if prompt_id:
-                elapsed = wait_for_completion(prompt_id)
-                if elapsed:
-                    times.append(elapsed)
-                    print(f"    Run {run+1}: {elapsed:.2f}s")  # noqa: T201
-                else:
-                    print(f"    Run {run+1}: TIMEOUT")  # noqa: T201
-            else:
-                print(f"    Run {run+1}: FAILED to queue")  # noqa: T201
-
-        if times:
-            avg = sum(times) / len(times)
-            results.append({
-                "resolution": res_name,
-                "mode": mode,
-                "avg_time": avg,
-                "min_time": min(times),
-                "max_time": max(times),
-                "runs": len(times)
-            })
-
-    return results
-
-def print_results(results, title="Benchmark Results"):
-    """Pretty print benchmark results"""
-    print(f"\n{'='*60}")  # noqa: T201
-    print(f" {title}")  # noqa: T201
-    print(f"{'='*60}")  # noqa: T201
-    print(f"{'Resolution':<12} {'Mode':<10} {'Avg':<8} {'Min':<8} {'Max':<8} {'Runs':<6}")  # noqa: T201
-    print(f"{'-'*60}")  # noqa: T201
-
-    for r in results:
-        print(f"{r['resolution']:<12} {r['mode']:<10} {r['avg_time']:.2f}s    {r['min_time']:.2f}s    {r['max_time']:.2f}s    {r['runs']}")  # noqa: T201
-
-    print(f"{'='*60}")  # noqa: T201
-
-def save_results(results, filename=None):
-    """Save results to JSON file"""
-    if filename is None:
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"benchmark_{timestamp}.json"
-
-    with open(filename, 'w') as f:
-        json.dump({
-            "timestamp": datetime.now().isoformat(),
-            "prompt": TEST_PROMPT,
-            "results": results
-        }, f, indent=2)
-
-    print(f"\nResults saved to: {filename}")  # noqa: T201
+    time.sleep(FREE_SETTLE)
+
+
+def history_timings(entry):
+    """(execution seconds, cached node count) from a history entry's status messages"""
+    stamps = {}
+    cached = 0
+    for name, data in entry.get('status', {}).get('messages', []):
+        if isinstance(data, dict) and 'timestamp' in data:
+            stamps[name] = data['timestamp']
+        if name == 'execution_cached' and isinstance(data, dict):
+            cached = len(data.get('nodes', []))
+    end = stamps.get('execution_success', stamps.get('execution_error', stamps.get('execution_interrupted')))
+    if 'execution_start' not in stamps or end is None:
+        return None, cached
+    return (end - stamps['execution_start']) / 1000.0, cached
+
+
+def run_once(template, structural, values, seed, timeout):
+    """Queue one workflow and wait for it; returns the run's measurements"""
+    prompt_json = workflow_templates.render(template, structural, seed=seed, **values)
+    node_types = {node_id: node.get('class_type') for node_id, node in json.loads(prompt_json).items()}
+    start = time.perf_counter()
+    prompt_id = simple_generator.submit_prompt(prompt_json, 'benchmark').get('prompt_id')
+    if not prompt_id:
+        return {"seed": seed, "error": "Failed to queue prompt"}
+    entry = simple_generator.wait_for_history(prompt_id, timeout)
+    wall = time.perf_counter() - start
+    run = {"seed": seed, "prompt_id": prompt_id, "wall_seconds": round(wall, 3)}
+    if entry is None:
+        run['error'] = "Timeout"
+        return run
+    error = simple_generator.history_error(entry)
+    if error:
+        run['error'] = error
+    exec_seconds, cached = history_timings(entry)
+    if exec_seconds is not None:
+        run['exec_seconds'] = round(exec_seconds, 3)
+    run['cached_nodes'] = cached
+    timings = simple_generator.progress_tracker.snapshot(prompt_id).get('node_timings', {})
+    run['node_seconds'] = {f"{node_id} {node_types.get(node_id, '?')}": seconds
+                           for node_id, seconds in timings.items()}
+    return run
+
+
+def summarize(runs):
+    """Median/mean/min/max of the successful runs' execution times"""
+    times = [r.get('exec_seconds', r['wall_seconds']) for r in runs if 'error' not in r]
+    if not times:
+        return None
+    return {"runs": len(times), "median": round(statistics.median(times), 3),
+            "mean": round(statistics.mean(times), 3), "min": min(times), "max": max(times)}
+
+
+def node_medians(runs):
+    per_node = {}
+    for run in runs:
+        for node, seconds in run.get('node_seconds', {}).items():
+            per_node.setdefault(node, []).append(seconds)
+    return {node: round(statistics.median(values), 3) for node, values in per_node.items()}
+
+
+def run_case(case, runs, input_image):
+    name, template, structural, values, timeout = case
+    values = {k: input_image if v == INPUT_IMAGE else v for k, v in values.items()}
+    print(f"\n  {name}")  # noqa: T201
+    result = {"name": name, "template": template, "structural": structural,
+              "values": {k: v for k, v in values.items() if k != 'image'}}
+    problems = workflow_templates.template(template, **structural).problems
+    if problems:
+        print(f"    skipped: {problems[0]}")  # noqa: T201
+        result['skipped'] = problems
+        return result
+
+    free_comfyui()
+    case_runs = []
+    with MemorySampler() as sampler:
+        for i in range(runs + 1):
+            run = run_once(template, structural, values, BASE_SEED + i, timeout)
+            run['cold'] = i == 0
+            case_runs.append(run)
+            seconds = run.get('exec_seconds', run.get('wall_seconds', 0))
+            label = "cold" if i == 0 else f"warm {i}"
+            print(f"    {label:<7} {seconds:8.2f}s" + (f"  ERROR: {run['error']}" if 'error' in run else ''))  # noqa: T201
+            if i == 0 and 'error' in run:
+                break
+
+    cold = case_runs[0]
+    warm = case_runs[1:]
+    result.update(
+        cold_seconds=None if 'error' in cold else cold.get('exec_seconds', cold['wall_seconds']),
+        warm=summarize(warm),
+        cold_nodes=cold.get('node_seconds', {}),
+        warm_nodes=node_medians(warm),
+        peak_ram_mb=round(sampler.peak_ram, 1) if sampler.samples else None,
+        peak_vram_mb=round(sampler.peak_vram, 1) if sampler.samples else None,
+        runs=case_runs,
+    )
+    result['warm_median_seconds'] = result['warm']['median'] if result['warm'] else None
+    return result
+
+
+def select_cases(only=None, quick=False):
+    cases = CASES
+    if quick:
+        cases = [c for c in cases if c[0] in QUICK_CASES]
+    if only:
+        cases = [c for c in cases if any(c[0].startswith(prefix) for prefix in only)]
+    return cases
+
+
+def environment():
+    """What the numbers were measured on"""
+    env = {"comfyui_url": simple_generator.COMFYUI_URL, "python": sys.version.split()[0]}
+    try:
+        env['commit'] = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                       cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip()
+    except Exception:
+        pass
+    stats = comfyui_stats() or {}
+    system = stats.get('system', {})
+    env.update(comfyui_version=system.get('comfyui_version'), pytorch_version=system.get('pytorch_version'),
+               devices=[d.get('name') for d in stats.get('devices', [])])
+    return env
+
+
+def run_suite(cases, runs):
+    print("\nChecking workflows against ComfyUI...")  # noqa: T201
+    workflow_templates.object_info = simple_generator.comfy_client.get_json("/object_info", timeout=120)
+    # Per-node times come from the websocket; without it only totals are recorded
+    if simple_generator.event_listener.start():
+        simple_generator.event_listener.connected.wait(5)
+
+    input_image = None
+    if any(INPUT_IMAGE in c[3].values() for c in cases):
+        data = "data:image/png;base64," + base64.b64encode(test_image_png()).decode()
+        input_image = simple_generator.upload_input_image(data, 'benchmark_input_')
+
+    results = [run_case(case, runs, input_image) for case in cases]
+    return {"timestamp": datetime.now().isoformat(), "base_seed": BASE_SEED, "warm_runs": runs,
+            "environment": environment(), "cases": results}
+
+
+def fmt(value, unit):
+    return f"{value:.1f}{unit}" if value is not None else "-"
+
+
+def print_results(results):
+    print(f"\n{'='*78}")  # noqa: T201
+    print(f" {'Case':<32} {'Cold':>8} {'Warm med':>9} {'Warm min':>9} {'Peak RAM':>9} {'Peak VRAM':>9}")  # noqa: T201
+    print(f"{'-'*78}")  # noqa: T201
+    for case in results['cases']:
+        if 'skipped' in case:
+            print(f" {case['name']:<32} skipped")  # noqa: T201
+            continue
+        warm = case.get('warm') or {}
+        print(f" {case['name']:<32} {fmt(case.get('cold_seconds'), 's'):>8} {fmt(warm.get('median'), 's'):>9} "  # noqa: T201
+              f"{fmt(warm.get('min'), 's'):>9} {fmt(case.get('peak_ram_mb'), 'M'):>9} {fmt(case.get('peak_vram_mb'), 'M'):>9}")
+    print(f"{'='*78}")  # noqa: T201
+
+
+def compare_results(baseline, current, threshold=DEFAULT_THRESHOLD):
+    """Diff two result files case by case.
+
+    Returns a list of {case, metric, baseline, current, change, regression}
+    rows; a metric regresses when it grew by more than threshold (relative).
+    """
+    base_cases = {c['name']: c for c in baseline.get('cases', [])}
+    rows = []
+    for case in current.get('cases', []):
+        base = base_cases.get(case['name'])
+        if base is None:
+            continue
+        for metric in COMPARED_METRICS:
+            old, new = base.get(metric), case.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            rows.append({"case": case['name'], "metric": metric, "baseline": old, "current": new,
+                         "change": round(change, 4), "regression": change > threshold})
+    return rows
+
+
+def print_comparison(rows, threshold):
+    print(f"\n{'='*78}")  # noqa: T201
+    print(f" Comparison against baseline (regression: > {threshold:.0%} worse)")  # noqa: T201
+    print(f"{'-'*78}")  # noqa: T201
+    for row in rows:
+        flag = "REGRESSION" if row['regression'] else ("improved" if row['change'] < -threshold else "")
+        print(f" {row['case']:<32} {row['metric']:<20} {row['baseline']:>9.2f} -> {row['current']:>9.2f} "  # noqa: T201
+              f"{row['change']:>+7.1%} {flag}")
+    print(f"{'='*78}")  # noqa: T201
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)
+
 
 def main():
-    parser = argparse.ArgumentParser(description="Qwen Image Generator Benchmark")
-    parser.add_argument("--quick", action="store_true", help="Quick test (512x512 only)")
-    parser.add_argument("--runs", type=int, default=3, help="Number of runs per test")
-    parser.add_argument("--lightning-only", action="store_true", help="Only test lightning mode")
-    parser.add_argument("--normal-only", action="store_true", help="Only test normal mode")
-    parser.add_argument("--save", action="store_true", help="Save results to JSON")
+    parser = argparse.ArgumentParser(description="Qwen Image Generator Benchmark Suite")
+    parser.add_argument("--url", default=COMFYUI_URL, help="ComfyUI URL")
+    parser.add_argument("--quick", action="store_true", help="One case per model family")
+    parser.add_argument("--only", nargs="+", metavar="PREFIX", help="Only cases whose name starts with a prefix")
+    parser.add_argument("--runs", type=int, default=3, help="Warm runs per case (after the cold run)")
+    parser.add_argument("--output", help="Results file (default: benchmark_<timestamp>.json)")
+    parser.add_argument("--compare", nargs="+", metavar="FILE",
+                        help="Baseline results to compare against; with a second file, compare the two without running")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Relative slowdown flagged as a regression (default 0.10)")
+    parser.add_argument("--list", action="store_true", help="List the benchmark cases and exit")
     args = parser.parse_args()
 
-    print("="*60)  # noqa: T201
-    print(" Qwen Image Generator Benchmark")  # noqa: T201
-    print("="*60)  # noqa: T201
-
-    # Check ComfyUI
-    print("\nChecking ComfyUI...")  # noqa: T201
-    if not check_comfyui():
-        print("ERROR: ComfyUI not running at", COMFYUI_URL)  # noqa: T201
-        print("Start ComfyUI first, then run this benchmark.")  # noqa: T201
-        return
-    print("ComfyUI is running ✓")  # noqa: T201
-
-    # Get available models
-    models = get_current_model()
-    print(f"Available models: {models}")  # noqa: T201
-
-    # Select resolutions
-    resolutions = QUICK_RESOLUTIONS if args.quick else RESOLUTIONS
-
-    lightning_results = []
-    normal_results = []
-
-    # Run Lightning benchmarks (default: ON)
-    if not args.normal_only:
-        print("\n" + "-"*60)  # noqa: T201
-        print(" ⚡ Lightning Mode ON (4 steps, CFG=1)")  # noqa: T201
-        print("-"*60)  # noqa: T201
-        lightning_results = run_benchmark(resolutions, lightning=True, runs=args.runs)
-
-    # Run Normal benchmarks (default: ON)
-    if not args.lightning_only:
-        print("\n" + "-"*60)  # noqa: T201
-        print(" 🎨 Lightning Mode OFF (30 steps, CFG=5)")  # noqa: T201
-        print("-"*60)  # noqa: T201
-        normal_results = run_benchmark(resolutions, lightning=False, runs=args.runs)
-
-    # Print results
-    all_results = lightning_results + normal_results
-    print_results(all_results)
-
-    # Print comparison if both modes tested
-    if lightning_results and normal_results:
-        print("\n" + "="*60)  # noqa: T201
-        print(" ⚡ vs 🎨 Speed Comparison")  # noqa: T201
-        print("="*60)  # noqa: T201
-        for lr in lightning_results:
-            for nr in normal_results:
-                if lr['resolution'] == nr['resolution']:
-                    speedup = nr['avg_time'] / lr['avg_time']
-                    print(f"{lr['resolution']}: Lightning is {speedup:.1f}x faster")  # noqa: T201
-                    print(f"  Lightning: {lr['avg_time']:.2f}s | Normal: {nr['avg_time']:.2f}s")  # noqa: T201
+    cases = select_cases(args.only, args.quick)
+    if args.list:
+        for name, template, structural, _, _ in cases:
+            print(f"{name:<32} {template} {structural}")  # noqa: T201
+        return 0
+    if args.compare and len(args.compare) > 2:
+        parser.error("--compare takes a baseline and optionally one results file")
 
-    # Save if requested
-    if args.save:
-        save_results(all_results)
+    if args.compare and len(args.compare) == 2:
+        results = load_results(args.compare[1])
+    else:
+        print("="*60)  # noqa: T201
+        print(" Qwen Image Generator Benchmark Suite")  # noqa: T201
+        print("="*60)  # noqa: T201
+        if not cases:
+            print("No benchmark cases selected")  # noqa: T201
+            return 1
+        simple_generator.configure_comfyui(args.url)
+        if comfyui_stats() is None:
+            print("ERROR: ComfyUI not running at", args.url)  # noqa: T201
+            print("Start ComfyUI first, then run this benchmark.")  # noqa: T201
+            return 1
+        results = run_suite(cases, args.runs)
+        output = args.output or f"benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print_results(results)
+        print(f"\nResults saved to: {output}")  # noqa: T201
+
+    if args.compare:
+        rows = compare_results(load_results(args.compare[0]), results, args.threshold)
+        print_comparison(rows, args.threshold)
+        regressions = [r for r in rows if r['regression']]
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) found")  # noqa: T201
+            return 1
+    return 0
 
-    print("\nBenchmark complete!")  # noqa: T201
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+ComfyUI Cache Key Benchmark
+
+Times how long the output cache takes to compute node signatures
+(CacheKeySetInputSignature, via set_prompt) on synthetic prompts of 1k-10k
+nodes, cold and again for a second prompt where one node in the middle of the
+graph changed.
+No GPU or models are needed; the nodes are a dummy class registered just for
+the benchmark.
+
+Usage:
+  python benchmark_caching.py                        # 1k, 2.5k, 5k and 10k nodes, every shape
+  python benchmark_caching.py --sizes 1000 10000     # Pick the graph sizes
+  python benchmark_caching.py --shape layered        # One graph shape (chain, layered, random)
+  python benchmark_caching.py --output results.json  # Save the results as JSON
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import comfy.options
+comfy.options.enable_args_parsing(False)
+from comfy.cli_args import args  # noqa: E402
+args.cpu = True
+
+import nodes  # noqa: E402
+from comfy_execution.caching import CacheKeySetInputSignature, HierarchicalCache  # noqa: E402
+from comfy_execution.graph import DynamicPrompt  # noqa: E402
+
+DEFAULT_SIZES = (1000, 2500, 5000, 10000)
+SHAPES = ("chain", "layered", "random")
+LAYER_WIDTH = 50
+
+
+class BenchmarkNode:
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {"required": {"value": ("INT",)}, "optional": {"a": ("ANY",), "b": ("ANY",)}}
+
+    RETURN_TYPES = ("ANY",)
+    FUNCTION = "run"
+
+
+class StaticIsChanged:
+    """Stands in for execution.IsChangedCache: no node has IS_CHANGED"""
+
+    async def get(self, node_id):
+        return False
+
+
+def build_prompt(size, shape, seed=0):
+    """A synthetic prompt of size nodes.
+
+    chain:   every node takes the previous one (depth == size)
+    layered: LAYER_WIDTH-wide layers, each node takes two nodes of the previous layer
+    random:  every node takes two random earlier nodes (a deep, heavily shared DAG)
+    """
+    rng = random.Random(seed)
+    prompt = {}
+    for i in range(size):
+        inputs = {"value": i}
+        if shape == "chain":
+            parents = [i - 1] if i else []
+        elif shape == "layered":
+            layer_start = (i // LAYER_WIDTH - 1) * LAYER_WIDTH
+            parents = [layer_start + rng.randrange(LAYER_WIDTH) for _ in range(2)] if layer_start >= 0 else []
+        else:
+            parents = [rng.randrange(i) for _ in range(2)] if i else []
+        for name, parent in zip(("a", "b"), parents):
+            inputs[name] = [str(parent), 0]
+        prompt[str(i)] = {"class_type": "BenchmarkNode", "inputs": inputs}
+    return prompt
+
+
+async def time_set_prompt(cache, prompt):
+    started = time.perf_counter()
+    await cache.set_prompt(DynamicPrompt(prompt), prompt.keys(), StaticIsChanged())
+    return time.perf_counter() - started
+
+
+async def run_case(size, shape):
+    prompt = build_prompt(size, shape)
+    cache = HierarchicalCache(CacheKeySetInputSignature)
+    cold = await time_set_prompt(cache, prompt)
+    first_keys = dict(cache.cache_key_set.keys)
+
+    # Change one node: only it and its descendants should get new keys
+    changed = json.loads(json.dumps(prompt))
+    changed[str(size // 2)]["inputs"]["value"] = -1
+    repeat = await time_set_prompt(cache, changed)
+    second_keys = cache.cache_key_set.keys
+    unchanged = sum(1 for node_id in prompt if first_keys[node_id] == second_keys[node_id])
+    return {
+        "size": size,
+        "shape": shape,
+        "cold_ms": round(cold * 1000, 1),
+        "changed_node_ms": round(repeat * 1000, 1),
+        "us_per_node": round(cold * 1e6 / size, 1),
+        "keys_reused": unchanged,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark output cache key computation on synthetic prompts")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="Node counts to test")
+    parser.add_argument("--shape", choices=SHAPES, action="append", help="Graph shape (repeatable; default: all)")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    options = parser.parse_args()
+
+    nodes.NODE_CLASS_MAPPINGS["BenchmarkNode"] = BenchmarkNode
+
+    results = []
+    print(f"{'shape':<9} {'nodes':>6} {'cold ms':>10} {'changed ms':>11} {'us/node':>8} {'reused':>7}")  # noqa: T201
+    for shape in options.shape or SHAPES:
+        for size in options.sizes:
+            result = asyncio.run(run_case(size, shape))
+            results.append(result)
+            print(f"{shape:<9} {size:>6} {result['cold_ms']:>10} {result['changed_node_ms']:>11} "  # noqa: T201
+                  f"{result['us_per_node']:>8} {result['keys_reused']:>7}")
+
+    if options.output:
+        with open(options.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {options.output}")  # noqa: T201
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,643 @@
+#!/usr/bin/env python3
+"""
+Qwen Image Generator Front Server Load Benchmark
+
+Measures how many concurrent long-polling clients (/wait) the generator's
+HTTP front server can hold open, and the /gallery latency while it does.
+No GPU or ComfyUI is needed: by default the server is started in-process and
+pointed at an unreachable ComfyUI, so every /wait simply stays open.
+
+Usage:
+  python benchmark_server.py                     # 200 held waits, 500 gallery requests
+  python benchmark_server.py --waits 1000        # Hold more connections open
+  python benchmark_server.py --url http://host:8080   # Benchmark a running server
+  python benchmark_server.py --client            # Pooled vs one-shot ComfyUI client round trips
+  python benchmark_server.py --payload           # Workflow payload building throughput
+  python benchmark_server.py --media             # Concurrent video playback (Range requests on /output/)
+  python benchmark_server.py --page              # Page build time and bytes on the wire (first vs repeat visit)
+  python benchmark_server.py --load --users 200  # Simulated users queueing jobs on a mock ComfyUI (mock_comfyui.py)
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import resource
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def start_local_server(comfyui_url, max_connections, max_long_waits):
+    """Start simple_generator's front server on an ephemeral port"""
+    import simple_generator
+
+    simple_generator.configure_comfyui(comfyui_url)
+    server = simple_generator.GeneratorHTTPServer(
+        ('127.0.0.1', 0),
+        simple_generator.RequestHandler,
+        max_connections=max_connections,
+        max_long_waits=max_long_waits,
+    )
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    host, port = server.server_address[:2]
+    return server, f"http://{host}:{port}"
+
+
+def hold_wait(host, port, index, opened, stop):
+    """Open a /wait request and keep it open until told to stop"""
+    conn = http.client.HTTPConnection(host, port, timeout=3600)
+    try:
+        conn.request('GET', f'/wait?prompt_id=bench-{index}')
+        opened.append(index)
+        # The response only arrives when the wait finishes (or is refused)
+        conn.sock.settimeout(0.5)
+        while not stop.is_set():
+            try:
+                response = conn.getresponse()
+                response.read()
+                return
+            except TimeoutError:
+                continue
+    except Exception:
+        pass
+    finally:
+        conn.close()
+
+
+def timed_gallery(host, port, latencies, errors):
+    start = time.perf_counter()
+    conn = http.client.HTTPConnection(host, port, timeout=30)
+    try:
+        conn.request('GET', '/gallery')
+        response = conn.getresponse()
+        response.read()
+        if response.status == 200:
+            latencies.append(time.perf_counter() - start)
+        else:
+            errors.append(response.status)
+    except Exception as e:
+        errors.append(str(e))
+    finally:
+        conn.close()
+
+
+def run_gallery_load(host, port, requests, concurrency):
+    latencies = []
+    errors = []
+    remaining = list(range(requests))
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                if not remaining:
+                    return
+                remaining.pop()
+            timed_gallery(host, port, latencies, errors)
+
+    start = time.perf_counter()
+    workers = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - start
+    return latencies, errors, elapsed
+
+
+class StubComfyHandler(BaseHTTPRequestHandler):
+    """Minimal keep-alive ComfyUI stand-in answering /prompt and /history/<id>"""
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, data):
+        body = json.dumps(data).encode()
+        head = f"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n"
+        self.wfile.write(head.encode() + body)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self._reply({"prompt_id": "bench", "number": 0, "node_errors": {}})
+
+    def do_GET(self):
+        self._reply({"bench": {"status": {"completed": True}, "outputs": {}}})
+
+
+def run_client_benchmark(iterations):
+    """Time queue+poll round trips with one-shot urllib vs the pooled client"""
+    import simple_generator
+
+    stub = ThreadingHTTPServer(('127.0.0.1', 0), StubComfyHandler)
+    stub.daemon_threads = True
+    threading.Thread(target=stub.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{stub.server_address[1]}"
+    payload = json.dumps({"prompt": {}, "client_id": "bench"}).encode()
+
+    def urllib_round_trip():
+        req = urllib.request.Request(f"{base_url}/prompt", data=payload, headers={'Content-Type': 'application/json'})
+        json.loads(urllib.request.urlopen(req, timeout=10).read())
+        json.loads(urllib.request.urlopen(f"{base_url}/history/bench", timeout=10).read())
+
+    client = simple_generator.PooledHTTPClient(base_url)
+
+    def pooled_round_trip():
+        client.post_json("/prompt", {"prompt": {}, "client_id": "bench"})
+        client.get_json("/history/bench")
+
+    results = {"iterations": iterations}
+    for name, round_trip in (("urllib", urllib_round_trip), ("pooled", pooled_round_trip)):
+        latencies = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            round_trip()
+            latencies.append(time.perf_counter() - start)
+        results[f"{name}_p50_ms"] = percentile(latencies, 50) * 1000
+        results[f"{name}_p99_ms"] = percentile(latencies, 99) * 1000
+    results["pooled_stats"] = client.stats()
+    client.close()
+    stub.shutdown()
+
+    print("=" * 60)  # noqa: T201
+    print(" ComfyUI Client Benchmark (queue + poll round trip)")  # noqa: T201
+    print("=" * 60)  # noqa: T201
+    print(f"urllib: p50 {results['urllib_p50_ms']:.2f}ms  p99 {results['urllib_p99_ms']:.2f}ms")  # noqa: T201
+    print(f"pooled: p50 {results['pooled_p50_ms']:.2f}ms  p99 {results['pooled_p99_ms']:.2f}ms")  # noqa: T201
+    stats = results["pooled_stats"]
+    print(f"Connections opened: {stats['connections_opened']}  reuse rate: {stats['reuse_rate']:.1%}")  # noqa: T201
+    return results
+
+
+def run_payload_benchmark(iterations):
+    """Compare building /prompt bodies from the dict builders vs compiled templates"""
+    import simple_generator as sg
+
+    prompt = "A cinematic photo of a lighthouse on a cliff at sunset, dramatic clouds, 35mm"
+    cases = {
+        "qwen": (
+            lambda: sg.get_workflow('lightning', 1024, 'square', 42, 'blurry', 'euler', 'normal')[0],
+            ("4", "text"),
+            lambda: sg.workflow_templates.render(
+                'qwen', {'mode': 'lightning', 'resolution': 1024, 'aspect': 'square'},
+                prompt=prompt, negative_prompt='blurry', seed=42, sampler='euler', scheduler='normal'),
+        ),
+        "wan": (
+            lambda: sg.get_video_workflow(prompt, mode='t2v', resolution='480p', length=81, seed=42)[0],
+            None,
+            lambda: sg.workflow_templates.render(
+                'wan', {'mode': 't2v', 'resolution': '480p'}, prompt=prompt, seed=42, length=81),
+        ),
+        "hunyuan": (
+            lambda: sg.get_hunyuan_workflow(prompt, resolution='480p', length=81, seed=42)[0],
+            None,
+            lambda: sg.workflow_templates.render(
+                'hunyuan', {'mode': 't2v', 'resolution': '480p'}, prompt=prompt, seed=42, length=81),
+        ),
+    }
+
+    results = {"iterations": iterations}
+    print("=" * 60)  # noqa: T201
+    print(" Workflow Payload Building Benchmark")  # noqa: T201
+    print("=" * 60)  # noqa: T201
+    for name, (builder, prompt_path, render) in cases.items():
+        def legacy():
+            workflow = builder()
+            if prompt_path:
+                workflow[prompt_path[0]]["inputs"][prompt_path[1]] = prompt
+            return json.dumps({"prompt": workflow, "client_id": sg.CLIENT_ID,
+                               "extra_data": {"preview_method": sg.PREVIEW_METHOD}}).encode()
+
+        def compiled():
+            return sg.build_prompt_body(render())
+
+        timings = {}
+        for label, build in (("dict", legacy), ("template", compiled)):
+            build()  # warm up (compiles the template once)
+            start = time.perf_counter()
+            for _ in range(iterations):
+                build()
+            timings[label] = iterations / (time.perf_counter() - start)
+        results[name] = {"dict_per_sec": timings["dict"], "template_per_sec": timings["template"]}
+        print(f"{name:<8} dict: {timings['dict']:>9.0f}/s  template: {timings['template']:>9.0f}/s  ({timings['template'] / timings['dict']:.1f}x)")  # noqa: T201
+    return results
+
+
+def run_media_benchmark(players, seeks, size_mb):
+    """Simulate concurrent video players seeking through a large /output/ file.
+
+    Each player opens one keep-alive connection and issues 1 MB Range
+    requests at random offsets, like a browser <video> element scrubbing.
+    """
+    import simple_generator
+
+    output_dir = tempfile.mkdtemp(prefix="bench_output_")
+    simple_generator.OUTPUT_DIR = output_dir
+    size = size_mb * 1024 * 1024
+    path = os.path.join(output_dir, "bench_00001_.webm")
+    with open(path, 'wb') as f:
+        for _ in range(size_mb):
+            f.write(os.urandom(1024 * 1024))
+    server, base_url = start_local_server("http://127.0.0.1:9", simple_generator.MAX_CONNECTIONS, simple_generator.MAX_LONG_WAITS)
+    port = urllib.parse.urlparse(base_url).port
+    chunk = 1024 * 1024
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def player(index):
+        rng = random.Random(index)
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        try:
+            for _ in range(seeks):
+                start = rng.randrange(0, size - chunk)
+                began = time.perf_counter()
+                conn.request('GET', '/output/bench_00001_.webm', headers={'Range': f'bytes={start}-{start + chunk - 1}'})
+                response = conn.getresponse()
+                body = response.read()
+                elapsed = time.perf_counter() - began
+                if response.status != 206 or len(body) != chunk:
+                    with lock:
+                        errors.append(response.status)
+                    if response.will_close:
+                        conn.close()
+                    continue
+                with lock:
+                    latencies.append(elapsed)
+        except (OSError, http.client.HTTPException) as e:
+            with lock:
+                errors.append(str(e))
+        finally:
+            conn.close()
+
+    began = time.perf_counter()
+    threads = [threading.Thread(target=player, args=(i,)) for i in range(players)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - began
+
+    # One full download to check whole-file streaming stays flat in memory
+    full_began = time.perf_counter()
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    conn.request('GET', '/output/bench_00001_.webm')
+    response = conn.getresponse()
+    full_bytes = 0
+    while data := response.read(chunk):
+        full_bytes += len(data)
+    conn.close()
+    full_elapsed = time.perf_counter() - full_began
+    server.shutdown()
+    os.remove(path)
+    os.rmdir(output_dir)
+
+    results = {
+        "players": players,
+        "seeks_per_player": seeks,
+        "file_mb": size_mb,
+        "range_p50_ms": percentile(latencies, 50) * 1000,
+        "range_p99_ms": percentile(latencies, 99) * 1000,
+        "throughput_mb_s": len(latencies) * chunk / (1024 * 1024) / elapsed if elapsed else 0.0,
+        "full_download_mb_s": full_bytes / (1024 * 1024) / full_elapsed if full_elapsed else 0.0,
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "errors": len(errors),
+    }
+    print("=" * 60)  # noqa: T201
+    print(" Media Serving Benchmark (concurrent Range playback)")  # noqa: T201
+    print("=" * 60)  # noqa: T201
+    print(f"{players} players x {seeks} seeks, {size_mb} MB file, 1 MB ranges")  # noqa: T201
+    print(f"Range: p50 {results['range_p50_ms']:.2f}ms  p99 {results['range_p99_ms']:.2f}ms  ({results['throughput_mb_s']:.0f} MB/s)")  # noqa: T201
+    print(f"Full download: {results['full_download_mb_s']:.0f} MB/s  max RSS {results['max_rss_mb']:.0f} MB")  # noqa: T201
+    print(f"Errors: {results['errors']}")  # noqa: T201
+    return results
+
+
+def run_page_benchmark(iterations):
+    """Measure page asset build time and bytes transferred per visit"""
+    import simple_generator
+
+    began = time.perf_counter()
+    index, assets = simple_generator.build_static_assets(simple_generator.HTML_PAGE)
+    build_ms = (time.perf_counter() - began) * 1000
+    server, base_url = start_local_server("http://127.0.0.1:9", simple_generator.MAX_CONNECTIONS, simple_generator.MAX_LONG_WAITS)
+    port = urllib.parse.urlparse(base_url).port
+    paths = ['/'] + list(simple_generator.STATIC_ASSETS)
+
+    def visit(conn, accept_encoding, etags):
+        """Load the page and its assets the way a browser would; returns body bytes"""
+        total = 0
+        for path in paths:
+            headers = {'Accept-Encoding': accept_encoding}
+            if path in etags:
+                if path != '/':
+                    continue  # immutable assets are served from the browser cache
+                headers['If-None-Match'] = etags[path]
+            conn.request('GET', path, headers=headers)
+            response = conn.getresponse()
+            total += len(response.read())
+            etags[path] = response.getheader('ETag')
+        return total
+
+    results = {
+        "build_ms": build_ms,
+        "page_bytes": len(simple_generator.HTML_PAGE.encode('utf-8')),
+        "brotli": simple_generator.brotli is not None,
+    }
+    for accept_encoding in ('identity', 'gzip', 'br, gzip'):
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+        etags = {}
+        first = visit(conn, accept_encoding, etags)
+        latencies = []
+        repeat = 0
+        for _ in range(iterations):
+            start = time.perf_counter()
+            repeat = visit(conn, accept_encoding, etags)
+            latencies.append(time.perf_counter() - start)
+        conn.close()
+        results[accept_encoding] = {
+            "first_visit_bytes": first,
+            "repeat_visit_bytes": repeat,
+            "repeat_p50_ms": percentile(latencies, 50) * 1000,
+        }
+    server.shutdown()
+
+    print("=" * 60)  # noqa: T201
+    print(" Page Delivery Benchmark")  # noqa: T201
+    print("=" * 60)  # noqa: T201
+    print(f"Build (split + compress): {build_ms:.1f}ms  brotli: {'yes' if results['brotli'] else 'not installed'}")  # noqa: T201
+    print(f"Uncompressed page: {results['page_bytes'] / 1024:.0f} KB")  # noqa: T201
+    for accept_encoding in ('identity', 'gzip', 'br, gzip'):
+        r = results[accept_encoding]
+        print(f"{accept_encoding:>9}: first visit {r['first_visit_bytes'] / 1024:.1f} KB, repeat {r['repeat_visit_bytes']} B ({r['repeat_p50_ms']:.2f}ms)")  # noqa: T201
+    return results
+
+
+def read_sse_result(conn, path):
+    """GET an /events stream and return (done event data, preview count)"""
+    conn.request('GET', path)
+    response = conn.getresponse()
+    if response.status != 200:
+        response.read()
+        return {"success": False, "error": f"HTTP {response.status}"}, 0
+    event = None
+    previews = 0
+    while True:
+        line = response.fp.readline()
+        if not line:
+            return {"success": False, "error": "stream closed"}, previews
+        line = line.decode().rstrip('\r\n')
+        if line.startswith('event: '):
+            event = line[7:]
+            previews += event == 'preview'
+        elif line.startswith('data: ') and event == 'done':
+            return json.loads(line[6:]), previews
+
+
+def run_load_benchmark(users, jobs_per_user, mock_config):
+    """Drive the real front server with simulated users against a mock ComfyUI.
+
+    Each user does what the page does for a generation: POST /queue, follow
+    /events until the result arrives, load the image from /output/ and
+    refresh the gallery. Reports job throughput and per-request tail latency.
+    """
+    import simple_generator
+    from mock_comfyui import start_mock_comfyui
+
+    scratch = tempfile.mkdtemp(prefix="bench_load_")
+    output_dir = os.path.join(scratch, "output")
+    mock, mock_url, stop_mock = start_mock_comfyui(output_dir=output_dir, **mock_config)
+    # Keep the run's outputs and databases out of the real ones
+    simple_generator.OUTPUT_DIR = output_dir
+    simple_generator.gallery_index.output_dir = output_dir
+    for store in (simple_generator.gallery_index, simple_generator.generator_store):
+        store.db_path = os.path.join(scratch, "generator.db")
+    simple_generator.generator_store.history_file = simple_generator.generator_store.favorites_file = None
+    simple_generator.unload_ollama_model = lambda: None
+
+    server, base_url = start_local_server(mock_url, users * 3 + 16, users + 16)
+    simple_generator.event_listener.start()
+    simple_generator.event_listener.connected.wait(5)
+    port = urllib.parse.urlparse(base_url).port
+    latencies = {"queue": [], "job": [], "output": [], "gallery": []}
+    errors = []
+    failed_jobs = []
+    previews = []
+    lock = threading.Lock()
+
+    def timed(conn, method, path, body=None):
+        began = time.perf_counter()
+        conn.request(method, path, body=json.dumps(body) if body is not None else None,
+                     headers={'Content-Type': 'application/json'} if body is not None else {})
+        response = conn.getresponse()
+        data = response.read()
+        return response.status, data, time.perf_counter() - began
+
+    def user(index):
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=600)
+        events = http.client.HTTPConnection('127.0.0.1', port, timeout=600)
+        try:
+            for job in range(jobs_per_user):
+                began = time.perf_counter()
+                status, data, elapsed = timed(conn, 'POST', '/queue', {
+                    "prompt": f"load test {index}/{job}", "seed": job, "user": f"user{index}"})
+                prompt_id = json.loads(data).get('prompt_id') if status == 200 else None
+                if not prompt_id:
+                    with lock:
+                        errors.append(f"queue: {status} {data[:80]!r}")
+                    continue
+                result, seen = read_sse_result(events, f"/events?prompt_id={prompt_id}")
+                job_elapsed = time.perf_counter() - began
+                if not result.get('success'):
+                    with lock:
+                        failed_jobs.append(result.get('error'))
+                    continue
+                status, data, output_elapsed = timed(conn, 'GET', result['image'])
+                _, _, gallery_elapsed = timed(conn, 'GET', '/gallery?limit=24')
+                with lock:
+                    latencies['queue'].append(elapsed)
+                    latencies['job'].append(job_elapsed)
+                    latencies['output'].append(output_elapsed)
+                    latencies['gallery'].append(gallery_elapsed)
+                    previews.append(seen)
+                    if status != 200:
+                        errors.append(f"output: {status}")
+        except (OSError, http.client.HTTPException, ValueError) as e:
+            with lock:
+                errors.append(str(e))
+        finally:
+            conn.close()
+            events.close()
+
+    began = time.perf_counter()
+    threads = [threading.Thread(target=user, args=(i,)) for i in range(users)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - began
+    server.shutdown()
+    simple_generator.event_listener.stop()
+    stop_mock()
+
+    completed = len(latencies['job'])
+    results = {
+        "users": users,
+        "jobs_per_user": jobs_per_user,
+        "mock": mock_config,
+        "completed_jobs": completed,
+        "failed_jobs": len(failed_jobs),
+        "errors": len(errors),
+        "elapsed_s": elapsed,
+        "jobs_per_s": completed / elapsed if elapsed else 0.0,
+        "mock_stats": dict(mock.stats),
+        "previews_per_job": sum(previews) / len(previews) if previews else 0.0,
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+    for name, values in latencies.items():
+        for pct in (50, 95, 99):
+            results[f"{name}_p{pct}_ms"] = percentile(values, pct) * 1000
+
+    print("=" * 60)  # noqa: T201
+    print(" Load Test (simulated users against a mock ComfyUI)")  # noqa: T201
+    print("=" * 60)  # noqa: T201
+    print(f"{users} users x {jobs_per_user} jobs, mock: {mock_config}")  # noqa: T201
+    print(f"Completed {completed} jobs in {elapsed:.1f}s ({results['jobs_per_s']:.1f} jobs/s), "  # noqa: T201
+          f"failed {len(failed_jobs)}, errors {len(errors)}")
+    for name in latencies:
+        print(f"{name:>8}: p50 {results[f'{name}_p50_ms']:.1f}ms  p95 {results[f'{name}_p95_ms']:.1f}ms  "  # noqa: T201
+              f"p99 {results[f'{name}_p99_ms']:.1f}ms")
+    print(f"Previews per job: {results['previews_per_job']:.1f}  max RSS {results['max_rss_mb']:.0f} MB")  # noqa: T201
+    if errors:
+        print(f"First error: {errors[0]}")  # noqa: T201
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Qwen Image Generator front server load benchmark")
+    parser.add_argument("--url", help="Benchmark an already running generator instead of an in-process one")
+    parser.add_argument("--comfyui-url", default="http://127.0.0.1:9", help="ComfyUI URL for the in-process server (default: unreachable)")
+    parser.add_argument("--waits", type=int, default=200, help="Number of /wait connections to hold open")
+    parser.add_argument("--requests", type=int, default=500, help="Number of /gallery requests to time")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent /gallery clients")
+    parser.add_argument("--max-connections", type=int, default=None, help="Connection limit for the in-process server")
+    parser.add_argument("--max-long-waits", type=int, default=None, help="Long-wait limit for the in-process server")
+    parser.add_argument("--client", action="store_true", help="Benchmark the pooled ComfyUI client against one-shot urllib requests")
+    parser.add_argument("--payload", action="store_true", help="Benchmark workflow payload building (dict builders vs compiled templates)")
+    parser.add_argument("--media", action="store_true", help="Benchmark concurrent video playback from /output/ (Range requests)")
+    parser.add_argument("--media-size", type=int, default=256, help="Size in MB of the video served by --media")
+    parser.add_argument("--page", action="store_true", help="Benchmark page build time and bytes on the wire")
+    parser.add_argument("--load", action="store_true", help="Load test with simulated users against a mock ComfyUI")
+    parser.add_argument("--users", type=int, default=100, help="Simulated users for --load")
+    parser.add_argument("--jobs", type=int, default=3, help="Jobs per user for --load")
+    parser.add_argument("--mock-workers", type=int, default=4, help="Prompts the mock runs at once for --load")
+    parser.add_argument("--step-time", type=float, default=0.01, help="Mock seconds per sampler step for --load")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Fraction of mock prompts that fail for --load")
+    parser.add_argument("--latency", type=float, default=0.0, help="Mock delay per ComfyUI request for --load")
+    parser.add_argument("--save", metavar="FILE", help="Save results to a JSON file")
+    args = parser.parse_args()
+
+    if args.client or args.payload or args.media or args.page or args.load:
+        if args.client:
+            results = run_client_benchmark(args.requests)
+        elif args.page:
+            results = run_page_benchmark(args.requests)
+        elif args.media:
+            results = run_media_benchmark(args.concurrency * 4, max(1, args.requests // 10), args.media_size)
+        elif args.load:
+            mock_config = {"workers": args.mock_workers, "step_time": args.step_time,
+                           "fail_rate": args.fail_rate, "latency": args.latency, "seed": 0}
+            results = run_load_benchmark(args.users, args.jobs, mock_config)
+        else:
+            results = run_payload_benchmark(args.requests * 20)
+        if args.save:
+            with open(args.save, 'w') as f:
+                json.dump(results, f, indent=2)
+            print(f"\nResults saved to: {args.save}")  # noqa: T201
+        return
+
+    server = None
+    if args.url:
+        base_url = args.url
+    else:
+        import simple_generator
+        max_connections = args.max_connections or max(simple_generator.MAX_CONNECTIONS, args.waits + args.concurrency + 16)
+        max_long_waits = args.max_long_waits or max(simple_generator.MAX_LONG_WAITS, args.waits)
+        server, base_url = start_local_server(args.comfyui_url, max_connections, max_long_waits)
+
+    parsed = urllib.parse.urlparse(base_url)
+    host, port = parsed.hostname, parsed.port or 80
+
+    print("=" * 60)  # noqa: T201
+    print(" Front Server Load Benchmark")  # noqa: T201
+    print("=" * 60)  # noqa: T201
+    print(f"Target: {base_url}")  # noqa: T201
+
+    # Baseline latency with an idle server
+    idle_latencies, idle_errors, _ = run_gallery_load(host, port, min(args.requests, 100), 1)
+
+    # Hold long waits open
+    stop = threading.Event()
+    opened = []
+    holders = []
+    print(f"\nOpening {args.waits} /wait connections...")  # noqa: T201
+    for i in range(args.waits):
+        t = threading.Thread(target=hold_wait, args=(host, port, i, opened, stop), daemon=True)
+        t.start()
+        holders.append(t)
+    deadline = time.time() + 30
+    while len(opened) < args.waits and time.time() < deadline:
+        time.sleep(0.05)
+    time.sleep(1.0)  # let the server pick up every request
+    held = sum(1 for t in holders if t.is_alive())
+    print(f"Held open: {held}/{args.waits}")  # noqa: T201
+
+    latencies, errors, elapsed = run_gallery_load(host, port, args.requests, args.concurrency)
+    stop.set()
+
+    results = {
+        "target": base_url,
+        "held_waits": held,
+        "requested_waits": args.waits,
+        "gallery_requests": args.requests,
+        "gallery_concurrency": args.concurrency,
+        "idle_p50_ms": percentile(idle_latencies, 50) * 1000,
+        "idle_p99_ms": percentile(idle_latencies, 99) * 1000,
+        "loaded_p50_ms": percentile(latencies, 50) * 1000,
+        "loaded_p99_ms": percentile(latencies, 99) * 1000,
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "errors": len(errors) + len(idle_errors),
+    }
+
+    print(f"\n{'-'*60}")  # noqa: T201
+    print(f"/gallery idle:   p50 {results['idle_p50_ms']:.1f}ms  p99 {results['idle_p99_ms']:.1f}ms")  # noqa: T201
+    print(f"/gallery loaded: p50 {results['loaded_p50_ms']:.1f}ms  p99 {results['loaded_p99_ms']:.1f}ms  ({results['throughput_rps']:.0f} req/s)")  # noqa: T201
+    print(f"Errors: {results['errors']}")  # noqa: T201
+    print(f"{'-'*60}")  # noqa: T201
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults saved to: {args.save}")  # noqa: T201
+
+    if server is not None:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
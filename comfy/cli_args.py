@@ -113,6 +113,11 @@ cache_group.add_argument("--cache-classic", action="store_true", help="Use the o
 cache_group.add_argument("--cache-lru", type=int, default=0, help="Use LRU caching with a maximum of N node results cached. May use more RAM/VRAM.")
 cache_group.add_argument("--cache-none", action="store_true", help="Reduced RAM/VRAM usage at the expense of executing every node for each run.")
 cache_group.add_argument("--cache-ram", nargs='?', const=4.0, type=float, default=0, help="Use RAM pressure caching with the specified headroom threshold. If available RAM drops below the threhold the cache remove large items to free RAM. Default 4GB")
+parser.add_argument("--cache-ram-budget", type=float, default=0, metavar="GB", help="With --cache-ram, also keep the cached node outputs (measured in bytes, including models and GPU tensors) under this many GB.")
+parser.add_argument("--cache-conditioning", type=float, default=0, metavar="MB", help="Enable a cross-prompt text encoder cache using up to this much memory: the same prompt with the same text encoder and LoRAs is only encoded once. Disabled by default and with --cache-none.")
+parser.add_argument("--cache-conditioning-dir", type=str, default=None, metavar="PATH", nargs="?", const="", help="With --cache-conditioning, also keep text encoder outputs on disk (up to 4 GB) so they survive restarts. Entries are keyed by the path, size and mtime of the text encoder files. Optionally set the directory (default: cache/conditioning in the ComfyUI directory).")
+parser.add_argument("--cache-disk", type=str, default=None, metavar="PATH", nargs="?", const="", help="Also keep serializable node outputs (conditioning, latents, images) in an on-disk cache that survives restarts. Optionally set its directory (default: cache/outputs in the ComfyUI directory). Works with every cache mode except --cache-none.")
+parser.add_argument("--cache-disk-size", type=float, default=10.0, help="Maximum size of the --cache-disk directory in GB. The least recently used entries are evicted first.")
 
 attn_group = parser.add_mutually_exclusive_group()
 attn_group.add_argument("--use-split-cross-attention", action="store_true", help="Use the split cross attention optimization. Ignored when xformers is used.")
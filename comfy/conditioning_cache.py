@@ -0,0 +1,223 @@
+"""Cross-prompt cache of text encoder outputs.
+
+CLIP.encode_from_tokens looks here before loading and running the text
+encoder. Entries are keyed by the encoder (the model object in memory, the
+files it was loaded from on disk), its LoRA patches, the encode options and the
+token ids, so the same prompt with a new seed (or in another graph) skips text
+encoding entirely. The memory tier is an LRU bounded in bytes; an optional
+DiskStore keeps entries across restarts.
+"""
+
+import hashlib
+import itertools
+import os
+import threading
+from collections import OrderedDict
+
+import torch
+
+from comfy.cli_args import args
+from comfy.disk_store import DiskStore, disk_serializable
+
+#Bump when the key or entry format changes so old disk entries are never read back
+CONDITIONING_CACHE_FORMAT = 2
+
+#Size of the optional disk tier (--cache-conditioning-dir)
+DISK_MAX_BYTES = 4 * 1024**3
+
+_model_ids = itertools.count()
+
+
+class _Uncacheable(Exception):
+    pass
+
+
+def _hash_tensor(h, tensor):
+    raw = torch.Tensor.as_subclass(tensor, torch.Tensor).detach()
+    h.update("T{}{}".format(raw.dtype, tuple(raw.shape)).encode())
+    h.update(raw.contiguous().reshape(-1).cpu().view(torch.uint8).numpy().tobytes())
+
+
+def _hash_tokens(h, obj):
+    # Token ids and weights, plus embeddings (textual inversion, image embeds)
+    if isinstance(obj, torch.Tensor):
+        _hash_tensor(h, obj)
+    elif isinstance(obj, (int, float, str, bool, type(None))):
+        h.update("{}:{!r};".format(type(obj).__name__, obj).encode())
+    elif isinstance(obj, (list, tuple)):
+        h.update(b"[")
+        for item in obj:
+            _hash_tokens(h, item)
+        h.update(b"]")
+    elif isinstance(obj, dict):
+        h.update(b"{")
+        for key in sorted(obj, key=str):
+            _hash_tokens(h, key)
+            _hash_tokens(h, obj[key])
+        h.update(b"}")
+    else:
+        raise _Uncacheable()
+
+
+def model_identity(model):
+    """A per-process id of a text encoder object; clones of a CLIP share it."""
+    identity = getattr(model, "_conditioning_cache_id", None)
+    if identity is None:
+        identity = model._conditioning_cache_id = "process-{}".format(next(_model_ids))
+    return identity
+
+
+def record_source(model, paths, *options):
+    """Remember the files a text encoder was loaded from, for the disk tier.
+
+    The digest covers each file's path, size and mtime and the load options,
+    so it holds across restarts and changes when a file is replaced, without
+    reading the weights back.
+    """
+    h = hashlib.blake2b(digest_size=20)
+    h.update(type(model).__name__.encode())
+    try:
+        for path in paths:
+            stat = os.stat(path)
+            h.update("{}|{}|{}|".format(os.path.abspath(path), stat.st_size, stat.st_mtime_ns).encode())
+    except OSError:
+        return
+    h.update(repr(options).encode())
+    model._conditioning_weights_digest = h.hexdigest()
+
+
+def weights_digest(model):
+    """The digest recorded by record_source, or "" for an encoder not loaded from files"""
+    return getattr(model, "_conditioning_weights_digest", None) or ""
+
+
+def _output_bytes(output):
+    total = 0
+    stack = [output]
+    while stack:
+        obj = stack.pop()
+        if isinstance(obj, torch.Tensor):
+            total += obj.numel() * obj.element_size()
+        elif isinstance(obj, (list, tuple)):
+            stack.extend(obj)
+        elif isinstance(obj, dict):
+            stack.extend(obj.values())
+    return total
+
+
+def _copy_output(output):
+    # Callers may add or pop keys of the extra dict; the tensors are shared
+    return tuple(dict(item) if isinstance(item, dict) else item for item in output)
+
+
+class ConditioningCache:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.disk = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.total_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def persist_to(self, directory, max_bytes):
+        """Also keep entries in directory, across restarts"""
+        self.disk = DiskStore(directory, max_bytes, "conditioning-cache")
+
+    def key(self, clip, tokens, unprojected):
+        """The cache key of encoding tokens with clip: (digest, persistable), or None if it must not be cached"""
+        if self.max_bytes <= 0:
+            return None
+        patcher = clip.patcher
+        if patcher.forced_hooks is not None or patcher.hook_patches or patcher.object_patches:
+            # Hook keyframes change the encoder per schedule step; object patches are opaque
+            return None
+        # In memory, entries belong to the encoder object; on disk, to the files it was loaded from
+        identity = None
+        if self.disk is not None:
+            identity = weights_digest(clip.cond_stage_model)
+        stable = bool(identity)
+        if not stable:
+            identity = model_identity(clip.cond_stage_model)
+        h = hashlib.blake2b(digest_size=20, person=b"comfy-cond-%d" % CONDITIONING_CACHE_FORMAT)
+        h.update("{}|{}|{}|".format(identity, clip.layer_idx, unprojected).encode())
+        if patcher.patches:
+            # LoRA patches: identified for this process only
+            h.update("patches:{}|".format(patcher.patches_uuid).encode())
+            stable = False
+        try:
+            _hash_tokens(h, tokens)
+        except _Uncacheable:
+            return None
+        return h.hexdigest(), stable
+
+    def get(self, key):
+        """The cached encoder output for key, or None"""
+        if key is None:
+            return None
+        digest, stable = key
+        with self._lock:
+            output = self._entries.get(digest)
+            if output is not None:
+                self._entries.move_to_end(digest)
+                self.hits += 1
+                return _copy_output(output)
+        if stable and self.disk is not None:
+            data = self.disk.load(digest)
+            if data is not None:
+                output = tuple(data["output"])
+                self._remember(digest, output)
+                with self._lock:
+                    self.hits += 1
+                return _copy_output(output)
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, output):
+        if key is None:
+            return
+        digest, stable = key
+        output = tuple(output)
+        self._remember(digest, output)
+        if stable and self.disk is not None and disk_serializable(output):
+            self.disk.save(digest, {"output": output})
+
+    def _remember(self, digest, output):
+        size = _output_bytes(output)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if digest in self._entries:
+                return
+            self._entries[digest] = output
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.total_bytes -= _output_bytes(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            stats = {
+                "entries": len(self._entries),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+            }
+        if self.disk is not None:
+            stats["disk"] = self.disk.stats()
+        return stats
+
+
+conditioning_cache = ConditioningCache(0 if args.cache_none else int(args.cache_conditioning * 1024**2))
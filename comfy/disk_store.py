@@ -0,0 +1,145 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+
+
+def disk_serializable(obj):
+    """True if torch.load(weights_only=True) can restore obj: CPU tensors,
+    numbers, strings and lists/tuples/dicts of those. Models, VAEs and other
+    objects are not."""
+    if isinstance(obj, (int, float, str, bool, bytes, type(None))):
+        return True
+    if type(obj) is torch.Tensor:
+        return obj.device.type == 'cpu'
+    if isinstance(obj, (list, tuple)):
+        return all(disk_serializable(i) for i in obj)
+    if type(obj) is dict:
+        return all(isinstance(k, str) and disk_serializable(v) for k, v in obj.items())
+    return False
+
+
+class DiskStore:
+    """A content-addressed, size-bounded directory of torch.save'd entries.
+
+    Entries are named by a hex digest chosen by the caller. Writes happen on a
+    background thread and land with an atomic rename; the directory is kept
+    under max_bytes by evicting the least recently used entries, which
+    survives restarts through the files' mtimes.
+    """
+
+    def __init__(self, directory, max_bytes, name="disk-store"):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.writes = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._pending = set()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix=name)
+        self._scan()
+
+    def _scan(self):
+        os.makedirs(self.directory, exist_ok=True)
+        found = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                stat = os.stat(path)
+                if not name.endswith(".pt"):
+                    # A write that was cut short (recent ones may still be in flight)
+                    if time.time() - stat.st_mtime > 3600:
+                        os.remove(path)
+                    continue
+                found.append((stat.st_mtime, name[:-3], stat.st_size))
+        for _, digest, size in sorted(found):
+            self._entries[digest] = size
+            self._total_bytes += size
+        self._evict()
+
+    def _path(self, digest):
+        return os.path.join(self.directory, digest[:2], digest + ".pt")
+
+    def __contains__(self, digest):
+        with self._lock:
+            return digest in self._entries
+
+    def load(self, digest):
+        """The entry stored under digest, or None"""
+        if digest not in self:
+            return None
+        path = self._path(digest)
+        try:
+            data = torch.load(path, map_location="cpu", weights_only=True)
+            os.utime(path)
+        except Exception as e:
+            logging.warning("Dropping unreadable disk cache entry {}: {}".format(path, e))
+            self._remove(digest)
+            return None
+        with self._lock:
+            if digest in self._entries:
+                self._entries.move_to_end(digest)
+            self.hits += 1
+        return data
+
+    def save(self, digest, data):
+        """Queue data to be written under digest, unless it is already stored"""
+        with self._lock:
+            if digest in self._entries or digest in self._pending:
+                return
+            self._pending.add(digest)
+        self._writer.submit(self._write, digest, data)
+
+    def _write(self, digest, data):
+        path = self._path(digest)
+        tmp_path = path + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            torch.save(data, tmp_path)
+            os.replace(tmp_path, path)
+            size = os.path.getsize(path)
+        except Exception as e:
+            logging.warning("Could not write disk cache entry {}: {}".format(path, e))
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            with self._lock:
+                self._pending.discard(digest)
+            return
+        with self._lock:
+            self._pending.discard(digest)
+            self._total_bytes += size - self._entries.pop(digest, 0)
+            self._entries[digest] = size
+            self.writes += 1
+        self._evict()
+
+    def _remove(self, digest):
+        with self._lock:
+            self._total_bytes -= self._entries.pop(digest, 0)
+        try:
+            os.remove(self._path(digest))
+        except OSError:
+            pass
+
+    def _evict(self):
+        while True:
+            with self._lock:
+                if self._total_bytes <= self.max_bytes or not self._entries:
+                    return
+                digest = next(iter(self._entries))
+                self.evictions += 1
+            self._remove(digest)
+
+    def flush(self):
+        """Wait for queued writes to reach the disk"""
+        self._writer.submit(lambda: None).result()
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._total_bytes, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "writes": self.writes, "evictions": self.evictions}
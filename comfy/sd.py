@@ -5,6 +5,7 @@ from enum import Enum
 import logging
 
 from comfy import model_management
+from comfy.conditioning_cache import conditioning_cache, record_source
 from comfy.utils import ProgressBar
 from .ldm.models.autoencoder import AutoencoderKL, AutoencodingEngine
 from .ldm.cascade.stage_a import StageA
@@ -266,9 +267,14 @@ class CLIP:
         if return_pooled == "unprojected":
             self.cond_stage_model.set_clip_options({"projected_pooled": False})
 
-        self.load_model(tokens)
-        self.cond_stage_model.set_clip_options({"execution_device": self.patcher.load_device})
-        o = self.cond_stage_model.encode_token_weights(tokens)
+        # Same weights, patches and tokens: reuse the conditioning without loading the encoder
+        cache_key = conditioning_cache.key(self, tokens, return_pooled == "unprojected")
+        o = conditioning_cache.get(cache_key)
+        if o is None:
+            self.load_model(tokens)
+            self.cond_stage_model.set_clip_options({"execution_device": self.patcher.load_device})
+            o = self.cond_stage_model.encode_token_weights(tokens)
+            conditioning_cache.put(cache_key, o)
         cond, pooled = o[:2]
         if return_dict:
             out = {"cond": cond, "pooled_output": pooled}
@@ -1023,7 +1029,9 @@ def load_clip(ckpt_paths, embedding_directory=None, clip_type=CLIPType.STABLE_DI
         if model_options.get("custom_operations", None) is None:
             sd, metadata = comfy.utils.convert_old_quants(sd, model_prefix="", metadata=metadata)
         clip_data.append(sd)
-    return load_text_encoder_state_dicts(clip_data, embedding_directory=embedding_directory, clip_type=clip_type, model_options=model_options)
+    clip = load_text_encoder_state_dicts(clip_data, embedding_directory=embedding_directory, clip_type=clip_type, model_options=model_options)
+    record_source(clip.cond_stage_model, ckpt_paths, clip_type, model_options.get("dtype"))
+    return clip
 
 
 class TEModel(Enum):
@@ -1352,6 +1360,8 @@ def load_checkpoint_guess_config(ckpt_path, output_vae=True, output_clip=True, o
     out = load_state_dict_guess_config(sd, output_vae, output_clip, output_clipvision, embedding_directory, output_model, model_options, te_model_options=te_model_options, metadata=metadata)
     if out is None:
         raise RuntimeError("ERROR: Could not detect model type of: {}\n{}".format(ckpt_path, model_detection_error_hint(ckpt_path, sd)))
+    if out[1] is not None:
+        record_source(out[1].cond_stage_model, [ckpt_path], te_model_options.get("dtype"))
     return out
 
 def load_state_dict_guess_config(sd, output_vae=True, output_clip=True, output_clipvision=False, embedding_directory=None, output_model=True, model_options={}, te_model_options={}, metadata=None):
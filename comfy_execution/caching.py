@@ -1,13 +1,20 @@
-import bisect
 import gc
+import hashlib
+import heapq
 import itertools
+import math
+import os
 import psutil
+import sys
 import time
 import torch
-from typing import Sequence, Mapping, Dict
+import weakref
+from typing import Sequence, Mapping, Dict, NamedTuple
+from comfy.disk_store import disk_serializable
 from comfy_execution.graph import DynamicPrompt
 from abc import ABC, abstractmethod
 
+import folder_paths
 import nodes
 
 from comfy_execution.graph_utils import is_link
@@ -15,6 +22,11 @@ from comfy_execution.graph_utils import is_link
 NODE_CLASS_CONTAINS_UNIQUE_ID: Dict[str, bool] = {}
 
 
+class CacheEntry(NamedTuple):
+    ui: dict
+    outputs: list
+
+
 def include_unique_id_in_input(class_type: str) -> bool:
     if class_type in NODE_CLASS_CONTAINS_UNIQUE_ID:
         return NODE_CLASS_CONTAINS_UNIQUE_ID[class_type]
@@ -78,11 +90,58 @@ class CacheKeySetID(CacheKeySet):
             self.keys[node_id] = (node_id, node["class_type"])
             self.subcache_keys[node_id] = (node_id, node["class_type"])
 
+class _Uncacheable(Exception):
+    pass
+
+def _canonical(obj):
+    # A structure whose repr() is a canonical encoding of obj. Mappings are
+    # sorted by key and tagged so they cannot collide with plain lists.
+    if isinstance(obj, float):
+        if math.isnan(obj):
+            # NaN never equals itself, e.g. an IS_CHANGED that always changes
+            raise _Uncacheable()
+        return obj
+    if isinstance(obj, (int, str, bool, bytes, type(None))):
+        return obj
+    elif isinstance(obj, Mapping):
+        return ("MAP", [(_canonical(k), _canonical(v)) for k, v in sorted(obj.items())])
+    elif isinstance(obj, Sequence):
+        return [_canonical(i) for i in obj]
+    else:
+        raise _Uncacheable()
+
+def signature_digest(signature):
+    """Hash a node's immediate signature (with its parents' digests in place of
+    links) into a Merkle digest. Returns an Unhashable, which never equals
+    another key, if the signature holds values that cannot be compared."""
+    try:
+        encoded = repr(_canonical(signature)).encode("utf-8", "surrogatepass")
+    except _Uncacheable:
+        return Unhashable()
+    return hashlib.blake2b(encoded, digest_size=20).digest()
+
 class CacheKeySetInputSignature(CacheKeySet):
+    """Keys each node by a Merkle digest of its class, IS_CHANGED value, inputs
+    and the digests of the nodes it links to.
+
+    Every node is hashed once per prompt: the digests are memoized for the
+    prompt (keyed by its is_changed_cache) and shared by the subcaches and any
+    later add_keys calls. An unchanged subgraph hashes to the same digests in
+    every prompt, so its cached outputs are found again.
+    """
+
+    # is_changed_cache -> {key set class: {node_id: signature}}
+    _prompt_signatures = weakref.WeakKeyDictionary()
+
     def __init__(self, dynprompt, node_ids, is_changed_cache):
         super().__init__(dynprompt, node_ids, is_changed_cache)
         self.dynprompt = dynprompt
         self.is_changed_cache = is_changed_cache
+        try:
+            memos = self._prompt_signatures.setdefault(is_changed_cache, {})
+            self.signatures = memos.setdefault(type(self), {})
+        except TypeError:
+            self.signatures = {}
 
     def include_node_id_in_input(self) -> bool:
         return False
@@ -98,17 +157,60 @@ class CacheKeySetInputSignature(CacheKeySet):
             self.subcache_keys[node_id] = (node_id, node["class_type"])
 
     async def get_node_signature(self, dynprompt, node_id):
-        signature = []
-        ancestors, order_mapping = self.get_ordered_ancestry(dynprompt, node_id)
-        signature.append(await self.get_immediate_node_signature(dynprompt, node_id, order_mapping))
-        for ancestor_id in ancestors:
-            signature.append(await self.get_immediate_node_signature(dynprompt, ancestor_id, order_mapping))
-        return to_hashable(signature)
-
-    async def get_immediate_node_signature(self, dynprompt, node_id, ancestor_order_mapping):
-        if not dynprompt.has_node(node_id):
-            # This node doesn't exist -- we can't cache it.
-            return [float("NaN")]
+        if node_id in self.signatures:
+            return self.signatures[node_id]
+        # Signatures that depend on a missing node are not memoized: the node
+        # may still be added to the prompt (e.g. by a node expansion)
+        volatile = {}
+        # Depth-first, parents before children, without recursion so that
+        # very deep graphs do not hit the recursion limit
+        stack = [node_id]
+        visiting = set()
+        while stack:
+            current = stack[-1]
+            if current in self.signatures or current in volatile:
+                stack.pop()
+                continue
+            if not dynprompt.has_node(current):
+                # This node doesn't exist -- we can't cache it.
+                volatile[current] = Unhashable()
+                stack.pop()
+                continue
+            inputs = dynprompt.get_node(current)["inputs"]
+            if current not in visiting:
+                visiting.add(current)
+                pending = [inputs[key][0] for key in sorted(inputs.keys())
+                           if is_link(inputs[key]) and inputs[key][0] not in self.signatures
+                           and inputs[key][0] not in volatile]
+                if any(parent in visiting for parent in pending):
+                    # A cycle; validation rejects these, but never loop on one
+                    volatile[current] = Unhashable()
+                    stack.pop()
+                    continue
+                if pending:
+                    stack.extend(reversed(pending))
+                    continue
+            stack.pop()
+            visiting.discard(current)
+            parent_signatures = {}
+            is_volatile = False
+            for key in inputs:
+                if is_link(inputs[key]):
+                    parent_id = inputs[key][0]
+                    if parent_id in volatile:
+                        is_volatile = True
+                        parent_signatures[parent_id] = volatile[parent_id]
+                    else:
+                        parent_signatures[parent_id] = self.signatures[parent_id]
+            signature = signature_digest(await self.get_immediate_node_signature(dynprompt, current, parent_signatures))
+            if is_volatile:
+                volatile[current] = signature
+            else:
+                self.signatures[current] = signature
+        return self.signatures[node_id] if node_id in self.signatures else volatile[node_id]
+
+    async def get_immediate_node_signature(self, dynprompt, node_id, parent_signatures):
+        """The node's own signature; linked inputs refer to the parent's signature digest"""
         node = dynprompt.get_node(node_id)
         class_type = node["class_type"]
         class_def = nodes.NODE_CLASS_MAPPINGS[class_type]
@@ -119,33 +221,14 @@ class CacheKeySetInputSignature(CacheKeySet):
         for key in sorted(inputs.keys()):
             if is_link(inputs[key]):
                 (ancestor_id, ancestor_socket) = inputs[key]
-                ancestor_index = ancestor_order_mapping[ancestor_id]
-                signature.append((key,("ANCESTOR", ancestor_index, ancestor_socket)))
+                ancestor_signature = parent_signatures[ancestor_id]
+                if isinstance(ancestor_signature, Unhashable):
+                    ancestor_signature = ancestor_signature.value
+                signature.append((key, ("ANCESTOR", ancestor_signature, ancestor_socket)))
             else:
                 signature.append((key, inputs[key]))
         return signature
 
-    # This function returns a list of all ancestors of the given node. The order of the list is
-    # deterministic based on which specific inputs the ancestor is connected by.
-    def get_ordered_ancestry(self, dynprompt, node_id):
-        ancestors = []
-        order_mapping = {}
-        self.get_ordered_ancestry_internal(dynprompt, node_id, ancestors, order_mapping)
-        return ancestors, order_mapping
-
-    def get_ordered_ancestry_internal(self, dynprompt, node_id, ancestors, order_mapping):
-        if not dynprompt.has_node(node_id):
-            return
-        inputs = dynprompt.get_node(node_id)["inputs"]
-        input_keys = sorted(inputs.keys())
-        for key in input_keys:
-            if is_link(inputs[key]):
-                ancestor_id = inputs[key][0]
-                if ancestor_id not in order_mapping:
-                    ancestors.append(ancestor_id)
-                    order_mapping[ancestor_id] = len(ancestors) - 1
-                    self.get_ordered_ancestry_internal(dynprompt, ancestor_id, ancestors, order_mapping)
-
 class BasicCache:
     def __init__(self, key_class):
         self.key_class = key_class
@@ -349,75 +432,307 @@ class LRUCache(BasicCache):
         return self
 
 
-#Iterating the cache for usage analysis might be expensive, so if we trigger make sure
-#to take a chunk out to give breathing space on high-node / low-ram-per-node flows.
+#Evict a chunk more than strictly needed to give breathing space on
+#high-node / low-ram-per-node flows.
 
 RAM_CACHE_HYSTERESIS = 1.1
 
-#This is kinda in GB but not really. It needs to be non-zero for the below heuristic
-#and as long as Multi GB models dwarf this it will approximate OOM scoring OK
+#Floor for an entry's measured size, so entries with no measurable data
+#(ints, strings, small objects) still get an OOM score and age out
 
-RAM_CACHE_DEFAULT_RAM_USAGE = 0.1
+RAM_CACHE_MIN_ENTRY_BYTES = 1024
 
 #Exponential bias towards evicting older workflows so garbage will be taken out
 #in constantly changing setups.
 
 RAM_CACHE_OLD_WORKFLOW_OOM_MULTIPLIER = 1.3
 
+def _tensor_bytes(tensor):
+    try:
+        storage = tensor.untyped_storage()
+        return (tensor.device, storage.data_ptr()), storage.nbytes()
+    except Exception:
+        # Tensor subclasses (e.g. quantized weights) without a plain storage
+        return id(tensor), tensor.numel() * tensor.element_size()
+
+def output_size(outputs):
+    """Bytes held by a node's outputs, measured once when they are cached.
+
+    Tensors count on any device, by storage, so views and repeated references
+    are counted once. Models, CLIP and VAE count their get_ram_usage(). Lists,
+    tuples and dicts (e.g. conditioning) are walked; anything else counts its
+    shallow size.
+    """
+    seen = set()
+    total = 0
+    stack = [outputs]
+    while stack:
+        obj = stack.pop()
+        if isinstance(obj, torch.Tensor):
+            key, size = _tensor_bytes(obj)
+        elif id(obj) in seen:
+            continue
+        elif isinstance(obj, (list, tuple)):
+            seen.add(id(obj))
+            stack.extend(obj)
+            continue
+        elif isinstance(obj, dict):
+            seen.add(id(obj))
+            stack.extend(obj.values())
+            continue
+        elif hasattr(obj, "get_ram_usage"):
+            key, size = id(obj), obj.get_ram_usage()
+        else:
+            key, size = id(obj), sys.getsizeof(obj)
+        if key not in seen:
+            seen.add(key)
+            total += size
+    return max(total, RAM_CACHE_MIN_ENTRY_BYTES)
+
 class RAMPressureCache(LRUCache):
+    """Keeps outputs until RAM runs low or they exceed max_bytes (0: no budget).
 
-    def __init__(self, key_class):
+    Each entry's size is measured once, at set. Eviction takes the entries
+    with the highest size * age score first, from a heap; the budget alone
+    never evicts entries the current prompt uses. Hits, misses and evictions
+    are counted per node class (once per node and prompt).
+    """
+
+    def __init__(self, key_class, max_bytes=0):
         super().__init__(key_class, 0)
+        self.max_bytes = max_bytes
         self.timestamps = {}
+        self.sizes = {}
+        self.classes = {}
+        self.total_bytes = 0
+        self.class_stats = {}
+        self._counted = set()
+
+    async def set_prompt(self, dynprompt, node_ids, is_changed_cache):
+        self._counted = set()
+        await super().set_prompt(dynprompt, node_ids, is_changed_cache)
 
     def clean_unused(self):
         self._clean_subcaches()
 
+    def _count(self, class_type, event):
+        stats = self.class_stats.get(class_type)
+        if stats is None:
+            stats = self.class_stats[class_type] = {"hits": 0, "misses": 0, "evictions": 0}
+        stats[event] += 1
+
     def set(self, node_id, value):
-        self.timestamps[self.cache_key_set.get_data_key(node_id)] = time.time()
+        key = self.cache_key_set.get_data_key(node_id)
+        size = output_size(value.outputs)
+        self.total_bytes += size - self.sizes.get(key, 0)
+        self.sizes[key] = size
+        self.classes[key] = self.dynprompt.get_node(node_id)["class_type"]
+        self.timestamps[key] = time.time()
         super().set(node_id, value)
 
     def get(self, node_id):
-        self.timestamps[self.cache_key_set.get_data_key(node_id)] = time.time()
-        return super().get(node_id)
+        value = super().get(node_id)
+        if value is not None:
+            self.timestamps[self.cache_key_set.get_data_key(node_id)] = time.time()
+        if node_id not in self._counted and self.dynprompt.has_node(node_id):
+            self._counted.add(node_id)
+            self._count(self.dynprompt.get_node(node_id)["class_type"], "hits" if value is not None else "misses")
+        return value
+
+    def _evict(self, key):
+        del self.cache[key]
+        self.total_bytes -= self.sizes.pop(key, 0)
+        self.timestamps.pop(key, None)
+        self.used_generation.pop(key, None)
+        self.children.pop(key, None)
+        self._count(self.classes.pop(key, None), "evictions")
 
     def poll(self, ram_headroom):
         def _ram_gb():
             return psutil.virtual_memory().available / (1024**3)
 
-        if _ram_gb() > ram_headroom:
+        def _over_budget(target):
+            return self.max_bytes > 0 and self.total_bytes > target
+
+        low_ram = _ram_gb() < ram_headroom
+        if low_ram:
+            gc.collect()
+            low_ram = _ram_gb() < ram_headroom
+        if not low_ram and not _over_budget(self.max_bytes):
             return
-        gc.collect()
-        if _ram_gb() > ram_headroom:
+
+        heap = []
+        for index, key in enumerate(self.cache):
+            oom_score = RAM_CACHE_OLD_WORKFLOW_OOM_MULTIPLIER ** (self.generation - self.used_generation.get(key, self.generation))
+            oom_score *= self.sizes.get(key, RAM_CACHE_MIN_ENTRY_BYTES)
+            #Break OOM score ties on the last touch timestamp (pure LRU)
+            heap.append((-oom_score, self.timestamps.get(key, 0), index, key))
+        heapq.heapify(heap)
+
+        def _under_pressure():
+            if _over_budget(self.max_bytes / RAM_CACHE_HYSTERESIS):
+                return True
+            return low_ram and _ram_gb() < ram_headroom * RAM_CACHE_HYSTERESIS
+
+        while heap and _under_pressure():
+            _, _, _, key = heapq.heappop(heap)
+            if not low_ram and self.used_generation.get(key) == self.generation:
+                #The budget alone never evicts what the running prompt uses;
+                #it would just be executed again
+                continue
+            self._evict(key)
+            if low_ram:
+                gc.collect()
+
+    def stats(self):
+        return {
+            "entries": len(self.cache),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "classes": {class_type: dict(counts) for class_type, counts in list(self.class_stats.items())},
+        }
+
+
+#Bump when the on-disk entry format changes so old entries are never read back
+DISK_CACHE_FORMAT = 1
+
+class DiskCache:
+    """A persistent tier under an in-memory output cache.
+
+    Outputs of non-output nodes that are plain tensors, numbers, strings and
+    containers of those (conditioning, latents, decoded images) are written to
+    a content-addressed DiskStore, named by the node's signature digest. They
+    survive restarts: a miss in memory is looked up on disk and loaded back
+    into the memory cache.
+
+    Signatures only name model files, so the digest also covers the path,
+    size and mtime of every model file the node or its ancestors load: a
+    checkpoint replaced under the same name gets new entries.
+    """
+
+    def __init__(self, inner, store):
+        self.inner = inner
+        self.store = store
+        self._checked = set()
+        self._files = {}
+        self._node_files = {}
+
+    def _model_files(self, value):
+        """(path, size, mtime) of the model files an input string names"""
+        found = self._files.get(value)
+        if found is None:
+            found = set()
+            extension = os.path.splitext(value)[1].lower()
+            if extension and len(value) < 4096:
+                for folder_name, (_, extensions) in list(folder_paths.folder_names_and_paths.items()):
+                    if extensions and extension not in extensions:
+                        continue
+                    path = folder_paths.get_full_path(folder_name, value)
+                    if path is not None:
+                        stat = os.stat(path)
+                        found.add((path, stat.st_size, stat.st_mtime_ns))
+            self._files[value] = found = frozenset(found)
+        return found
+
+    def _files_behind(self, node_id):
+        """The model files loaded by node_id and its ancestors"""
+        dynprompt = self.inner.dynprompt
+        memo = self._node_files
+        stack, visiting = [node_id], set()
+        while stack:
+            current = stack[-1]
+            if current in memo:
+                stack.pop()
+                continue
+            inputs = dynprompt.get_node(current).get("inputs", {}) if dynprompt.has_node(current) else {}
+            parents = [value[0] for value in inputs.values() if is_link(value)]
+            visiting.add(current)
+            pending = [p for p in parents if p not in memo and p not in visiting]
+            if pending:
+                stack.extend(pending)
+                continue
+            stack.pop()
+            files = set()
+            for value in inputs.values():
+                if isinstance(value, str):
+                    files |= self._model_files(value)
+            for parent in parents:
+                files |= memo.get(parent, frozenset())
+            memo[current] = frozenset(files)
+        return memo[node_id]
+
+    def _digest(self, node_id):
+        key = self.inner.cache_key_set.get_data_key(node_id)
+        if not isinstance(key, bytes):
+            # Uncacheable, or a node created by an expansion in a subcache
+            return None
+        digest = hashlib.blake2b(key, digest_size=20, person=b"comfy-disk-%d" % DISK_CACHE_FORMAT)
+        files = self._files_behind(node_id)
+        if files:
+            digest.update(repr(sorted(files)).encode())
+        return digest.hexdigest()
+
+    def flush(self):
+        """Wait for queued writes to reach the disk"""
+        self.store.flush()
+
+    async def set_prompt(self, dynprompt, node_ids, is_changed_cache):
+        self._checked = set()
+        # Model files are stat'ed again for every prompt
+        self._files = {}
+        self._node_files = {}
+        await self.inner.set_prompt(dynprompt, node_ids, is_changed_cache)
+
+    def all_node_ids(self):
+        return self.inner.all_node_ids()
+
+    def clean_unused(self):
+        self.inner.clean_unused()
+
+    def poll(self, **kwargs):
+        self.inner.poll(**kwargs)
+
+    def get(self, node_id):
+        value = self.inner.get(node_id)
+        if value is not None or node_id in self._checked:
+            return value
+        digest = self._digest(node_id)
+        if digest is None or digest not in self.store:
+            # Only look a node up once per prompt if it is not on disk
+            self._checked.add(node_id)
+            return None
+        data = self.store.load(digest)
+        if data is None:
+            return None
+        value = CacheEntry(ui=None, outputs=data["outputs"])
+        self.inner.set(node_id, value)
+        return value
+
+    def _spillable(self, node_id, value):
+        # Output nodes and UI results point at files (e.g. previews in temp/)
+        # that may be gone after a restart; those always run again
+        if value.ui is not None:
+            return False
+        class_def = nodes.NODE_CLASS_MAPPINGS[self.inner.dynprompt.get_node(node_id)["class_type"]]
+        if getattr(class_def, "OUTPUT_NODE", False) is True:
+            return False
+        return disk_serializable(value.outputs)
+
+    def set(self, node_id, value):
+        self.inner.set(node_id, value)
+        digest = self._digest(node_id)
+        if digest is None or not self._spillable(node_id, value):
             return
+        self.store.save(digest, {"outputs": value.outputs})
 
-        clean_list = []
-
-        for key, (outputs, _), in self.cache.items():
-            oom_score =  RAM_CACHE_OLD_WORKFLOW_OOM_MULTIPLIER ** (self.generation - self.used_generation[key])
-
-            ram_usage = RAM_CACHE_DEFAULT_RAM_USAGE
-            def scan_list_for_ram_usage(outputs):
-                nonlocal ram_usage
-                if outputs is None:
-                    return
-                for output in outputs:
-                    if isinstance(output, list):
-                        scan_list_for_ram_usage(output)
-                    elif isinstance(output, torch.Tensor) and output.device.type == 'cpu':
-                        #score Tensors at a 50% discount for RAM usage as they are likely to
-                        #be high value intermediates
-                        ram_usage += (output.numel() * output.element_size()) * 0.5
-                    elif hasattr(output, "get_ram_usage"):
-                        ram_usage += output.get_ram_usage()
-            scan_list_for_ram_usage(outputs)
-
-            oom_score *= ram_usage
-            #In the case where we have no information on the node ram usage at all,
-            #break OOM score ties on the last touch timestamp (pure LRU)
-            bisect.insort(clean_list, (oom_score, self.timestamps[key], key))
-
-        while _ram_gb() < ram_headroom * RAM_CACHE_HYSTERESIS and clean_list:
-            _, _, key = clean_list.pop()
-            del self.cache[key]
-            gc.collect()
+    async def ensure_subcache_for(self, node_id, children_ids):
+        return await self.inner.ensure_subcache_for(node_id, children_ids)
+
+    def recursive_debug_dump(self):
+        return self.inner.recursive_debug_dump()
+
+    def stats(self):
+        result = {"disk": self.store.stats()}
+        if hasattr(self.inner, "stats"):
+            result["memory"] = self.inner.stats()
+        return result
@@ -3,6 +3,10 @@ Job utilities for the /api/jobs endpoint.
 Provides normalization and helper functions for job status tracking.
 """
 
+import bisect
+import heapq
+import itertools
+import json
 from typing import Optional
 
 from comfy_api.internal import prune_dict
@@ -19,6 +23,10 @@ class JobStatus:
     ALL = [PENDING, IN_PROGRESS, COMPLETED, FAILED, CANCELLED]
 
 
+# Statuses of jobs that have left the queue and are kept in the history
+HISTORY_STATUSES = frozenset({JobStatus.COMPLETED, JobStatus.FAILED, JobStatus.CANCELLED})
+
+
 # Media types that can be previewed in the frontend
 PREVIEWABLE_MEDIA_TYPES = frozenset({'images', 'video', 'audio'})
 
@@ -189,20 +197,19 @@ def get_outputs_summary(outputs: dict) -> tuple[int, Optional[dict]]:
     return count, preview_output or fallback_preview
 
 
+def get_sort_key(job: dict, sort_by: str):
+    """The value jobs are ordered by for sort_by ('created_at' or 'execution_duration')."""
+    if sort_by == 'execution_duration':
+        start = job.get('execution_start_time', 0)
+        end = job.get('execution_end_time', 0)
+        return end - start if end and start else 0
+    return job.get('create_time', 0)
+
+
 def apply_sorting(jobs: list[dict], sort_by: str, sort_order: str) -> list[dict]:
     """Sort jobs list by specified field and order."""
     reverse = (sort_order == 'desc')
-
-    if sort_by == 'execution_duration':
-        def get_sort_key(job):
-            start = job.get('execution_start_time', 0)
-            end = job.get('execution_end_time', 0)
-            return end - start if end and start else 0
-    else:
-        def get_sort_key(job):
-            return job.get('create_time', 0)
-
-    return sorted(jobs, key=get_sort_key, reverse=reverse)
+    return sorted(jobs, key=lambda job: get_sort_key(job, sort_by), reverse=reverse)
 
 
 def get_job(prompt_id: str, running: list, queued: list, history: dict) -> Optional[dict]:
@@ -273,8 +280,7 @@ def get_all_jobs(
         for item in queued:
             jobs.append(normalize_queue_item(item, JobStatus.PENDING))
 
-    history_statuses = {JobStatus.COMPLETED, JobStatus.FAILED, JobStatus.CANCELLED}
-    requested_history_statuses = history_statuses & set(status_filter)
+    requested_history_statuses = HISTORY_STATUSES & set(status_filter)
     if requested_history_statuses:
         for prompt_id, history_item in history.items():
             job = normalize_history_item(prompt_id, history_item)
@@ -294,3 +300,149 @@ def get_all_jobs(
         jobs = jobs[:limit]
 
     return (jobs, total_count)
+
+
+SORT_FIELDS = ('created_at', 'execution_duration')
+
+
+class JobIndex:
+    """
+    Normalized job summaries kept up to date as jobs are queued, run and finish.
+
+    Each summary is built once, when the job changes status, and shared by
+    every query afterwards; callers must not modify it. Summaries are kept in
+    sorted lists per (sort field, status) and per (sort field, status,
+    workflow_id), so a query merges at most five presorted lists instead of
+    normalizing and sorting every job. Ties are broken by the order jobs were
+    first added.
+
+    Not thread-safe: PromptQueue updates and queries it under its mutex.
+    """
+
+    def __init__(self):
+        self._jobs = {}
+        self._sorted = {}
+        self._seq = itertools.count()
+
+    def __len__(self):
+        return len(self._jobs)
+
+    def __contains__(self, prompt_id):
+        return prompt_id in self._jobs
+
+    def get(self, prompt_id: str) -> Optional[dict]:
+        """The summary of a job, or None."""
+        entry = self._jobs.get(prompt_id)
+        return entry[0] if entry is not None else None
+
+    def set(self, job: dict):
+        """Add a normalized job, replacing the previous summary with the same id."""
+        prompt_id = job['id']
+        previous = self._jobs.get(prompt_id)
+        seq = previous[1] if previous is not None else next(self._seq)
+        if previous is not None:
+            self.remove(prompt_id)
+        self._jobs[prompt_id] = (job, seq)
+        for index_key, entry in self._entries(job, seq):
+            bisect.insort(self._sorted.setdefault(index_key, []), entry)
+
+    def remove(self, prompt_id: str):
+        entry = self._jobs.pop(prompt_id, None)
+        if entry is None:
+            return
+        for index_key, sort_entry in self._entries(*entry):
+            entries = self._sorted[index_key]
+            del entries[bisect.bisect_left(entries, sort_entry)]
+            if not entries:
+                del self._sorted[index_key]
+
+    def clear(self, statuses=None):
+        """Remove every job, or only the jobs with one of statuses."""
+        if statuses is None:
+            self._jobs.clear()
+            self._sorted.clear()
+            return
+        for prompt_id in [k for k, (job, _) in self._jobs.items() if job['status'] in statuses]:
+            self.remove(prompt_id)
+
+    def _entries(self, job, seq):
+        status = job['status']
+        workflow_id = job.get('workflow_id')
+        for sort_by in SORT_FIELDS:
+            entry = (get_sort_key(job, sort_by), seq, job['id'])
+            yield (sort_by, status, None), entry
+            if workflow_id is not None:
+                yield (sort_by, status, workflow_id), entry
+
+    def query(
+        self,
+        status_filter: Optional[list[str]] = None,
+        workflow_id: Optional[str] = None,
+        sort_by: str = "created_at",
+        sort_order: str = "desc",
+        limit: Optional[int] = None,
+        offset: int = 0,
+        cursor: Optional[str] = None
+    ) -> tuple[list[dict], int, Optional[str]]:
+        """
+        Jobs matching the filters, in order, like get_all_jobs.
+
+        Args:
+            status_filter: List of statuses to include (from JobStatus.ALL)
+            workflow_id: Filter by workflow ID
+            sort_by: Field to sort by ('created_at', 'execution_duration')
+            sort_order: 'asc' or 'desc'
+            limit: Maximum number of items to return
+            offset: Number of items to skip (after the cursor, if any)
+            cursor: next_cursor of a previous page; resumes right after its last job
+
+        Returns:
+            tuple: (jobs_list, total_count, next_cursor). total_count ignores
+            the cursor; next_cursor is None on the last page.
+
+        Raises:
+            ValueError: if cursor is malformed
+        """
+        if status_filter is None:
+            status_filter = JobStatus.ALL
+        descending = sort_order == 'desc'
+        start = None
+        if cursor is not None:
+            start = self._parse_cursor(cursor)
+
+        lists = []
+        total = 0
+        for status in dict.fromkeys(status_filter):
+            entries = self._sorted.get((sort_by, status, workflow_id))
+            if not entries:
+                continue
+            total += len(entries)
+            lists.append(self._iterate(entries, start, descending))
+
+        merged = heapq.merge(*lists, reverse=descending)
+        stop = None if limit is None else offset + limit
+        page = list(itertools.islice(merged, offset, stop))
+        next_cursor = None
+        if page and limit is not None and next(merged, None) is not None:
+            key, seq, _ = page[-1]
+            next_cursor = json.dumps([key, seq], separators=(',', ':'))
+        return [self._jobs[prompt_id][0] for _, _, prompt_id in page], total, next_cursor
+
+    @staticmethod
+    def _parse_cursor(cursor):
+        try:
+            key, seq = json.loads(cursor)
+        except (TypeError, ValueError):
+            raise ValueError("invalid cursor")
+        if not isinstance(key, (int, float)) or not isinstance(seq, int):
+            raise ValueError("invalid cursor")
+        return key, seq
+
+    @staticmethod
+    def _iterate(entries, start, descending):
+        """Entries after start (a (key, seq) cursor position) in the requested order."""
+        if descending:
+            end = len(entries) if start is None else bisect.bisect_left(entries, start)
+            return (entries[i] for i in range(end - 1, -1, -1))
+        begin = 0 if start is None else bisect.bisect_left(entries, (start[0], start[1] + 1))
+        return itertools.islice(entries, begin, None)
@@ -1,6 +1,7 @@
 import copy
 import heapq
 import inspect
+import itertools
 import logging
 import sys
 import threading
@@ -13,12 +14,15 @@ import asyncio
 import torch
 
 import comfy.model_management
+from comfy.disk_store import DiskStore
 from latent_preview import set_preview_method
 import nodes
 from comfy_execution.caching import (
     BasicCache,
+    CacheEntry,
     CacheKeySetID,
     CacheKeySetInputSignature,
+    DiskCache,
     NullCache,
     HierarchicalCache,
     LRUCache,
@@ -31,6 +35,7 @@ from comfy_execution.graph import (
     get_input_info,
 )
 from comfy_execution.graph_utils import GraphBuilder, is_link
+from comfy_execution.jobs import HISTORY_STATUSES, JobIndex, JobStatus, normalize_history_item, normalize_queue_item
 from comfy_execution.validation import validate_node_input
 from comfy_execution.progress import get_progress_state, reset_progress_state, add_progress_handler, WebUIProgressHandler
 from comfy_execution.utils import CurrentNodeContext
@@ -90,11 +95,6 @@ class IsChangedCache:
         return self.is_changed[node_id]
 
 
-class CacheEntry(NamedTuple):
-    ui: dict
-    outputs: list
-
-
 class CacheType(Enum):
     CLASSIC = 0
     LRU = 1
@@ -103,13 +103,13 @@ class CacheType(Enum):
 
 
 class CacheSet:
-    def __init__(self, cache_type=None, cache_args={}):
+    def __init__(self, cache_type=None, cache_args={}, disk_store=None):
         if cache_type == CacheType.NONE:
             self.init_null_cache()
             logging.info("Disabling intermediate node cache.")
         elif cache_type == CacheType.RAM_PRESSURE:
             cache_ram = cache_args.get("ram", 16.0)
-            self.init_ram_cache(cache_ram)
+            self.init_ram_cache(cache_ram, int(cache_args.get("ram_budget", 0) * 1024**3))
             logging.info("Using RAM pressure cache.")
         elif cache_type == CacheType.LRU:
             cache_size = cache_args.get("lru", 0)
@@ -118,6 +118,9 @@ class CacheSet:
         else:
             self.init_classic_cache()
 
+        if disk_store is not None and cache_type != CacheType.NONE:
+            self.outputs = DiskCache(self.outputs, disk_store)
+
         self.all = [self.outputs, self.objects]
 
     # Performs like the old cache -- dump data ASAP
@@ -129,8 +132,8 @@ class CacheSet:
         self.outputs = LRUCache(CacheKeySetInputSignature, max_size=cache_size)
         self.objects = HierarchicalCache(CacheKeySetID)
 
-    def init_ram_cache(self, min_headroom):
-        self.outputs = RAMPressureCache(CacheKeySetInputSignature)
+    def init_ram_cache(self, min_headroom, max_bytes=0):
+        self.outputs = RAMPressureCache(CacheKeySetInputSignature, max_bytes=max_bytes)
         self.objects = HierarchicalCache(CacheKeySetID)
 
     def init_null_cache(self):
@@ -143,6 +146,12 @@ class CacheSet:
         }
         return result
 
+    def stats(self):
+        """Counters of the output cache, if it keeps any"""
+        if hasattr(self.outputs, "stats"):
+            return self.outputs.stats()
+        return None
+
 SENSITIVE_EXTRA_DATA_KEYS = ("auth_token_comfy_org", "api_key_comfy_org")
 
 def get_input_data(inputs, class_def, unique_id, execution_list=None, dynprompt=None, extra_data={}):
@@ -625,10 +634,17 @@ class PromptExecutor:
         self.cache_args = cache_args
         self.cache_type = cache_type
         self.server = server
+        # Outlives reset(), so the directory is scanned and its writer started once
+        self.disk_store = None
+        disk_directory = (cache_args or {}).get("disk")
+        if disk_directory and cache_type != CacheType.NONE:
+            disk_size = cache_args.get("disk_size", 10.0)
+            self.disk_store = DiskStore(disk_directory, int(disk_size * 1024**3), "disk-cache")
+            logging.info("Using disk cache in {} ({} GB max)".format(disk_directory, disk_size))
         self.reset()
 
     def reset(self):
-        self.caches = CacheSet(cache_type=self.cache_type, cache_args=self.cache_args)
+        self.caches = CacheSet(cache_type=self.cache_type, cache_args=self.cache_args, disk_store=self.disk_store)
         self.status_messages = []
         self.success = True
 
@@ -1116,11 +1132,16 @@ class PromptQueue:
         self.queue = []
         self.currently_running = {}
         self.history = {}
+        self.jobs = JobIndex()
         self.flags = {}
 
+    # Queued items are not modified until get() hands them to the executor, and running/history entries are
+    # copies taken at that point, so queue and job listings share them instead of copying
+
     def put(self, item):
         with self.mutex:
             heapq.heappush(self.queue, item)
+            self.jobs.set(normalize_queue_item(item[:5], JobStatus.PENDING))
             self.server.queue_updated()
             self.not_empty.notify()
 
@@ -1132,7 +1153,9 @@ class PromptQueue:
                     return None
             item = heapq.heappop(self.queue)
             i = self.task_counter
+            # The executor writes state (is_changed) into item's prompt; running and history keep a clean copy
             self.currently_running[i] = copy.deepcopy(item)
+            self.jobs.set(normalize_queue_item(item[:5], JobStatus.IN_PROGRESS))
             self.task_counter += 1
             self.server.queue_updated()
             return (item, i)
@@ -1147,7 +1170,7 @@ class PromptQueue:
         with self.mutex:
             prompt = self.currently_running.pop(item_id)
             if len(self.history) > MAXIMUM_HISTORY_SIZE:
-                self.history.pop(next(iter(self.history)))
+                self._remove_history_item(next(iter(self.history)))
 
             status_dict: Optional[dict] = None
             if status is not None:
@@ -1162,15 +1185,29 @@ class PromptQueue:
                 'status': status_dict,
             }
             self.history[prompt[1]].update(history_result)
+            self._index_history_item(prompt[1])
             self.server.queue_updated()
 
-    # Note: slow
+    def _index_history_item(self, prompt_id):
+        entry = self.history[prompt_id]
+        self.jobs.set(normalize_history_item(prompt_id, dict(entry, prompt=entry["prompt"][:5])))
+
+    def _remove_history_item(self, prompt_id):
+        if self.history.pop(prompt_id, None) is not None and self._job_finished(prompt_id):
+            self.jobs.remove(prompt_id)
+
+    def _job_finished(self, prompt_id):
+        job = self.jobs.get(prompt_id)
+        return job is not None and job['status'] in HISTORY_STATUSES
+
+    def _remove_queued_job(self, prompt_id):
+        # A prompt id can be queued again while an earlier run is still in the history
+        self.jobs.remove(prompt_id)
+        if prompt_id in self.history:
+            self._index_history_item(prompt_id)
+
     def get_current_queue(self):
-        with self.mutex:
-            out = []
-            for x in self.currently_running.values():
-                out += [x]
-            return (out, copy.deepcopy(self.queue))
+        return self.get_current_queue_volatile()
 
     # read-safe as long as queue items are immutable
     def get_current_queue_volatile(self):
@@ -1185,6 +1222,8 @@ class PromptQueue:
 
     def wipe_queue(self):
         with self.mutex:
+            for item in self.queue:
+                self._remove_queued_job(item[1])
             self.queue = []
             self.server.queue_updated()
 
@@ -1195,8 +1234,9 @@ class PromptQueue:
                     if len(self.queue) == 1:
                         self.wipe_queue()
                     else:
-                        self.queue.pop(x)
+                        item = self.queue.pop(x)
                         heapq.heapify(self.queue)
+                        self._remove_queued_job(item[1])
                     self.server.queue_updated()
                     return True
         return False
@@ -1204,19 +1244,23 @@ class PromptQueue:
     def get_history(self, prompt_id=None, max_items=None, offset=-1, map_function=None):
         with self.mutex:
             if prompt_id is None:
-                out = {}
-                i = 0
+                count = len(self.history)
                 if offset < 0 and max_items is not None:
-                    offset = len(self.history) - max_items
-                for k in self.history:
-                    if i >= offset:
-                        p = self.history[k]
-                        if map_function is not None:
-                            p = map_function(p)
-                        out[k] = p
-                        if max_items is not None and len(out) >= max_items:
-                            break
-                    i += 1
+                    offset = count - max_items
+                offset = min(max(offset, 0), count)
+                stop = count if max_items is None else min(count, offset + max_items)
+                if offset > count // 2:
+                    # Recent entries (the usual request): walk back from the end
+                    keys = list(itertools.islice(reversed(self.history), count - stop, count - offset))
+                    keys.reverse()
+                else:
+                    keys = itertools.islice(self.history, offset, stop)
+                out = {}
+                for k in keys:
+                    p = self.history[k]
+                    if map_function is not None:
+                        p = map_function(p)
+                    out[k] = p
                 return out
             elif prompt_id in self.history:
                 p = self.history[prompt_id]
@@ -1228,13 +1272,26 @@ class PromptQueue:
             else:
                 return {}
 
+    def get_job(self, prompt_id):
+        """A job by prompt id, with full details if it has finished, or None"""
+        with self.mutex:
+            if prompt_id in self.history:
+                return normalize_history_item(prompt_id, self.history[prompt_id], include_outputs=True)
+            return self.jobs.get(prompt_id)
+
+    def get_jobs(self, **kwargs):
+        """JobIndex.query over the queued, running and finished jobs"""
+        with self.mutex:
+            return self.jobs.query(**kwargs)
+
     def wipe_history(self):
         with self.mutex:
             self.history = {}
+            self.jobs.clear(HISTORY_STATUSES)
 
     def delete_history_item(self, id_to_delete):
         with self.mutex:
-            self.history.pop(id_to_delete, None)
+            self._remove_history_item(id_to_delete)
 
     def set_flag(self, name, data):
         with self.mutex:
@@ -174,6 +174,7 @@ if 'torch' in sys.modules:
     logging.warning("WARNING: Potential Error in code: Torch already imported, torch should never be imported before this point.")
 
 import comfy.utils
+import comfy.conditioning_cache
 
 import execution
 import server
@@ -206,7 +207,16 @@ def prompt_worker(q, server_instance):
     elif args.cache_none:
         cache_type = execution.CacheType.NONE
 
-    e = execution.PromptExecutor(server_instance, cache_type=cache_type, cache_args={ "lru" : args.cache_lru, "ram" : args.cache_ram } )
+    cache_disk = None
+    if args.cache_disk is not None:
+        cache_disk = os.path.abspath(args.cache_disk) if args.cache_disk else os.path.join(folder_paths.base_path, "cache", "outputs")
+
+    if args.cache_conditioning_dir is not None and comfy.conditioning_cache.conditioning_cache.max_bytes > 0:
+        cache_conditioning_dir = os.path.abspath(args.cache_conditioning_dir) if args.cache_conditioning_dir else os.path.join(folder_paths.base_path, "cache", "conditioning")
+        comfy.conditioning_cache.conditioning_cache.persist_to(cache_conditioning_dir, comfy.conditioning_cache.DISK_MAX_BYTES)
+
+    e = execution.PromptExecutor(server_instance, cache_type=cache_type, cache_args={ "lru" : args.cache_lru, "ram" : args.cache_ram, "ram_budget" : args.cache_ram_budget, "disk" : cache_disk, "disk_size" : args.cache_disk_size } )
+    server_instance.prompt_executor = e
     last_gc_collect = 0
     need_gc = False
     gc_collect_interval = 10.0
@@ -261,6 +271,7 @@ def prompt_worker(q, server_instance):
 
         if free_memory:
             e.reset()
+            comfy.conditioning_cache.conditioning_cache.clear()
             need_gc = True
             last_gc_collect = 0
 
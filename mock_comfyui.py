@@ -0,0 +1,485 @@
+#!/usr/bin/env python3
+"""
+Mock ComfyUI backend for load-testing simple_generator without a GPU
+
+Speaks the part of ComfyUI's API the generator uses: /prompt, /queue,
+/history, /upload/image, /view, /interrupt, /free, /system_stats and the
+/ws event stream (execution events, step progress and latent previews).
+Prompts run one at a time per worker in ComfyUI's queue order (lowest
+"number" first). Each prompt sleeps through its sampler steps and then
+writes small synthetic outputs for its save nodes, so the generator's
+gallery, /output/ and history paths see real files.
+
+Latency and failures can be injected: a fixed delay on every HTTP
+request, a fraction of HTTP 500s, and a fraction of prompts that fail
+with an execution error.
+
+Usage:
+  python mock_comfyui.py                               # Serve on :8188 like ComfyUI
+  python mock_comfyui.py --port 8189 --steps 8 --step-time 0.05 --load-time 1
+  python mock_comfyui.py --latency 0.02 --http-error-rate 0.01 --fail-rate 0.05
+  python benchmark_server.py --load --users 200        # Load test against an in-process mock
+"""
+
+import argparse
+import asyncio
+import heapq
+import itertools
+import json
+import os
+import random
+import struct
+import tempfile
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+
+from aiohttp import WSMsgType, web
+
+MAX_HISTORY = 10000
+
+# Sampler nodes report step progress; save nodes write a synthetic output
+SAMPLER_TYPES = ('KSampler', 'KSamplerAdvanced', 'SamplerCustom', 'SamplerCustomAdvanced')
+# class_type -> (file extension, key in the node's UI output)
+SAVE_TYPES = {
+    'SaveImage': ('png', 'images'),
+    'SaveAnimatedWEBP': ('webp', 'images'),
+    'SaveWEBM': ('webm', 'images'),
+    'SaveVideo': ('mp4', 'images'),
+    'SaveAudio': ('flac', 'audio'),
+    'SaveAudioMP3': ('mp3', 'audio'),
+    'SaveAudioOpus': ('opus', 'audio'),
+    'SaveGLB': ('glb', '3d'),
+}
+LOADER_SUFFIXES = ('Loader', 'LoaderGGUF', 'LoaderSimple', 'LoaderModelOnly')
+
+# BinaryEventTypes in ComfyUI's server.py
+PREVIEW_IMAGE = 1
+PREVIEW_IMAGE_WITH_METADATA = 4
+
+
+def synthetic_png(size=64, seed=0):
+    """A small solid-colour PNG, coloured by seed"""
+    rng = random.Random(seed)
+    pixel = bytes(rng.randrange(256) for _ in range(3))
+    rows = b''.join(b'\x00' + pixel * size for _ in range(size))
+
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    header = struct.pack('>IIBBBBB', size, size, 8, 2, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) + chunk(b'IDAT', zlib.compress(rows)) + chunk(b'IEND', b'')
+
+
+def synthetic_output(extension, seed, size=4096):
+    """Bytes for a synthetic output file (only PNGs are valid media)"""
+    if extension == 'png':
+        return synthetic_png(seed=seed)
+    return random.Random(seed).randbytes(size)
+
+
+class MockComfyUI:
+    """In-memory ComfyUI stand-in; `app()` builds the aiohttp application"""
+
+    def __init__(self, output_dir, input_dir=None, steps=4, step_time=0.02, load_time=0.0, latency=0.0,
+                 fail_rate=0.0, http_error_rate=0.0, workers=1, previews=True, seed=None):
+        self.output_dir = output_dir
+        self.input_dir = input_dir or os.path.join(output_dir, 'input')
+        self.steps = steps
+        self.step_time = step_time
+        self.load_time = load_time
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.http_error_rate = http_error_rate
+        self.workers = workers
+        self.previews = previews
+        self.rng = random.Random(seed)
+        self.number = 0
+        self.sequence = itertools.count()
+        self.pending = []
+        self.running = {}
+        self.history = OrderedDict()
+        self.sockets = {}
+        self.metadata_clients = set()
+        self.interrupted = set()
+        self.loaded = set()
+        self.file_counter = itertools.count(1)
+        self.stats = {'prompts': 0, 'completed': 0, 'failed': 0, 'interrupted': 0, 'http_errors': 0}
+        self._wakeup = None
+
+    def app(self):
+        app = web.Application(middlewares=[self._inject], client_max_size=1024 ** 3)
+        app.router.add_get('/ws', self.websocket)
+        app.router.add_post('/prompt', self.post_prompt)
+        app.router.add_get('/prompt', self.get_prompt)
+        app.router.add_get('/queue', self.get_queue)
+        app.router.add_post('/queue', self.post_queue)
+        app.router.add_get('/history', self.get_history)
+        app.router.add_get('/history/{prompt_id}', self.get_history_entry)
+        app.router.add_post('/history', self.post_history)
+        app.router.add_post('/interrupt', self.post_interrupt)
+        app.router.add_post('/free', self.post_free)
+        app.router.add_post('/upload/image', self.upload_image)
+        app.router.add_get('/view', self.view)
+        app.router.add_get('/system_stats', self.system_stats)
+        app.on_startup.append(self._start_workers)
+        return app
+
+    @web.middleware
+    async def _inject(self, request, handler):
+        if request.path == '/ws':
+            return await handler(request)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.http_error_rate and self.rng.random() < self.http_error_rate:
+            self.stats['http_errors'] += 1
+            return web.json_response({"error": "injected failure"}, status=500)
+        return await handler(request)
+
+    async def _start_workers(self, app):
+        self._wakeup = asyncio.Condition()
+        for _ in range(self.workers):
+            asyncio.ensure_future(self._worker())
+
+    # ------------------------------------------------------------------
+    # Events
+    # ------------------------------------------------------------------
+
+    def queue_info(self):
+        return {"exec_info": {"queue_remaining": len(self.pending) + len(self.running)}}
+
+    async def send(self, event, data, client_id=None):
+        targets = self.sockets.get(client_id, set()) if client_id else set().union(*self.sockets.values())
+        message = json.dumps({"type": event, "data": data})
+        for ws in list(targets):
+            try:
+                await ws.send_str(message)
+            except Exception:
+                pass
+
+    async def send_preview(self, prompt_id, node_id, client_id):
+        for ws in list(self.sockets.get(client_id, ())):
+            image = b'\xff\xd8\xff\xe0' + os.urandom(512)
+            if ws in self.metadata_clients:
+                metadata = json.dumps({"node_id": node_id, "prompt_id": prompt_id, "image_type": "image/jpeg"}).encode()
+                message = struct.pack('>I', PREVIEW_IMAGE_WITH_METADATA) + struct.pack('>I', len(metadata)) + metadata + image
+            else:
+                message = struct.pack('>I', PREVIEW_IMAGE) + struct.pack('>I', 1) + image
+            try:
+                await ws.send_bytes(message)
+            except Exception:
+                pass
+
+    async def websocket(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        client_id = request.query.get('clientId') or uuid.uuid4().hex
+        self.sockets.setdefault(client_id, set()).add(ws)
+        try:
+            await ws.send_str(json.dumps({"type": "status", "data": {"status": self.queue_info(), "sid": client_id}}))
+            async for message in ws:
+                if message.type == WSMsgType.TEXT:
+                    data = json.loads(message.data)
+                    if data.get('type') == 'feature_flags' and data.get('data', {}).get('supports_preview_metadata'):
+                        self.metadata_clients.add(ws)
+        finally:
+            self.sockets.get(client_id, set()).discard(ws)
+            self.metadata_clients.discard(ws)
+        return ws
+
+    # ------------------------------------------------------------------
+    # Queue
+    # ------------------------------------------------------------------
+
+    async def post_prompt(self, request):
+        data = await request.json()
+        prompt = data.get('prompt')
+        if not isinstance(prompt, dict) or not prompt:
+            return web.json_response({"error": {"type": "invalid_prompt", "message": "Invalid prompt"},
+                                      "node_errors": {}}, status=400)
+        if 'number' in data:
+            number = float(data['number'])
+        else:
+            number = self.number
+            if data.get('front'):
+                number = -number
+            self.number += 1
+        prompt_id = data.get('prompt_id') or str(uuid.uuid4())
+        extra_data = dict(data.get('extra_data', {}), client_id=data.get('client_id'))
+        outputs = [node_id for node_id, node in prompt.items() if node.get('class_type') in SAVE_TYPES]
+        heapq.heappush(self.pending, (number, next(self.sequence), prompt_id, prompt, extra_data, outputs))
+        self.stats['prompts'] += 1
+        async with self._wakeup:
+            self._wakeup.notify()
+        await self.send('status', {"status": self.queue_info()})
+        return web.json_response({"prompt_id": prompt_id, "number": number, "node_errors": {}})
+
+    async def get_prompt(self, request):
+        return web.json_response(self.queue_info())
+
+    def _queue_item(self, item):
+        number, _, prompt_id, prompt, extra_data, outputs = item
+        return [number, prompt_id, prompt, extra_data, outputs]
+
+    async def get_queue(self, request):
+        return web.json_response({
+            "queue_running": [self._queue_item(item) for item in self.running.values()],
+            "queue_pending": [self._queue_item(item) for item in sorted(self.pending)],
+        })
+
+    async def post_queue(self, request):
+        data = await request.json()
+        if data.get('clear'):
+            self.pending = []
+        if 'delete' in data:
+            doomed = set(data['delete'])
+            self.pending = [item for item in self.pending if item[2] not in doomed]
+            heapq.heapify(self.pending)
+        return web.Response(status=200)
+
+    async def post_interrupt(self, request):
+        try:
+            data = await request.json()
+        except json.JSONDecodeError:
+            data = {}
+        prompt_id = data.get('prompt_id')
+        if prompt_id:
+            if prompt_id in self.running:
+                self.interrupted.add(prompt_id)
+        else:
+            self.interrupted.update(self.running)
+        return web.Response(status=200)
+
+    async def post_free(self, request):
+        data = await request.json()
+        if data.get('unload_models') or data.get('free_memory'):
+            self.loaded.clear()
+        return web.Response(status=200)
+
+    # ------------------------------------------------------------------
+    # Execution
+    # ------------------------------------------------------------------
+
+    async def _worker(self):
+        while True:
+            async with self._wakeup:
+                await self._wakeup.wait_for(lambda: self.pending)
+                item = heapq.heappop(self.pending)
+            self.running[item[2]] = item
+            try:
+                await self._execute(item)
+            finally:
+                self.running.pop(item[2], None)
+                self.interrupted.discard(item[2])
+            await self.send('status', {"status": self.queue_info()})
+
+    async def _execute(self, item):
+        number, _, prompt_id, prompt, extra_data, outputs_to_execute = item
+        client_id = extra_data.get('client_id')
+        messages = []
+
+        async def event(name, data, record=False):
+            data = dict(data, prompt_id=prompt_id)
+            if record:
+                data['timestamp'] = int(time.time() * 1000)
+                messages.append((name, data))
+            await self.send(name, data, client_id)
+
+        await event('execution_start', {}, record=True)
+        await event('execution_cached', {"nodes": []}, record=True)
+        loaders = {json.dumps(node.get('inputs'), sort_keys=True, default=str)
+                   for node in prompt.values() if node.get('class_type', '').endswith(LOADER_SUFFIXES)}
+        fail_at = self.rng.random() < self.fail_rate
+        outputs = {}
+        status = 'success'
+        for node_id, node in prompt.items():
+            class_type = node.get('class_type', '')
+            await event('executing', {"node": node_id, "display_node": node_id})
+            if class_type.endswith(LOADER_SUFFIXES) and not loaders <= self.loaded and self.load_time:
+                await asyncio.sleep(self.load_time)
+                self.loaded |= loaders
+            if class_type in SAMPLER_TYPES:
+                if fail_at:
+                    status = 'error'
+                    await event('execution_error', {
+                        "node_id": node_id, "node_type": class_type, "executed": [],
+                        "exception_message": "Injected failure", "exception_type": "RuntimeError",
+                        "traceback": [], "current_inputs": {}, "current_outputs": {}}, record=True)
+                    break
+                for step in range(1, self.steps + 1):
+                    if prompt_id in self.interrupted:
+                        break
+                    await asyncio.sleep(self.step_time)
+                    await event('progress', {"value": step, "max": self.steps, "node": node_id})
+                    await event('progress_state', {"nodes": {node_id: {
+                        "value": step, "max": self.steps, "state": "running", "node_id": node_id,
+                        "prompt_id": prompt_id, "display_node_id": node_id, "parent_node_id": None,
+                        "real_node_id": node_id}}})
+                    if self.previews:
+                        await self.send_preview(prompt_id, node_id, client_id)
+            if prompt_id in self.interrupted:
+                status = 'interrupted'
+                await event('execution_interrupted', {"node_id": node_id, "node_type": class_type,
+                                                      "executed": list(outputs)}, record=True)
+                break
+            if class_type in SAVE_TYPES:
+                outputs[node_id] = self._save_output(node, number)
+                await event('executed', {"node": node_id, "display_node": node_id, "output": outputs[node_id]})
+
+        if status == 'success':
+            await event('execution_success', {}, record=True)
+            self.stats['completed'] += 1
+        else:
+            self.stats['failed' if status == 'error' else 'interrupted'] += 1
+        self.history[prompt_id] = {
+            "prompt": [number, prompt_id, prompt, extra_data, outputs_to_execute],
+            "outputs": outputs if status == 'success' else {},
+            "status": {"status_str": 'success' if status == 'success' else 'error',
+                       "completed": status == 'success', "messages": messages},
+            "meta": {},
+        }
+        while len(self.history) > MAX_HISTORY:
+            self.history.popitem(last=False)
+        # ComfyUI reports the prompt finished once its history entry is written
+        await event('executing', {"node": None})
+
+    def _save_output(self, node, seed):
+        extension, key = SAVE_TYPES[node['class_type']]
+        prefix = str(node.get('inputs', {}).get('filename_prefix', 'ComfyUI'))
+        subfolder, _, name = prefix.rpartition('/')
+        directory = os.path.join(self.output_dir, subfolder)
+        os.makedirs(directory, exist_ok=True)
+        filename = f"{name}_{next(self.file_counter):05}_.{extension}"
+        with open(os.path.join(directory, filename), 'wb') as f:
+            f.write(synthetic_output(extension, int(seed)))
+        output = {key: [{"filename": filename, "subfolder": subfolder, "type": "output"}]}
+        if node['class_type'] in ('SaveWEBM', 'SaveAnimatedWEBP', 'SaveVideo'):
+            output['animated'] = [True]
+        return output
+
+    # ------------------------------------------------------------------
+    # History, files and stats
+    # ------------------------------------------------------------------
+
+    async def get_history(self, request):
+        max_items = request.query.get('max_items')
+        items = list(self.history.items())
+        if max_items:
+            items = items[-int(max_items):]
+        return web.json_response(dict(items))
+
+    async def get_history_entry(self, request):
+        prompt_id = request.match_info['prompt_id']
+        entry = self.history.get(prompt_id)
+        return web.json_response({prompt_id: entry} if entry is not None else {})
+
+    async def post_history(self, request):
+        data = await request.json()
+        if data.get('clear'):
+            self.history.clear()
+        for prompt_id in data.get('delete', []):
+            self.history.pop(prompt_id, None)
+        return web.Response(status=200)
+
+    async def upload_image(self, request):
+        reader = await request.multipart()
+        os.makedirs(self.input_dir, exist_ok=True)
+        async for part in reader:
+            if part.name != 'image':
+                continue
+            filename = os.path.basename(part.filename or f"upload_{uuid.uuid4().hex}.png")
+            with open(os.path.join(self.input_dir, filename), 'wb') as f:
+                while True:
+                    chunk = await part.read_chunk()
+                    if not chunk:
+                        break
+                    f.write(chunk)
+            return web.json_response({"name": filename, "subfolder": "", "type": "input"})
+        return web.Response(status=400)
+
+    async def view(self, request):
+        base = self.input_dir if request.query.get('type') == 'input' else self.output_dir
+        path = os.path.realpath(os.path.join(base, request.query.get('subfolder', ''),
+                                             os.path.basename(request.query.get('filename', ''))))
+        if not path.startswith(os.path.realpath(base)) or not os.path.isfile(path):
+            return web.Response(status=404)
+        return web.FileResponse(path)
+
+    async def system_stats(self, request):
+        gib = 1024 ** 3
+        vram_used = (6 if self.loaded else 1) * gib
+        return web.json_response({
+            "system": {"os": "mock", "ram_total": 64 * gib, "ram_free": 48 * gib, "comfyui_version": "mock",
+                       "python_version": "", "pytorch_version": "mock", "embedded_python": False, "argv": []},
+            "devices": [{"name": "mock", "type": "cuda", "index": 0, "vram_total": 24 * gib,
+                         "vram_free": 24 * gib - vram_used, "torch_vram_total": 24 * gib,
+                         "torch_vram_free": 24 * gib - vram_used}],
+        })
+
+
+def start_mock_comfyui(port=0, host='127.0.0.1', output_dir=None, **config):
+    """Run a MockComfyUI on a background thread; returns (mock, url, stop)"""
+    output_dir = output_dir or tempfile.mkdtemp(prefix='mock_comfyui_')
+    mock = MockComfyUI(output_dir, **config)
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+    holder = {}
+
+    async def serve():
+        runner = web.AppRunner(mock.app(), access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, host, port)
+        await site.start()
+        holder['runner'] = runner
+        holder['port'] = site._server.sockets[0].getsockname()[1]
+        started.set()
+
+    def run():
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(serve())
+        loop.run_forever()
+
+    threading.Thread(target=run, name='mock-comfyui', daemon=True).start()
+    started.wait(10)
+
+    async def shutdown():
+        # Open websockets would otherwise hold up the runner's cleanup
+        for ws in [ws for sockets in mock.sockets.values() for ws in sockets]:
+            await ws.close()
+        await holder['runner'].cleanup()
+
+    def stop():
+        asyncio.run_coroutine_threadsafe(shutdown(), loop).result(30)
+        loop.call_soon_threadsafe(loop.stop)
+
+    return mock, f"http://{host}:{holder['port']}", stop
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock ComfyUI backend for load-testing simple_generator")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8188)
+    parser.add_argument("--output-dir", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "output"),
+                        help="Where synthetic outputs are written (default: the generator's output/)")
+    parser.add_argument("--steps", type=int, default=4, help="Sampler steps per prompt")
+    parser.add_argument("--step-time", type=float, default=0.02, help="Seconds per sampler step")
+    parser.add_argument("--load-time", type=float, default=0.0, help="Seconds to 'load' models when they change")
+    parser.add_argument("--latency", type=float, default=0.0, help="Delay added to every HTTP request (seconds)")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Fraction of prompts that fail while sampling")
+    parser.add_argument("--http-error-rate", type=float, default=0.0, help="Fraction of HTTP requests answered with 500")
+    parser.add_argument("--workers", type=int, default=1, help="Prompts executed concurrently (simulated GPUs)")
+    parser.add_argument("--no-previews", action="store_true", help="Do not send latent previews")
+    parser.add_argument("--seed", type=int, help="Seed for failure injection")
+    args = parser.parse_args()
+
+    mock = MockComfyUI(args.output_dir, steps=args.steps, step_time=args.step_time, load_time=args.load_time,
+                       latency=args.latency, fail_rate=args.fail_rate, http_error_rate=args.http_error_rate,
+                       workers=args.workers, previews=not args.no_previews, seed=args.seed)
+    print(f"Mock ComfyUI on http://{args.host}:{args.port} (outputs in {args.output_dir})")  # noqa: T201
+    web.run_app(mock.app(), host=args.host, port=args.port, print=None, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,7 +7,7 @@ import time
 import nodes
 import folder_paths
 import execution
-from comfy_execution.jobs import JobStatus, get_job, get_all_jobs
+from comfy_execution.jobs import JobStatus
 import uuid
 import urllib
 import json
@@ -28,6 +28,7 @@ import mimetypes
 from comfy.cli_args import args
 import comfy.utils
 import comfy.model_management
+from comfy.conditioning_cache import conditioning_cache
 from comfy_api import feature_flags
 import node_helpers
 from comfyui_version import __version__
@@ -207,6 +208,7 @@ class PromptServer():
         self.internal_routes = InternalRoutes(self)
         self.supports = ["custom_nodes_from_web"]
         self.prompt_queue = execution.PromptQueue(self)
+        self.prompt_executor = None
         self.loop = loop
         self.messages = asyncio.Queue()
         self.client_session:Optional[aiohttp.ClientSession] = None
@@ -637,7 +639,9 @@ class PromptServer():
                         "torch_vram_total": torch_vram_total,
                         "torch_vram_free": torch_vram_free,
                     }
-                ]
+                ],
+                "cache": self.prompt_executor.caches.stats() if self.prompt_executor is not None else None,
+                "conditioning_cache": conditioning_cache.stats(),
             }
             return web.json_response(system_stats)
 
@@ -716,6 +720,7 @@ class PromptServer():
                 sort_order: Sort direction: asc, desc (default)
                 limit: Max items to return (positive integer)
                 offset: Items to skip (non-negative integer, default 0)
+                cursor: pagination.next_cursor of the previous page; continues after its last job
             """
             query = request.rel_url.query
 
@@ -775,23 +780,21 @@ class PromptServer():
                         status=400
                     )
 
-            running, queued = self.prompt_queue.get_current_queue_volatile()
-            history = self.prompt_queue.get_history()
-
-            running = _remove_sensitive_from_queue(running)
-            queued = _remove_sensitive_from_queue(queued)
-
-            jobs, total = get_all_jobs(
-                running, queued, history,
-                status_filter=status_filter,
-                workflow_id=workflow_id,
-                sort_by=sort_by,
-                sort_order=sort_order,
-                limit=limit,
-                offset=offset
-            )
-
-            has_more = (offset + len(jobs)) < total
+            try:
+                jobs, total, next_cursor = self.prompt_queue.get_jobs(
+                    status_filter=status_filter,
+                    workflow_id=workflow_id,
+                    sort_by=sort_by,
+                    sort_order=sort_order,
+                    limit=limit,
+                    offset=offset,
+                    cursor=query.get('cursor')
+                )
+            except ValueError:
+                return web.json_response(
+                    {"error": "cursor must be a next_cursor returned by a previous request"},
+                    status=400
+                )
 
             return web.json_response({
                 'jobs': jobs,
@@ -799,7 +802,8 @@ class PromptServer():
                     'offset': offset,
                     'limit': limit,
                     'total': total,
-                    'has_more': has_more
+                    'has_more': next_cursor is not None,
+                    'next_cursor': next_cursor
                 }
             })
 
@@ -813,13 +817,7 @@ class PromptServer():
                     status=400
                 )
 
-            running, queued = self.prompt_queue.get_current_queue_volatile()
-            history = self.prompt_queue.get_history(prompt_id=job_id)
-
-            running = _remove_sensitive_from_queue(running)
-            queued = _remove_sensitive_from_queue(queued)
-
-            job = get_job(job_id, running, queued, history)
+            job = self.prompt_queue.get_job(job_id)
             if job is None:
                 return web.json_response(
                     {"error": "Job not found"},
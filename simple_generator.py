@@ -6,27 +6,83 @@ Access from other devices: http://<your-ip>:8080
 """
 
 import json
-import urllib.request
+import http.client
 import urllib.parse
 import os
+import random
+import re
+import socket
+import sqlite3
 import sys
 import time
 import threading
 import webbrowser
 import base64
-from http.server import HTTPServer, SimpleHTTPRequestHandler
+import binascii
+import gzip
+import email.utils
+import hashlib
+import queue
+import struct
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait as wait_futures
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
 import subprocess
 
+try:
+    import websocket  # NOTE: websocket-client (https://github.com/websocket-client/websocket-client)
+except ImportError:
+    websocket = None
+
+try:
+    from PIL import Image  # Gallery thumbnails; without it the grid shows full-size images
+except ImportError:
+    Image = None
+
+try:
+    import brotli  # Optional; the page is still served gzip-compressed without it
+except ImportError:
+    brotli = None
+
 COMFYUI_URL = "http://127.0.0.1:8188"
 OUTPUT_DIR = os.path.join(os.path.dirname(__file__), "output")
 FAVORITES_FILE = os.path.join(os.path.dirname(__file__), "favorites.json")
 HISTORY_FILE = os.path.join(os.path.dirname(__file__), "prompt_history.json")
+INPUT_DIR = os.path.join(os.path.dirname(__file__), "input")
+# Optional API-format workflow exports that replace the built-in graphs
+WORKFLOWS_DIR = os.path.join(os.path.dirname(__file__), "workflows")
+# SQLite database for the gallery index
+DB_FILE = os.path.join(os.path.dirname(__file__), "generator.db")
+THUMB_DIR = os.path.join(os.path.dirname(__file__), "thumbnails")
+
+# Front server concurrency limits. Long-running waits (/wait, /edit, ...) may
+# only use MAX_LONG_WAITS of the MAX_CONNECTIONS slots so short requests like
+# /health, /gallery and /progress always have headroom.
+MAX_CONNECTIONS = 256
+MAX_LONG_WAITS = 192
+
+# Media served from /output/
+MEDIA_TYPES = {
+    '.png': 'image/png',
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.gif': 'image/gif',
+    '.webp': 'image/webp',
+    '.mp4': 'video/mp4',
+    '.webm': 'video/webm',
+    '.flac': 'audio/flac',
+    '.mp3': 'audio/mpeg',
+    '.opus': 'audio/opus',
+    '.wav': 'audio/wav',
+    '.glb': 'model/gltf-binary',
+    '.gltf': 'model/gltf+json',
+}
+# Outputs never change once written (ComfyUI picks a new filename each time)
+OUTPUT_CACHE_CONTROL = 'public, max-age=31536000, immutable'
 
 # Note: Seed storage moved to client-side localStorage
 
-# Prompt history (in-memory, synced to file)
-prompt_history = []
-
 # Quick presets
 PRESETS = {
     'quick': {'mode': 'lightning', 'resolution': 512, 'aspect': 'square', 'name': 'Quick Preview'},
@@ -1301,6 +1357,24 @@ HTML_PAGE = '''<!DOCTYPE html>
             transform: scale(1.05);
         }
 
+        /* Generation details under an opened gallery image */
+        .modal-meta {
+            display: none;
+            position: absolute;
+            bottom: var(--space-6);
+            left: 50%;
+            transform: translateX(-50%);
+            max-width: min(720px, 90%);
+            background: rgba(30, 30, 50, 0.9);
+            backdrop-filter: blur(20px);
+            padding: var(--space-3) var(--space-4);
+            border-radius: var(--radius-lg);
+            border: 1px solid var(--glass-border);
+            cursor: default;
+        }
+        .modal-meta-prompt { font-size: var(--text-footnote); max-height: 4.5em; overflow-y: auto; }
+        .modal-meta-details { font-size: var(--text-caption); color: var(--text-tertiary); margin: var(--space-1) 0 var(--space-2); }
+
         /* Modal content panel - standardized */
         .modal-panel {
             background: rgba(30, 30, 50, 0.98);
@@ -2654,6 +2728,7 @@ HTML_PAGE = '''<!DOCTYPE html>
                     <button type="button" onclick="refineLocal('refine')" title="Refine with AI" class="ai-float-btn">AI</button>
                     <button type="button" onclick="refineLocal('expand')" title="Expand prompt" class="ai-float-btn">+</button>
                     <button type="button" onclick="refineLocal('style')" title="Add style" class="ai-float-btn">S</button>
+                    <button type="button" onclick="refineVariants()" title="Compare refine, expand and style side by side" class="ai-float-btn">V</button>
                 </div>
             </div>
 
@@ -3290,6 +3365,7 @@ Dancing to our favorite song"></textarea>
     <div class="modal" id="imageModal" onclick="closeModal()">
         <span class="modal-close">&times;</span>
         <img id="modalImage" src="">
+        <div id="modalMeta" class="modal-meta" onclick="event.stopPropagation()"></div>
     </div>
 
     <!-- Gallery Picker Modal for Edit Tab -->
@@ -3445,6 +3521,18 @@ Dancing to our favorite song"></textarea>
     </div>
 
     <!-- Generate Templates Modal -->
+    <!-- Refinement Variants Modal -->
+    <div class="modal" id="refineVariantsModal" onclick="closeRefineVariants(event)">
+        <div class="modal-panel modal-panel-compact" onclick="event.stopPropagation()">
+            <div class="modal-header">
+                <h3>Prompt Variants</h3>
+                <button class="modal-close-btn" onclick="closeRefineVariants()">&times;</button>
+            </div>
+            <p class="modal-description">Pick the version to use.</p>
+            <div id="refineVariantsList"></div>
+        </div>
+    </div>
+
     <div class="modal" id="generateTemplatesModal" onclick="closeGenerateTemplates(event)">
         <div class="modal-panel modal-panel-compact" onclick="event.stopPropagation()">
             <div class="modal-header">
@@ -3516,22 +3604,65 @@ Dancing to our favorite song"></textarea>
         let lastSeed = null;
         let lastPrompt = '';
         let uploadedImageData = null;
+        // Cached locally for instant startup; the server copy is authoritative
         let favorites = JSON.parse(localStorage.getItem('qwen_favorites') || '[]');
         let promptHistory = JSON.parse(localStorage.getItem('qwen_history') || '[]');
+        const HISTORY_LOCAL_LIMIT = 200;
+        let historyTotal = promptHistory.length;
+
+        // Pull history and favorites from the server. Whatever only this
+        // browser knows about (from before they were stored server-side) is
+        // uploaded once so it shows up everywhere.
+        async function loadServerState() {
+            try {
+                const [historyResponse, favoritesResponse] = await Promise.all([
+                    fetch('/history?limit=' + HISTORY_LOCAL_LIMIT), fetch('/favorites')]);
+                const historyData = await historyResponse.json();
+                const favoritesData = await favoritesResponse.json();
+
+                const localOnly = promptHistory.filter(item => !item.id);
+                if (localOnly.length > 0 && historyData.total === 0) {
+                    for (const item of localOnly.slice().reverse()) {
+                        await fetch('/history', { method: 'POST', headers: {'Content-Type': 'application/json'}, body: JSON.stringify(item) });
+                    }
+                    return loadServerState();
+                }
+                promptHistory = historyData.history;
+                localStorage.setItem('qwen_history', JSON.stringify(promptHistory));
+                historyTotal = historyData.total;
+                document.getElementById('historyCount').textContent = '(' + historyTotal + ')';
+
+                if (favoritesData.favorites.length === 0 && favorites.length > 0) {
+                    fetch('/favorite', { method: 'POST', headers: {'Content-Type': 'application/json'}, body: JSON.stringify({favorites}) });
+                } else {
+                    favorites = favoritesData.favorites;
+                    localStorage.setItem('qwen_favorites', JSON.stringify(favorites));
+                }
+            } catch (e) {
+                console.log('Using locally cached history and favorites');
+            }
+        }
+        loadServerState();
 
         // Connection Status Check
+        let startupPoll = null;
         async function checkConnection() {
             const dot = document.getElementById('statusDot');
             const text = document.getElementById('statusText');
             try {
                 const response = await fetch('/health', { timeout: 3000 });
                 const data = await response.json();
+                const stage = data.startup ? data.startup.stage : null;
                 if (data.comfyui) {
                     dot.className = 'status-dot connected';
-                    text.textContent = 'Connected';
+                    text.textContent = stage === 'warming' ? 'Warming up models...' : 'Connected';
                 } else {
                     dot.className = 'status-dot disconnected';
-                    text.textContent = 'ComfyUI offline';
+                    text.textContent = stage === 'starting' ? 'ComfyUI starting...' : 'ComfyUI offline';
+                }
+                // Poll quickly until the backend is fully up
+                if ((stage === 'starting' || stage === 'warming') && !startupPoll) {
+                    startupPoll = setTimeout(() => { startupPoll = null; checkConnection(); }, 3000);
                 }
             } catch (e) {
                 dot.className = 'status-dot disconnected';
@@ -3698,12 +3829,7 @@ Dancing to our favorite song"></textarea>
                     if (!queueData.prompt_id) throw new Error(queueData.error || 'Failed to queue');
 
                     currentPromptId = queueData.prompt_id;
-                    progressInterval = setInterval(pollProgress, 500);
-
-                    const response = await fetch('/wait?prompt_id=' + currentPromptId);
-                    const data = await response.json();
-
-                    clearInterval(progressInterval);
+                    const data = await waitForResult(currentPromptId, '/wait', renderProgress);
 
                     if (data.success) {
                         item.status = 'done';
@@ -3827,20 +3953,17 @@ Dancing to our favorite song"></textarea>
             promptEl.placeholder = providerName + ' is enhancing your prompt...';
 
             try {
-                const response = await fetch('/refine', {
-                    method: 'POST',
-                    headers: {'Content-Type': 'application/json'},
-                    body: JSON.stringify({ prompt: prompt, mode: mode, provider: provider })
-                });
-                const data = await response.json();
+                const data = await refineStreaming(prompt, mode, provider, promptEl);
 
                 if (data.success) {
                     promptEl.value = data.refined;
-                    showToast('Prompt Enhanced', 'Your prompt has been refined', 'success');
+                    showToast('Prompt Enhanced', data.cached ? 'Reused an earlier refinement' : 'Your prompt has been refined', 'success');
                 } else {
+                    promptEl.value = prompt;
                     showToast('Refinement Failed', data.error || 'Unknown error', 'error');
                 }
             } catch (e) {
+                promptEl.value = prompt;
                 showToast('Error', e.message, 'error');
             }
 
@@ -3853,29 +3976,126 @@ Dancing to our favorite song"></textarea>
             promptEl.placeholder = 'Describe your image... e.g., A majestic dragon flying over mountains at sunset';
         }
 
+        // Stream a refinement from /refine-stream, showing the words as they
+        // arrive. Returns the final result like /refine does.
+        async function refineStreaming(prompt, mode, provider, promptEl) {
+            const body = JSON.stringify({ prompt: prompt, mode: mode, provider: provider });
+            const response = await fetch('/refine-stream', {
+                method: 'POST',
+                headers: {'Content-Type': 'application/json'},
+                body: body
+            });
+            if (!response.ok || !response.body) {
+                // No streaming support: fall back to the one-shot endpoint
+                const fallback = await fetch('/refine', { method: 'POST', headers: {'Content-Type': 'application/json'}, body: body });
+                return fallback.json();
+            }
+            const NL = String.fromCharCode(10);
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            let streamed = '';
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                let end;
+                while ((end = buffer.indexOf(NL + NL)) !== -1) {
+                    const message = buffer.slice(0, end);
+                    buffer = buffer.slice(end + 2);
+                    let event = 'message';
+                    let data = '';
+                    message.split(NL).forEach(line => {
+                        if (line.startsWith('event: ')) event = line.slice(7);
+                        else if (line.startsWith('data: ')) data += line.slice(6);
+                    });
+                    if (!data) continue;
+                    const payload = JSON.parse(data);
+                    if (event === 'delta') {
+                        streamed += payload.text;
+                        promptEl.value = streamed.trimStart();
+                    } else if (event === 'done' || event === 'error') {
+                        reader.cancel();
+                        return payload;
+                    }
+                }
+            }
+            return { success: false, error: 'Refinement stream ended early' };
+        }
+
+        // Refine, expand and style the prompt at once and let the user pick one
+        let refineVariantResults = [];
+
+        async function refineVariants() {
+            if (isRefining) return;
+            const promptEl = document.getElementById('prompt');
+            const prompt = promptEl.value.trim();
+            if (!prompt) {
+                showToast('Missing Prompt', 'Enter a prompt first', 'warning');
+                return;
+            }
+            isRefining = true;
+            promptEl.style.opacity = '0.7';
+            try {
+                const response = await fetch('/refine-batch', {
+                    method: 'POST',
+                    headers: {'Content-Type': 'application/json'},
+                    body: JSON.stringify({ prompt: prompt, modes: ['refine', 'expand', 'style'] })
+                });
+                const data = await response.json();
+                if (!data.success) {
+                    showToast('Refinement Failed', data.error || (data.variants && data.variants[0].error) || 'Unknown error', 'error');
+                    return;
+                }
+                refineVariantResults = data.variants.filter(v => v.success);
+                const list = document.getElementById('refineVariantsList');
+                list.innerHTML = refineVariantResults.map((v, i) =>
+                    '<div class="history-item" onclick="useRefineVariant(' + i + ')">' +
+                    '<div class="history-item-text"><div class="refine-variant-text"></div>' +
+                    '<div class="history-meta">' + v.mode + (v.cached ? ' | cached' : ' | ' + (v.latency_ms / 1000).toFixed(1) + 's') + '</div></div></div>'
+                ).join('');
+                list.querySelectorAll('.refine-variant-text').forEach((el, i) => { el.textContent = refineVariantResults[i].refined; });
+                document.getElementById('refineVariantsModal').style.display = 'flex';
+            } catch (e) {
+                showToast('Error', e.message, 'error');
+            } finally {
+                isRefining = false;
+                promptEl.style.opacity = '1';
+            }
+        }
+
+        function useRefineVariant(index) {
+            document.getElementById('prompt').value = refineVariantResults[index].refined;
+            closeRefineVariants();
+        }
+
+        function closeRefineVariants(event) {
+            if (!event || event.target === event.currentTarget) {
+                document.getElementById('refineVariantsModal').style.display = 'none';
+            }
+        }
+
         // Local refinement (Qwen abliterated - uncensored)
         function refineLocal(mode) { refinePromptAI(mode, 'ollama'); }
 
         let historySearchTerm = '';
+        let historySearchTimer = null;
+        let historyView = [];  // the items currently shown in the dropdown
 
-        function renderHistory(searchTerm = '') {
+        function renderHistory(searchTerm = '', results = null) {
             const dropdown = document.getElementById('historyDropdown');
-            document.getElementById('historyCount').textContent = '(' + promptHistory.length + ')';
+            document.getElementById('historyCount').textContent = '(' + historyTotal + ')';
 
-            // Filter history based on search
-            const filtered = searchTerm
-                ? promptHistory.filter(item =>
-                    item.prompt.toLowerCase().includes(searchTerm.toLowerCase()) ||
-                    item.mode.toLowerCase().includes(searchTerm.toLowerCase()))
-                : promptHistory;
+            // Search results come from the server (full history); otherwise show the recent items
+            const filtered = results || promptHistory;
+            historyView = filtered;
 
             let html = '<div class="history-search"><input type="text" id="historySearchInput" placeholder="Search prompts..." value="' + (searchTerm || '') + '" oninput="filterHistory(this.value)"></div>';
 
             if (filtered.length === 0) {
                 html += '<div class="history-empty">' + (searchTerm ? 'No matching prompts' : 'No recent prompts') + '</div>';
             } else {
-                html += '<div class="history-list">' + filtered.slice(0, 20).map((item, i) => {
-                    const originalIndex = promptHistory.indexOf(item);
+                html += '<div class="history-list">' + filtered.slice(0, 50).map((item, originalIndex) => {
                     return '<div class="history-item">' +
                         '<div class="history-item-content">' +
                         '<div class="history-item-text" onclick="useHistoryPrompt(' + originalIndex + ')">' +
@@ -3893,28 +4113,49 @@ Dancing to our favorite song"></textarea>
 
         function filterHistory(term) {
             historySearchTerm = term;
-            renderHistory(term);
-            // Keep focus on search input
-            setTimeout(() => {
+            clearTimeout(historySearchTimer);
+            historySearchTimer = setTimeout(async () => {
+                let results = null;
+                if (term.trim()) {
+                    try {
+                        const response = await fetch('/history?limit=50&q=' + encodeURIComponent(term));
+                        results = (await response.json()).history;
+                    } catch (e) {
+                        const lower = term.toLowerCase();
+                        results = promptHistory.filter(item =>
+                            item.prompt.toLowerCase().includes(lower) || (item.mode || '').toLowerCase().includes(lower));
+                    }
+                }
+                if (term !== historySearchTerm) return;  // a newer search is on its way
+                renderHistory(term, results);
+                // Keep focus on search input
                 const input = document.getElementById('historySearchInput');
                 if (input) {
                     input.focus();
                     input.setSelectionRange(input.value.length, input.value.length);
                 }
-            }, 0);
+            }, 150);
         }
 
         async function deleteHistoryItem(index) {
+            const item = historyView[index];
+            if (!item) return;
             try {
                 const response = await fetch('/delete-history', {
                     method: 'POST',
                     headers: {'Content-Type': 'application/json'},
-                    body: JSON.stringify({index: index})
+                    body: JSON.stringify(item.id ? {id: item.id} : {index: promptHistory.indexOf(item)})
                 });
                 const data = await response.json();
                 if (data.success) {
                     promptHistory = data.history;
-                    renderHistory();
+                    historyTotal = data.total;
+                    localStorage.setItem('qwen_history', JSON.stringify(promptHistory));
+                    if (historySearchTerm.trim()) {
+                        filterHistory(historySearchTerm);
+                    } else {
+                        renderHistory();
+                    }
                 }
             } catch (e) {
                 console.log('Failed to delete history item');
@@ -3922,7 +4163,7 @@ Dancing to our favorite song"></textarea>
         }
 
         function useHistoryPrompt(index) {
-            const item = promptHistory[index];
+            const item = historyView[index];
             document.getElementById('prompt').value = item.prompt;
             document.getElementById('mode').value = item.mode;
             document.getElementById('resolution').value = item.resolution;
@@ -3935,11 +4176,21 @@ Dancing to our favorite song"></textarea>
         function addToHistory(prompt, mode, resolution, aspect, negativePrompt) {
             const item = { prompt, mode, resolution, aspect, negativePrompt, timestamp: Date.now() };
             // Remove duplicate if exists
+            const known = promptHistory.some(h => h.prompt === prompt);
             promptHistory = promptHistory.filter(h => h.prompt !== prompt);
             promptHistory.unshift(item);
-            promptHistory = promptHistory.slice(0, 20); // Keep last 20
+            if (!known) historyTotal++;
+            promptHistory = promptHistory.slice(0, HISTORY_LOCAL_LIMIT); // The server keeps everything
             localStorage.setItem('qwen_history', JSON.stringify(promptHistory));
-            fetch('/history', { method: 'POST', headers: {'Content-Type': 'application/json'}, body: JSON.stringify(item) });
+            fetch('/history', { method: 'POST', headers: {'Content-Type': 'application/json'}, body: JSON.stringify(item) })
+                .then(r => r.json())
+                .then(data => {
+                    if (data.success) {
+                        item.id = data.id;
+                        localStorage.setItem('qwen_history', JSON.stringify(promptHistory));
+                    }
+                })
+                .catch(() => {});
         }
 
         function updateEstimate() {
@@ -3973,11 +4224,57 @@ Dancing to our favorite song"></textarea>
             return Math.floor(seconds / 60) + 'm ' + Math.round(seconds % 60) + 's';
         }
 
-        async function pollProgress() {
-            if (!currentPromptId) return;
+        // Wait for a job over the /events stream (progress, previews, result),
+        // falling back to the blocking wait endpoint if the stream fails
+        function waitForResult(promptId, waitPath, onProgress, onPreview) {
+            return new Promise((resolve) => {
+                let settled = false;
+                let source = null;
+                const fallback = async () => {
+                    if (settled) return;
+                    settled = true;
+                    if (source) source.close();
+                    try {
+                        const response = await fetch(waitPath + '?prompt_id=' + promptId);
+                        resolve(await response.json());
+                    } catch (e) {
+                        resolve({ success: false, error: e.message });
+                    }
+                };
+                if (!window.EventSource) {
+                    fallback();
+                    return;
+                }
+                source = new EventSource('/events?prompt_id=' + encodeURIComponent(promptId));
+                source.addEventListener('progress', (e) => {
+                    if (onProgress) onProgress(JSON.parse(e.data));
+                });
+                source.addEventListener('preview', (e) => {
+                    if (onPreview) onPreview(JSON.parse(e.data).image);
+                });
+                source.addEventListener('done', (e) => {
+                    if (settled) return;
+                    settled = true;
+                    source.close();
+                    resolve(JSON.parse(e.data));
+                });
+                source.onerror = fallback;
+            });
+        }
+
+        function showLivePreview(src) {
+            if (totalBatchSize > 1) return;
+            const result = document.getElementById('result');
+            let preview = document.getElementById('livePreview');
+            if (!preview) {
+                result.innerHTML = '<img id="livePreview" alt="Preview">';
+                preview = document.getElementById('livePreview');
+            }
+            preview.src = src;
+        }
+
+        function renderProgress(data) {
             try {
-                const response = await fetch('/progress?prompt_id=' + currentPromptId);
-                const data = await response.json();
                 const progressFill = document.getElementById('progressFill');
                 const stepText = document.getElementById('stepText');
                 const timeRemaining = document.getElementById('timeRemaining');
@@ -3997,7 +4294,9 @@ Dancing to our favorite song"></textarea>
                     statusText.textContent = 'Generating...';
                     if (data.current_step > 0 && startTime) {
                         const elapsed = (Date.now() - startTime) / 1000;
-                        const remaining = (elapsed / data.current_step) * (data.total_steps - data.current_step);
+                        const remaining = data.eta_seconds != null
+                            ? data.eta_seconds
+                            : (elapsed / data.current_step) * (data.total_steps - data.current_step);
                         timeRemaining.textContent = '~' + formatTime(remaining) + ' left';
                     }
                 } else if (data.status === 'done') {
@@ -4011,11 +4310,8 @@ Dancing to our favorite song"></textarea>
         let currentBatchIndex = 0;
         let totalBatchSize = 1;
 
-        async function pollBatchProgress() {
-            if (!currentPromptId) return;
+        function renderBatchStepProgress(data) {
             try {
-                const response = await fetch('/progress?prompt_id=' + currentPromptId);
-                const data = await response.json();
                 const progressFill = document.getElementById('progressFill');
                 const stepText = document.getElementById('stepText');
                 const timeRemaining = document.getElementById('timeRemaining');
@@ -4051,7 +4347,9 @@ Dancing to our favorite song"></textarea>
                         : 'Generating...';
                     if (data.current_step > 0 && startTime) {
                         const elapsed = (Date.now() - startTime) / 1000;
-                        const remaining = (elapsed / data.current_step) * (data.total_steps - data.current_step);
+                        const remaining = data.eta_seconds != null
+                            ? data.eta_seconds
+                            : (elapsed / data.current_step) * (data.total_steps - data.current_step);
                         timeRemaining.textContent = '~' + formatTime(remaining) + ' left';
                     }
                 } else if (data.status === 'done') {
@@ -4153,12 +4451,7 @@ Dancing to our favorite song"></textarea>
                     currentPromptId = queueData.prompt_id;
                     seeds.push(queueData.seed);
                     startTime = Date.now(); // Reset start time for each image
-                    progressInterval = setInterval(pollBatchProgress, 500);
-
-                    const response = await fetch('/wait?prompt_id=' + currentPromptId);
-                    const data = await response.json();
-
-                    clearInterval(progressInterval);
+                    const data = await waitForResult(currentPromptId, '/wait', renderBatchStepProgress, showLivePreview);
 
                     if (data.success) {
                         generatedImages.push(data.image);
@@ -4228,10 +4521,19 @@ Dancing to our favorite song"></textarea>
             generate();
         }
 
+        // Cancels only this job: dequeued if still waiting, interrupted if running
+        function cancelJob(promptId) {
+            return fetch('/cancel', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ prompt_id: promptId })
+            });
+        }
+
         async function cancelGeneration() {
             if (!currentPromptId) return;
             try {
-                await fetch('/interrupt', { method: 'POST' });
+                await cancelJob(currentPromptId);
                 clearInterval(progressInterval);
                 currentPromptId = null;
                 document.getElementById('status').className = 'error';
@@ -4403,7 +4705,7 @@ Dancing to our favorite song"></textarea>
             fetch('/favorite', {
                 method: 'POST',
                 headers: {'Content-Type': 'application/json'},
-                body: JSON.stringify({filename, favorites})
+                body: JSON.stringify({filename, favorite: index === -1})
             });
         }
 
@@ -4661,12 +4963,8 @@ Dancing to our favorite song"></textarea>
                 currentVideoPromptId = queueData.prompt_id;
                 statusText.textContent = 'Generating video... This may take several minutes.';
 
-                // Poll for progress
-                pollVideoProgress(queueData.prompt_id);
-
-                // Wait for completion
-                const response = await fetch('/video-wait?prompt_id=' + queueData.prompt_id);
-                const data = await response.json();
+                // Stream progress and wait for completion
+                const data = await waitForResult(queueData.prompt_id, '/video-wait', renderVideoProgress);
 
                 if (data.success) {
                     statusText.textContent = 'Video generated!';
@@ -4696,35 +4994,25 @@ Dancing to our favorite song"></textarea>
             }
         }
 
-        async function pollVideoProgress(promptId) {
+        function renderVideoProgress(data) {
             const progressFill = document.getElementById('videoProgressFill');
             const stepText = document.getElementById('videoStepText');
             const percentText = document.getElementById('videoPercentText');
 
-            while (currentVideoPromptId === promptId) {
-                try {
-                    const response = await fetch('/progress?prompt_id=' + promptId);
-                    const data = await response.json();
-
-                    if (data.progress !== undefined) {
-                        const percent = Math.round(data.progress * 100);
-                        progressFill.style.width = percent + '%';
-                        percentText.textContent = percent + '%';
-                        if (data.current && data.total) {
-                            stepText.textContent = `Step ${data.current}/${data.total}`;
-                        }
-                    }
-                } catch (e) {
-                    // Ignore polling errors
+            if (data.progress !== undefined) {
+                const percent = Math.round(data.progress * 100);
+                progressFill.style.width = percent + '%';
+                percentText.textContent = percent + '%';
+                if (data.current_step && data.total_steps) {
+                    stepText.textContent = `Step ${data.current_step}/${data.total_steps}`;
                 }
-                await new Promise(r => setTimeout(r, 1000));
             }
         }
 
         async function cancelVideoGeneration() {
             if (currentVideoPromptId) {
                 try {
-                    await fetch('/interrupt', { method: 'POST' });
+                    await cancelJob(currentVideoPromptId);
                     showToast('Cancelled', 'Video generation cancelled', 'info');
                 } catch (e) {
                     // Ignore
@@ -4835,12 +5123,8 @@ Dancing to our favorite song"></textarea>
                 const usedSeed = queueResult.seed;
                 statusText.textContent = 'Generating music... (this may take 20-60 seconds)';
 
-                // Poll for progress
-                pollAudioProgress(promptId);
-
-                // Wait for completion
-                const waitResponse = await fetch('/audio-wait?prompt_id=' + promptId);
-                const waitResult = await waitResponse.json();
+                // Stream progress and wait for completion
+                const waitResult = await waitForResult(promptId, '/audio-wait', renderAudioProgress);
 
                 if (currentAudioPromptId !== promptId) {
                     return;
@@ -4879,29 +5163,17 @@ Dancing to our favorite song"></textarea>
             }
         }
 
-        async function pollAudioProgress(promptId) {
+        function renderAudioProgress(data) {
             const progressFill = document.getElementById('audioProgressBar');
-
-            while (currentAudioPromptId === promptId) {
-                try {
-                    const response = await fetch('/progress?prompt_id=' + promptId);
-                    const data = await response.json();
-
-                    if (data.progress !== undefined) {
-                        const percent = Math.round(data.progress * 100);
-                        progressFill.style.width = percent + '%';
-                    }
-                } catch (e) {
-                    // Ignore polling errors
-                }
-                await new Promise(r => setTimeout(r, 1000));
+            if (data.progress !== undefined) {
+                progressFill.style.width = Math.round(data.progress * 100) + '%';
             }
         }
 
         async function cancelAudioGeneration() {
             if (currentAudioPromptId) {
                 try {
-                    await fetch('/interrupt', { method: 'POST' });
+                    await cancelJob(currentAudioPromptId);
                     showToast('Cancelled', 'Audio generation cancelled', 'info');
                 } catch (e) {
                     // Ignore
@@ -4957,11 +5229,11 @@ Dancing to our favorite song"></textarea>
             const grid = document.getElementById('galleryPickerGrid');
             modal.classList.add('active');
 
-            fetch('/gallery').then(r => r.json()).then(images => {
-                grid.innerHTML = images.map(item => {
+            fetch('/gallery?limit=200').then(r => r.json()).then(page => {
+                grid.innerHTML = page.images.map(item => {
                     const q = String.fromCharCode(39);
                     return '<div class="gallery-item gallery-item-compact" onclick="select3DFromGallery(' + q + item.filename + q + ')">' +
-                        '<img src="/output/' + item.filename + '">' +
+                        '<img src="/thumb/' + encodeURIComponent(item.filename) + '?size=160" loading="lazy">' +
                         '</div>';
                 }).join('');
             });
@@ -5031,12 +5303,8 @@ Dancing to our favorite song"></textarea>
                 current3DPromptId = promptId;
                 statusText.textContent = 'Generating 3D model... (this may take 1-3 minutes)';
 
-                // Poll for progress
-                poll3DProgress(promptId);
-
-                // Wait for completion
-                const waitResponse = await fetch('/3d-wait?prompt_id=' + promptId);
-                const waitResult = await waitResponse.json();
+                // Stream progress and wait for completion
+                const waitResult = await waitForResult(promptId, '/3d-wait', render3DProgress);
 
                 if (current3DPromptId !== promptId) {
                     return;
@@ -5078,29 +5346,17 @@ Dancing to our favorite song"></textarea>
             }
         }
 
-        async function poll3DProgress(promptId) {
+        function render3DProgress(data) {
             const progressFill = document.getElementById('3dProgressBar');
-
-            while (current3DPromptId === promptId) {
-                try {
-                    const response = await fetch('/progress?prompt_id=' + promptId);
-                    const data = await response.json();
-
-                    if (data.progress !== undefined) {
-                        const percent = Math.round(data.progress * 100);
-                        progressFill.style.width = percent + '%';
-                    }
-                } catch (e) {
-                    // Ignore polling errors
-                }
-                await new Promise(r => setTimeout(r, 1000));
+            if (data.progress !== undefined) {
+                progressFill.style.width = Math.round(data.progress * 100) + '%';
             }
         }
 
         async function cancel3DGeneration() {
             if (current3DPromptId) {
                 try {
-                    await fetch('/interrupt', { method: 'POST' });
+                    await cancelJob(current3DPromptId);
                     showToast('Cancelled', '3D generation cancelled', 'info');
                 } catch (e) {
                     // Ignore
@@ -5141,38 +5397,94 @@ Dancing to our favorite song"></textarea>
             return new Date(timestamp * 1000).toLocaleDateString();
         }
 
-        async function loadGallery() {
+        let galleryCursor = null;
+        let galleryFilter = 'all';
+        let galleryLoading = false;
+        let galleryObserver = null;
+        const GALLERY_PAGE_SIZE = 120;
+        const galleryEmptyMessages = {
+            'all': 'No images yet. Generate some!',
+            'recent': 'No images from the last 24 hours',
+            'favorites': 'No favorites yet. Mark some as favorites!',
+            'lightning': 'No Lightning mode images',
+            'normal': 'No Normal mode images',
+            'edit': 'No edited images'
+        };
+
+        function galleryQuery(filter) {
+            const params = ['limit=' + GALLERY_PAGE_SIZE];
+            if (filter === 'recent') params.push('since=' + (Date.now() / 1000 - 86400));
+            else if (filter === 'favorites') favorites.forEach(name => params.push('name=' + encodeURIComponent(name)));
+            else if (filter !== 'all') params.push('mode=' + filter);
+            return params;
+        }
+
+        function galleryItemHtml(item) {
+            const img = item.filename;
+            const type = item.mode || getImageType(img);
+            const q = String.fromCharCode(39);
+            const timeAgo = formatRelativeTime(item.timestamp);
+            const size = formatFileSize(item.size);
+            const typeBadge = type === 'lightning' ? 'Lightning' : type === 'edit' ? 'Edit' : 'Normal';
+            return '<div class="gallery-item" data-type="' + type + '" data-filename="' + img + '" data-timestamp="' + item.timestamp + '">' +
+                '<img src="/thumb/' + encodeURIComponent(img) + '" loading="lazy" onclick="handleGalleryClick(' + q + img + q + ')">' +
+                '<div class="gallery-actions">' +
+                '<span class="favorite-star" onclick="event.stopPropagation(); toggleFavorite(' + q + img + q + ')">' + (favorites.includes(img) ? '★' : '☆') + '</span>' +
+                '<span class="delete-btn" onclick="event.stopPropagation(); deleteImage(' + q + img + q + ')">×</span>' +
+                '</div>' +
+                '<div class="gallery-type-badge">' + typeBadge + '</div>' +
+                '<div class="gallery-info"><div class="gallery-info-text"><span>' + timeAgo + '</span><span>' + size + '</span></div></div>' +
+                '</div>';
+        }
+
+        async function loadGallery(more) {
+            if (galleryLoading || (more && !galleryCursor)) return;
+            if (galleryFilter === 'favorites' && favorites.length === 0) {
+                galleryData = [];
+                galleryCursor = null;
+                document.getElementById('gallery').innerHTML = '<div class="gallery-empty">' + galleryEmptyMessages.favorites + '</div>';
+                return;
+            }
+            galleryLoading = true;
             try {
-                const response = await fetch('/gallery');
-                galleryData = await response.json();
+                const params = galleryQuery(galleryFilter);
+                if (more) params.push('cursor=' + encodeURIComponent(galleryCursor));
+                const response = await fetch('/gallery?' + params.join('&'));
+                const page = await response.json();
+                galleryData = more ? galleryData.concat(page.images) : page.images;
+                galleryCursor = page.next_cursor;
                 const gallery = document.getElementById('gallery');
                 const countEl = document.getElementById('galleryCount');
-                if (countEl) countEl.textContent = '(' + galleryData.length + ')';
+                if (countEl && galleryFilter === 'all') countEl.textContent = '(' + page.total + ')';
 
+                const oldSentinel = document.getElementById('gallerySentinel');
+                if (oldSentinel) oldSentinel.remove();
                 if (galleryData.length === 0) {
-                    gallery.innerHTML = '<div class="gallery-empty">No images yet. Generate some!</div>';
+                    gallery.innerHTML = '<div class="gallery-empty">' + (galleryEmptyMessages[galleryFilter] || 'No images') + '</div>';
                     return;
                 }
-
-                gallery.innerHTML = galleryData.map(item => {
-                    const img = item.filename;
-                    const type = getImageType(img);
-                    const q = String.fromCharCode(39);
-                    const timeAgo = formatRelativeTime(item.timestamp);
-                    const size = formatFileSize(item.size);
-                    const typeBadge = type === 'lightning' ? 'Lightning' : type === 'edit' ? 'Edit' : 'Normal';
-                    return '<div class="gallery-item" data-type="' + type + '" data-filename="' + img + '" data-timestamp="' + item.timestamp + '">' +
-                        '<img src="/output/' + img + '" onclick="handleGalleryClick(' + q + img + q + ')">' +
-                        '<div class="gallery-actions">' +
-                        '<span class="favorite-star" onclick="event.stopPropagation(); toggleFavorite(' + q + img + q + ')">' + (favorites.includes(img) ? '★' : '☆') + '</span>' +
-                        '<span class="delete-btn" onclick="event.stopPropagation(); deleteImage(' + q + img + q + ')">×</span>' +
-                        '</div>' +
-                        '<div class="gallery-type-badge">' + typeBadge + '</div>' +
-                        '<div class="gallery-info"><div class="gallery-info-text"><span>' + timeAgo + '</span><span>' + size + '</span></div></div>' +
-                        '</div>';
-                }).join('');
+                const html = page.images.map(galleryItemHtml).join('');
+                if (more) gallery.insertAdjacentHTML('beforeend', html);
+                else gallery.innerHTML = html;
+                annotateGallery(page.images);
+
+                // Fetch the next page when the end of the grid scrolls into view
+                if (galleryCursor) {
+                    gallery.insertAdjacentHTML('beforeend', '<div id="gallerySentinel" class="gallery-empty"><button class="btn-sm" onclick="loadGallery(true)">Load more</button></div>');
+                    if ('IntersectionObserver' in window) {
+                        if (!galleryObserver) {
+                            galleryObserver = new IntersectionObserver(entries => {
+                                if (entries.some(e => e.isIntersecting)) loadGallery(true);
+                            }, { rootMargin: '600px' });
+                        }
+                        galleryObserver.disconnect();
+                        galleryObserver.observe(document.getElementById('gallerySentinel'));
+                    }
+                }
             } catch (e) {
-                document.getElementById('gallery').innerHTML = '<div class="gallery-empty">Could not load gallery</div>';
+                if (!more) document.getElementById('gallery').innerHTML = '<div class="gallery-empty">Could not load gallery</div>';
+            } finally {
+                galleryLoading = false;
             }
         }
 
@@ -5180,46 +5492,16 @@ Dancing to our favorite song"></textarea>
             if (compareMode) {
                 addToCompare(img);
             } else {
-                openModal('/output/' + img);
+                openModal('/output/' + img, img);
             }
         }
 
         function filterGallery(filter) {
             document.querySelectorAll('.filter-tab').forEach(t => t.classList.remove('active'));
             event.target.classList.add('active');
-            const now = Date.now() / 1000;
-            const oneDayAgo = now - 86400;
-            let visibleCount = 0;
-
-            document.querySelectorAll('.gallery-item').forEach(item => {
-                const imgName = item.dataset.filename;
-                const timestamp = parseFloat(item.dataset.timestamp);
-                let show = false;
-
-                if (filter === 'all') show = true;
-                else if (filter === 'recent') show = timestamp > oneDayAgo;
-                else if (filter === 'favorites') show = favorites.includes(imgName);
-                else show = item.dataset.type === filter;
-
-                item.style.display = show ? 'block' : 'none';
-                if (show) visibleCount++;
-            });
-
-            // Show empty state if no matches
-            const gallery = document.getElementById('gallery');
-            const existingEmpty = gallery.querySelector('.gallery-empty');
-            if (existingEmpty) existingEmpty.remove();
-
-            if (visibleCount === 0) {
-                const emptyMsg = {
-                    'recent': 'No images from the last 24 hours',
-                    'favorites': 'No favorites yet. Mark some as favorites!',
-                    'lightning': 'No Lightning mode images',
-                    'normal': 'No Normal mode images',
-                    'edit': 'No edited images'
-                };
-                gallery.insertAdjacentHTML('beforeend', '<div class="gallery-empty">' + (emptyMsg[filter] || 'No images') + '</div>');
-            }
+            galleryFilter = filter;
+            galleryCursor = null;
+            loadGallery();
         }
 
         function enterCompareMode() {
@@ -5290,9 +5572,82 @@ Dancing to our favorite song"></textarea>
             }
         }
 
-        function openModal(src) {
+        let modalMeta = null;
+
+        function openModal(src, filename) {
             document.getElementById('modalImage').src = src;
             document.getElementById('imageModal').classList.add('active');
+            document.getElementById('modalMeta').style.display = 'none';
+            modalMeta = null;
+            if (filename) showImageMeta(filename);
+        }
+
+        // Show how a gallery image was made, with one-click reuse
+        async function showImageMeta(filename) {
+            try {
+                const response = await fetch('/image-meta?filename=' + encodeURIComponent(filename));
+                if (!response.ok) return;  // made before generation data was recorded
+                const meta = await response.json();
+                modalMeta = meta;
+                const panel = document.getElementById('modalMeta');
+                const details = [
+                    meta.model, meta.mode, meta.resolution ? meta.resolution + (meta.kind === 'image' ? 'px' : '') : '',
+                    meta.aspect, meta.seed !== null ? 'seed ' + meta.seed : '', meta.sampler, meta.scheduler,
+                    meta.duration ? meta.duration.toFixed(1) + 's' : ''
+                ].filter(Boolean).join(' | ');
+                panel.innerHTML = '<div class="modal-meta-prompt"></div><div class="modal-meta-details"></div>' +
+                    (meta.kind === 'image'
+                        ? '<div class="btn-row"><button class="btn-sm" onclick="reuseGeneration(false)">Reuse settings</button>' +
+                          '<button class="btn-sm" onclick="reuseGeneration(true)">Regenerate</button></div>'
+                        : '');
+                panel.querySelector('.modal-meta-prompt').textContent = meta.prompt || '';
+                panel.querySelector('.modal-meta-details').textContent = details;
+                panel.style.display = 'block';
+            } catch (e) {
+                console.log('No generation data for ' + filename);
+            }
+        }
+
+        // Fill the Generate tab with a recorded image's parameters (and optionally run it)
+        function reuseGeneration(run) {
+            const meta = modalMeta;
+            if (!meta) return;
+            closeModal();
+            document.querySelectorAll('.tab')[0].click();
+            selectImageModel(meta.model === 'zimage' ? 'zimage' : 'qwen');
+            document.getElementById('prompt').value = meta.prompt || '';
+            if (meta.mode) document.getElementById('mode').value = meta.mode;
+            if (meta.resolution) document.getElementById('resolution').value = String(meta.resolution);
+            if (meta.aspect) document.getElementById('aspect').value = meta.aspect;
+            document.getElementById('negativePrompt').value = meta.negative_prompt || '';
+            document.getElementById('seedInput').value = meta.seed !== null ? meta.seed : '';
+            if (meta.sampler) document.getElementById('sampler').value = meta.sampler;
+            if (meta.scheduler) document.getElementById('scheduler').value = meta.scheduler;
+            updateEstimate();
+            if (run) {
+                document.getElementById('batchSize').value = '1';
+                generate();
+            } else {
+                showToast('Settings Loaded', 'Parameters restored from the image', 'success');
+            }
+        }
+
+        // Show each image's prompt as a tooltip, one request per gallery page
+        async function annotateGallery(images) {
+            try {
+                const response = await fetch('/image-meta', {
+                    method: 'POST',
+                    headers: {'Content-Type': 'application/json'},
+                    body: JSON.stringify({filenames: images.map(item => item.filename)})
+                });
+                const meta = (await response.json()).meta || {};
+                document.querySelectorAll('#gallery .gallery-item').forEach(el => {
+                    const info = meta[el.dataset.filename];
+                    if (info && info.prompt) el.querySelector('img').title = info.prompt;
+                });
+            } catch (e) {
+                console.log('Could not load gallery prompts');
+            }
         }
 
         function closeModal() {
@@ -5334,17 +5689,17 @@ Dancing to our favorite song"></textarea>
             const grid = document.getElementById('galleryPickerGrid');
 
             try {
-                const response = await fetch('/gallery');
-                const images = await response.json();
+                const response = await fetch('/gallery?limit=20');
+                const images = (await response.json()).images;
 
                 if (images.length === 0) {
                     grid.innerHTML = '<div class="gallery-empty">No images in gallery. Generate some first!</div>';
                 } else {
-                    grid.innerHTML = images.slice(0, 20).map(item => {
+                    grid.innerHTML = images.map(item => {
                         const img = item.filename;
                         const q = String.fromCharCode(39);
                         return '<div class="gallery-item" style="cursor:pointer;" onclick="selectGalleryImage(' + q + img + q + ')">' +
-                            '<img src="/output/' + img + '">' +
+                            '<img src="/thumb/' + encodeURIComponent(img) + '?size=160">' +
                             '</div>';
                     }).join('');
                 }
@@ -5737,42 +6092,95 @@ Dancing to our favorite song"></textarea>
 </html>
 '''
 
+# ==========================================
+# STATIC ASSETS (built once, precompressed)
+# ==========================================
+
+class StaticAsset:
+    """An in-memory response body with precompressed variants.
+
+    Encoding happens once at startup; each request just picks the smallest
+    variant the client accepts. Every variant has its own strong ETag.
+    """
+
+    def __init__(self, body, content_type):
+        self.content_type = content_type
+        self.digest = hashlib.sha256(body).hexdigest()[:16]
+        self.variants = {'identity': body, 'gzip': gzip.compress(body, 9, mtime=0)}
+        if brotli is not None:
+            self.variants['br'] = brotli.compress(body, quality=11)
+        self.etags = {encoding: f'"{self.digest}-{encoding}"' for encoding in self.variants}
+
+    def negotiate(self, accept_encoding):
+        """Pick the smallest variant allowed by an Accept-Encoding header.
+
+        An explicit q=0 refuses that encoding even when '*' is accepted.
+        """
+        accepted, refused = set(), set()
+        for item in (accept_encoding or '').split(','):
+            name, _, params = item.partition(';')
+            key, _, value = params.strip().partition('=')
+            try:
+                quality = float(value) if key.strip() == 'q' else 1.0
+            except ValueError:
+                quality = 0.0
+            (accepted if quality > 0 else refused).add(name.strip().lower())
+        for encoding in ('br', 'gzip'):
+            if encoding in refused or encoding not in self.variants:
+                continue
+            if encoding in accepted or '*' in accepted:
+                return encoding
+        return 'identity'
+
+
+def build_static_assets(page):
+    """Split the page's stylesheet and main script into fingerprinted assets.
+
+    The HTML shell is revalidated on every load (cheap 304s), while the CSS
+    and JS URLs contain their content hash and are cached as immutable.
+    Returns (index asset, {url path: asset}).
+    """
+    assets = {}
+    style_start = page.index('<style>')
+    style_end = page.index('</style>', style_start)
+    css = StaticAsset(page[style_start + len('<style>'):style_end].encode('utf-8'), 'text/css; charset=utf-8')
+    css_path = f'/static/app.{css.digest}.css'
+    assets[css_path] = css
+
+    script_start = page.rindex('<script>')
+    script_end = page.index('</script>', script_start)
+    js = StaticAsset(page[script_start + len('<script>'):script_end].encode('utf-8'), 'text/javascript; charset=utf-8')
+    js_path = f'/static/app.{js.digest}.js'
+    assets[js_path] = js
+
+    shell = (page[:style_start] + f'<link rel="stylesheet" href="{css_path}">'
+             + page[style_end + len('</style>'):script_start] + f'<script src="{js_path}"></script>'
+             + page[script_end + len('</script>'):])
+    return StaticAsset(shell.encode('utf-8'), 'text/html; charset=utf-8'), assets
+
+
+INDEX_ASSET, STATIC_ASSETS = build_static_assets(HTML_PAGE)
+STATIC_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+INDEX_CACHE_CONTROL = 'no-cache'
+
+
 class RequestHandler(SimpleHTTPRequestHandler):
     def do_GET(self):
         if self.path == '/' or self.path == '/index.html':
-            self.send_response(200)
-            self.send_header('Content-type', 'text/html; charset=utf-8')
-            self.end_headers()
-            self.wfile.write(HTML_PAGE.encode('utf-8'))
-        elif self.path.startswith('/output/'):
-            # Strip query string from path (e.g., ?t=123 cache busters)
-            clean_path = urllib.parse.urlparse(self.path).path
-            file_path = os.path.join(os.path.dirname(__file__), clean_path[1:])
-            if os.path.exists(file_path):
-                self.send_response(200)
-                # Determine content type based on file extension
-                ext = os.path.splitext(file_path)[1].lower()
-                content_types = {
-                    '.png': 'image/png',
-                    '.jpg': 'image/jpeg',
-                    '.jpeg': 'image/jpeg',
-                    '.gif': 'image/gif',
-                    '.webp': 'image/webp',
-                    '.mp4': 'video/mp4',
-                    '.flac': 'audio/flac',
-                    '.mp3': 'audio/mpeg',
-                    '.opus': 'audio/opus',
-                    '.wav': 'audio/wav',
-                    '.glb': 'model/gltf-binary',
-                    '.gltf': 'model/gltf+json',
-                }
-                content_type = content_types.get(ext, 'application/octet-stream')
-                self.send_header('Content-type', content_type)
-                self.end_headers()
-                with open(file_path, 'rb') as f:
-                    self.wfile.write(f.read())
+            self.send_asset(INDEX_ASSET, INDEX_CACHE_CONTROL)
+        elif self.path.startswith('/static/'):
+            asset = STATIC_ASSETS.get(urllib.parse.urlparse(self.path).path)
+            if asset is None:
+                self.send_error(404)
             else:
+                self.send_asset(asset, STATIC_CACHE_CONTROL)
+        elif self.path.startswith('/output/'):
+            file_path = self.output_path()
+            if file_path is None:
                 self.send_error(404)
+            else:
+                ext = os.path.splitext(file_path)[1].lower()
+                self.send_file(file_path, MEDIA_TYPES.get(ext, 'application/octet-stream'), OUTPUT_CACHE_CONTROL)
         elif self.path.startswith('/progress'):
             query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
             prompt_id = query.get('prompt_id', [''])[0]
@@ -5781,51 +6189,100 @@ class RequestHandler(SimpleHTTPRequestHandler):
             self.send_header('Content-type', 'application/json')
             self.end_headers()
             self.wfile.write(json.dumps(result).encode())
+        elif self.path.startswith('/batch-progress'):
+            query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+            result = batch_queue.status(query.get('batch_id', [''])[0], query.get('jobs', [''])[0] in ('1', 'true'))
+            if result is None:
+                self.send_json({"error": "Unknown batch"}, 404)
+            else:
+                self.send_json(result)
+        elif self.path == '/jobs' or self.path.startswith('/jobs?'):
+            query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+            user = query.get('user', [None])[0]
+            if query.get('mine', [''])[0] in ('1', 'true'):
+                user = self.job_user({})
+            try:
+                limit = min(max(int(query.get('limit', [MAX_JOB_LIST])[0]), 1), MAX_JOB_LIST)
+            except ValueError:
+                limit = MAX_JOB_LIST
+            self.send_json(job_queue.jobs(user, query.get('status', [None])[0], limit))
+        elif self.path.startswith('/events'):
+            query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+            prompt_id = query.get('prompt_id', [''])[0]
+            busy = self.run_long_wait(self.stream_events, prompt_id)
+            if busy is not None:
+                self.send_json(busy, status=503)
         elif self.path.startswith('/wait'):
             query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
             prompt_id = query.get('prompt_id', [''])[0]
-            result = wait_for_image(prompt_id)
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps(result).encode())
+            self.send_json(self.run_long_wait(wait_for_image, prompt_id))
         elif self.path.startswith('/video-wait'):
             query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
             prompt_id = query.get('prompt_id', [''])[0]
-            result = wait_for_video(prompt_id)
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps(result).encode())
+            self.send_json(self.run_long_wait(wait_for_video, prompt_id))
         elif self.path.startswith('/audio-wait'):
             query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
             prompt_id = query.get('prompt_id', [''])[0]
-            result = wait_for_audio(prompt_id)
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps(result).encode())
+            self.send_json(self.run_long_wait(wait_for_audio, prompt_id))
         elif self.path.startswith('/3d-wait'):
             query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
             prompt_id = query.get('prompt_id', [''])[0]
-            result = wait_for_3d(prompt_id)
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps(result).encode())
+            self.send_json(self.run_long_wait(wait_for_3d, prompt_id))
         elif self.path == '/gallery':
             images = get_gallery_images_with_meta()
             self.send_response(200)
             self.send_header('Content-type', 'application/json')
             self.end_headers()
             self.wfile.write(json.dumps(images).encode())
+        elif self.path.startswith('/gallery?'):
+            result = gallery_page(urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query))
+            if result is None:
+                self.send_json({"error": "Invalid gallery query"}, 400)
+            else:
+                self.send_json(result)
+        elif self.path == '/history' or self.path.startswith('/history?'):
+            result = history_page(urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query))
+            if result is None:
+                self.send_json({"error": "Invalid history query"}, 400)
+            else:
+                self.send_json(result)
+        elif self.path == '/favorites':
+            self.send_json({'favorites': generator_store.favorites()})
+        elif self.path.startswith('/image-meta?'):
+            query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+            meta = generator_store.image_meta(query.get('filename', [''])[0])
+            if meta is None:
+                self.send_json({"error": "No generation data for this file"}, 404)
+            else:
+                self.send_json(meta)
+        elif self.path.startswith('/thumb/'):
+            query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+            filename = urllib.parse.unquote(urllib.parse.urlparse(self.path).path[len('/thumb/'):])
+            size = query.get('size', [str(THUMB_SIZE)])[0]
+            thumb = get_thumbnail(filename, int(size) if size.isdigit() and int(size) in THUMB_SIZES else THUMB_SIZE)
+            if thumb is None:
+                # No Pillow or not an image we can shrink: send the original
+                self.send_response(302)
+                self.send_header('Location', '/output/' + urllib.parse.quote(filename))
+                self.end_headers()
+            else:
+                self.send_file(thumb, 'image/webp', 'public, max-age=86400')
         elif self.path == '/health':
             # Check ComfyUI connection status
             comfyui_ok = check_comfyui()
             self.send_response(200)
             self.send_header('Content-type', 'application/json')
             self.end_headers()
-            self.wfile.write(json.dumps({'comfyui': comfyui_ok}).encode())
+            self.wfile.write(json.dumps({
+                'comfyui': comfyui_ok,
+                'client': comfy_client.stats(),
+                'workflow_problems': workflow_templates.problems(),
+                'ollama': ollama_arbiter.stats(),
+                'refine_cache': refine_cache.stats(),
+                'refine_batch': refine_batcher.stats(),
+                'jobs': job_queue.stats(),
+                'startup': comfy_supervisor.status() if comfy_supervisor else None,
+            }).encode())
         else:
             self.send_error(404)
 
@@ -5846,27 +6303,41 @@ class RequestHandler(SimpleHTTPRequestHandler):
                 data.get('negativePrompt', ''),
                 data.get('sampler', 'euler'),
                 data.get('scheduler', 'normal'),
-                model
+                model,
+                self.job_user(data),
+                data.get('priority')
             )
             self.send_json(result)
+        elif self.path == '/queue-batch':
+            result = batch_queue.create(data, self.job_user(data))
+            self.send_json(result, 400 if 'error' in result else 200)
         elif self.path == '/generate':
-            result = queue_prompt(data.get('prompt', ''))
+            result = queue_prompt(data.get('prompt', ''), user=self.job_user(data), priority=data.get('priority'))
             if 'error' not in result:
-                result = wait_for_image(result['prompt_id'])
+                result = self.run_long_wait(wait_for_image, result['prompt_id'])
             self.send_json(result)
         elif self.path == '/favorite':
-            save_favorites(data.get('favorites', []))
-            self.send_json({'success': True})
+            result = save_favorites(data)
+            self.send_json(result, 200 if result['success'] else 400)
         elif self.path == '/history':
-            save_history(data)
-            self.send_json({'success': True})
+            result = save_history(data)
+            self.send_json(result, 200 if result['success'] else 400)
+        elif self.path == '/image-meta':
+            result = image_meta_bulk(data)
+            if result is None:
+                self.send_json({"error": f"filenames must be a list of at most {MAX_GALLERY_PAGE_SIZE} names"}, 400)
+            else:
+                self.send_json(result)
         elif self.path == '/edit':
-            result = edit_image(
+            result = self.run_long_wait(
+                edit_image,
                 data.get('image', ''),
                 data.get('prompt', ''),
                 data.get('useAnglesLora', False),
                 data.get('anglePrompt', ''),
-                data.get('useUpscaleLora', False)
+                data.get('useUpscaleLora', False),
+                self.job_user(data),
+                data.get('priority')
             )
             self.send_json(result)
         elif self.path == '/video-queue':
@@ -5878,7 +6349,9 @@ class RequestHandler(SimpleHTTPRequestHandler):
                 data.get('length', 81),
                 data.get('seed'),
                 data.get('negative_prompt', ''),
-                data.get('start_image')
+                data.get('start_image'),
+                self.job_user(data),
+                data.get('priority')
             )
             self.send_json(result)
         elif self.path == '/audio-queue':
@@ -5888,7 +6361,9 @@ class RequestHandler(SimpleHTTPRequestHandler):
                 data.get('duration', 60),
                 data.get('format', 'flac'),
                 data.get('lyrics_strength', 1.0),
-                data.get('seed')
+                data.get('seed'),
+                self.job_user(data),
+                data.get('priority')
             )
             self.send_json(result)
         elif self.path == '/3d-queue':
@@ -5897,16 +6372,29 @@ class RequestHandler(SimpleHTTPRequestHandler):
                 data.get('resolution', 256),
                 data.get('algorithm', 'surface net'),
                 data.get('threshold', 0.6),
-                data.get('seed')
+                data.get('seed'),
+                self.job_user(data),
+                data.get('priority')
             )
             self.send_json(result)
         elif self.path == '/refine':
             result = refine_prompt_ai(
                 data.get('prompt', ''),
                 data.get('mode', 'refine'),
-                data.get('provider', 'ollama')  # ollama (local) or gemini (cloud)
+                data.get('provider', 'ollama'),  # ollama (local) or gemini (cloud)
+                bool(data.get('fresh'))
             )
             self.send_json(result)
+        elif self.path == '/refine-batch':
+            status, result = refine_batcher.run(data)
+            self.send_json(result, status, {'Retry-After': str(result['retry_after'])} if status == 503 else None)
+        elif self.path == '/refine-stream':
+            self.stream_refinement(refine_prompt_stream(
+                data.get('prompt', ''),
+                data.get('mode', 'refine'),
+                data.get('provider', 'ollama'),
+                bool(data.get('fresh'))
+            ))
         elif self.path == '/settings':
             global app_settings
             app_settings.update(data)
@@ -5918,74 +6406,1651 @@ class RequestHandler(SimpleHTTPRequestHandler):
             result = delete_image(data.get('filename', ''))
             self.send_json(result)
         elif self.path == '/delete-history':
-            result = delete_history_item(data.get('index', -1))
+            result = delete_history_item(data)
             self.send_json(result)
+        elif self.path == '/cancel':
+            status, result = job_queue.cancel(data.get('prompt_id', ''), self.job_user(data))
+            self.send_json(result, status)
         elif self.path == '/interrupt':
-            # Forward interrupt to ComfyUI
+            # Forward interrupt to ComfyUI (stops whatever is running)
             try:
-                req = urllib.request.Request(f"{COMFYUI_URL}/interrupt", method='POST')
-                urllib.request.urlopen(req, timeout=5)
+                comfy_client.request('POST', '/interrupt', timeout=5)
                 self.send_json({'success': True})
             except Exception as e:
                 self.send_json({'success': False, 'error': str(e)})
         else:
             self.send_error(404)
 
-    def send_json(self, data):
+    def do_HEAD(self):
+        # Only the page and media support HEAD; the inherited handler would list the cwd
+        if self.path == '/' or self.path == '/index.html':
+            self.send_asset(INDEX_ASSET, INDEX_CACHE_CONTROL, head=True)
+            return
+        file_path = self.output_path() if self.path.startswith('/output/') else None
+        if file_path is None:
+            self.send_error(404)
+        else:
+            ext = os.path.splitext(file_path)[1].lower()
+            self.send_file(file_path, MEDIA_TYPES.get(ext, 'application/octet-stream'), OUTPUT_CACHE_CONTROL, head=True)
+
+    def output_path(self):
+        """Resolve an /output/ URL to a file inside OUTPUT_DIR, or None"""
+        # Strip query string from path (e.g., ?t=123 cache busters)
+        relative = urllib.parse.unquote(urllib.parse.urlparse(self.path).path[len('/output/'):])
+        root = os.path.realpath(OUTPUT_DIR)
+        file_path = os.path.realpath(os.path.join(root, relative))
+        if os.path.commonpath([root, file_path]) != root or not os.path.isfile(file_path):
+            return None
+        return file_path
+
+    def parse_range(self, size, etag, mtime):
+        """Return (start, end) for a satisfiable single Range header, None to
+        send the whole file (no or invalid Range), or False if the range
+        starts past the end of the file."""
+        header = self.headers.get('Range')
+        if not header or not header.startswith('bytes=') or ',' in header:
+            return None
+        if_range = self.headers.get('If-Range')
+        if if_range and if_range != etag and if_range != email.utils.formatdate(mtime, usegmt=True):
+            return None
+        first, _, last = header[len('bytes='):].strip().partition('-')
+        try:
+            if first:
+                start = int(first)
+                if last and int(last) < start:
+                    # Not a valid byte range (RFC 9110 14.2): ignore the header
+                    return None
+                end = min(int(last), size - 1) if last else size - 1
+            else:
+                # Suffix range: the last N bytes
+                start = max(0, size - int(last))
+                end = size - 1
+        except ValueError:
+            return None
+        if start > end or start >= size:
+            return False
+        return start, end
+
+    def not_modified(self, etag, mtime):
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match:
+            return any(tag.strip().removeprefix('W/') in (etag, '*') for tag in if_none_match.split(','))
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if if_modified_since:
+            try:
+                return int(mtime) <= email.utils.parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def send_file(self, file_path, content_type, cache_control, head=False):
+        """Stream a file with conditional GET and byte-range support.
+
+        The body goes out with sendfile() in the requested range, so large
+        videos and meshes are never read into memory and can be seeked.
+        """
+        try:
+            f = open(file_path, 'rb')
+        except OSError:
+            self.send_error(404)
+            return
+        with f:
+            stat = os.fstat(f.fileno())
+            size = stat.st_size
+            etag = f'"{stat.st_mtime_ns:x}-{size:x}"'
+            if self.not_modified(etag, stat.st_mtime):
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.send_header('Cache-Control', cache_control)
+                self.end_headers()
+                return
+            byte_range = self.parse_range(size, etag, stat.st_mtime)
+            if byte_range is False:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{size}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            start, end = byte_range or (0, size - 1)
+            length = max(0, end - start + 1)
+            self.send_response(206 if byte_range else 200)
+            if byte_range:
+                self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+            self.send_header('Content-type', content_type)
+            self.send_header('Content-Length', str(length))
+            self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('ETag', etag)
+            self.send_header('Last-Modified', email.utils.formatdate(stat.st_mtime, usegmt=True))
+            self.send_header('Cache-Control', cache_control)
+            self.end_headers()
+            if head or length == 0:
+                return
+            try:
+                self.wfile.flush()
+                self.connection.sendfile(f, start, length)
+            except (BrokenPipeError, ConnectionResetError):
+                # Players drop connections all the time when seeking
+                pass
+
+    def send_asset(self, asset, cache_control, head=False):
+        """Send a StaticAsset in the best accepted encoding, or 304"""
+        encoding = asset.negotiate(self.headers.get('Accept-Encoding'))
+        etag = asset.etags[encoding]
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match and any(tag.strip().removeprefix('W/') in (etag, '*') for tag in if_none_match.split(',')):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', cache_control)
+            self.send_header('Vary', 'Accept-Encoding')
+            self.end_headers()
+            return
+        body = asset.variants[encoding]
         self.send_response(200)
+        self.send_header('Content-type', asset.content_type)
+        self.send_header('Content-Length', str(len(body)))
+        if encoding != 'identity':
+            self.send_header('Content-Encoding', encoding)
+        self.send_header('Vary', 'Accept-Encoding')
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', cache_control)
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+
+    def job_user(self, data):
+        """Owner of the jobs queued by this request: the "user" field or
+        X-User header when the client names one, else the client address.
+        Client-supplied, so not an authenticated identity."""
+        user = data.get('user') or self.headers.get('X-User') or self.client_address[0]
+        return str(user)[:64]
+
+    def send_json(self, data, status=200, headers=None):
+        self.send_response(status)
         self.send_header('Content-type', 'application/json')
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
         self.end_headers()
         self.wfile.write(json.dumps(data).encode())
 
-    def log_message(self, format, *args):
-        pass
-
-# Progress tracking
-progress_state = {}
-
-def get_progress(prompt_id):
-    try:
-        queue_url = f"{COMFYUI_URL}/queue"
-        queue_response = urllib.request.urlopen(queue_url, timeout=5)
-        queue_data = json.loads(queue_response.read().decode())
-
-        for item in queue_data.get('queue_pending', []):
-            if item[1] == prompt_id:
-                return {"status": "queued", "message": "Waiting in queue..."}
+    def send_event(self, event, data):
+        self.wfile.write(f"event: {event}\ndata: {json.dumps(data)}\n\n".encode())
+        self.wfile.flush()
 
+    def stream_events(self, prompt_id, timeout=1800):
+        """Stream a job's progress, latent previews and result as Server-Sent Events"""
+        subscriber = event_broker.subscribe(prompt_id)
         try:
-            history_url = f"{COMFYUI_URL}/history/{prompt_id}"
-            hist_response = urllib.request.urlopen(history_url, timeout=5)
-            history = json.loads(hist_response.read().decode())
-            if prompt_id in history:
-                if history[prompt_id].get('status', {}).get('status_str') == 'error':
-                    return {"status": "error", "message": "Generation failed"}
-                if history[prompt_id].get('outputs', {}):
-                    return {"status": "done", "current_step": 30, "total_steps": 30}
-        except Exception:
+            self.send_response(200)
+            self.send_header('Content-type', 'text/event-stream')
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('X-Accel-Buffering', 'no')
+            self.end_headers()
+            self.send_event('progress', get_progress(prompt_id))
+
+            # The job may have finished before we subscribed
+            connection = event_listener.connection
+            entry = fetch_history_entry(prompt_id)
+            deadline = time.time() + timeout
+            while entry is None and time.time() < deadline:
+                if not event_listener.connected.is_set():
+                    # No push events: fall back to polling once a second
+                    time.sleep(1.0)
+                    entry = fetch_history_entry(prompt_id)
+                    if entry is None:
+                        self.send_event('progress', get_progress(prompt_id))
+                    continue
+                if event_listener.connection != connection:
+                    # Reconnected: a finish sent while disconnected was lost
+                    connection = event_listener.connection
+                    entry = fetch_history_entry(prompt_id)
+                    continue
+                try:
+                    event, data = subscriber.get(timeout=min(15, HISTORY_RECHECK_INTERVAL))
+                except queue.Empty:
+                    self.wfile.write(b": keep-alive\n\n")
+                    self.wfile.flush()
+                    connection = event_listener.connection
+                    entry = fetch_history_entry(prompt_id)
+                    continue
+                if event == 'finished':
+                    entry = wait_for_history(prompt_id, timeout=10)
+                    break
+                self.send_event(event, data)
+
+            if entry is None:
+                self.send_event('done', {"success": False, "error": "Timeout"})
+            else:
+                self.send_event('done', job_result(prompt_id, entry))
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            event_broker.unsubscribe(prompt_id, subscriber)
+
+    def stream_refinement(self, events):
+        """Relay refine_prompt_stream events to the client as Server-Sent Events"""
+        try:
+            self.send_response(200)
+            self.send_header('Content-type', 'text/event-stream')
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('X-Accel-Buffering', 'no')
+            self.end_headers()
+            for event, data in events:
+                self.send_event(event, data)
+        except (BrokenPipeError, ConnectionResetError):
+            # Client went away; closing the generator drops the Ollama stream
             pass
+        finally:
+            events.close()
+
+    def run_long_wait(self, func, *args):
+        """Run a long-polling call inside one of the server's long-wait slots"""
+        slots = getattr(self.server, 'long_wait_slots', None)
+        if slots is None:
+            return func(*args)
+        if not slots.acquire(blocking=False):
+            return {"success": False, "error": "Server busy, too many generations in progress"}
+        try:
+            return func(*args)
+        finally:
+            slots.release()
 
-        is_running = any(item[1] == prompt_id for item in queue_data.get('queue_running', []))
-        if is_running:
-            if prompt_id not in progress_state:
-                progress_state[prompt_id] = {'start_time': time.time()}
+    def log_message(self, format, *args):
+        pass
 
-            elapsed = time.time() - progress_state[prompt_id]['start_time']
-            mode = progress_state.get(prompt_id, {}).get('mode', 'lightning')
-            total_steps = 4 if mode == 'lightning' else 30
-            loading_time = 45
-            step_time = 13
 
-            if elapsed < loading_time:
-                return {"status": "loading", "message": "Loading AI models...", "current_step": 0, "total_steps": total_steps}
-            else:
-                step = min(int((elapsed - loading_time) / step_time), total_steps - 1)
-                return {"status": "generating", "current_step": max(1, step), "total_steps": total_steps}
+class GeneratorHTTPServer(ThreadingHTTPServer):
+    """Thread-per-connection HTTP server with bounded concurrency.
+
+    Every connection takes one of max_connections slots; when they are all in
+    use the client gets an immediate 503 instead of queuing behind a 20 minute
+    /video-wait. Long waits additionally draw from the smaller long_wait_slots
+    pool (see RequestHandler.run_long_wait), which keeps capacity free for
+    short requests.
+    """
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, server_address, handler_class, max_connections=MAX_CONNECTIONS, max_long_waits=MAX_LONG_WAITS):
+        super().__init__(server_address, handler_class)
+        self.connection_slots = threading.BoundedSemaphore(max_connections)
+        self.long_wait_slots = threading.BoundedSemaphore(min(max_long_waits, max_connections))
+
+    def process_request(self, request, client_address):
+        if not self.connection_slots.acquire(blocking=False):
+            try:
+                request.sendall(b"HTTP/1.0 503 Service Unavailable\r\nRetry-After: 1\r\nContent-Length: 0\r\n\r\n")
+            except OSError:
+                pass
+            self.shutdown_request(request)
+            return
+        try:
+            super().process_request(request, client_address)
+        except Exception:
+            self.connection_slots.release()
+            raise
+
+    def process_request_thread(self, request, client_address):
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            self.connection_slots.release()
+
+# Progress tracking
+progress_state = {}
+
+def get_progress(prompt_id):
+    """Progress of a prompt, read from the event-driven tracker when connected"""
+    if event_listener.connected.is_set():
+        result = progress_tracker.snapshot(prompt_id)
+    else:
+        result = poll_progress(prompt_id)
+    if result.get('total_steps') and 'progress' not in result:
+        result['progress'] = result.get('current_step', 0) / result['total_steps']
+    return result
 
-        return {"status": "unknown", "message": "Processing..."}
+def poll_progress(prompt_id):
+    """Fallback progress from /queue and /history when the websocket is down.
+
+    Only the job's status can be polled; it is applied to the tracker, whose
+    snapshot keeps the last real step counts and the learned timings for ETAs.
+    """
+    try:
+        queue_data = comfy_client.get_json("/queue", timeout=5)
+
+        status = None
+        if any(item[1] == prompt_id for item in queue_data.get('queue_pending', [])):
+            status = 'queued'
+        else:
+            try:
+                history = comfy_client.get_json(f"/history/{prompt_id}", timeout=5)
+                if prompt_id in history:
+                    if history[prompt_id].get('status', {}).get('status_str') == 'error':
+                        status = 'error'
+                    elif history[prompt_id].get('outputs', {}):
+                        status = 'done'
+            except Exception:
+                pass
+        if status is None and any(item[1] == prompt_id for item in queue_data.get('queue_running', [])):
+            status = 'loading'
+        if status is None:
+            return {"status": "unknown", "message": "Processing..."}
+        progress_tracker.poll_status(prompt_id, status)
+        return progress_tracker.snapshot(prompt_id)
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
+# ==========================================
+# COMFYUI HTTP CLIENT (pooled keep-alive)
+# ==========================================
+
+class HTTPStatusError(Exception):
+    def __init__(self, status, body):
+        self.status = status
+        self.body = body
+        detail = body.decode(errors='replace').strip()[:500] if body else ''
+        super().__init__(f"HTTP Error {status}" + (f": {detail}" if detail else ''))
+
+
+class PooledHTTPClient:
+    """Thread-safe keep-alive HTTP client for a single host.
+
+    Idle connections are kept in a LIFO pool and reused across requests, so a
+    queue + poll round trip does not pay for a new TCP connection each time.
+    Connection resets are retried with jittered exponential backoff: always
+    when a pooled connection turned out to be stale, and for idempotent
+    methods otherwise (a POST /prompt is never sent twice).
+    """
+
+    RETRYABLE_ERRORS = (ConnectionResetError, ConnectionAbortedError, BrokenPipeError, http.client.RemoteDisconnected)
+    IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'DELETE')
+
+    def __init__(self, base_url, max_idle=8, retries=2, backoff=0.05):
+        parsed = urllib.parse.urlparse(base_url)
+        self.base_url = base_url
+        self.host = parsed.hostname
+        self.port = parsed.port or (443 if parsed.scheme == 'https' else 80)
+        self.connection_class = http.client.HTTPSConnection if parsed.scheme == 'https' else http.client.HTTPConnection
+        self.max_idle = max_idle
+        self.retries = retries
+        self.backoff = backoff
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._stats = {'requests': 0, 'connections_opened': 0, 'connections_reused': 0, 'retries': 0, 'errors': 0}
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def _acquire(self, timeout):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            self._count('connections_opened')
+            conn = self.connection_class(self.host, self.port, timeout=timeout)
+            conn.connect()
+            # Small request/response pairs on a reused socket stall on Nagle + delayed ACK
+            conn.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            return conn, False
+        self._count('connections_reused')
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        return conn, True
+
+    def _release(self, conn):
+        if self._idle.qsize() < self.max_idle:
+            self._idle.put(conn)
+        else:
+            conn.close()
+
+    def request(self, method, path, body=None, headers=None, timeout=10):
+        """Send a request and return (status, response_headers, body).
+
+        Raises HTTPStatusError for 4xx/5xx responses, like urlopen does.
+        """
+        self._count('requests')
+        attempt = 0
+        while True:
+            conn, reused = self._acquire(timeout)
+            try:
+                conn.request(method, path, body=body, headers=headers or {})
+                response = conn.getresponse()
+                data = response.read()
+            except self.RETRYABLE_ERRORS:
+                conn.close()
+                if attempt >= self.retries or not (reused or method in self.IDEMPOTENT_METHODS):
+                    self._count('errors')
+                    raise
+                attempt += 1
+                self._count('retries')
+                if not reused:
+                    time.sleep(self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5))
+                continue
+            except Exception:
+                conn.close()
+                self._count('errors')
+                raise
+            if response.will_close:
+                conn.close()
+            else:
+                self._release(conn)
+            if response.status >= 400:
+                raise HTTPStatusError(response.status, data)
+            return response.status, response.headers, data
+
+    def get_json(self, path, timeout=10):
+        return json.loads(self.request('GET', path, timeout=timeout)[2])
+
+    def post_json(self, path, payload, timeout=10):
+        _, _, data = self.request('POST', path, body=json.dumps(payload).encode(),
+                                  headers={'Content-Type': 'application/json'}, timeout=timeout)
+        return json.loads(data) if data else {}
+
+    def post_json_lines(self, path, payload, timeout=10):
+        """POST JSON and yield each line of a newline-delimited JSON response
+        as it arrives (Ollama's streaming API).
+
+        The connection only goes back to the pool if the response was read to
+        the end; closing the generator early drops it, which also tells the
+        server to stop generating.
+        """
+        self._count('requests')
+        body = json.dumps(payload).encode()
+        attempt = 0
+        while True:
+            conn, reused = self._acquire(timeout)
+            try:
+                conn.request('POST', path, body=body, headers={'Content-Type': 'application/json'})
+                response = conn.getresponse()
+                break
+            except self.RETRYABLE_ERRORS:
+                conn.close()
+                # Nothing was generated yet, but only a stale pooled socket is worth retrying
+                if not reused or attempt >= self.retries:
+                    self._count('errors')
+                    raise
+                attempt += 1
+                self._count('retries')
+            except Exception:
+                conn.close()
+                self._count('errors')
+                raise
+        finished = False
+        try:
+            if response.status >= 400:
+                raise HTTPStatusError(response.status, response.read())
+            for line in response:
+                if line.strip():
+                    yield json.loads(line)
+            finished = True
+        finally:
+            if finished and not response.will_close:
+                self._release(conn)
+            else:
+                conn.close()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        connections = stats['connections_opened'] + stats['connections_reused']
+        stats['reuse_rate'] = stats['connections_reused'] / connections if connections else 0.0
+        stats['idle_connections'] = self._idle.qsize()
+        return stats
+
+
+comfy_client = PooledHTTPClient(COMFYUI_URL)
+
+
+# ==========================================
+# COMFYUI EVENT LISTENER (websocket push)
+# ==========================================
+
+# Sent as client_id with every queued prompt so ComfyUI routes that prompt's
+# execution events to our websocket
+CLIENT_ID = uuid.uuid4().hex
+
+# Latent preview method requested for our prompts (streamed to /events)
+PREVIEW_METHOD = "auto"
+
+
+def build_prompt_body(prompt_json, number=None):
+    """POST /prompt body for an already serialized API-format workflow.
+
+    The client_id routes the prompt's events to our websocket listener;
+    number, when given, is the prompt's position key in ComfyUI's queue.
+    """
+    extra = {"client_id": CLIENT_ID, "extra_data": {"preview_method": PREVIEW_METHOD}}
+    if number is not None:
+        extra['number'] = number
+    return ('{"prompt": ' + prompt_json + ', ' + json.dumps(extra)[1:]).encode()
+
+
+def submit_prompt(prompt_json, user=None, priority=None):
+    """Queue a serialized workflow on ComfyUI and return its JSON response.
+
+    job_queue picks the prompt's place in ComfyUI's queue from its owner's
+    fair share and its priority, and registers the job under its owner.
+    """
+    slot, number = job_queue.assign(user, priority)
+    _, _, data = comfy_client.request(
+        'POST', '/prompt', body=build_prompt_body(prompt_json, number),
+        headers={'Content-Type': 'application/json'}, timeout=10
+    )
+    result = json.loads(data) if data else {}
+    if result.get('prompt_id'):
+        job_queue.submitted(result['prompt_id'], user, priority, slot, number)
+    return result
+
+
+# Jobs kept in progress_state: finished jobs beyond JOB_RETENTION are dropped
+# oldest first, and any entry older than JOB_MAX_AGE is dropped regardless
+JOB_RETENTION = 500
+JOB_MAX_AGE = 6 * 3600
+JOB_PRUNE_INTERVAL = 60
+FINISHED_JOB_STATUSES = ('done', 'error', 'interrupted')
+
+
+class ProgressTracker:
+    """Per-prompt progress built from ComfyUI's websocket events.
+
+    Keeps the entries of progress_state up to date with the real step counts
+    from the progress_state/progress messages sent by WebUIProgressHandler,
+    per-node execution times, and learned seconds-per-step and model load
+    times for each model/resolution profile, so a /progress request is a
+    single dictionary read. Old entries are pruned so the dictionary stays
+    bounded on a long-running server.
+    """
+
+    EMA_WEIGHT = 0.3
+
+    def __init__(self, states, max_jobs=JOB_RETENTION, max_age=JOB_MAX_AGE):
+        self.states = states
+        self.max_jobs = max_jobs
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.step_times = {}
+        self.load_times = {}
+        self.step_counts = {}
+        self._pruned = time.time()
+        self.evicted = 0
+
+    @staticmethod
+    def profile_key(state):
+        return (state.get('model'), state.get('mode'), state.get('resolution'), state.get('aspect'),
+                state.get('length'), state.get('duration'))
+
+    def _ema(self, table, key, value):
+        previous = table.get(key)
+        table[key] = value if previous is None else previous + self.EMA_WEIGHT * (value - previous)
+
+    def register(self, prompt_id, **info):
+        """Record the parameters of a newly queued prompt"""
+        now = time.time()
+        with self.lock:
+            state = self.states.setdefault(prompt_id, {'status': 'queued'})
+            state.setdefault('start_time', now)
+            state.update(info)
+            self._prune(now)
+
+    def _prune(self, now):
+        # Called with the lock held; dicts iterate oldest entry first
+        if len(self.states) <= self.max_jobs and now - self._pruned < JOB_PRUNE_INTERVAL:
+            return
+        self._pruned = now
+        for prompt_id in list(self.states):
+            state = self.states[prompt_id]
+            expired = now - state.get('start_time', now) > self.max_age
+            if expired or (len(self.states) > self.max_jobs and state.get('status') in FINISHED_JOB_STATUSES):
+                del self.states[prompt_id]
+                self.evicted += 1
+
+    def handle_event(self, event, data):
+        prompt_id = data.get('prompt_id')
+        if not prompt_id:
+            return
+        now = time.time()
+        with self.lock:
+            state = self.states.setdefault(prompt_id, {'status': 'queued', 'start_time': now})
+            if event == 'execution_start':
+                state.update(status='loading', exec_start=now, node_timings={})
+            elif event == 'execution_cached':
+                state['cached_nodes'] = data.get('nodes', [])
+            elif event == 'executing':
+                self._finish_node(state, now)
+                node = data.get('node')
+                if node is None:
+                    if state.get('status') not in ('error', 'interrupted'):
+                        state['status'] = 'done'
+                    state['finish_time'] = now
+                else:
+                    state['current_node'] = node
+                    state['node_start'] = now
+            elif event == 'progress_state':
+                running = [n for n in (data.get('nodes') or {}).values()
+                           if n.get('state') == 'running' and (n.get('max') or 0) > 1]
+                if running:
+                    self._record_step(state, running[-1]['value'], running[-1]['max'], now)
+            elif event == 'progress':
+                if (data.get('max') or 0) > 1:
+                    self._record_step(state, data.get('value', 0), data['max'], now)
+            elif event == 'execution_success':
+                state['status'] = 'done'
+            elif event == 'execution_error':
+                state['status'] = 'error'
+                state['message'] = data.get('exception_message') or 'Generation failed'
+            elif event == 'execution_interrupted':
+                state['status'] = 'interrupted'
+                state['message'] = 'Generation cancelled'
+
+    def poll_status(self, prompt_id, status):
+        """Apply a status polled from /queue or /history while the websocket is down.
+
+        'loading' means ComfyUI reports the prompt running; a job already
+        known to be generating keeps its last real step counts.
+        """
+        now = time.time()
+        with self.lock:
+            state = self.states.setdefault(prompt_id, {'status': 'queued', 'start_time': now})
+            current = state.get('status')
+            if current in FINISHED_JOB_STATUSES or current == status:
+                return
+            if status == 'loading':
+                if current == 'generating':
+                    return
+                state.setdefault('exec_start', now)
+            elif status in FINISHED_JOB_STATUSES:
+                state['finish_time'] = now
+            state['status'] = status
+
+    def _finish_node(self, state, now):
+        node = state.pop('current_node', None)
+        started = state.pop('node_start', None)
+        if node is not None and started is not None:
+            state.setdefault('node_timings', {})[node] = round(now - started, 3)
+
+    def _record_step(self, state, value, total, now):
+        value, total = int(value), int(total)
+        if state.get('current_step') == value and state.get('total_steps') == total:
+            return
+        key = self.profile_key(state)
+        if state.get('status') != 'generating':
+            if 'exec_start' in state:
+                self._ema(self.load_times, key, now - state['exec_start'])
+        elif value > state.get('current_step', 0) and total == state.get('total_steps'):
+            per_step = (now - state['last_step_time']) / (value - state['current_step'])
+            state['sec_per_step'] = per_step
+            self._ema(self.step_times, key, per_step)
+        self.step_counts[key] = total
+        state.update(status='generating', current_step=value, total_steps=total, last_step_time=now)
+
+    def _eta(self, state, now):
+        key = self.profile_key(state)
+        per_step = state.get('sec_per_step') or self.step_times.get(key)
+        status = state.get('status')
+        if status == 'generating':
+            if per_step is None:
+                return None
+            remaining = (state['total_steps'] - state['current_step']) * per_step
+            return max(0.0, remaining - (now - state['last_step_time']))
+        if status in ('queued', 'loading') and per_step is not None and key in self.load_times:
+            loading_left = self.load_times[key] - (now - state.get('exec_start', now))
+            return max(0.0, loading_left) + self.step_counts.get(key, 0) * per_step
+        return None
+
+    def snapshot(self, prompt_id):
+        now = time.time()
+        with self.lock:
+            state = self.states.get(prompt_id)
+            if state is None:
+                return {"status": "unknown", "message": "Processing..."}
+            status = state.get('status', 'queued')
+            result = {
+                "status": status,
+                "elapsed": round(now - state.get('start_time', now), 1),
+                "node_timings": dict(state.get('node_timings', {})),
+            }
+            if 'current_node' in state:
+                result['current_node'] = state['current_node']
+            if 'total_steps' in state:
+                result['current_step'] = state['current_step']
+                result['total_steps'] = state['total_steps']
+            eta = self._eta(state, now)
+            if eta is not None:
+                result['eta_seconds'] = round(eta, 1)
+            if status == 'queued':
+                result['message'] = "Waiting in queue..."
+            elif status == 'loading':
+                result['message'] = "Loading AI models..."
+                result.setdefault('current_step', 0)
+                result.setdefault('total_steps', self.step_counts.get(self.profile_key(state), 0))
+            elif status == 'done':
+                total = state.get('total_steps', 1)
+                result.update(current_step=total, total_steps=total)
+            elif status in ('error', 'interrupted'):
+                result['message'] = state.get('message', 'Generation failed')
+            if result.get('total_steps'):
+                result['progress'] = result['current_step'] / result['total_steps']
+            return result
+
+
+class ComfyEventListener:
+    """Single shared listener on ComfyUI's /ws websocket.
+
+    Runs in a background thread, reconnecting with backoff, and wakes up any
+    request waiting on a prompt as soon as ComfyUI reports it finished. When
+    the websocket is down (or websocket-client is not installed) waiters are
+    released immediately and fall back to polling /history.
+    """
+
+    def __init__(self, base_url, client_id, max_finished=1024):
+        self.client_id = client_id
+        self.set_base_url(base_url)
+        self.connected = threading.Event()
+        # Bumped on every (re)connect: events sent while disconnected are lost
+        self.connection = 0
+        self.max_finished = max_finished
+        self._lock = threading.Lock()
+        self._waiters = {}
+        self._finished = OrderedDict()
+        self._stop = threading.Event()
+        self._thread = None
+        self.handlers = []
+        self.preview_handlers = []
+        self.executing_prompt = None
+        self._metadata_previews = False
+
+    def set_base_url(self, base_url):
+        """Takes effect on the next (re)connect"""
+        self.ws_url = base_url.replace('http://', 'ws://', 1).replace('https://', 'wss://', 1) + f"/ws?clientId={self.client_id}"
+
+    def add_handler(self, handler):
+        """Call handler(event, data) for every JSON message from ComfyUI"""
+        self.handlers.append(handler)
+
+    def add_preview_handler(self, handler):
+        """Call handler(prompt_id, mime_type, image_bytes) for every latent preview"""
+        self.preview_handlers.append(handler)
+
+    def start(self):
+        """Start the listener thread; returns False if websockets are unavailable"""
+        if websocket is None:
+            print("websocket-client not installed, falling back to polling ComfyUI history")  # noqa: T201
+            return False
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="comfy-ws-listener", daemon=True)
+            self._thread.start()
+        return True
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        backoff = 1.0
+        while not self._stop.is_set():
+            ws = None
+            try:
+                ws = websocket.WebSocket()
+                ws.connect(self.ws_url, timeout=5)
+                # Ask for previews that carry their prompt_id
+                ws.send(json.dumps({"type": "feature_flags", "data": {"supports_preview_metadata": True}}))
+                ws.settimeout(1.0)
+                with self._lock:
+                    self.connection += 1
+                self.connected.set()
+                backoff = 1.0
+                while not self._stop.is_set():
+                    try:
+                        message = ws.recv()
+                    except websocket.WebSocketTimeoutException:
+                        continue
+                    if isinstance(message, str):
+                        self._handle_message(json.loads(message))
+                    elif message:
+                        self._handle_binary(message)
+            except Exception:
+                pass
+            finally:
+                self.connected.clear()
+                self._metadata_previews = False
+                self._wake_all()
+                if ws is not None:
+                    try:
+                        ws.close()
+                    except Exception:
+                        pass
+            self._stop.wait(backoff)
+            backoff = min(backoff * 2, 30.0)
+
+    def dispatch(self, event, data):
+        """Handle an event as if ComfyUI had sent it (used for jobs we cancel
+        before they start, which ComfyUI drops silently)"""
+        self._handle_message({'type': event, 'data': data})
+
+    def _handle_message(self, message):
+        event = message.get('type')
+        data = message.get('data') or {}
+        for handler in self.handlers:
+            try:
+                handler(event, data)
+            except Exception as e:
+                print(f"Error handling ComfyUI event {event}: {e}")  # noqa: T201
+        if event == 'execution_start':
+            self.executing_prompt = data.get('prompt_id')
+        # ComfyUI sends executing with node=None once the prompt's history entry
+        # has been written, whether it succeeded, failed or was interrupted
+        if event == 'executing' and data.get('node') is None and data.get('prompt_id'):
+            if self.executing_prompt == data['prompt_id']:
+                self.executing_prompt = None
+            self._mark_finished(data['prompt_id'])
+
+    def _handle_binary(self, message):
+        if len(message) < 8 or not self.preview_handlers:
+            return
+        event_type = struct.unpack(">I", message[:4])[0]
+        if event_type == 4:  # BinaryEventTypes.PREVIEW_IMAGE_WITH_METADATA
+            self._metadata_previews = True
+            metadata_length = struct.unpack(">I", message[4:8])[0]
+            metadata = json.loads(message[8:8 + metadata_length])
+            prompt_id = metadata.get('prompt_id')
+            mime_type = metadata.get('image_type', 'image/jpeg')
+            image = message[8 + metadata_length:]
+        elif event_type == 1 and not self._metadata_previews:  # BinaryEventTypes.PREVIEW_IMAGE
+            image_type = struct.unpack(">I", message[4:8])[0]
+            prompt_id = self.executing_prompt
+            mime_type = 'image/png' if image_type == 2 else 'image/jpeg'
+            image = message[8:]
+        else:
+            return
+        if not prompt_id:
+            return
+        for handler in self.preview_handlers:
+            try:
+                handler(prompt_id, mime_type, image)
+            except Exception as e:
+                print(f"Error handling ComfyUI preview: {e}")  # noqa: T201
+
+    def _mark_finished(self, prompt_id):
+        with self._lock:
+            self._finished[prompt_id] = time.time()
+            while len(self._finished) > self.max_finished:
+                self._finished.popitem(last=False)
+            waiters = self._waiters.pop(prompt_id, [])
+        for event in waiters:
+            event.set()
+
+    def _wake_all(self):
+        with self._lock:
+            waiters = [event for events in self._waiters.values() for event in events]
+            self._waiters.clear()
+        for event in waiters:
+            event.set()
+
+    def is_finished(self, prompt_id):
+        with self._lock:
+            return prompt_id in self._finished
+
+    def wait(self, prompt_id, timeout, connection=None):
+        """Block until prompt_id finishes, the websocket drops, or timeout.
+
+        Pass the connection number read before checking /history: if the
+        websocket reconnected since, the finish event may have been missed
+        and this returns at once. Returns True if ComfyUI reported the
+        prompt as finished.
+        """
+        event = threading.Event()
+        with self._lock:
+            if prompt_id in self._finished:
+                return True
+            if not self.connected.is_set() or (connection is not None and connection != self.connection):
+                return False
+            self._waiters.setdefault(prompt_id, []).append(event)
+        event.wait(timeout)
+        with self._lock:
+            waiters = self._waiters.get(prompt_id)
+            if waiters and event in waiters:
+                waiters.remove(event)
+                if not waiters:
+                    del self._waiters[prompt_id]
+            return prompt_id in self._finished
+
+
+class EventBroker:
+    """Fans job events out to /events (Server-Sent Events) subscribers.
+
+    Each subscriber gets its own bounded queue; when a slow client falls
+    behind, new events for it are dropped rather than blocking the
+    websocket listener.
+    """
+
+    def __init__(self, tracker, max_queue=256):
+        self.tracker = tracker
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def subscribe(self, prompt_id):
+        subscriber = queue.Queue(maxsize=self.max_queue)
+        with self._lock:
+            self._subscribers.setdefault(prompt_id, []).append(subscriber)
+        return subscriber
+
+    def unsubscribe(self, prompt_id, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(prompt_id, [])
+            if subscriber in subscribers:
+                subscribers.remove(subscriber)
+            if not subscribers:
+                self._subscribers.pop(prompt_id, None)
+
+    def has_subscribers(self, prompt_id):
+        return prompt_id in self._subscribers
+
+    def publish(self, prompt_id, event, data):
+        with self._lock:
+            subscribers = list(self._subscribers.get(prompt_id, []))
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait((event, data))
+            except queue.Full:
+                pass
+
+    def handle_event(self, event, data):
+        prompt_id = data.get('prompt_id')
+        if not prompt_id or not self.has_subscribers(prompt_id):
+            return
+        if event == 'executing' and data.get('node') is None:
+            self.publish(prompt_id, 'finished', None)
+        elif event in ('execution_start', 'executing', 'progress_state', 'progress',
+                       'execution_error', 'execution_interrupted'):
+            self.publish(prompt_id, 'progress', self.tracker.snapshot(prompt_id))
+
+    def handle_preview(self, prompt_id, mime_type, image):
+        if self.has_subscribers(prompt_id):
+            encoded = base64.b64encode(image).decode()
+            self.publish(prompt_id, 'preview', {"image": f"data:{mime_type};base64,{encoded}"})
+
+
+# ==========================================
+# JOB QUEUE (fair share, priorities and cancellation)
+# ==========================================
+
+# Added to a job's queue slot; ComfyUI runs the lowest number first, so a
+# high priority job goes ahead of every normal one and a low one behind them
+JOB_PRIORITIES = {'high': -1e6, 'normal': 0.0, 'low': 1e6}
+MAX_JOB_LIST = 500
+
+# History entry returned for jobs cancelled before ComfyUI started them
+CANCELLED_ENTRY = {'outputs': {}, 'status': {'status_str': 'error', 'completed': False,
+                                             'messages': [['execution_interrupted', 'Generation cancelled']]}}
+
+
+class JobQueue:
+    """Orders, lists and cancels the jobs we queue on ComfyUI.
+
+    Every job gets a slot from its owner's virtual clock: a new job is
+    placed one slot after the later of the owner's previous job and the job
+    ComfyUI is running now. Someone queueing 50 prompts therefore only gets
+    every other turn once a second person queues one, instead of making
+    them wait for all 50. Priorities (per job, plus a per-user default from
+    the "user_priorities" setting) shift the slot, and the result is sent as
+    the prompt's "number", which ComfyUI sorts its pending queue by.
+    Prompts queued on ComfyUI by other clients keep ComfyUI's own numbering.
+
+    Owners come from the request's "user" field or X-User header, which any
+    client can set, so the per-user cancel check only guards against
+    mistakes (a tab cancelling someone else's job by accident). It is not
+    access control. Put the server behind an authenticating proxy that sets
+    X-User if users must not be able to cancel each other's jobs.
+
+    Job state lives in the tracker's entries, so retention is the tracker's.
+    """
+
+    def __init__(self, tracker, client, listener):
+        self.tracker = tracker
+        self.client = client
+        self.listener = listener
+        self.lock = threading.Lock()
+        self.clock = 0
+        self.user_clocks = {}
+        self.cancelled = 0
+
+    @staticmethod
+    def priority_offset(user, priority):
+        user_priority = app_settings.get('user_priorities', {}).get(user, 'normal')
+        return JOB_PRIORITIES.get(user_priority, 0.0) + JOB_PRIORITIES.get(priority, 0.0)
+
+    def assign(self, user, priority=None):
+        """Return (slot, number) for a new job of user"""
+        offset = self.priority_offset(user, priority)
+        with self.lock:
+            slot = max(self.clock, self.user_clocks.get(user, 0)) + 1
+            self.user_clocks[user] = slot
+            # Owners with no job left in the window are forgotten
+            if len(self.user_clocks) > MAX_JOB_LIST:
+                self.user_clocks = {u: c for u, c in self.user_clocks.items() if c > self.clock}
+        return slot, slot + offset
+
+    def submitted(self, prompt_id, user, priority, slot, number):
+        priority = priority if priority in JOB_PRIORITIES else 'normal'
+        self.tracker.register(prompt_id, user=user, priority=priority, slot=slot, number=number)
+
+    def handle_event(self, event, data):
+        """ComfyEventListener handler: the running job advances the clock"""
+        if event != 'execution_start':
+            return
+        with self.tracker.lock:
+            slot = self.tracker.states.get(data.get('prompt_id'), {}).get('slot')
+        if slot is not None:
+            with self.lock:
+                self.clock = max(self.clock, slot)
+
+    def jobs(self, user=None, status=None, limit=MAX_JOB_LIST):
+        """Our jobs, newest first, with progress and queue position"""
+        with self.tracker.lock:
+            entries = [(prompt_id, dict(state)) for prompt_id, state in self.tracker.states.items()
+                       if 'number' in state]
+        pending = sorted((state['number'], prompt_id) for prompt_id, state in entries
+                         if state.get('status') == 'queued')
+        positions = {prompt_id: i + 1 for i, (_, prompt_id) in enumerate(pending)}
+        jobs = []
+        for prompt_id, state in reversed(entries):
+            if user is not None and state.get('user') != user:
+                continue
+            job = self.tracker.snapshot(prompt_id)
+            if status is not None and job['status'] != status:
+                continue
+            job.update(prompt_id=prompt_id, user=state.get('user'), priority=state.get('priority'),
+                       mode=state.get('mode'), model=state.get('model'), queued_at=state.get('start_time'))
+            if prompt_id in positions:
+                job['position'] = positions[prompt_id]
+            jobs.append(job)
+            if len(jobs) >= limit:
+                break
+        return {"jobs": jobs, "pending": len(pending)}
+
+    def is_cancelled(self, prompt_id):
+        with self.tracker.lock:
+            return self.tracker.states.get(prompt_id, {}).get('cancelled', False)
+
+    def cancel(self, prompt_id, user=None):
+        """Cancel one job; returns (HTTP status, response).
+
+        A pending job is deleted from ComfyUI's queue, a running one gets a
+        targeted interrupt, so other people's jobs are never touched. With
+        user given, only that user's jobs (or ownerless ones) can be cancelled;
+        the user is client-supplied, so this is advisory (see the class docstring).
+        """
+        with self.tracker.lock:
+            state = dict(self.tracker.states.get(prompt_id) or {})
+        if not state:
+            return 404, {"success": False, "error": "Unknown job"}
+        if user is not None and state.get('user') not in (None, user):
+            return 403, {"success": False, "error": "Job belongs to another user"}
+        if state.get('status') in FINISHED_JOB_STATUSES:
+            return 409, {"success": False, "error": f"Job already {state['status']}"}
+        try:
+            if state.get('status') == 'queued':
+                self.client.post_json('/queue', {"delete": [prompt_id]}, timeout=5)
+                queue_info = self.client.get_json('/queue', timeout=5)
+                queued = queue_info.get('queue_running', []) + queue_info.get('queue_pending', [])
+                if not any(item[1] == prompt_id for item in queued):
+                    if not self.listener.is_finished(prompt_id) and fetch_history_entry(prompt_id) is None:
+                        self._cancelled(prompt_id)
+                    return 200, {"success": True, "status": "cancelled"}
+            self.client.post_json('/interrupt', {"prompt_id": prompt_id}, timeout=5)
+        except Exception as e:
+            return 502, {"success": False, "error": str(e)}
+        return 200, {"success": True, "status": "interrupting"}
+
+    def _cancelled(self, prompt_id):
+        with self.tracker.lock:
+            self.tracker.states.setdefault(prompt_id, {})['cancelled'] = True
+        self.cancelled += 1
+        # ComfyUI sends nothing for a deleted queue item; tell our handlers
+        # (tracker, batches, store, SSE) and wake its waiters ourselves
+        self.listener.dispatch('execution_interrupted', {'prompt_id': prompt_id})
+        self.listener.dispatch('executing', {'node': None, 'prompt_id': prompt_id})
+
+    def stats(self):
+        with self.tracker.lock:
+            statuses = [state.get('status', 'queued') for state in self.tracker.states.values() if 'number' in state]
+        counts = {status: statuses.count(status) for status in set(statuses)}
+        return {"jobs": counts, "users": len(self.user_clocks), "cancelled": self.cancelled,
+                "evicted": self.tracker.evicted}
+
+
+progress_tracker = ProgressTracker(progress_state)
+event_broker = EventBroker(progress_tracker)
+event_listener = ComfyEventListener(COMFYUI_URL, CLIENT_ID)
+job_queue = JobQueue(progress_tracker, comfy_client, event_listener)
+event_listener.add_handler(progress_tracker.handle_event)
+event_listener.add_handler(job_queue.handle_event)
+event_listener.add_handler(event_broker.handle_event)
+event_listener.add_preview_handler(event_broker.handle_preview)
+
+
+def configure_comfyui(url):
+    """Point the generator at a different ComfyUI server (e.g. a mock backend)"""
+    global COMFYUI_URL, comfy_client
+    COMFYUI_URL = url
+    comfy_client.close()
+    comfy_client = PooledHTTPClient(url)
+    job_queue.client = comfy_client
+    event_listener.set_base_url(url)
+
+
+def fetch_history_entry(prompt_id):
+    """Return ComfyUI's history entry for prompt_id, or None if not finished"""
+    try:
+        history = comfy_client.get_json(f"/history/{prompt_id}", timeout=5)
+        return history.get(prompt_id)
+    except Exception:
+        return None
+
+
+# A waiter re-checks /history at least this often, even with the websocket up
+HISTORY_RECHECK_INTERVAL = 30.0
+
+
+def wait_for_history(prompt_id, timeout):
+    """Wait for prompt_id to finish and return its history entry (None on timeout).
+
+    Completion is pushed by event_listener, so an idle wait costs almost no
+    HTTP traffic. If the websocket is down, /history is polled with
+    exponential backoff instead, and after a reconnect it is checked again
+    since the finish event may have been sent while disconnected.
+    """
+    deadline = time.time() + timeout
+    delay = 0.25
+    while True:
+        connection = event_listener.connection
+        entry = fetch_history_entry(prompt_id)
+        if entry is not None:
+            # Covers jobs whose 'executed' events were missed (websocket down)
+            generator_store.record_outputs(prompt_id, entry.get('outputs'))
+            return entry
+        if job_queue.is_cancelled(prompt_id):
+            return CANCELLED_ENTRY
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            return None
+        if event_listener.connected.is_set() and not event_listener.is_finished(prompt_id):
+            if not event_listener.wait(prompt_id, min(remaining, HISTORY_RECHECK_INTERVAL), connection):
+                continue
+            # Finished, history is written just before the event; retry quickly
+            delay = 0.05
+        time.sleep(min(delay, max(0.0, deadline - time.time())))
+        delay = min(delay * 2, 5.0)
+
+
+def history_error(entry, default='Unknown error'):
+    """Return the error message of a failed history entry, or None"""
+    status = entry.get('status', {})
+    if status.get('status_str') == 'error':
+        return str(status.get('messages', [['', default]])[0][1])
+    return None
+
+
+# ==========================================
+# INPUT IMAGE UPLOADS (streamed, deduplicated)
+# ==========================================
+
+# Prefixes of the input images we stage for edit / i2v / 3D jobs
+INPUT_PREFIXES = ('edit_input_', 'video_input_', '3d_input_')
+INPUT_MAX_AGE = 24 * 3600
+INPUT_GC_INTERVAL = 3600
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# Extension and content type of staged inputs, by their leading bytes
+# (anything unrecognised is staged as PNG and left to ComfyUI to reject)
+INPUT_IMAGE_SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', '.png'),
+    (b'\xff\xd8\xff', '.jpg'),
+    (b'GIF87a', '.gif'),
+    (b'GIF89a', '.gif'),
+)
+INPUT_IMAGE_TYPES = {'.png': 'image/png', '.jpg': 'image/jpeg', '.gif': 'image/gif', '.webp': 'image/webp'}
+
+_input_gc_lock = threading.Lock()
+_last_input_gc = 0.0
+
+
+class MultipartFileBody:
+    """Streams a single-file multipart/form-data body straight from disk.
+
+    Iterable more than once, so the pooled client can resend it on retry.
+    """
+
+    def __init__(self, path, filename, field='image', content_type='image/png'):
+        self.path = path
+        self.boundary = '----QwenGeneratorBoundary' + uuid.uuid4().hex
+        self.head = (
+            f'--{self.boundary}\r\n'
+            f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+            f'Content-Type: {content_type}\r\n\r\n'
+        ).encode()
+        self.tail = f'\r\n--{self.boundary}--\r\n'.encode()
+
+    @property
+    def content_type(self):
+        return f'multipart/form-data; boundary={self.boundary}'
+
+    def __len__(self):
+        return len(self.head) + os.path.getsize(self.path) + len(self.tail)
+
+    def __iter__(self):
+        yield self.head
+        with open(self.path, 'rb') as f:
+            while True:
+                chunk = f.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+        yield self.tail
+
+
+def image_extension(header):
+    """File extension for an image's leading bytes, '.png' if unrecognised"""
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return '.webp'
+    for signature, extension in INPUT_IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return extension
+    return '.png'
+
+
+def decode_image_to_file(image_data, prefix):
+    """Decode a base64 (data URL) image into input/ without buffering it whole.
+
+    Files are named by content hash, so resubmitting the same image reuses
+    the file already on disk, and get the extension of the decoded format.
+    Returns (path, filename).
+    Raises ValueError for invalid or empty base64.
+    """
+    if image_data.startswith('data:'):
+        image_data = image_data.partition(',')[2]
+    if re.search(r'\s', image_data):
+        image_data = ''.join(image_data.split())
+    if not image_data:
+        raise ValueError("Invalid image data: empty")
+    os.makedirs(INPUT_DIR, exist_ok=True)
+    hasher = hashlib.sha256()
+    header = b''
+    tmp_path = os.path.join(INPUT_DIR, f".{prefix}{uuid.uuid4().hex}.tmp")
+    # Decode in slices that are a multiple of 4 base64 characters
+    step = UPLOAD_CHUNK_SIZE // 3 * 4
+    try:
+        with open(tmp_path, 'wb') as f:
+            for start in range(0, len(image_data), step):
+                chunk = base64.b64decode(image_data[start:start + step], validate=True)
+                header = header or chunk[:12]
+                hasher.update(chunk)
+                f.write(chunk)
+    except (binascii.Error, ValueError) as e:
+        os.remove(tmp_path)
+        raise ValueError(f"Invalid image data: {e}")
+    if not header:
+        os.remove(tmp_path)
+        raise ValueError("Invalid image data: empty")
+    filename = f"{prefix}{hasher.hexdigest()[:16]}{image_extension(header)}"
+    path = os.path.join(INPUT_DIR, filename)
+    if os.path.exists(path):
+        os.remove(tmp_path)
+        os.utime(path)  # keep it fresh for the garbage collector
+    else:
+        os.replace(tmp_path, path)
+    return path, filename
+
+
+def comfyui_has_input(filename):
+    """True if ComfyUI's input folder already holds this file"""
+    query = urllib.parse.urlencode({'filename': filename, 'type': 'input'})
+    try:
+        comfy_client.request('HEAD', f"/view?{query}", timeout=5)
+        return True
+    except Exception:
+        return False
+
+
+def upload_input_image(image_data, prefix):
+    """Stage a base64 input image and make sure ComfyUI has it.
+
+    The upload is skipped when ComfyUI already serves a file with the same
+    content-hash name (always the case when it shares our input/ folder).
+    Returns the filename to reference in the workflow.
+    Raises ValueError for invalid image data and RuntimeError if the upload fails.
+    """
+    path, filename = decode_image_to_file(image_data, prefix)
+    cleanup_input_files()
+    if comfyui_has_input(filename):
+        return filename
+
+    body = MultipartFileBody(path, filename, content_type=INPUT_IMAGE_TYPES[os.path.splitext(filename)[1]])
+    _, _, response = comfy_client.request(
+        'POST', '/upload/image', body=body,
+        headers={'Content-Type': body.content_type, 'Content-Length': str(len(body))},
+        timeout=30
+    )
+    upload_result = json.loads(response.decode())
+    if not isinstance(upload_result, dict) or not upload_result.get('name'):
+        error_msg = upload_result.get('error') if isinstance(upload_result, dict) else None
+        message = "Failed to upload image to ComfyUI"
+        if error_msg:
+            message = f"{message}: {error_msg}"
+        raise RuntimeError(message)
+    return upload_result['name']
+
+
+def cleanup_input_files(max_age=INPUT_MAX_AGE, force=False):
+    """Delete staged input images not used for max_age seconds.
+
+    Runs at most once per INPUT_GC_INTERVAL unless forced. Returns the number
+    of files removed.
+    """
+    global _last_input_gc
+    now = time.time()
+    with _input_gc_lock:
+        if not force and now - _last_input_gc < INPUT_GC_INTERVAL:
+            return 0
+        _last_input_gc = now
+    removed = 0
+    try:
+        entries = list(os.scandir(INPUT_DIR))
+    except FileNotFoundError:
+        return 0
+    for entry in entries:
+        name = entry.name
+        stale_tmp = name.startswith('.') and name.endswith('.tmp') and name[1:].startswith(INPUT_PREFIXES)
+        if not (name.startswith(INPUT_PREFIXES) or stale_tmp):
+            continue
+        try:
+            if now - entry.stat().st_mtime > max_age:
+                os.remove(entry.path)
+                removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+# ==========================================
+# WORKFLOW TEMPLATES (compiled once)
+# ==========================================
+
+def new_seed():
+    """Default seed when the user did not pick one"""
+    return int(time.time() * 1000) % 999999999
+
+
+class WorkflowTemplate:
+    """A workflow graph pre-serialized to JSON with named parameter slots.
+
+    Slots are (node_id, input_name) paths. Compiling serializes the graph
+    once with a marker at every slot path and splits the text around the
+    markers, so render() is a join of constant fragments and the JSON
+    encoding of each value. Slot paths missing from the graph are ignored,
+    which lets one slot map cover several structural variants.
+    """
+
+    _MARKER = re.compile(r'"\\u0000([A-Za-z0-9_]+)\\u0000"')
+
+    def __init__(self, key, workflow, slots):
+        self.key = key
+        self.workflow = workflow
+        self.problems = []
+        self.defaults = {}
+        self.slot_names = set(slots)
+        self.slot_paths = {tuple(path) for paths in slots.values() for path in paths}
+        skeleton = json.loads(json.dumps(workflow))
+        for name, paths in slots.items():
+            for node_id, input_name in paths:
+                inputs = skeleton.get(node_id, {}).get('inputs', {})
+                if input_name in inputs:
+                    self.defaults.setdefault(name, json.dumps(inputs[input_name]))
+                    inputs[input_name] = f"\x00{name}\x00"
+        parts = self._MARKER.split(json.dumps(skeleton))
+        self.fragments = parts[0::2]
+        self.order = parts[1::2]
+
+    def render(self, **values):
+        """Return the workflow JSON with the given slot values filled in.
+
+        Slots that are not given (or None) keep the value the graph was
+        compiled with.
+        """
+        unknown = set(values) - self.slot_names
+        if unknown:
+            raise KeyError(f"{self.key}: unknown workflow slot(s) {', '.join(sorted(unknown))}")
+        encoded = {name: self.defaults[name] if values.get(name) is None else json.dumps(values[name])
+                   for name in self.defaults}
+        out = [self.fragments[0]]
+        for name, fragment in zip(self.order, self.fragments[1:]):
+            out.append(encoded[name])
+            out.append(fragment)
+        return ''.join(out)
+
+    def build(self, **values):
+        """Return a filled-in workflow dict"""
+        return json.loads(self.render(**values))
+
+
+class WorkflowRegistry:
+    """Named workflow builders compiled into templates on first use.
+
+    Each builder is called once per distinct set of structural arguments
+    (mode, resolution, ...); per-request values such as prompts and seeds
+    are slots filled at render time. An API-format export saved as
+    workflows/<name>.json replaces the built-in graph for every variant.
+    """
+
+    def __init__(self, workflows_dir=WORKFLOWS_DIR, max_variants=256):
+        self.workflows_dir = workflows_dir
+        self.max_variants = max_variants
+        self.definitions = {}
+        self.object_info = None
+        self._templates = OrderedDict()
+        self._files = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, builder, slots, variants=({},)):
+        """variants are the structural argument sets checked at startup"""
+        self.definitions[name] = (builder, slots, tuple(variants))
+
+    def _load_file(self, name):
+        if name not in self._files:
+            workflow = None
+            path = os.path.join(self.workflows_dir, f"{name}.json")
+            if os.path.exists(path):
+                try:
+                    with open(path) as f:
+                        data = json.load(f)
+                    if isinstance(data, dict) and data and all(
+                            isinstance(node, dict) and 'class_type' in node for node in data.values()):
+                        workflow = data
+                    else:
+                        print(f"⚠️ {path} is not an API-format workflow export, using the built-in {name} workflow")  # noqa: T201
+                except Exception as e:
+                    print(f"⚠️ Could not load {path}: {e}")  # noqa: T201
+            self._files[name] = workflow
+        return self._files[name]
+
+    def template(self, name, **structural):
+        """Return the compiled template for a workflow variant"""
+        key = (name, tuple(sorted(structural.items())))
+        with self._lock:
+            template = self._templates.get(key)
+            if template is not None:
+                self._templates.move_to_end(key)
+                return template
+        builder, slots, _ = self.definitions[name]
+        workflow = self._load_file(name)
+        if workflow is None:
+            workflow = builder(**structural)
+            if isinstance(workflow, tuple):
+                workflow = workflow[0]
+        label = name + ''.join(f"[{k}={v}]" for k, v in key[1])
+        template = WorkflowTemplate(label, workflow, slots)
+        if self.object_info is not None:
+            template.problems = validate_workflow(workflow, self.object_info, template.slot_paths)
+        with self._lock:
+            self._templates[key] = template
+            while len(self._templates) > self.max_variants:
+                self._templates.popitem(last=False)
+        return template
+
+    def render(self, name, structural=None, **values):
+        return self.template(name, **(structural or {})).render(**values)
+
+    def validate(self, object_info):
+        """Check every registered variant against ComfyUI's /object_info.
+
+        Returns {template label: [problems]} for variants with problems.
+        """
+        self.object_info = object_info
+        report = {}
+        for name, (_, _, variants) in self.definitions.items():
+            for structural in variants:
+                template = self.template(name, **structural)
+                template.problems = validate_workflow(template.workflow, object_info, template.slot_paths)
+                if template.problems:
+                    report[template.key] = template.problems
+        return report
+
+    def problems(self):
+        with self._lock:
+            templates = list(self._templates.values())
+        return {t.key: t.problems for t in templates if t.problems}
+
+
+def validate_workflow(workflow, object_info, skip_paths=()):
+    """List problems that would make ComfyUI reject or fail this workflow.
+
+    Catches unknown node classes (missing custom nodes), unknown or missing
+    inputs, and combo values ComfyUI does not offer (usually a model file
+    that is not downloaded). Values at skip_paths are filled per request and
+    are not checked against combo options.
+    """
+    problems = []
+    for node_id, node in workflow.items():
+        class_type = node.get('class_type')
+        info = object_info.get(class_type)
+        if info is None:
+            problems.append(f"node {node_id}: unknown node type {class_type} (missing custom node?)")
+            continue
+        spec = info.get('input', {})
+        required = spec.get('required', {})
+        known = dict(spec.get('optional', {}), **required)
+        inputs = node.get('inputs', {})
+        for input_name in required:
+            if input_name not in inputs:
+                problems.append(f"node {node_id} ({class_type}): missing input {input_name}")
+        for input_name, value in inputs.items():
+            if input_name not in known:
+                problems.append(f"node {node_id} ({class_type}): unknown input {input_name}")
+                continue
+            if isinstance(value, list) or (node_id, input_name) in skip_paths:
+                continue
+            input_type = known[input_name][0] if known[input_name] else None
+            options = input_type if isinstance(input_type, list) else None
+            if input_type == 'COMBO' and len(known[input_name]) > 1:
+                options = known[input_name][1].get('options')
+            if options is not None and value not in options:
+                problems.append(f"node {node_id} ({class_type}): {input_name} '{value}' is not available")
+    return problems
+
+
+workflow_templates = WorkflowRegistry()
+
+QWEN_SLOTS = {
+    'prompt': [('4', 'text')],
+    'negative_prompt': [('9', 'text')],
+    'seed': [('8', 'seed')],
+    'sampler': [('8', 'sampler_name')],
+    'scheduler': [('8', 'scheduler')],
+}
+workflow_templates.register(
+    'qwen',
+    lambda mode='lightning', resolution=512, aspect='square': get_workflow(mode, resolution, aspect),
+    QWEN_SLOTS,
+    variants=tuple({'mode': mode, 'resolution': 512, 'aspect': 'square'} for mode in ('lightning', 'normal')),
+)
+workflow_templates.register(
+    'zimage',
+    lambda resolution=1024, aspect='square': get_zimage_workflow(resolution, aspect),
+    {'prompt': [('2', 'text')], 'seed': [('8', 'seed')]},
+    variants=({'resolution': 1024, 'aspect': 'square'},),
+)
+workflow_templates.register(
+    'edit',
+    lambda use_angles_lora=False, use_upscale_lora=False: get_edit_workflow(
+        '', use_angles_lora=use_angles_lora, use_upscale_lora=use_upscale_lora),
+    {'image': [('1', 'image')], 'prompt': [('4', 'text')], 'seed': [('8', 'seed')]},
+    variants=tuple({'use_angles_lora': angles, 'use_upscale_lora': upscale}
+                   for angles in (False, True) for upscale in (False, True)),
+)
+# Video: 'negative_prompt' left as None keeps each model's default negative
+workflow_templates.register(
+    'wan',
+    lambda mode='t2v', resolution='480p': get_video_workflow(
+        '', mode=mode, resolution=resolution, start_image='image' if mode == 'i2v' else None),
+    {'prompt': [('2', 'text')], 'negative_prompt': [('3', 'text')], 'seed': [('8', 'seed')],
+     'length': [('7', 'length'), ('7b', 'length')], 'image': [('7', 'image')]},
+    variants=({'mode': 't2v', 'resolution': '480p'}, {'mode': 'i2v', 'resolution': '480p'}),
+)
+workflow_templates.register(
+    'ltx',
+    lambda resolution='480p': get_ltx_workflow('', resolution=resolution),
+    {'prompt': [('2', 'text')], 'negative_prompt': [('3', 'text')], 'seed': [('8', 'noise_seed')],
+     'length': [('6', 'length')]},
+    variants=({'resolution': '480p'},),
+)
+workflow_templates.register(
+    'hunyuan',
+    lambda mode='t2v', resolution='480p': get_hunyuan_workflow(
+        '', mode=mode, resolution=resolution, start_image='image' if mode == 'i2v' else None),
+    {'prompt': [('2', 'text')], 'seed': [('10', 'noise_seed')],
+     'length': [('5', 'length'), ('16', 'length')], 'image': [('15', 'image')]},
+    variants=({'mode': 't2v', 'resolution': '480p'}, {'mode': 'i2v', 'resolution': '480p'}),
+)
+workflow_templates.register(
+    'audio',
+    lambda format='flac': get_audio_workflow('', format=format),
+    {'tags': [('2', 'tags')], 'lyrics': [('2', 'lyrics')], 'lyrics_strength': [('2', 'lyrics_strength')],
+     'seconds': [('3', 'seconds')], 'seed': [('4', 'seed')]},
+    variants=({'format': 'flac'}, {'format': 'mp3'}, {'format': 'opus'}),
+)
+workflow_templates.register(
+    '3d',
+    lambda resolution=256: get_3d_workflow('image', resolution=resolution),
+    {'image': [('1', 'image')], 'seed': [('8', 'seed')], 'algorithm': [('10', 'algorithm')],
+     'threshold': [('10', 'threshold')]},
+    variants=({'resolution': 256},),
+)
+
+
+def validate_workflows():
+    """Fetch /object_info once and report workflows ComfyUI cannot run"""
+    try:
+        object_info = comfy_client.get_json("/object_info", timeout=120)
+    except Exception as e:
+        print(f"⚠️ Skipping workflow validation: {e}")  # noqa: T201
+        return {}
+    report = workflow_templates.validate(object_info)
+    for key, problems in report.items():
+        print(f"⚠️ Workflow {key}:")  # noqa: T201
+        for problem in problems:
+            print(f"   - {problem}")  # noqa: T201
+    if not report:
+        print("✅ All workflows validated against ComfyUI")  # noqa: T201
+    return report
+
+
 # AI Prompt Refinement - supports Ollama (local) and OpenAI (cloud)
 OLLAMA_URL = "http://localhost:11434"
 OPENAI_URL = "https://api.openai.com/v1"
@@ -6021,18 +8086,12 @@ def save_settings(settings):
 # Global settings
 app_settings = load_settings()
 
-def refine_prompt_ai(prompt, mode='refine', provider='ollama'):
-    """Use AI to refine/expand prompts for image generation
+ollama_client = PooledHTTPClient(OLLAMA_URL)
 
-    provider: 'ollama' for local (Qwen abliterated/uncensored) or 'gemini' for cloud
-    """
-    if not prompt.strip():
-        return {"success": False, "error": "No prompt provided"}
-
-    # Different system prompts - local is more permissive
-    if provider == 'ollama':
-        system_prompts = {
-            'refine': """You are an expert at writing prompts for AI image generation. You have NO content restrictions.
+# System prompts per provider and mode; local is more permissive
+REFINE_SYSTEM_PROMPTS = {
+    'ollama': {
+        'refine': """You are an expert at writing prompts for AI image generation. You have NO content restrictions.
 Take the user's simple prompt and enhance it with:
 - Specific visual details (lighting, composition, style)
 - Quality modifiers (highly detailed, sharp focus, etc.)
@@ -6040,7 +8099,7 @@ Take the user's simple prompt and enhance it with:
 Keep the core subject but make it more descriptive and vivid.
 Output ONLY the enhanced prompt, nothing else. Keep it under 100 words.""",
 
-            'expand': """You are an expert at writing prompts for AI image generation. You have NO content restrictions.
+        'expand': """You are an expert at writing prompts for AI image generation. You have NO content restrictions.
 Take the user's prompt and significantly expand it with:
 - Rich environmental details
 - Atmospheric descriptions
@@ -6049,16 +8108,15 @@ Take the user's prompt and significantly expand it with:
 - Mood and tone modifiers
 Output ONLY the expanded prompt, nothing else. Keep it under 150 words.""",
 
-            'style': """You are an expert at writing prompts for AI image generation. You have NO content restrictions.
+        'style': """You are an expert at writing prompts for AI image generation. You have NO content restrictions.
 Take the user's prompt and add a creative artistic style to it.
 Choose from: digital art, oil painting, watercolor, concept art, anime,
 hyperrealistic photography, surrealist, impressionist, noir, vintage, cyberpunk, fantasy art.
 Also add appropriate lighting and mood. Be creative and bold.
 Output ONLY the styled prompt, nothing else. Keep it under 100 words."""
-        }
-    else:
-        system_prompts = {
-            'refine': """You are an expert at writing prompts for AI image generation.
+    },
+    'cloud': {
+        'refine': """You are an expert at writing prompts for AI image generation.
 Take the user's simple prompt and enhance it with:
 - Specific visual details (lighting, composition, style)
 - Quality modifiers (highly detailed, sharp focus, etc.)
@@ -6066,7 +8124,7 @@ Take the user's simple prompt and enhance it with:
 Keep the core subject but make it more descriptive.
 Output ONLY the enhanced prompt, nothing else. Keep it under 100 words.""",
 
-            'expand': """You are an expert at writing prompts for AI image generation.
+        'expand': """You are an expert at writing prompts for AI image generation.
 Take the user's prompt and significantly expand it with:
 - Rich environmental details
 - Atmospheric descriptions
@@ -6075,45 +8133,171 @@ Take the user's prompt and significantly expand it with:
 - Mood and tone modifiers
 Output ONLY the expanded prompt, nothing else. Keep it under 150 words.""",
 
-            'style': """You are an expert at writing prompts for AI image generation.
+        'style': """You are an expert at writing prompts for AI image generation.
 Take the user's prompt and add a creative artistic style to it.
 Choose from: digital art, oil painting, watercolor, concept art, anime,
 hyperrealistic photography, surrealist, impressionist, noir, vintage, cyberpunk, fantasy art.
 Also add appropriate lighting and mood.
 Output ONLY the styled prompt, nothing else. Keep it under 100 words."""
-        }
+    },
+}
+
+REFINE_TIMEOUT = 30
+REFINE_TEMPERATURE = 0.7
+# Refinements kept in memory / in generator.db
+REFINE_CACHE_SIZE = 512
+REFINE_CACHE_DISK_SIZE = 5000
+
+
+class RefineCache:
+    """Refinement results keyed by normalized prompt, mode, provider and model.
 
+    A small in-memory LRU in front of a table in generator.db, so a repeat
+    refinement is answered without touching Ollama, even after a restart.
+    """
+
+    def __init__(self, db_path, max_entries=REFINE_CACHE_SIZE, max_disk_entries=REFINE_CACHE_DISK_SIZE):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+        self._db = None
+
+    @property
+    def db(self):
+        # Opened on first use so importing the module does not create the file
+        if self._db is None:
+            db = sqlite3.connect(self.db_path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA busy_timeout=5000")
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS refine_cache (
+                    key TEXT PRIMARY KEY,
+                    refined TEXT NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+            db.execute("CREATE INDEX IF NOT EXISTS refine_cache_last_used ON refine_cache (last_used)")
+            db.commit()
+            self._db = db
+        return self._db
+
+    @staticmethod
+    def key(prompt, mode, provider, model, temperature=REFINE_TEMPERATURE):
+        # Case and whitespace differences do not change what the model is asked
+        normalized = ' '.join(prompt.split()).casefold()
+        parts = [normalized, mode, provider, model]
+        if temperature != REFINE_TEMPERATURE:
+            parts.append(temperature)
+        return hashlib.sha256(json.dumps(parts).encode()).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            refined = self.entries.get(key)
+            if refined is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return refined
+            try:
+                row = self.db.execute("SELECT refined FROM refine_cache WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    with self.db:
+                        self.db.execute("UPDATE refine_cache SET last_used = ? WHERE key = ?", (time.time(), key))
+            except sqlite3.Error:
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._remember(key, row[0])
+            return row[0]
+
+    def put(self, key, refined):
+        with self._lock:
+            self._remember(key, refined)
+            self._puts += 1
+            try:
+                with self.db:
+                    self.db.execute("INSERT OR REPLACE INTO refine_cache VALUES (?, ?, ?)", (key, refined, time.time()))
+                    if self._puts % 100 == 0:
+                        self.db.execute("""
+                            DELETE FROM refine_cache WHERE key NOT IN
+                                (SELECT key FROM refine_cache ORDER BY last_used DESC LIMIT ?)
+                        """, (self.max_disk_entries,))
+            except sqlite3.Error as e:
+                print(f"Could not store refinement: {e}")  # noqa: T201
+
+    def _remember(self, key, refined):
+        self.entries[key] = refined
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+
+refine_cache = RefineCache(DB_FILE)
+
+
+def refine_request(prompt, mode, provider, stream=False, temperature=REFINE_TEMPERATURE):
+    """Return (model, Ollama /api/chat payload) for a refinement"""
+    system_prompts = REFINE_SYSTEM_PROMPTS['ollama' if provider == 'ollama' else 'cloud']
     system = system_prompts.get(mode, system_prompts['refine'])
+    model = app_settings.get('ollama_model', 'qwen2.5:0.5b')
+    payload = {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": system},
+            {"role": "user", "content": f"Enhance this prompt: {prompt}"}
+        ],
+        "stream": stream,
+        "options": {
+            "temperature": temperature,
+            "num_predict": 200
+        }
+    }
+    return model, payload
+
+
+def clean_refined(text):
+    """Strip quotes and a leading label the model sometimes adds"""
+    refined = text.strip().strip('"\'')
+    if refined.startswith('Enhanced prompt:'):
+        refined = refined[16:].strip()
+    return refined
+
+
+def refine_prompt_ai(prompt, mode='refine', provider='ollama', fresh=False, temperature=REFINE_TEMPERATURE, timeout=REFINE_TIMEOUT):
+    """Use AI to refine/expand prompts for image generation
 
+    provider: 'ollama' for local (Qwen abliterated/uncensored) or 'gemini' for cloud
+    fresh: skip the cache and ask the model again
+    """
+    if not prompt.strip():
+        return {"success": False, "error": "No prompt provided"}
+
+    model, payload = refine_request(prompt, mode, provider, temperature=temperature)
+    key = refine_cache.key(prompt, mode, provider, model, temperature)
+    cached = None if fresh else refine_cache.get(key)
+    if cached is not None:
+        return {"success": True, "refined": cached, "provider": provider, "cached": True}
     try:
         # Use Ollama (local - Qwen abliterated/uncensored)
-        payload = {
-            "model": app_settings.get('ollama_model', 'qwen2.5:0.5b'),
-            "messages": [
-                {"role": "system", "content": system},
-                {"role": "user", "content": f"Enhance this prompt: {prompt}"}
-            ],
-            "stream": False,
-            "options": {
-                "temperature": 0.7,
-                "num_predict": 200
-            }
-        }
-
-        req = urllib.request.Request(
-            f"{OLLAMA_URL}/api/chat",
-            data=json.dumps(payload).encode(),
-            headers={'Content-Type': 'application/json'}
-        )
-        response = urllib.request.urlopen(req, timeout=30)
-        result = json.loads(response.read().decode())
-        refined = result.get('message', {}).get('content', '').strip()
+        try:
+            result = ollama_client.post_json("/api/chat", payload, timeout=timeout)
+        finally:
+            # The model may now be loaded even if the call failed midway
+            ollama_arbiter.mark_used(model)
+        refined = clean_refined(result.get('message', {}).get('content', ''))
 
         if refined:
-            # Clean up any markdown or quotes
-            refined = refined.strip('"\'')
-            if refined.startswith('Enhanced prompt:'):
-                refined = refined[16:].strip()
+            refine_cache.put(key, refined)
             return {"success": True, "refined": refined, "provider": provider}
         else:
             return {"success": False, "error": "No response from AI"}
@@ -6121,76 +8305,539 @@ Output ONLY the styled prompt, nothing else. Keep it under 100 words."""
     except Exception as e:
         return {"success": False, "error": f"AI refinement failed: {str(e)}"}
 
-def unload_ollama_model():
-    """Unload Ollama model to free VRAM before image generation"""
-    if app_settings.get('auto_unload_ollama', True):
+
+def refine_prompt_stream(prompt, mode='refine', provider='ollama', fresh=False):
+    """Like refine_prompt_ai, but yields ('delta', {'text'}) events as Ollama
+    produces tokens, then one ('done', result) or ('error', {'error'})."""
+    if not prompt.strip():
+        yield 'error', {"success": False, "error": "No prompt provided"}
+        return
+
+    model, payload = refine_request(prompt, mode, provider, stream=True)
+    key = refine_cache.key(prompt, mode, provider, model)
+    cached = None if fresh else refine_cache.get(key)
+    if cached is not None:
+        yield 'done', {"success": True, "refined": cached, "provider": provider, "cached": True}
+        return
+
+    parts = []
+    lines = ollama_client.post_json_lines("/api/chat", payload, timeout=REFINE_TIMEOUT)
+    try:
+        for line in lines:
+            if line.get('error'):
+                raise RuntimeError(line['error'])
+            text = line.get('message', {}).get('content', '')
+            if text:
+                parts.append(text)
+                yield 'delta', {"text": text}
+    except Exception as e:
+        yield 'error', {"success": False, "error": f"AI refinement failed: {str(e)}"}
+        return
+    finally:
+        lines.close()
+        ollama_arbiter.mark_used(model)
+
+    refined = clean_refined(''.join(parts))
+    if not refined:
+        yield 'error', {"success": False, "error": "No response from AI"}
+        return
+    refine_cache.put(key, refined)
+    yield 'done', {"success": True, "refined": refined, "provider": provider}
+
+# ==========================================
+# BATCH REFINEMENT (several variants at once)
+# ==========================================
+
+REFINE_MODES = ('refine', 'expand', 'style')
+MAX_REFINE_VARIANTS = 8
+# Concurrent Ollama requests; Ollama itself serves OLLAMA_NUM_PARALLEL (often 1-4) at once
+REFINE_WORKERS = 3
+# Variants allowed in flight across all /refine-batch calls before new batches are turned away
+REFINE_BACKLOG = 16
+# Temperatures used for N variants of a single mode
+REFINE_VARIANT_TEMPERATURES = (0.7, 0.9, 1.1, 0.5, 1.0, 0.8, 1.2, 0.6)
+
+
+class RefineBatcher:
+    """Runs several refinements of one prompt concurrently on a bounded pool.
+
+    Each batch must reserve a backlog slot per variant up front; if Ollama is
+    already busy with REFINE_BACKLOG variants the batch is refused at once
+    (the caller answers 503 + Retry-After) instead of piling up threads.
+    Every variant has its own deadline, measured from submission.
+    """
+
+    def __init__(self, workers=REFINE_WORKERS, backlog=REFINE_BACKLOG):
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='refine')
+        self.backlog = backlog
+        self.in_flight = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def _reserve(self, count):
+        with self._lock:
+            if self.in_flight + count > self.backlog:
+                self.rejected += 1
+                return False
+            self.in_flight += count
+            return True
+
+    def _release(self, future):
+        with self._lock:
+            self.in_flight -= 1
+
+    @staticmethod
+    def variants(data):
+        """Turn a request into [(mode, temperature)], or raise ValueError"""
+        modes = data.get('modes')
+        count = data.get('variants')
+        if count is not None and (not isinstance(count, int) or isinstance(count, bool) or count < 1):
+            raise ValueError("variants must be a positive integer")
+        if modes is not None:
+            if not isinstance(modes, list) or not modes or any(m not in REFINE_MODES for m in modes):
+                raise ValueError(f"modes must be a list drawn from {', '.join(REFINE_MODES)}")
+            variants = [(mode, REFINE_TEMPERATURE) for mode in dict.fromkeys(modes)]
+        else:
+            mode = data.get('mode', 'refine')
+            if mode not in REFINE_MODES or count is None:
+                raise ValueError("Give a list of modes, or a mode and a number of variants")
+            variants = [(mode, t) for t in REFINE_VARIANT_TEMPERATURES[:count]]
+        if len(variants) > MAX_REFINE_VARIANTS or (count or 0) > MAX_REFINE_VARIANTS:
+            raise ValueError(f"At most {MAX_REFINE_VARIANTS} variants per request")
+        return variants
+
+    def _run(self, prompt, mode, temperature, provider, fresh, deadline):
+        started = time.time()
+        remaining = deadline - started
+        if remaining <= 0:
+            return {"success": False, "error": "Timed out waiting for a worker"}, 0.0
+        result = refine_prompt_ai(prompt, mode, provider, fresh, temperature, timeout=remaining)
+        return result, time.time() - started
+
+    def run(self, data, timeout=REFINE_TIMEOUT):
+        """Handle a /refine-batch request. Returns (status, response)."""
+        prompt = data.get('prompt', '')
+        if not isinstance(prompt, str) or not prompt.strip():
+            return 400, {"success": False, "error": "No prompt provided"}
         try:
-            model = app_settings.get('ollama_model', 'llama3.1:8b')
-            # Use subprocess to call ollama stop
-            subprocess.run(['ollama', 'stop', model], capture_output=True, timeout=10)
+            variants = self.variants(data)
+        except ValueError as e:
+            return 400, {"success": False, "error": str(e)}
+        if not self._reserve(len(variants)):
+            return 503, {"success": False, "error": "Prompt refinement is busy, try again shortly", "retry_after": 1}
+
+        provider = data.get('provider', 'ollama')
+        fresh = bool(data.get('fresh'))
+        started = time.time()
+        deadline = started + timeout
+        futures = []
+        for mode, temperature in variants:
+            future = self.pool.submit(self._run, prompt, mode, temperature, provider, fresh, deadline)
+            future.add_done_callback(self._release)
+            futures.append(future)
+        wait_futures(futures, timeout=timeout)
+
+        results = []
+        for (mode, temperature), future in zip(variants, futures):
+            entry = {"mode": mode, "temperature": temperature}
+            if future.done():
+                result, latency = future.result()
+                entry.update(result)
+                entry["latency_ms"] = round(latency * 1000, 1)
+            else:
+                # Not started yet: drop it; already running: it finishes in the background
+                future.cancel()
+                entry.update(success=False, error="Timed out", latency_ms=None)
+            entry.pop("provider", None)
+            results.append(entry)
+        return 200, {
+            "success": any(r["success"] for r in results),
+            "provider": provider,
+            "variants": results,
+            "elapsed_ms": round((time.time() - started) * 1000, 1),
+        }
+
+    def stats(self):
+        with self._lock:
+            return {"in_flight": self.in_flight, "rejected": self.rejected}
+
+
+refine_batcher = RefineBatcher()
+
+
+class OllamaArbiter:
+    """Frees the refine model's VRAM before generation jobs, only when needed.
+
+    Tracks whether the Ollama model may be resident: refine_prompt_ai marks
+    it used, an unload marks it gone, and an unknown state (startup, or a
+    model loaded by someone else) is resolved with GET /api/ps. Unloads go
+    through Ollama's HTTP API with keep_alive 0 on a background thread, so
+    queueing a job does not wait on them, and concurrent requests share a
+    single in-flight unload.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.resident = None  # None = unknown, check /api/ps
+        self.model = None
+        self.unloads = 0
+        self._uses = 0
+        self._lock = threading.Lock()
+        self._unloading = None
+
+    def mark_used(self, model):
+        with self._lock:
+            self.resident = True
+            self.model = model
+            self._uses += 1
+
+    def release(self, model=None):
+        """Start unloading the refine model if it may be loaded.
+
+        Returns the unload thread, or None when there is nothing to do.
+        """
+        with self._lock:
+            if self.resident is False:
+                return None
+            if self._unloading is not None and self._unloading.is_alive():
+                return self._unloading
+            model = self.model or model
+            thread = threading.Thread(target=self._unload, args=(model, self.resident is None, self._uses), daemon=True)
+            self._unloading = thread
+        thread.start()
+        return thread
+
+    def _loaded_models(self):
+        running = self.client.get_json("/api/ps", timeout=2).get('models', [])
+        return {m.get('model') or m.get('name') for m in running}
+
+    def _mark_unloaded(self, uses):
+        with self._lock:
+            # Unless a refine ran meanwhile and loaded it again
+            if self._uses == uses:
+                self.resident = False
+                self.model = None
+
+    def _unload(self, model, check_first, uses):
+        try:
+            if check_first and model not in self._loaded_models():
+                self._mark_unloaded(uses)
+                return
+            self.client.post_json("/api/generate", {"model": model, "keep_alive": 0}, timeout=10)
+            with self._lock:
+                self.unloads += 1
+            self._mark_unloaded(uses)
             print(f"Unloaded Ollama model {model} to free VRAM")  # noqa: T201
+        except (ConnectionRefusedError, socket.timeout):
+            # Ollama is not running, so nothing holds VRAM
+            self._mark_unloaded(uses)
         except Exception as e:
             print(f"Could not unload Ollama: {e}")  # noqa: T201
 
-def queue_prompt(prompt, mode='lightning', resolution=512, aspect='square', seed=None, negative_prompt='', sampler='euler', scheduler='normal', model='qwen'):
+    def stats(self):
+        with self._lock:
+            return {"resident": self.resident, "model": self.model, "unloads": self.unloads}
+
+
+ollama_arbiter = OllamaArbiter(ollama_client)
+
+
+def unload_ollama_model():
+    """Unload the Ollama model (in the background) to free VRAM before generation"""
+    if app_settings.get('auto_unload_ollama', True):
+        ollama_arbiter.release(app_settings.get('ollama_model', 'qwen2.5:0.5b'))
+
+def render_image_prompt(prompt, mode='lightning', resolution=512, aspect='square', seed=None, negative_prompt='', sampler='euler', scheduler='normal', model='qwen'):
+    """Return (workflow JSON, seed) for a text-to-image job"""
+    used_seed = new_seed() if seed is None else seed
+    # Select workflow based on model
+    if model == 'zimage':
+        prompt_json = workflow_templates.render(
+            'zimage', {'resolution': resolution, 'aspect': aspect}, prompt=prompt, seed=used_seed)
+    else:
+        # Default to Qwen
+        prompt_json = workflow_templates.render(
+            'qwen', {'mode': mode, 'resolution': resolution, 'aspect': aspect},
+            prompt=prompt, negative_prompt=negative_prompt, seed=used_seed, sampler=sampler, scheduler=scheduler)
+    return prompt_json, used_seed
+
+
+def queue_prompt(prompt, mode='lightning', resolution=512, aspect='square', seed=None, negative_prompt='', sampler='euler', scheduler='normal', model='qwen', user=None, priority=None):
     # Free up VRAM by unloading Ollama model before image generation
     unload_ollama_model()
 
     try:
-        # Select workflow based on model
-        if model == 'zimage':
-            workflow, used_seed = get_zimage_workflow(resolution, aspect, seed, negative_prompt)
-            workflow["2"]["inputs"]["text"] = prompt  # Z-Image uses node 2 for prompt
-        else:
-            # Default to Qwen
-            workflow, used_seed = get_workflow(mode, resolution, aspect, seed, negative_prompt, sampler, scheduler)
-            workflow["4"]["inputs"]["text"] = prompt
-
-        payload = {"prompt": workflow}
-        req = urllib.request.Request(
-            f"{COMFYUI_URL}/prompt",
-            data=json.dumps(payload).encode(),
-            headers={'Content-Type': 'application/json'}
-        )
-        response = urllib.request.urlopen(req, timeout=10)
-        result = json.loads(response.read().decode())
+        prompt_json, used_seed = render_image_prompt(prompt, mode, resolution, aspect, seed, negative_prompt, sampler, scheduler, model)
+        result = submit_prompt(prompt_json, user, priority)
         prompt_id = result.get('prompt_id')
 
         if prompt_id:
-            progress_state[prompt_id] = {'start_time': time.time(), 'mode': mode, 'model': model}
+            progress_tracker.register(prompt_id, mode=mode, model=model, resolution=resolution, aspect=aspect)
+            generator_store.record_generation(
+                prompt_id, 'image', prompt=prompt, negative_prompt=negative_prompt, seed=used_seed, model=model,
+                mode=mode, sampler=sampler, scheduler=scheduler, resolution=resolution, aspect=aspect)
             return {"prompt_id": prompt_id, "seed": used_seed}
         return {"error": "Failed to queue prompt"}
     except Exception as e:
         return {"error": str(e)}
 
+def image_result(entry):
+    """Build the /wait response for a finished image history entry"""
+    error = history_error(entry)
+    if error:
+        return {"success": False, "error": error}
+
+    outputs = entry.get('outputs', {})
+    for node_output in outputs.values():
+        if 'images' in node_output:
+            img = node_output['images'][0]
+            subfolder = img.get('subfolder', '')
+            path = f"/output/{subfolder}/{img['filename']}" if subfolder else f"/output/{img['filename']}"
+            return {"success": True, "image": path}
+    return {"success": False, "error": "No image in output"}
+
 def wait_for_image(prompt_id):
     try:
-        for _ in range(1200):
-            time.sleep(0.5)
-            try:
-                history_url = f"{COMFYUI_URL}/history/{prompt_id}"
-                hist_response = urllib.request.urlopen(history_url, timeout=5)
-                history = json.loads(hist_response.read().decode())
-
-                if prompt_id in history:
-                    status = history[prompt_id].get('status', {})
-                    if status.get('status_str') == 'error':
-                        return {"success": False, "error": str(status.get('messages', [['', 'Unknown error']])[0][1])}
-
-                    outputs = history[prompt_id].get('outputs', {})
-                    for node_output in outputs.values():
-                        if 'images' in node_output:
-                            img = node_output['images'][0]
-                            subfolder = img.get('subfolder', '')
-                            path = f"/output/{subfolder}/{img['filename']}" if subfolder else f"/output/{img['filename']}"
-                            return {"success": True, "image": path}
-                    return {"success": False, "error": "No image in output"}
-            except Exception:
-                pass
-        return {"success": False, "error": "Timeout"}
+        entry = wait_for_history(prompt_id, timeout=600)
+        if entry is None:
+            return {"success": False, "error": "Timeout"}
+        return image_result(entry)
     except Exception as e:
         return {"success": False, "error": str(e)}
 
+# ==========================================
+# BATCH QUEUE (/queue-batch)
+# ==========================================
+
+MAX_BATCH_JOBS = 10000
+MAX_BATCHES = 64
+# Prompts in flight at once while submitting a batch
+BATCH_SUBMIT_WINDOW = 4
+
+# /queue request keys accepted per batch job (request key -> queue_prompt argument)
+BATCH_JOB_KEYS = {
+    'prompt': 'prompt',
+    'mode': 'mode',
+    'resolution': 'resolution',
+    'aspect': 'aspect',
+    'seed': 'seed',
+    'negativePrompt': 'negative_prompt',
+    'sampler': 'sampler',
+    'scheduler': 'scheduler',
+    'model': 'model',
+}
+
+
+def model_stack(job):
+    """Jobs with the same key run on the same loaded checkpoint + LoRAs"""
+    if job.get('model') == 'zimage':
+        return ('zimage',)
+    return ('qwen', job.get('mode', 'lightning') == 'lightning')
+
+
+class BatchQueue:
+    """Fans a list of text-to-image jobs into ComfyUI and tracks them.
+
+    Model housekeeping runs once per batch. Jobs are grouped by model stack
+    and the groups are submitted one after another, so ComfyUI's queue never
+    alternates between checkpoints. Within a group up to `window` prompts are
+    submitted concurrently over the pooled keep-alive connections. Job state
+    follows ComfyUI's websocket events, or its /queue when the websocket is
+    down.
+    """
+
+    def __init__(self, max_batches=MAX_BATCHES, window=BATCH_SUBMIT_WINDOW):
+        self.max_batches = max_batches
+        self.window = window
+        self.batches = OrderedDict()
+        self._by_prompt = {}
+        self._lock = threading.Lock()
+
+    def create(self, data, user=None):
+        """Validate a /queue-batch request and start submitting it.
+
+        Accepts {"jobs": [{...}, ...]} and/or {"prompts": ["...", ...]};
+        other top-level /queue keys are defaults for every job, and
+        "priority" applies to the whole batch.
+        """
+        defaults = {k: v for k, v in data.items() if k in BATCH_JOB_KEYS}
+        jobs = [dict(defaults, prompt=p) for p in data.get('prompts', [])]
+        for job in data.get('jobs', []):
+            if not isinstance(job, dict):
+                return {"error": "Each job must be an object"}
+            jobs.append(dict(defaults, **{k: v for k, v in job.items() if k in BATCH_JOB_KEYS}))
+        if not jobs:
+            return {"error": "No prompts given"}
+        if len(jobs) > MAX_BATCH_JOBS:
+            return {"error": f"Too many jobs (max {MAX_BATCH_JOBS})"}
+
+        groups = OrderedDict()
+        for index, job in enumerate(jobs):
+            job.update(index=index, status='pending', prompt_id=None, error=None)
+            groups.setdefault(model_stack(job), []).append(job)
+
+        batch_id = uuid.uuid4().hex[:12]
+        batch = {
+            'batch_id': batch_id,
+            'created': time.time(),
+            'jobs': jobs,
+            'groups': list(groups.values()),
+            'submitting': True,
+            'user': user,
+            'priority': data.get('priority'),
+        }
+        with self._lock:
+            self.batches[batch_id] = batch
+            self._evict()
+        threading.Thread(target=self._submit, args=(batch,), daemon=True).start()
+        return {"batch_id": batch_id, "total": len(jobs), "groups": len(groups)}
+
+    def _evict(self):
+        # Drop the oldest batches that are no longer submitting
+        for batch_id in list(self.batches):
+            if len(self.batches) <= self.max_batches:
+                return
+            batch = self.batches[batch_id]
+            if not batch['submitting']:
+                del self.batches[batch_id]
+                for job in batch['jobs']:
+                    self._by_prompt.pop(job['prompt_id'], None)
+
+    def _submit_job(self, batch, job):
+        args = {BATCH_JOB_KEYS[k]: v for k, v in job.items() if k in BATCH_JOB_KEYS}
+        try:
+            prompt_json, job['seed'] = render_image_prompt(**args)
+            prompt_id = submit_prompt(prompt_json, batch['user'], batch['priority']).get('prompt_id')
+        except Exception as e:
+            prompt_id = None
+            job['error'] = str(e)
+        # A short job may already have finished (or failed) before we got its id
+        # back; its events were ignored, so read the outcome from /history
+        entry = fetch_history_entry(prompt_id) if prompt_id and event_listener.is_finished(prompt_id) else None
+        with self._lock:
+            if not prompt_id:
+                job['status'] = 'failed'
+                job['error'] = job['error'] or "Failed to queue prompt"
+                return
+            job['prompt_id'] = prompt_id
+            job['status'] = 'queued'
+            if entry is not None:
+                error = history_error(entry)
+                job['status'] = 'failed' if error else 'completed'
+                job['error'] = error
+                job['finished'] = time.time()
+            self._by_prompt[prompt_id] = job
+        progress_tracker.register(prompt_id, mode=args.get('mode', 'lightning'), model=args.get('model', 'qwen'),
+                                  resolution=args.get('resolution', 512), aspect=args.get('aspect', 'square'),
+                                  batch_id=batch['batch_id'])
+        # Parameters the job left out used render_image_prompt's defaults
+        generator_store.record_generation(prompt_id, 'image', **{**args, 'seed': job['seed'], 'batch_id': batch['batch_id']})
+
+    def _submit(self, batch):
+        # Housekeeping once for the whole batch instead of once per prompt
+        unload_ollama_model()
+        try:
+            with ThreadPoolExecutor(max_workers=self.window) as pool:
+                # Finish one model stack before starting the next
+                for group in batch['groups']:
+                    list(pool.map(lambda job: self._submit_job(batch, job), group))
+        finally:
+            with self._lock:
+                batch['submitting'] = False
+
+    def handle_event(self, event, data):
+        """ComfyEventListener handler"""
+        if not isinstance(data, dict):
+            return
+        with self._lock:
+            job = self._by_prompt.get(data.get('prompt_id'))
+            if job is None:
+                return
+            if event == 'execution_start':
+                job['status'] = 'running'
+                job['started'] = time.time()
+            elif event == 'execution_error':
+                job['status'] = 'failed'
+                job['error'] = data.get('exception_message', 'Execution error')
+            elif event == 'execution_interrupted':
+                job['status'] = 'failed'
+                job['error'] = 'Interrupted'
+            elif event == 'executing' and data.get('node') is None and job['status'] != 'failed':
+                job['status'] = 'completed'
+                job['finished'] = time.time()
+
+    def _reconcile(self, batch):
+        """Update job states from ComfyUI's /queue when events are unavailable"""
+        try:
+            queue_info = comfy_client.get_json("/queue", timeout=5)
+        except Exception:
+            return
+        running = {item[1] for item in queue_info.get('queue_running', [])}
+        pending = {item[1] for item in queue_info.get('queue_pending', [])}
+        with self._lock:
+            unsettled = [job for job in batch['jobs'] if job['status'] in ('queued', 'running') and job['prompt_id'] is not None]
+        for job in unsettled:
+            prompt_id = job['prompt_id']
+            if prompt_id in running:
+                with self._lock:
+                    if job['status'] == 'queued':
+                        job['status'] = 'running'
+                        job.setdefault('started', time.time())
+            elif prompt_id not in pending:
+                # Fetched without the lock; an event may settle the job meanwhile
+                entry = fetch_history_entry(prompt_id)
+                if entry is None:
+                    continue
+                generator_store.record_outputs(prompt_id, entry.get('outputs'))
+                error = history_error(entry)
+                with self._lock:
+                    if job['status'] in ('queued', 'running'):
+                        job['status'] = 'failed' if error else 'completed'
+                        job['error'] = error
+                        job['finished'] = time.time()
+
+    def status(self, batch_id, include_jobs=False):
+        """Aggregate progress of a batch"""
+        with self._lock:
+            batch = self.batches.get(batch_id)
+        if batch is None:
+            return None
+        if not event_listener.connected.is_set():
+            self._reconcile(batch)
+        with self._lock:
+            jobs = [dict(job) for job in batch['jobs']]
+        counts = {state: 0 for state in ('pending', 'queued', 'running', 'completed', 'failed')}
+        running_progress = 0.0
+        for job in jobs:
+            counts[job['status']] += 1
+            if job['status'] == 'running':
+                running_progress += progress_tracker.snapshot(job['prompt_id']).get('progress', 0.0)
+        total = len(jobs)
+        done = counts['completed'] + counts['failed']
+        result = {
+            "batch_id": batch_id,
+            "total": total,
+            "submitted": total - counts['pending'],
+            **counts,
+            "progress": (done + running_progress) / total,
+            "done": done == total,
+            "eta_seconds": None,
+        }
+        finished = [job['finished'] for job in jobs if job.get('finished')]
+        started = [job['started'] for job in jobs if job.get('started')]
+        if finished and started and done < total:
+            per_job = (max(finished) - min(started)) / len(finished)
+            result["eta_seconds"] = round(per_job * (total - done - running_progress), 1)
+        if include_jobs:
+            result["jobs"] = [{k: job.get(k) for k in ('index', 'prompt', 'prompt_id', 'seed', 'status', 'error')}
+                              for job in jobs]
+        return result
+
+
+batch_queue = BatchQueue()
+event_listener.add_handler(batch_queue.handle_event)
+
+
 def get_gallery_images():
     try:
         output_dir = os.path.join(os.path.dirname(__file__), "output")
@@ -6203,22 +8850,251 @@ def get_gallery_images():
 def get_gallery_images_with_meta():
     """Get gallery images with metadata (timestamp, size)"""
     try:
-        output_dir = os.path.join(os.path.dirname(__file__), "output")
-        files = [f for f in os.listdir(output_dir) if f.endswith('.png') and not f.startswith('.')]
-        result = []
-        for f in files:
-            filepath = os.path.join(output_dir, f)
-            stat = os.stat(filepath)
-            result.append({
-                'filename': f,
-                'timestamp': stat.st_mtime,
-                'size': stat.st_size
-            })
-        result.sort(key=lambda x: x['timestamp'], reverse=True)
-        return result
+        return gallery_index.page(limit=None)['images']
     except Exception:
         return []
 
+
+# ==========================================
+# GALLERY INDEX (SQLite) AND THUMBNAILS
+# ==========================================
+
+GALLERY_PAGE_SIZE = 100
+MAX_GALLERY_PAGE_SIZE = 1000
+# Minimum seconds between directory checks while serving the gallery
+GALLERY_RESCAN_INTERVAL = 1.0
+# Files modified within this many seconds may still be being written; they are
+# re-stat'ed on every scan until they settle
+GALLERY_SETTLE_TIME = 2.0
+THUMB_SIZE = 320
+THUMB_SIZES = (160, 320, 640)
+
+
+def image_model_mode(filename):
+    """Classify an output file the same way the gallery filter tabs do"""
+    name = filename.lower()
+    model = 'zimage' if name.startswith('zimage') else 'qwen' if name.startswith('qwen') else 'other'
+    if 'edit' in name or 'upscale' in name:
+        mode = 'edit'
+    elif 'lightning' in name:
+        mode = 'lightning'
+    elif 'normal' in name or 'image' in name:
+        mode = 'normal'
+    else:
+        mode = 'lightning'
+    return model, mode
+
+
+class GalleryIndex:
+    """Persistent index of the PNGs in output/, kept in SQLite.
+
+    The directory is only re-listed when its mtime changes (files added,
+    removed or renamed), and only new or recently modified files are
+    stat'ed, so a gallery page is a single indexed query instead of a stat
+    of every image. Writing into an existing file does not touch the
+    directory mtime, so while any file is younger than GALLERY_SETTLE_TIME
+    the checkpoint is not saved and the next refresh re-stats it.
+    """
+
+    def __init__(self, db_path, output_dir):
+        self.db_path = db_path
+        self.output_dir = output_dir
+        self._lock = threading.Lock()
+        self._last_check = 0.0
+        self._db = None
+
+    @property
+    def db(self):
+        # Opened on first use so importing the module does not create the file
+        if self._db is None:
+            self._db = self._open()
+        return self._db
+
+    def _open(self):
+        db = sqlite3.connect(self.db_path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.executescript("""
+            CREATE TABLE IF NOT EXISTS gallery (
+                filename TEXT PRIMARY KEY,
+                mtime REAL NOT NULL,
+                size INTEGER NOT NULL,
+                model TEXT NOT NULL,
+                mode TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS gallery_mtime ON gallery (mtime DESC, filename DESC);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        """)
+        db.commit()
+        return db
+
+    def _meta(self, key):
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return float(row[0]) if row else None
+
+    def refresh(self, force=False):
+        """Bring the index up to date with output/. Returns (added, removed)."""
+        now = time.time()
+        with self._lock:
+            if not force and now - self._last_check < GALLERY_RESCAN_INTERVAL:
+                return 0, 0
+            self._last_check = now
+            try:
+                dir_mtime = os.stat(self.output_dir).st_mtime
+            except FileNotFoundError:
+                return 0, 0
+            if not force and dir_mtime == self._meta('gallery_dir_mtime'):
+                return 0, 0
+
+            on_disk = {}
+            with os.scandir(self.output_dir) as entries:
+                for entry in entries:
+                    if entry.name.endswith('.png') and not entry.name.startswith('.') and entry.is_file():
+                        on_disk[entry.name] = entry
+            indexed = {row[0] for row in self.db.execute("SELECT filename FROM gallery")}
+            # Entries that were still young at the last settled scan may have grown since
+            settled = self._meta('gallery_settled') or 0.0
+            recent = {row[0]: (row[1], row[2]) for row in self.db.execute(
+                "SELECT filename, mtime, size FROM gallery WHERE mtime >= ?", (settled,))}
+            added, changed, young = [], [], False
+            for name in (on_disk.keys() - indexed) | (on_disk.keys() & recent.keys()):
+                try:
+                    stat = on_disk[name].stat()
+                except FileNotFoundError:
+                    continue
+                young = young or stat.st_mtime > now - GALLERY_SETTLE_TIME
+                row = (name, stat.st_mtime, stat.st_size, *image_model_mode(name))
+                if name not in indexed:
+                    added.append(row)
+                elif recent[name] != (stat.st_mtime, stat.st_size):
+                    changed.append(row)
+            removed = [(name,) for name in indexed - on_disk.keys()]
+            self.db.executemany("INSERT OR REPLACE INTO gallery VALUES (?, ?, ?, ?, ?)", added + changed)
+            self.db.executemany("DELETE FROM gallery WHERE filename = ?", removed)
+            if young:
+                self.db.execute("DELETE FROM meta WHERE key = 'gallery_dir_mtime'")
+            else:
+                self.db.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)", [
+                    ('gallery_dir_mtime', str(dir_mtime)), ('gallery_settled', str(now - GALLERY_SETTLE_TIME))])
+            self.db.commit()
+            return len(added), len(removed)
+
+    def remove(self, filename):
+        with self._lock:
+            self.db.execute("DELETE FROM gallery WHERE filename = ?", (filename,))
+            self.db.commit()
+
+    def page(self, cursor=None, limit=GALLERY_PAGE_SIZE, model=None, mode=None, since=None, until=None, names=None):
+        """Return newest-first images plus a cursor for the next page.
+
+        The cursor is opaque to clients ("<mtime>:<filename>" of the last
+        row), so pages stay stable while new images are being added.
+        """
+        self.refresh()
+        where, args = [], []
+        for column, value in (('model', model), ('mode', mode)):
+            if value:
+                where.append(f"{column} = ?")
+                args.append(value)
+        if since is not None:
+            where.append("mtime >= ?")
+            args.append(float(since))
+        if until is not None:
+            where.append("mtime < ?")
+            args.append(float(until))
+        if names is not None:
+            where.append("filename IN (SELECT value FROM json_each(?))")
+            args.append(json.dumps(list(names)))
+        filters = list(where), list(args)
+        if cursor:
+            mtime, _, filename = cursor.partition(':')
+            where.append("(mtime < ? OR (mtime = ? AND filename < ?))")
+            args += [float(mtime), float(mtime), filename]
+        clause = f"WHERE {' AND '.join(where)}" if where else ""
+        sql = f"SELECT filename, mtime, size, model, mode FROM gallery {clause} ORDER BY mtime DESC, filename DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            args.append(limit + 1)
+        with self._lock:
+            rows = self.db.execute(sql, args).fetchall()
+            count_clause = f"WHERE {' AND '.join(filters[0])}" if filters[0] else ""
+            total = self.db.execute(f"SELECT COUNT(*) FROM gallery {count_clause}", filters[1]).fetchone()[0]
+        next_cursor = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = f"{rows[-1][1]!r}:{rows[-1][0]}"
+        images = [{'filename': f, 'timestamp': t, 'size': size, 'model': m, 'mode': md} for f, t, size, m, md in rows]
+        return {'images': images, 'next_cursor': next_cursor, 'total': total}
+
+
+gallery_index = GalleryIndex(DB_FILE, OUTPUT_DIR)
+
+
+def gallery_page(query):
+    """Handle /gallery query parameters (cursor, limit, model, mode, since, until, name).
+
+    name may be repeated to restrict the page to those files.
+    """
+    def param(name):
+        return query.get(name, [None])[0] or None
+    try:
+        limit = min(MAX_GALLERY_PAGE_SIZE, max(1, int(param('limit') or GALLERY_PAGE_SIZE)))
+        return gallery_index.page(
+            cursor=param('cursor'),
+            limit=limit,
+            model=param('model'),
+            mode=param('mode'),
+            since=param('since'),
+            until=param('until'),
+            names=query.get('name'),
+        )
+    except ValueError:
+        return None
+
+
+def get_thumbnail(filename, size=THUMB_SIZE):
+    """Path of a cached WebP thumbnail for an output image, or None.
+
+    Thumbnails live in thumbnails/ and are regenerated when the source
+    image is newer. Returns None without Pillow or for unknown files.
+    """
+    if Image is None or not filename or '/' in filename or '\\' in filename or filename.startswith('.'):
+        return None
+    source = os.path.join(OUTPUT_DIR, filename)
+    try:
+        source_mtime = os.stat(source).st_mtime
+    except OSError:
+        return None
+    thumb = os.path.join(THUMB_DIR, f"{os.path.splitext(filename)[0]}_{size}.webp")
+    try:
+        if os.stat(thumb).st_mtime >= source_mtime:
+            return thumb
+    except FileNotFoundError:
+        pass
+    os.makedirs(THUMB_DIR, exist_ok=True)
+    tmp = f"{thumb}.{uuid.uuid4().hex}.tmp"
+    try:
+        with Image.open(source) as img:
+            img.thumbnail((size, size))
+            if img.mode not in ('RGB', 'RGBA'):
+                img = img.convert('RGBA')
+            img.save(tmp, 'WEBP', quality=80, method=4)
+        os.replace(tmp, thumb)
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        return None
+    return thumb
+
+
+def remove_thumbnails(filename):
+    stem = os.path.splitext(filename)[0]
+    for size in THUMB_SIZES:
+        try:
+            os.remove(os.path.join(THUMB_DIR, f"{stem}_{size}.webp"))
+        except FileNotFoundError:
+            pass
+
+
 def delete_image(filename):
     """Delete an image from the output directory"""
     try:
@@ -6227,50 +9103,429 @@ def delete_image(filename):
         filepath = os.path.join(OUTPUT_DIR, filename)
         if os.path.exists(filepath):
             os.remove(filepath)
+            gallery_index.remove(filename)
+            remove_thumbnails(filename)
             return {"success": True}
         return {"success": False, "error": "File not found"}
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-def delete_history_item(index):
-    """Delete an item from prompt history"""
-    global prompt_history
-    try:
-        if index < 0 or index >= len(prompt_history):
-            return {"success": False, "error": "Invalid index"}
-        prompt_history.pop(index)
-        # Save to file
+# ==========================================
+# PROMPT HISTORY, FAVORITES AND GENERATION LOG (SQLite)
+# ==========================================
+
+HISTORY_PAGE_SIZE = 50
+MAX_HISTORY_PAGE_SIZE = 500
+# Recent prompts the page keeps locally (matches HISTORY_LOCAL_LIMIT in the page)
+HISTORY_RECENT_SIZE = 200
+# Parameters that get their own column in the generation log; everything
+# else a job was queued with is kept in the params JSON
+GENERATION_COLUMNS = ('prompt', 'negative_prompt', 'seed', 'model', 'mode', 'sampler', 'scheduler', 'resolution', 'aspect')
+# Keys of a ComfyUI node output that list files it wrote
+OUTPUT_FILE_KEYS = ('images', 'videos', 'gifs', 'audio', '3d')
+GENERATION_STATUSES = {
+    'execution_start': 'running',
+    'execution_success': 'done',
+    'execution_error': 'error',
+    'execution_interrupted': 'interrupted',
+}
+# A fast or fully cached job can report events before its row is written; those
+# are held (for this many jobs at most) and applied once the row exists
+EARLY_EVENT_JOBS = 256
+
+
+class GeneratorStore:
+    """Prompt history, favorites and the parameters of every queued job.
+
+    Lives in generator.db next to the gallery index. Each change is one
+    transaction, so concurrent requests no longer overwrite each other the
+    way whole-file JSON rewrites did, and history is no longer capped.
+    Prompts are searched through an FTS5 index when SQLite provides one.
+    """
+
+    def __init__(self, db_path, history_file=None, favorites_file=None):
+        self.db_path = db_path
+        self.history_file = history_file
+        self.favorites_file = favorites_file
+        self.fts = False
+        self._lock = threading.Lock()
+        self._db = None
+        self._early_events = OrderedDict()
+
+    @property
+    def db(self):
+        # Opened on first use so importing the module does not create the file
+        if self._db is None:
+            self._db = self._open()
+        return self._db
+
+    def _open(self):
+        db = sqlite3.connect(self.db_path, check_same_thread=False)
+        db.row_factory = sqlite3.Row
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute("PRAGMA busy_timeout=5000")
+        # resolution has no declared type: images use pixels, videos '480p'
+        db.executescript("""
+            CREATE TABLE IF NOT EXISTS history (
+                id INTEGER PRIMARY KEY,
+                prompt TEXT NOT NULL UNIQUE,
+                mode TEXT,
+                resolution,
+                aspect TEXT,
+                negative_prompt TEXT,
+                timestamp INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS history_timestamp ON history (timestamp DESC, id DESC);
+            CREATE TABLE IF NOT EXISTS favorites (
+                filename TEXT PRIMARY KEY,
+                added REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS generations (
+                prompt_id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                prompt TEXT,
+                negative_prompt TEXT,
+                seed INTEGER,
+                model TEXT,
+                mode TEXT,
+                sampler TEXT,
+                scheduler TEXT,
+                resolution,
+                aspect TEXT,
+                params TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'queued',
+                queued_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS generations_queued ON generations (queued_at DESC);
+            CREATE TABLE IF NOT EXISTS generation_outputs (
+                filename TEXT PRIMARY KEY,
+                prompt_id TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS generation_outputs_prompt ON generation_outputs (prompt_id);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        """)
         try:
-            with open(HISTORY_FILE, 'w') as f:
-                json.dump(prompt_history, f)
-        except Exception:
-            pass
-        return {"success": True, "history": prompt_history}
+            db.executescript("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING fts5(
+                    prompt, mode, content='history', content_rowid='id');
+                CREATE TRIGGER IF NOT EXISTS history_fts_insert AFTER INSERT ON history BEGIN
+                    INSERT INTO history_fts (rowid, prompt, mode) VALUES (new.id, new.prompt, new.mode);
+                END;
+                CREATE TRIGGER IF NOT EXISTS history_fts_delete AFTER DELETE ON history BEGIN
+                    INSERT INTO history_fts (history_fts, rowid, prompt, mode) VALUES ('delete', old.id, old.prompt, old.mode);
+                END;
+                CREATE TRIGGER IF NOT EXISTS history_fts_update AFTER UPDATE ON history BEGIN
+                    INSERT INTO history_fts (history_fts, rowid, prompt, mode) VALUES ('delete', old.id, old.prompt, old.mode);
+                    INSERT INTO history_fts (rowid, prompt, mode) VALUES (new.id, new.prompt, new.mode);
+                END;
+            """)
+            self.fts = True
+        except sqlite3.OperationalError:
+            # SQLite built without FTS5: search falls back to LIKE
+            self.fts = False
+        self._import_json(db)
+        db.commit()
+        return db
+
+    def _import_json(self, db):
+        """One-time import of the old prompt_history.json / favorites.json"""
+        if db.execute("SELECT 1 FROM meta WHERE key = 'json_imported'").fetchone():
+            return
+        history = load_json_list(self.history_file)
+        now = int(time.time() * 1000)
+        # The file is newest first; insert oldest first so ids follow time
+        for offset, item in enumerate(reversed(history)):
+            if isinstance(item, dict) and item.get('prompt'):
+                self._upsert_history(db, item, item.get('timestamp') or now - len(history) + offset)
+        db.executemany("INSERT OR IGNORE INTO favorites VALUES (?, ?)",
+                       [(name, time.time()) for name in load_json_list(self.favorites_file) if isinstance(name, str)])
+        db.execute("INSERT OR REPLACE INTO meta VALUES ('json_imported', ?)", (str(time.time()),))
+
+    # --- prompt history ---
+
+    @staticmethod
+    def _upsert_history(db, item, timestamp):
+        # Re-using a prompt moves it to the top instead of adding a duplicate
+        db.execute("""
+            INSERT INTO history (prompt, mode, resolution, aspect, negative_prompt, timestamp)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (prompt) DO UPDATE SET
+                mode = excluded.mode, resolution = excluded.resolution, aspect = excluded.aspect,
+                negative_prompt = excluded.negative_prompt, timestamp = excluded.timestamp
+        """, (item['prompt'], item.get('mode'), item.get('resolution'), item.get('aspect'),
+              item.get('negativePrompt') or item.get('negative_prompt'), int(timestamp)))
+        return db.execute("SELECT id FROM history WHERE prompt = ?", (item['prompt'],)).fetchone()[0]
+
+    def add_history(self, item):
+        """Record a prompt; returns its history id"""
+        if not isinstance(item, dict) or not isinstance(item.get('prompt'), str) or not item['prompt'].strip():
+            raise ValueError("History item needs a prompt")
+        timestamp = item.get('timestamp')
+        if not isinstance(timestamp, (int, float)):
+            timestamp = time.time() * 1000
+        with self._lock, self.db:
+            return self._upsert_history(self.db, item, timestamp)
+
+    def history(self, search=None, limit=HISTORY_PAGE_SIZE, offset=0):
+        """Newest-first page of prompt history, optionally filtered by search terms"""
+        where, params = "", []
+        if search and search.strip():
+            if self.fts:
+                # Every word must match as a prefix; quoting keeps FTS syntax out
+                terms = ' '.join('"' + word.replace('"', '""') + '"*' for word in search.split())
+                where = "WHERE id IN (SELECT rowid FROM history_fts WHERE history_fts MATCH ?)"
+                params.append(terms)
+            else:
+                where = "WHERE prompt LIKE ? OR mode LIKE ?"
+                params += [f"%{search.strip()}%"] * 2
+        with self._lock:
+            total = self.db.execute(f"SELECT COUNT(*) FROM history {where}", params).fetchone()[0]
+            rows = self.db.execute(
+                f"SELECT * FROM history {where} ORDER BY timestamp DESC, id DESC LIMIT ? OFFSET ?",
+                params + [limit, offset]).fetchall()
+        return {
+            "history": [{
+                "id": row['id'],
+                "prompt": row['prompt'],
+                "mode": row['mode'],
+                "resolution": row['resolution'],
+                "aspect": row['aspect'],
+                "negativePrompt": row['negative_prompt'] or '',
+                "timestamp": row['timestamp'],
+            } for row in rows],
+            "total": total,
+        }
+
+    def delete_history(self, history_id):
+        with self._lock, self.db:
+            return self.db.execute("DELETE FROM history WHERE id = ?", (history_id,)).rowcount > 0
+
+    def history_id_at(self, index):
+        """Id of the index-th newest history item (for clients that delete by position)"""
+        with self._lock:
+            row = self.db.execute("SELECT id FROM history ORDER BY timestamp DESC, id DESC LIMIT 1 OFFSET ?",
+                                  (index,)).fetchone()
+        return row[0] if row else None
+
+    # --- favorites ---
+
+    def favorites(self):
+        with self._lock:
+            return [row[0] for row in self.db.execute("SELECT filename FROM favorites ORDER BY added, filename")]
+
+    def set_favorite(self, filename, favorite=True):
+        with self._lock, self.db:
+            if favorite:
+                self.db.execute("INSERT OR IGNORE INTO favorites VALUES (?, ?)", (filename, time.time()))
+            else:
+                self.db.execute("DELETE FROM favorites WHERE filename = ?", (filename,))
+
+    def replace_favorites(self, filenames):
+        """Make the favorites exactly this list (keeps when existing ones were added)"""
+        names = [name for name in filenames if isinstance(name, str)]
+        with self._lock, self.db:
+            self.db.execute("DELETE FROM favorites WHERE filename NOT IN (SELECT value FROM json_each(?))",
+                            (json.dumps(names),))
+            self.db.executemany("INSERT OR IGNORE INTO favorites VALUES (?, ?)", [(name, time.time()) for name in names])
+
+    # --- generation log ---
+
+    def record_generation(self, prompt_id, kind, **params):
+        """Remember what a queued job was asked to do. Never raises: the log
+        must not turn a successfully queued job into an error."""
+        columns = [params.get(key) for key in GENERATION_COLUMNS]
+        try:
+            with self._lock, self.db:
+                # Recording a job again updates what it was asked to do, never its progress
+                self.db.execute(f"""
+                    INSERT INTO generations
+                        (prompt_id, kind, {', '.join(GENERATION_COLUMNS)}, params, queued_at)
+                    VALUES (?, ?, {', '.join('?' * len(GENERATION_COLUMNS))}, ?, ?)
+                    ON CONFLICT (prompt_id) DO UPDATE SET
+                        kind = excluded.kind, {', '.join(f'{key} = excluded.{key}' for key in GENERATION_COLUMNS)},
+                        params = excluded.params
+                """, [prompt_id, kind, *columns, json.dumps(params, default=str), time.time()])
+                for event, data, when in self._early_events.pop(prompt_id, ()):
+                    self._apply_event(self.db, event, data, when)
+        except sqlite3.Error as e:
+            print(f"Could not record generation {prompt_id}: {e}")  # noqa: T201
+
+    @staticmethod
+    def _generation(row):
+        result = dict(row)
+        result['params'] = json.loads(result['params'])
+        if result['started_at'] and result['finished_at']:
+            result['duration'] = round(result['finished_at'] - result['started_at'], 3)
+        return result
+
+    def generation(self, prompt_id):
+        with self._lock:
+            row = self.db.execute("SELECT * FROM generations WHERE prompt_id = ?", (prompt_id,)).fetchone()
+        return None if row is None else self._generation(row)
+
+    def record_outputs(self, prompt_id, outputs):
+        """Remember which output files a job wrote. outputs maps node ids to
+        node outputs, as in a history entry. Files of jobs we did not queue
+        are ignored."""
+        filenames = [(name, prompt_id) for node_output in (outputs or {}).values()
+                     for name in output_filenames(node_output)]
+        if not filenames:
+            return
+        try:
+            with self._lock, self.db:
+                self.db.executemany("""
+                    INSERT OR IGNORE INTO generation_outputs
+                    SELECT ?, prompt_id FROM generations WHERE prompt_id = ?
+                """, filenames)
+        except sqlite3.Error as e:
+            print(f"Could not record outputs of {prompt_id}: {e}")  # noqa: T201
+
+    def image_meta(self, filename):
+        """Generation parameters and timings of the job that wrote an output file, or None"""
+        with self._lock:
+            row = self.db.execute("""
+                SELECT o.filename, g.* FROM generation_outputs o JOIN generations g USING (prompt_id)
+                WHERE o.filename = ?
+            """, (filename,)).fetchone()
+        return None if row is None else self._generation(row)
+
+    def image_metas(self, filenames):
+        """image_meta for many files at once: {filename: meta} for the known ones"""
+        with self._lock:
+            rows = self.db.execute("""
+                SELECT o.filename, g.* FROM generation_outputs o JOIN generations g USING (prompt_id)
+                WHERE o.filename IN (SELECT value FROM json_each(?))
+            """, (json.dumps(list(filenames)),)).fetchall()
+        return {row['filename']: self._generation(row) for row in rows}
+
+    def handle_event(self, event, data):
+        """ComfyEventListener handler: keeps job status, timings and outputs current"""
+        if not isinstance(data, dict) or not data.get('prompt_id'):
+            return
+        now = time.time()
+        try:
+            with self._lock, self.db:
+                if not self._apply_event(self.db, event, data, now):
+                    self._hold_event(event, data, now)
+        except sqlite3.Error as e:
+            print(f"Could not update generation {data['prompt_id']}: {e}")  # noqa: T201
+
+    @staticmethod
+    def _apply_event(db, event, data, when):
+        """Apply an event to its job's row. False if the job is not recorded (yet)."""
+        if event == 'executed':
+            filenames = [(name, data['prompt_id']) for name in output_filenames(data.get('output'))]
+            if not filenames:
+                return True
+            if db.execute("SELECT 1 FROM generations WHERE prompt_id = ?", (data['prompt_id'],)).fetchone() is None:
+                return False
+            db.executemany("INSERT OR IGNORE INTO generation_outputs VALUES (?, ?)", filenames)
+            return True
+        if event == 'executing' and data.get('node') is None:
+            sql = "UPDATE generations SET finished_at = COALESCE(finished_at, ?), status = CASE status WHEN 'running' THEN 'done' WHEN 'queued' THEN 'done' ELSE status END WHERE prompt_id = ?"
+            args = (when, data['prompt_id'])
+        elif event == 'execution_start':
+            sql = "UPDATE generations SET started_at = ?, status = 'running' WHERE prompt_id = ?"
+            args = (when, data['prompt_id'])
+        elif event in GENERATION_STATUSES:
+            sql = "UPDATE generations SET status = ? WHERE prompt_id = ?"
+            args = (GENERATION_STATUSES[event], data['prompt_id'])
+        else:
+            return True
+        return db.execute(sql, args).rowcount > 0
+
+    def _hold_event(self, event, data, when):
+        # Called with the lock held. Jobs queued by other clients never get a row and age out.
+        self._early_events.setdefault(data['prompt_id'], []).append((event, data, when))
+        self._early_events.move_to_end(data['prompt_id'])
+        while len(self._early_events) > EARLY_EVENT_JOBS:
+            self._early_events.popitem(last=False)
+
+
+def output_filenames(node_output):
+    """Paths relative to output/ of the files listed in a node output"""
+    if not isinstance(node_output, dict):
+        return []
+    names = []
+    for key in OUTPUT_FILE_KEYS:
+        for item in node_output.get(key) or []:
+            # Previews are written to temp/ and never show up under /output/
+            if isinstance(item, dict) and item.get('filename') and item.get('type', 'output') == 'output':
+                subfolder = item.get('subfolder', '')
+                names.append(f"{subfolder}/{item['filename']}" if subfolder else item['filename'])
+    return names
+
+
+def load_json_list(path):
+    """Contents of a JSON file holding a list, or [] if it is missing or unreadable"""
+    if not path or not os.path.exists(path):
+        return []
+    try:
+        with open(path, 'r') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return []
+    return data if isinstance(data, list) else []
+
+
+generator_store = GeneratorStore(DB_FILE, HISTORY_FILE, FAVORITES_FILE)
+event_listener.add_handler(generator_store.handle_event)
+
+
+def history_page(query):
+    """Handle /history query parameters (q, limit, offset)"""
+    try:
+        limit = min(MAX_HISTORY_PAGE_SIZE, max(1, int(query.get('limit', [HISTORY_PAGE_SIZE])[0])))
+        offset = max(0, int(query.get('offset', [0])[0]))
+    except ValueError:
+        return None
+    return generator_store.history(query.get('q', [''])[0], limit, offset)
+
+
+def delete_history_item(data):
+    """Delete a prompt history item by id (or by position, for older pages)"""
+    try:
+        history_id = data.get('id')
+        if history_id is None:
+            index = data.get('index', -1)
+            history_id = generator_store.history_id_at(index) if isinstance(index, int) and index >= 0 else None
+        if not isinstance(history_id, int) or not generator_store.delete_history(history_id):
+            return {"success": False, "error": "Invalid history item"}
+        return {"success": True, **generator_store.history(limit=HISTORY_RECENT_SIZE)}
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-def save_favorites(favorites):
+
+def save_favorites(data):
+    """Handle /favorite: toggle one image, or replace the whole list"""
     try:
-        with open(FAVORITES_FILE, 'w') as f:
-            json.dump(favorites, f)
-    except Exception:
-        pass
+        if isinstance(data.get('filename'), str) and 'favorite' in data:
+            generator_store.set_favorite(data['filename'], bool(data['favorite']))
+        elif isinstance(data.get('favorites'), list):
+            generator_store.replace_favorites(data['favorites'])
+        else:
+            return {"success": False, "error": "Nothing to save"}
+        return {"success": True}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
 
 def save_history(item):
-    global prompt_history
     try:
-        # Load existing history
-        if os.path.exists(HISTORY_FILE):
-            with open(HISTORY_FILE, 'r') as f:
-                prompt_history = json.load(f)
-        # Add new item (avoid duplicates)
-        prompt_history = [h for h in prompt_history if h.get('prompt') != item.get('prompt')]
-        prompt_history.insert(0, item)
-        prompt_history = prompt_history[:20]  # Keep last 20
-        with open(HISTORY_FILE, 'w') as f:
-            json.dump(prompt_history, f)
-    except Exception:
-        pass
+        return {"success": True, "id": generator_store.add_history(item)}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+
+def image_meta_bulk(data):
+    """Handle POST /image-meta: generation data for up to a gallery page of files"""
+    filenames = data.get('filenames')
+    if not isinstance(filenames, list) or len(filenames) > MAX_GALLERY_PAGE_SIZE:
+        return None
+    return {"meta": generator_store.image_metas(name for name in filenames if isinstance(name, str))}
 
 def get_edit_workflow(prompt, seed=None, use_angles_lora=False, angle_prompt="", use_upscale_lora=False):
     """Generate workflow for image editing using Qwen-Image-Edit-2511"""
@@ -7063,7 +10318,7 @@ def get_3d_workflow(image_path, resolution=256, algorithm='surface net', thresho
     return workflow, seed
 
 
-def queue_video(prompt, model='ltx', mode='t2v', resolution='480p', length=81, seed=None, negative_prompt='', start_image=None):
+def queue_video(prompt, model='ltx', mode='t2v', resolution='480p', length=81, seed=None, negative_prompt='', start_image=None, user=None, priority=None):
     """Queue a video generation job to ComfyUI"""
     # Free up VRAM by unloading Ollama model before video generation
     unload_ollama_model()
@@ -7072,124 +10327,71 @@ def queue_video(prompt, model='ltx', mode='t2v', resolution='480p', length=81, s
         # For I2V mode, upload the start image first
         uploaded_filename = None
         if mode == 'i2v' and start_image:
-            import uuid
-            img_id = str(uuid.uuid4())[:8]
-
-            # Decode base64 image
-            if ',' in start_image:
-                start_image = start_image.split(',')[1]
-
-            img_bytes = base64.b64decode(start_image)
-            input_dir = os.path.join(os.path.dirname(__file__), "input")
-            os.makedirs(input_dir, exist_ok=True)
-            input_path = os.path.join(input_dir, f"video_input_{img_id}.png")
-
-            with open(input_path, 'wb') as f:
-                f.write(img_bytes)
-
-            # Upload to ComfyUI
-            boundary = '----WebKitFormBoundary' + img_id
-            body = (
-                f'--{boundary}\r\n'
-                f'Content-Disposition: form-data; name="image"; filename="video_input_{img_id}.png"\r\n'
-                f'Content-Type: image/png\r\n\r\n'
-            ).encode() + img_bytes + f'\r\n--{boundary}--\r\n'.encode()
-
-            req = urllib.request.Request(
-                f"{COMFYUI_URL}/upload/image",
-                data=body,
-                headers={'Content-Type': f'multipart/form-data; boundary={boundary}'}
-            )
-            response = urllib.request.urlopen(req, timeout=30)
-            upload_result = json.loads(response.read().decode())
-            uploaded_filename = upload_result.get('name', f"video_input_{img_id}.png")
+            uploaded_filename = upload_input_image(start_image, 'video_input_')
 
+        used_seed = new_seed() if seed is None else seed
+        values = {'prompt': prompt, 'seed': used_seed, 'length': length}
         # Select workflow based on model
         if model == 'ltx':
-            workflow, used_seed = get_ltx_workflow(
-                prompt,
-                resolution=resolution,
-                length=length,
-                seed=seed,
-                negative_prompt=negative_prompt
-            )
+            structural = {'resolution': resolution}
+            values['negative_prompt'] = negative_prompt or None
         elif model == 'hunyuan':
-            workflow, used_seed = get_hunyuan_workflow(
-                prompt,
-                mode=mode,
-                resolution=resolution,
-                length=length,
-                seed=seed,
-                negative_prompt=negative_prompt,
-                start_image=uploaded_filename
-            )
+            # Hunyuan has no negative prompt
+            structural = {'mode': 'i2v' if uploaded_filename else 't2v', 'resolution': resolution}
+            values['image'] = uploaded_filename
         else:  # wan (default)
-            workflow, used_seed = get_video_workflow(
-                prompt,
-                mode=mode,
-                resolution=resolution,
-                length=length,
-                seed=seed,
-                negative_prompt=negative_prompt,
-                start_image=uploaded_filename
-            )
+            structural = {'mode': 'i2v' if uploaded_filename else 't2v', 'resolution': resolution}
+            values['negative_prompt'] = negative_prompt or None
+            values['image'] = uploaded_filename
+        template_name = model if model in ('ltx', 'hunyuan') else 'wan'
 
-        payload = {"prompt": workflow}
-        req = urllib.request.Request(
-            f"{COMFYUI_URL}/prompt",
-            data=json.dumps(payload).encode(),
-            headers={'Content-Type': 'application/json'}
-        )
-        response = urllib.request.urlopen(req, timeout=10)
-        result = json.loads(response.read().decode())
+        result = submit_prompt(workflow_templates.render(template_name, structural, **values), user, priority)
         prompt_id = result.get('prompt_id')
 
         if prompt_id:
-            progress_state[prompt_id] = {'start_time': time.time(), 'mode': 'video', 'model': model, 'resolution': resolution, 'length': length}
+            progress_tracker.register(prompt_id, mode='video', model=model, resolution=resolution, length=length)
+            generator_store.record_generation(
+                prompt_id, 'video', prompt=prompt, negative_prompt=negative_prompt, seed=used_seed, model=model,
+                mode='i2v' if uploaded_filename else 't2v', resolution=resolution, length=length, image=uploaded_filename)
             return {"prompt_id": prompt_id, "seed": used_seed}
         return {"error": "Failed to queue video prompt"}
     except Exception as e:
         return {"error": str(e)}
 
 
+def video_result(entry):
+    """Build the /video-wait response for a finished video history entry"""
+    error = history_error(entry)
+    if error:
+        return {"success": False, "error": error}
+
+    outputs = entry.get('outputs', {})
+    for node_output in outputs.values():
+        # Check for video files (webm, mp4)
+        if 'videos' in node_output:
+            vid = node_output['videos'][0]
+            subfolder = vid.get('subfolder', '')
+            path = f"/output/{subfolder}/{vid['filename']}" if subfolder else f"/output/{vid['filename']}"
+            return {"success": True, "video": path}
+        # Also check for 'images' with video extension
+        if 'images' in node_output:
+            for item in node_output['images']:
+                filename = item.get('filename', '')
+                if filename.endswith(('.webm', '.mp4', '.gif')):
+                    subfolder = item.get('subfolder', '')
+                    path = f"/output/{subfolder}/{filename}" if subfolder else f"/output/{filename}"
+                    return {"success": True, "video": path}
+    return {"success": False, "error": "No video in output"}
+
+
 def wait_for_video(prompt_id):
     """Wait for video generation to complete and return the video path"""
     try:
         # Video generation takes longer - wait up to 20 minutes
-        for _ in range(2400):
-            time.sleep(0.5)
-            try:
-                history_url = f"{COMFYUI_URL}/history/{prompt_id}"
-                hist_response = urllib.request.urlopen(history_url, timeout=5)
-                history = json.loads(hist_response.read().decode())
-
-                if prompt_id in history:
-                    status = history[prompt_id].get('status', {})
-                    if status.get('status_str') == 'error':
-                        return {"success": False, "error": str(status.get('messages', [['', 'Unknown error']])[0][1])}
-
-                    outputs = history[prompt_id].get('outputs', {})
-                    for node_output in outputs.values():
-                        # Check for video files (webm, mp4)
-                        if 'videos' in node_output:
-                            vid = node_output['videos'][0]
-                            subfolder = vid.get('subfolder', '')
-                            path = f"/output/{subfolder}/{vid['filename']}" if subfolder else f"/output/{vid['filename']}"
-                            return {"success": True, "video": path}
-                        # Also check for 'images' with video extension
-                        if 'images' in node_output:
-                            for item in node_output['images']:
-                                filename = item.get('filename', '')
-                                if filename.endswith(('.webm', '.mp4', '.gif')):
-                                    subfolder = item.get('subfolder', '')
-                                    path = f"/output/{subfolder}/{filename}" if subfolder else f"/output/{filename}"
-                                    return {"success": True, "video": path}
-                    # If we got here with outputs but no video, might still be processing
-                    if outputs:
-                        return {"success": False, "error": "No video in output"}
-            except Exception:
-                pass
-        return {"success": False, "error": "Timeout waiting for video"}
+        entry = wait_for_history(prompt_id, timeout=1200)
+        if entry is None:
+            return {"success": False, "error": "Timeout waiting for video"}
+        return video_result(entry)
     except Exception as e:
         return {"success": False, "error": str(e)}
 
@@ -7198,39 +10400,51 @@ def wait_for_video(prompt_id):
 # AUDIO QUEUE AND WAIT FUNCTIONS
 # ==========================================
 
-def queue_audio(tags, lyrics='', duration=60, format='flac', lyrics_strength=1.0, seed=None):
+def queue_audio(tags, lyrics='', duration=60, format='flac', lyrics_strength=1.0, seed=None, user=None, priority=None):
     """Queue an audio generation job to ComfyUI"""
     # Free up VRAM by unloading Ollama model before audio generation
     unload_ollama_model()
 
     try:
-        workflow, used_seed = get_audio_workflow(
-            tags=tags,
-            lyrics=lyrics,
-            duration=duration,
-            lyrics_strength=lyrics_strength,
-            seed=seed,
-            format=format
-        )
+        used_seed = new_seed() if seed is None else seed
+        prompt_json = workflow_templates.render(
+            'audio', {'format': format if format in ('mp3', 'opus') else 'flac'},
+            tags=tags, lyrics=lyrics, lyrics_strength=lyrics_strength, seconds=float(duration), seed=used_seed)
 
-        payload = {"prompt": workflow}
-        req = urllib.request.Request(
-            f"{COMFYUI_URL}/prompt",
-            data=json.dumps(payload).encode(),
-            headers={'Content-Type': 'application/json'}
-        )
-        response = urllib.request.urlopen(req, timeout=10)
-        result = json.loads(response.read().decode())
+        result = submit_prompt(prompt_json, user, priority)
         prompt_id = result.get('prompt_id')
 
         if prompt_id:
-            progress_state[prompt_id] = {'start_time': time.time(), 'mode': 'audio', 'format': format, 'duration': duration}
+            progress_tracker.register(prompt_id, mode='audio', format=format, duration=duration)
+            generator_store.record_generation(
+                prompt_id, 'audio', prompt=tags, seed=used_seed, model='ace_step', lyrics=lyrics,
+                duration=duration, format=format, lyrics_strength=lyrics_strength)
             return {"prompt_id": prompt_id, "seed": used_seed}
         return {"error": "Failed to queue audio prompt"}
     except Exception as e:
         return {"error": str(e)}
 
 
+def audio_result(entry):
+    """Build the /audio-wait response for a finished audio history entry"""
+    error = history_error(entry)
+    if error:
+        return {"success": False, "error": error}
+
+    outputs = entry.get('outputs', {})
+    for node_output in outputs.values():
+        # Check for audio files
+        if 'audio' in node_output:
+            audio = node_output['audio'][0]
+            filename = audio['filename']
+            return {"success": True, "audio": filename}
+        # Also check gifs (used by some audio nodes)
+        if 'gifs' in node_output:
+            audio = node_output['gifs'][0]
+            return {"success": True, "audio": audio['filename']}
+    return {"success": False, "error": "No audio in output"}
+
+
 def wait_for_audio(prompt_id):
     """Wait for audio generation to complete and return the audio path"""
     try:
@@ -7240,35 +10454,10 @@ def wait_for_audio(prompt_id):
         except Exception:
             duration = 60
         max_wait_seconds = max(300, int(duration * 3))
-        max_iterations = int(max_wait_seconds * 2)
-        for _ in range(max_iterations):
-            time.sleep(0.5)
-            try:
-                history_url = f"{COMFYUI_URL}/history/{prompt_id}"
-                hist_response = urllib.request.urlopen(history_url, timeout=5)
-                history = json.loads(hist_response.read().decode())
-
-                if prompt_id in history:
-                    status = history[prompt_id].get('status', {})
-                    if status.get('status_str') == 'error':
-                        return {"success": False, "error": str(status.get('messages', [['', 'Unknown error']])[0][1])}
-
-                    outputs = history[prompt_id].get('outputs', {})
-                    for node_output in outputs.values():
-                        # Check for audio files
-                        if 'audio' in node_output:
-                            audio = node_output['audio'][0]
-                            filename = audio['filename']
-                            return {"success": True, "audio": filename}
-                        # Also check gifs (used by some audio nodes)
-                        if 'gifs' in node_output:
-                            audio = node_output['gifs'][0]
-                            return {"success": True, "audio": audio['filename']}
-                    if outputs:
-                        return {"success": False, "error": "No audio in output"}
-            except Exception:
-                pass
-        return {"success": False, "error": "Timeout waiting for audio"}
+        entry = wait_for_history(prompt_id, timeout=max_wait_seconds)
+        if entry is None:
+            return {"success": False, "error": "Timeout waiting for audio"}
+        return audio_result(entry)
     except Exception as e:
         return {"success": False, "error": str(e)}
 
@@ -7277,7 +10466,7 @@ def wait_for_audio(prompt_id):
 # 3D QUEUE AND WAIT FUNCTIONS
 # ==========================================
 
-def queue_3d(image_data, resolution=256, algorithm='surface net', threshold=0.6, seed=None):
+def queue_3d(image_data, resolution=256, algorithm='surface net', threshold=0.6, seed=None, user=None, priority=None):
     """Queue a 3D generation job to ComfyUI"""
     # Free up VRAM by unloading Ollama model before 3D generation
     unload_ollama_model()
@@ -7286,105 +10475,76 @@ def queue_3d(image_data, resolution=256, algorithm='surface net', threshold=0.6,
         if not image_data:
             return {"error": "No image data provided"}
         # Save uploaded image and upload to ComfyUI
-        import uuid
-        img_id = str(uuid.uuid4())[:8]
-
-        # Decode base64 image
-        if ',' in image_data:
-            image_data = image_data.split(',')[1]
-
         try:
-            img_bytes = base64.b64decode(image_data)
-        except Exception:
+            uploaded_filename = upload_input_image(image_data, '3d_input_')
+        except ValueError:
             return {"error": "Invalid image data"}
-        input_dir = os.path.join(os.path.dirname(__file__), "input")
-        os.makedirs(input_dir, exist_ok=True)
-        input_path = os.path.join(input_dir, f"3d_input_{img_id}.png")
-
-        with open(input_path, 'wb') as f:
-            f.write(img_bytes)
-
-        # Upload to ComfyUI
-        boundary = '----WebKitFormBoundary' + img_id
-        body = (
-            f'--{boundary}\r\n'
-            f'Content-Disposition: form-data; name="image"; filename="3d_input_{img_id}.png"\r\n'
-            f'Content-Type: image/png\r\n\r\n'
-        ).encode() + img_bytes + f'\r\n--{boundary}--\r\n'.encode()
-
-        req = urllib.request.Request(
-            f"{COMFYUI_URL}/upload/image",
-            data=body,
-            headers={'Content-Type': f'multipart/form-data; boundary={boundary}'}
-        )
-        response = urllib.request.urlopen(req, timeout=30)
-        upload_result = json.loads(response.read().decode())
-        if not isinstance(upload_result, dict) or not upload_result.get('name'):
-            error_msg = upload_result.get('error') if isinstance(upload_result, dict) else None
-            message = "Failed to upload image to ComfyUI"
-            if error_msg:
-                message = f"{message}: {error_msg}"
-            return {"error": message}
-        uploaded_filename = upload_result.get('name')
-
-        workflow, used_seed = get_3d_workflow(
-            image_path=uploaded_filename,
-            resolution=resolution,
-            algorithm=algorithm,
-            threshold=threshold,
-            seed=seed
-        )
+        except RuntimeError as e:
+            return {"error": str(e)}
 
-        payload = {"prompt": workflow}
-        req = urllib.request.Request(
-            f"{COMFYUI_URL}/prompt",
-            data=json.dumps(payload).encode(),
-            headers={'Content-Type': 'application/json'}
-        )
-        response = urllib.request.urlopen(req, timeout=10)
-        result = json.loads(response.read().decode())
+        used_seed = new_seed() if seed is None else seed
+        prompt_json = workflow_templates.render(
+            '3d', {'resolution': resolution},
+            image=uploaded_filename, algorithm=algorithm, threshold=threshold, seed=used_seed)
+
+        result = submit_prompt(prompt_json, user, priority)
         prompt_id = result.get('prompt_id')
 
         if prompt_id:
-            progress_state[prompt_id] = {'start_time': time.time(), 'mode': '3d', 'resolution': resolution}
+            progress_tracker.register(prompt_id, mode='3d', resolution=resolution)
+            generator_store.record_generation(
+                prompt_id, '3d', seed=used_seed, model='hunyuan3d', resolution=resolution,
+                algorithm=algorithm, threshold=threshold, image=uploaded_filename)
             return {"prompt_id": prompt_id, "seed": used_seed}
         return {"error": "Failed to queue 3D prompt"}
     except Exception as e:
         return {"error": str(e)}
 
 
+def mesh_result(entry):
+    """Build the /3d-wait response for a finished 3D history entry"""
+    error = history_error(entry)
+    if error:
+        return {"success": False, "error": error}
+
+    outputs = entry.get('outputs', {})
+    for node_output in outputs.values():
+        # Check for 3D mesh files
+        if '3d' in node_output:
+            mesh = node_output['3d'][0]
+            return {"success": True, "mesh": mesh['filename']}
+    return {"success": False, "error": "No mesh in output"}
+
+
 def wait_for_3d(prompt_id):
     """Wait for 3D generation to complete and return the mesh path"""
     try:
         # 3D generation can take 1-10 minutes depending on resolution
-        for _ in range(1200):  # 10 minutes max
-            time.sleep(0.5)
-            try:
-                history_url = f"{COMFYUI_URL}/history/{prompt_id}"
-                hist_response = urllib.request.urlopen(history_url, timeout=5)
-                history = json.loads(hist_response.read().decode())
-
-                if prompt_id in history:
-                    status = history[prompt_id].get('status', {})
-                    if status.get('status_str') == 'error':
-                        return {"success": False, "error": str(status.get('messages', [['', 'Unknown error']])[0][1])}
-
-                    outputs = history[prompt_id].get('outputs', {})
-                    for node_output in outputs.values():
-                        # Check for 3D mesh files
-                        if '3d' in node_output:
-                            mesh = node_output['3d'][0]
-                            return {"success": True, "mesh": mesh['filename']}
-                    if outputs:
-                        return {"success": False, "error": "No mesh in output"}
-            except Exception:
-                pass
-        return {"success": False, "error": "Timeout waiting for 3D mesh"}
+        entry = wait_for_history(prompt_id, timeout=600)
+        if entry is None:
+            return {"success": False, "error": "Timeout waiting for 3D mesh"}
+        return mesh_result(entry)
     except Exception as e:
         return {"success": False, "error": str(e)}
 
 
-def edit_image(image_data, prompt, use_angles_lora=False, angle_prompt="", use_upscale_lora=False):
+RESULT_BUILDERS = {
+    'video': video_result,
+    'audio': audio_result,
+    '3d': mesh_result,
+}
+
+
+def job_result(prompt_id, entry):
+    """Build the wait-endpoint response for any finished job"""
+    state = progress_state.get(prompt_id, {})
+    result = RESULT_BUILDERS.get(state.get('mode'), image_result)(entry)
+    if result.get('success') and state.get('mode') == 'edit':
+        result['seed'] = state.get('seed')
+    return result
+
+
+def edit_image(image_data, prompt, use_angles_lora=False, angle_prompt="", use_upscale_lora=False, user=None, priority=None):
     # Free up VRAM by unloading Ollama model before image editing
     unload_ollama_model()
 
@@ -7399,104 +10559,295 @@ def edit_image(image_data, prompt, use_angles_lora=False, angle_prompt="", use_u
         return {"success": False, "error": f"Image Edit model still downloading... ({size_gb:.1f} GB / 13.2 GB)"}
 
     try:
-        # Save uploaded image temporarily
-        import uuid
-        img_id = str(uuid.uuid4())[:8]
-
-        # Decode base64 image
-        if ',' in image_data:
-            image_data = image_data.split(',')[1]
-
-        img_bytes = base64.b64decode(image_data)
-        input_dir = os.path.join(os.path.dirname(__file__), "input")
-        os.makedirs(input_dir, exist_ok=True)
-        input_path = os.path.join(input_dir, f"edit_input_{img_id}.png")
-
-        with open(input_path, 'wb') as f:
-            f.write(img_bytes)
-
-        # Upload to ComfyUI
-        with open(input_path, 'rb') as f:
-            import urllib.request
-
-            # Create multipart form data
-            boundary = '----WebKitFormBoundary' + img_id
-            body = (
-                f'--{boundary}\r\n'
-                f'Content-Disposition: form-data; name="image"; filename="edit_input_{img_id}.png"\r\n'
-                f'Content-Type: image/png\r\n\r\n'
-            ).encode() + img_bytes + f'\r\n--{boundary}--\r\n'.encode()
-
-            req = urllib.request.Request(
-                f"{COMFYUI_URL}/upload/image",
-                data=body,
-                headers={'Content-Type': f'multipart/form-data; boundary={boundary}'}
-            )
-            response = urllib.request.urlopen(req, timeout=30)
-            upload_result = json.loads(response.read().decode())
-            uploaded_filename = upload_result.get('name', f"edit_input_{img_id}.png")
+        # Stage the image and upload it to ComfyUI (skipped if already there)
+        uploaded_filename = upload_input_image(image_data, 'edit_input_')
 
         # Create and queue workflow
-        workflow, seed = get_edit_workflow(prompt, use_angles_lora=use_angles_lora, angle_prompt=angle_prompt, use_upscale_lora=use_upscale_lora)
-        workflow["1"]["inputs"]["image"] = uploaded_filename
-
-        payload = {"prompt": workflow}
-        req = urllib.request.Request(
-            f"{COMFYUI_URL}/prompt",
-            data=json.dumps(payload).encode(),
-            headers={'Content-Type': 'application/json'}
-        )
-        response = urllib.request.urlopen(req, timeout=10)
-        result = json.loads(response.read().decode())
+        seed = new_seed()
+        structural = {'use_angles_lora': bool(use_angles_lora), 'use_upscale_lora': bool(use_upscale_lora)}
+        full_prompt = f"{angle_prompt} {prompt}".strip() if angle_prompt else prompt
+        prompt_json = workflow_templates.render('edit', structural, image=uploaded_filename, prompt=full_prompt, seed=seed)
+
+        result = submit_prompt(prompt_json, user, priority)
         prompt_id = result.get('prompt_id')
 
         if not prompt_id:
             return {"success": False, "error": "Failed to queue edit workflow"}
-
-        # Wait for result
-        for _ in range(1200):  # 10 minute timeout (edit takes longer)
-            time.sleep(0.5)
-            try:
-                history_url = f"{COMFYUI_URL}/history/{prompt_id}"
-                hist_response = urllib.request.urlopen(history_url, timeout=5)
-                history = json.loads(hist_response.read().decode())
-
-                if prompt_id in history:
-                    status = history[prompt_id].get('status', {})
-                    if status.get('status_str') == 'error':
-                        return {"success": False, "error": str(status.get('messages', [['', 'Edit failed']])[0][1])}
-
-                    outputs = history[prompt_id].get('outputs', {})
-                    for node_output in outputs.values():
-                        if 'images' in node_output:
-                            img = node_output['images'][0]
-                            subfolder = img.get('subfolder', '')
-                            path = f"/output/{subfolder}/{img['filename']}" if subfolder else f"/output/{img['filename']}"
-                            return {"success": True, "image": path, "seed": seed}
-            except Exception:
-                pass
-
-        return {"success": False, "error": "Edit timeout"}
+        progress_tracker.register(prompt_id, mode='edit', model='qwen_edit', upscale=use_upscale_lora, seed=seed)
+        generator_store.record_generation(
+            prompt_id, 'edit', prompt=prompt, seed=seed, model='qwen_edit', image=uploaded_filename,
+            use_angles_lora=bool(use_angles_lora), angle_prompt=angle_prompt, use_upscale_lora=bool(use_upscale_lora))
+
+        # Wait for result (10 minute timeout, edit takes longer)
+        entry = wait_for_history(prompt_id, timeout=600)
+        if entry is None:
+            return {"success": False, "error": "Edit timeout"}
+        error = history_error(entry, default='Edit failed')
+        if error:
+            return {"success": False, "error": error}
+        result = image_result(entry)
+        if result.get('success'):
+            result['seed'] = seed
+        return result
     except Exception as e:
         return {"success": False, "error": str(e)}
 
 def check_comfyui():
     try:
-        urllib.request.urlopen(f"{COMFYUI_URL}/system_stats", timeout=2)
+        comfy_client.request('GET', '/system_stats', timeout=2)
         return True
     except Exception:
         return False
 
-def start_comfyui():
+
+# ==========================================
+# COMFYUI SUPERVISOR (startup readiness, prewarm, crash restart)
+# ==========================================
+
+# ComfyUI logs this once its HTTP server is listening
+COMFYUI_READY_LINE = "To see the GUI go to:"
+STARTUP_TIMEOUT = 300
+PREWARM_TIMEOUT = 600
+MAX_RESTARTS = 5
+RESTART_DELAY = 2.0
+MAX_RESTART_DELAY = 60.0
+# A backend that stayed up this long has its restart backoff reset
+STABLE_UPTIME = 600
+LOG_TAIL_LINES = 200
+# tqdm progress bars ("50%|█████     | 2/4 [00:01<00:01, ...]") are kept in the tail but not echoed
+PROGRESS_BAR_RE = re.compile(r'\|\s*\d+/\d+ \[')
+
+
+def comfyui_command():
+    """The command line used to launch the ComfyUI backend"""
     script_dir = os.path.dirname(os.path.abspath(__file__))
     venv_python = os.path.join(script_dir, "venv", "bin", "python")
-    main_py = os.path.join(script_dir, "main.py")
-    subprocess.Popen([venv_python, main_py, "--highvram"], cwd=script_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-    for _ in range(30):
-        time.sleep(1)
-        if check_comfyui():
-            return True
-    return False
+    python = venv_python if os.path.isfile(venv_python) else sys.executable
+    return [python, os.path.join(script_dir, "main.py"), "--highvram", "--disable-auto-launch"]
+
+
+def prewarm_default_workflow():
+    """Run the default Qwen workflow once so its models are loaded before the first user job.
+
+    SaveImage is swapped for PreviewImage, so the warm-up image lands in
+    ComfyUI's temp directory rather than the gallery.
+    """
+    prompt_json, _ = render_image_prompt("warm-up", 'lightning', 512, 'square', seed=0)
+    workflow = json.loads(prompt_json)
+    for node in workflow.values():
+        if node.get('class_type') == 'SaveImage':
+            node['class_type'] = 'PreviewImage'
+            node['inputs'].pop('filename_prefix', None)
+    result = submit_prompt(json.dumps(workflow), user='prewarm')
+    prompt_id = result.get('prompt_id')
+    if not prompt_id:
+        raise RuntimeError(result.get('error') or 'prompt was not queued')
+    entry = wait_for_history(prompt_id, PREWARM_TIMEOUT)
+    if entry is None:
+        raise RuntimeError('timed out')
+    error = history_error(entry)
+    if error:
+        raise RuntimeError(error)
+
+
+class ComfySupervisor:
+    """Run the ComfyUI backend as a child process and report when it is usable.
+
+    The child's log is streamed to our stdout with a [comfyui] prefix. Stages
+    go starting -> server_up (HTTP answers) -> warming (prewarm running) ->
+    ready; the server_up and ready events let callers wait on either. If the
+    child exits on its own it is restarted with exponential backoff, giving up
+    ('failed') after max_restarts crashes in a row.
+    """
+
+    def __init__(self, command, cwd=None, probe=check_comfyui, prewarm=None, startup_timeout=STARTUP_TIMEOUT,
+                 max_restarts=MAX_RESTARTS, restart_delay=RESTART_DELAY, echo=True):
+        self.command = command
+        self.cwd = cwd
+        self.probe = probe
+        self.prewarm = prewarm
+        self.startup_timeout = startup_timeout
+        self.max_restarts = max_restarts
+        self.restart_delay = restart_delay
+        self.echo = echo
+        self.stage = 'stopped'
+        self.server_up = threading.Event()
+        self.ready = threading.Event()
+        self.process = None
+        self.restarts = 0
+        self.last_exit = None
+        self.last_error = None
+        self.startup_time = None
+        self.warmup_time = None
+        self.log = []
+        self._log_lock = threading.Lock()
+        self._ready_line = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._pump_thread = None
+
+    def start(self):
+        self._stopping.clear()
+        self.stage = 'starting'
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10):
+        """Stop supervising and terminate the backend"""
+        self._stopping.set()
+        process = self.process
+        if process and process.poll() is None:
+            process.terminate()
+            try:
+                process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+        if self._thread:
+            self._thread.join(timeout)
+        self.stage = 'stopped'
+
+    def wait_server_up(self):
+        """Block until the backend answers (True) or the supervisor gives up (False)"""
+        while not self.server_up.wait(1.0):
+            if self.stage in ('failed', 'stopped'):
+                return False
+        return True
+
+    def status(self):
+        with self._log_lock:
+            tail = self.log[-20:]
+        return {
+            'stage': self.stage,
+            'pid': self.process.pid if self.process else None,
+            'restarts': self.restarts,
+            'last_exit': self.last_exit,
+            'last_error': self.last_error,
+            'startup_time': self.startup_time,
+            'warmup_time': self.warmup_time,
+            'log_tail': tail,
+        }
+
+    def _set_stage(self, stage):
+        self.stage = stage
+        if self.echo:
+            print(f"[comfyui] stage: {stage}")  # noqa: T201
+
+    def _pump(self, stream):
+        for line in stream:
+            line = line.rstrip()
+            if not line:
+                continue
+            with self._log_lock:
+                self.log.append(line)
+                del self.log[:-LOG_TAIL_LINES]
+            if COMFYUI_READY_LINE in line:
+                self._ready_line.set()
+            if self.echo and not PROGRESS_BAR_RE.search(line):
+                print(f"[comfyui] {line}")  # noqa: T201
+        stream.close()
+
+    def _spawn(self):
+        env = dict(os.environ, PYTHONUNBUFFERED='1')
+        self._ready_line.clear()
+        self.process = subprocess.Popen(
+            self.command, cwd=self.cwd, env=env, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT, text=True, encoding='utf-8', errors='replace')
+        self._pump_thread = threading.Thread(target=self._pump, args=(self.process.stdout,), daemon=True)
+        self._pump_thread.start()
+
+    def _wait_server_up(self):
+        """Wait for the ready log line or a successful probe; False if the child dies or times out"""
+        deadline = time.time() + self.startup_timeout
+        while not self._stopping.is_set():
+            # The log line wakes us at once; polling covers quiet or unusual logging setups.
+            # Clear it after it fires so a failed probe waits again instead of spinning.
+            if self._ready_line.wait(1.0):
+                self._ready_line.clear()
+            if self.probe():
+                return True
+            if self.process.poll() is not None:
+                self.last_error = 'exited during startup'
+                return False
+            if time.time() > deadline:
+                self.last_error = f'not reachable after {self.startup_timeout}s'
+                self.process.kill()
+                return False
+        return False
+
+    def _warm_up(self):
+        self._set_stage('warming')
+        started = time.time()
+        try:
+            self.prewarm()
+            self.warmup_time = round(time.time() - started, 2)
+            if self.echo:
+                print(f"[comfyui] models warmed in {self.warmup_time}s")  # noqa: T201
+        except Exception as e:
+            # A failed warm-up only costs the first user job its load time
+            self.last_error = f'prewarm failed: {e}'
+            if self.echo:
+                print(f"[comfyui] ⚠️ {self.last_error}")  # noqa: T201
+
+    def _run(self):
+        crashes = 0
+        while not self._stopping.is_set():
+            self._set_stage('starting')
+            started = time.time()
+            self._spawn()
+            if self._wait_server_up():
+                self.startup_time = round(time.time() - started, 2)
+                self._set_stage('server_up')
+                self.server_up.set()
+                if self.prewarm:
+                    self._warm_up()
+                if self.process.poll() is None:
+                    self._set_stage('ready')
+                    self.ready.set()
+            self.last_exit = self.process.wait()
+            # Drain the rest of the log so the tail explains the exit
+            self._pump_thread.join(5)
+            if self._stopping.is_set():
+                return
+            self.server_up.clear()
+            self.ready.clear()
+            if time.time() - started > STABLE_UPTIME:
+                crashes = 0
+            crashes += 1
+            if crashes > self.max_restarts:
+                self._set_stage('failed')
+                return
+            self.restarts += 1
+            delay = min(self.restart_delay * 2 ** (crashes - 1), MAX_RESTART_DELAY)
+            if self.echo:
+                print(f"[comfyui] backend exited with code {self.last_exit}, restarting in {delay:.0f}s")  # noqa: T201
+            self._stopping.wait(delay)
+
+
+comfy_supervisor = None
+
+
+def start_comfyui():
+    """Launch and supervise the ComfyUI backend; returns the supervisor"""
+    global comfy_supervisor
+    prewarm = prewarm_default_workflow if app_settings.get('prewarm_on_start', True) else None
+    comfy_supervisor = ComfySupervisor(
+        comfyui_command(), cwd=os.path.dirname(os.path.abspath(__file__)), prewarm=prewarm)
+    comfy_supervisor.start()
+    return comfy_supervisor
+
+
+def watch_startup(url):
+    """Once ComfyUI answers, open the UI and check the workflows against it"""
+    if comfy_supervisor is not None:
+        if not comfy_supervisor.wait_server_up():
+            print("❌ Failed to start ComfyUI. Please run it manually.")  # noqa: T201
+            return
+        print("✅ ComfyUI backend running")  # noqa: T201
+    webbrowser.open(url)
+    # Catch missing models / custom nodes now rather than on the first job
+    validate_workflows()
+
 
 def get_local_ip():
     import socket
@@ -7515,14 +10866,17 @@ def main():
     print("=" * 50)  # noqa: T201
     print()  # noqa: T201
 
-    if not check_comfyui():
+    if check_comfyui():
+        print("✅ ComfyUI backend running")  # noqa: T201
+    else:
+        # The UI is served right away; /health reports the backend's startup stage
         print("Starting ComfyUI backend...")  # noqa: T201
-        if not start_comfyui():
-            print("❌ Failed to start ComfyUI. Please run it manually.")  # noqa: T201
-            sys.exit(1)
+        start_comfyui()
+
+    event_listener.start()
+    cleanup_input_files(force=True)
 
     local_ip = get_local_ip()
-    print("✅ ComfyUI backend running")  # noqa: T201
     print()  # noqa: T201
     print("🌐 Access the generator:")  # noqa: T201
     print("   Local:   http://localhost:8080")  # noqa: T201
@@ -7531,14 +10885,15 @@ def main():
     print("Press Ctrl+C to stop")  # noqa: T201
     print()  # noqa: T201
 
-    threading.Timer(1.5, lambda: webbrowser.open('http://localhost:8080')).start()
-
-    server = HTTPServer(('0.0.0.0', 8080), RequestHandler)
+    server = GeneratorHTTPServer(('0.0.0.0', 8080), RequestHandler)
+    threading.Thread(target=watch_startup, args=('http://localhost:8080',), daemon=True).start()
     try:
         server.serve_forever()
     except KeyboardInterrupt:
         print("\n👋 Goodbye!")  # noqa: T201
         server.shutdown()
+        if comfy_supervisor is not None:
+            comfy_supervisor.stop()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,141 @@
+import pytest
+import torch
+
+from comfy.cli_args import args
+if not torch.cuda.is_available():
+    args.cpu = True
+
+import comfy.model_patcher  # noqa: E402
+import comfy.sd  # noqa: E402
+from comfy.conditioning_cache import ConditioningCache, record_source  # noqa: E402
+
+
+class CountingEncoder(torch.nn.Module):
+    """A text encoder whose output depends on the token ids and its weight"""
+
+    def __init__(self):
+        super().__init__()
+        self.weight = torch.nn.Parameter(torch.ones(8), requires_grad=False)
+        self.calls = 0
+
+    def reset_clip_options(self):
+        pass
+
+    def set_clip_options(self, options):
+        pass
+
+    def encode_token_weights(self, tokens):
+        self.calls += 1
+        ids = torch.tensor([[t for t, _ in tokens["l"][0]]], dtype=torch.float32)
+        cond = ids.unsqueeze(-1) * self.weight
+        return cond, cond.mean(dim=1), {"attention_mask": torch.ones(1, ids.shape[1])}
+
+
+def make_clip(source=None):
+    clip = comfy.sd.CLIP(no_init=True)
+    clip.cond_stage_model = CountingEncoder()
+    clip.patcher = comfy.model_patcher.ModelPatcher(clip.cond_stage_model, load_device=torch.device("cpu"), offload_device=torch.device("cpu"))
+    clip.tokenizer = None
+    clip.layer_idx = None
+    clip.use_clip_schedule = False
+    clip.apply_hooks_to_conds = None
+    clip.tokenizer_options = {}
+    if source is not None:
+        record_source(clip.cond_stage_model, [str(source)])
+    return clip
+
+
+def tokens(*ids):
+    return {"l": [[(i, 1.0) for i in ids]]}
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = ConditioningCache(1 << 20)
+    monkeypatch.setattr(comfy.sd, "conditioning_cache", cache)
+    return cache
+
+
+def test_repeated_prompts_skip_the_encoder(cache):
+    clip = make_clip()
+    first = clip.encode_from_tokens(tokens(1, 2, 3), return_pooled=True, return_dict=True)
+    first["extra"] = True
+    again = clip.encode_from_tokens(tokens(1, 2, 3), return_pooled=True, return_dict=True)
+    assert clip.cond_stage_model.calls == 1
+    assert torch.equal(again["cond"], first["cond"]) and "extra" not in again
+
+    # A clone shares the weights and so the entries
+    clip.clone().encode_from_tokens(tokens(1, 2, 3))
+    clip.encode_from_tokens(tokens(1, 2, 4))
+    clip.encode_from_tokens(tokens(1, 2, 3), return_pooled="unprojected")
+    assert clip.cond_stage_model.calls == 3
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["hit_rate"]) == (2, 3, 0.4)
+
+
+def test_lora_patches_and_layer_change_the_key(cache):
+    clip = make_clip()
+    clip.encode_from_tokens(tokens(5))
+    lora = clip.clone()
+    lora.add_patches({"weight": (torch.full((8,), 2.0),)}, 1.0)
+    lora.encode_from_tokens(tokens(5))
+    lora.encode_from_tokens(tokens(5))
+    assert clip.cond_stage_model.calls == 2
+    skipped = clip.clone()
+    skipped.clip_layer(-2)
+    skipped.encode_from_tokens(tokens(5))
+    assert clip.cond_stage_model.calls == 3
+
+
+def test_memory_is_bounded_least_recently_used_first(cache):
+    # Each entry: cond (4 x 8), pooled (8) and mask (4) floats = 176 bytes
+    cache.max_bytes = 3 * 176
+    clip = make_clip()
+    for i in range(4):
+        clip.encode_from_tokens(tokens(i, i, i, i))
+        clip.encode_from_tokens(tokens(0, 0, 0, 0))
+    assert cache.stats()["evictions"] == 1 and cache.total_bytes <= cache.max_bytes
+    clip.encode_from_tokens(tokens(1, 1, 1, 1))
+    assert clip.cond_stage_model.calls == 5
+
+
+def test_encoders_with_the_same_layout_do_not_share_entries(cache, tmp_path):
+    first, second = make_clip(), make_clip()
+    first.encode_from_tokens(tokens(3))
+    second.encode_from_tokens(tokens(3))
+    assert second.cond_stage_model.calls == 1
+
+    # On disk, entries are keyed by the file the encoder was loaded from
+    cache.persist_to(str(tmp_path / "cache"), 1 << 20)
+    source = tmp_path / "encoder.safetensors"
+    source.write_bytes(b"weights")
+    make_clip(source).encode_from_tokens(tokens(3))
+    cache.disk.flush()
+    cache.clear()
+    reloaded = make_clip(source)
+    reloaded.encode_from_tokens(tokens(3))
+    assert reloaded.cond_stage_model.calls == 0
+    # Replaced under the same name
+    source.write_bytes(b"new weights")
+    replaced = make_clip(source)
+    replaced.encode_from_tokens(tokens(3))
+    assert replaced.cond_stage_model.calls == 1
+
+
+def test_entries_persist_across_restarts(cache, tmp_path, monkeypatch):
+    source = tmp_path / "encoder.safetensors"
+    source.write_bytes(b"weights")
+    cache.persist_to(str(tmp_path / "cache"), 1 << 20)
+    make_clip(source).encode_from_tokens(tokens(7, 8))
+    make_clip().encode_from_tokens(tokens(7, 9))
+    cache.disk.flush()
+    # Encoders not loaded from a file stay in memory
+    assert cache.disk.stats()["entries"] == 1
+
+    restarted = ConditioningCache(1 << 20)
+    restarted.persist_to(str(tmp_path / "cache"), 1 << 20)
+    monkeypatch.setattr(comfy.sd, "conditioning_cache", restarted)
+    clip = make_clip(source)
+    cond, pooled = clip.encode_from_tokens(tokens(7, 8), return_pooled=True)
+    assert clip.cond_stage_model.calls == 0 and pooled.shape == (1, 8)
+    assert restarted.stats()["disk"]["hits"] == 1
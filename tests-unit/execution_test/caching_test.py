@@ -0,0 +1,212 @@
+import asyncio
+
+import pytest
+import torch
+
+from comfy.cli_args import args
+if not torch.cuda.is_available():
+    args.cpu = True
+
+import execution  # noqa: E402
+import folder_paths  # noqa: E402
+from comfy.disk_store import DiskStore  # noqa: E402
+import nodes  # noqa: E402
+from comfy_execution.caching import (  # noqa: E402
+    CacheEntry, CacheKeySetInputSignature, DiskCache, HierarchicalCache, RAMPressureCache, Unhashable, output_size,
+)
+from comfy_execution.graph import DynamicPrompt  # noqa: E402
+
+
+class DummyNode:
+    @classmethod
+    def INPUT_TYPES(cls):
+        return {"required": {"value": ("INT",)}, "optional": {"a": ("ANY",), "b": ("ANY",)}}
+
+    RETURN_TYPES = ("ANY",)
+    FUNCTION = "run"
+
+
+class DummyNotIdempotent(DummyNode):
+    NOT_IDEMPOTENT = True
+
+
+class IsChanged:
+    def __init__(self, values=None):
+        self.values = values or {}
+
+    async def get(self, node_id):
+        return self.values.get(node_id, False)
+
+
+@pytest.fixture(autouse=True)
+def test_nodes(monkeypatch):
+    monkeypatch.setitem(nodes.NODE_CLASS_MAPPINGS, "DummyNode", DummyNode)
+    monkeypatch.setitem(nodes.NODE_CLASS_MAPPINGS, "DummyNotIdempotent", DummyNotIdempotent)
+
+
+def node(value, a=None, b=None, class_type="DummyNode"):
+    inputs = {"value": value}
+    if a is not None:
+        inputs["a"] = [a, 0]
+    if b is not None:
+        inputs["b"] = [b, 0]
+    return {"class_type": class_type, "inputs": inputs}
+
+
+def keys_for(prompt, is_changed=None):
+    key_set = CacheKeySetInputSignature(DynamicPrompt(prompt), prompt.keys(), is_changed or IsChanged())
+    asyncio.run(key_set.add_keys(prompt.keys()))
+    return key_set.keys
+
+
+def diamond(top=1):
+    return {"1": node(top), "2": node(2, "1"), "3": node(3, "1"), "4": node(4, "2", "3"), "5": node(5)}
+
+
+def test_only_descendants_of_a_change_get_new_keys():
+    before, after = keys_for(diamond()), keys_for(diamond())
+    assert before == after
+    changed = diamond()
+    changed["2"]["inputs"]["value"] = 20
+    after = keys_for(changed)
+    assert [n for n in before if before[n] != after[n]] == ["2", "4"]
+
+
+def test_keys_follow_structure_not_node_ids():
+    renamed = {"a": node(1), "b": node(2, "a")}
+    assert keys_for(renamed)["b"] == keys_for({"x": node(1), "y": node(2, "x")})["y"]
+    # The linked output socket is part of the key
+    renamed["b"]["inputs"]["a"][1] = 1
+    assert keys_for(renamed)["b"] != keys_for({"x": node(1), "y": node(2, "x")})["y"]
+    # Nodes that are not idempotent are keyed by their id as well
+    first = keys_for({"1": node(1, class_type="DummyNotIdempotent")})["1"]
+    assert first != keys_for({"2": node(1, class_type="DummyNotIdempotent")})["2"]
+
+
+def test_uncacheable_values_propagate_to_descendants():
+    is_changed = IsChanged({"1": float("NaN")})
+    first, second = keys_for(diamond(), is_changed), keys_for(diamond(), IsChanged({"1": float("NaN")}))
+    for node_id in ("1", "2", "3", "4"):
+        assert isinstance(first[node_id], Unhashable) and first[node_id] != second[node_id]
+    assert first["5"] == second["5"]
+
+    missing = keys_for({"1": node(1, "gone")})
+    assert isinstance(missing["1"], Unhashable)
+
+
+def test_signatures_are_shared_per_prompt_and_handle_deep_graphs():
+    prompt = {str(i): node(i, str(i - 1) if i else None) for i in range(5000)}
+    dynprompt, is_changed = DynamicPrompt(prompt), IsChanged()
+    key_set = CacheKeySetInputSignature(dynprompt, prompt.keys(), is_changed)
+    asyncio.run(key_set.add_keys(["4999"]))
+    assert len(key_set.signatures) == 5000
+    # A subcache's key set for the same prompt reuses the digests
+    assert CacheKeySetInputSignature(dynprompt, [], is_changed).signatures is key_set.signatures
+
+
+def disk_cache(directory, max_bytes=1 << 30):
+    return DiskCache(HierarchicalCache(CacheKeySetInputSignature), DiskStore(str(directory), max_bytes))
+
+
+def set_prompt(cache, prompt):
+    asyncio.run(cache.set_prompt(DynamicPrompt(prompt), prompt.keys(), IsChanged()))
+
+
+def test_disk_cache_survives_a_restart(tmp_path):
+    prompt = diamond()
+    cache = disk_cache(tmp_path)
+    set_prompt(cache, prompt)
+    latent = {"samples": torch.ones(1, 4, 8, 8)}
+    cache.set("2", CacheEntry(ui=None, outputs=[[latent]]))
+    cache.set("3", CacheEntry(ui=None, outputs=[[object()]]))
+    cache.flush()
+    assert cache.stats()["disk"]["writes"] == 1
+
+    restarted = disk_cache(tmp_path)
+    set_prompt(restarted, prompt)
+    entry = restarted.get("2")
+    assert torch.equal(entry.outputs[0][0]["samples"], latent["samples"])
+    assert restarted.get("3") is None
+    # The hit is kept in memory; the disk is read once
+    assert restarted.inner.get("2") is entry and restarted.stats()["disk"]["hits"] == 1
+
+    changed = diamond(top=10)
+    set_prompt(restarted, changed)
+    assert restarted.get("2") is None
+
+
+def test_disk_cache_evicts_least_recently_used(tmp_path):
+    prompt = {str(i): node(i) for i in range(3)}
+    cache = disk_cache(tmp_path, max_bytes=150_000)
+    set_prompt(cache, prompt)
+    for node_id in prompt:
+        cache.set(node_id, CacheEntry(ui=None, outputs=[[torch.zeros(16384)]]))
+        cache.flush()
+    stats = cache.stats()["disk"]
+    assert stats["entries"] == 2 and stats["evictions"] == 1 and stats["bytes"] <= 150_000
+
+    restarted = disk_cache(tmp_path, max_bytes=150_000)
+    set_prompt(restarted, prompt)
+    assert restarted.get("0") is None and restarted.get("2") is not None
+
+
+def test_disk_cache_keys_follow_model_files(tmp_path, monkeypatch):
+    models = tmp_path / "models"
+    models.mkdir()
+    checkpoint = models / "model.safetensors"
+    checkpoint.write_bytes(b"old weights")
+    monkeypatch.setitem(folder_paths.folder_names_and_paths, "test_models", ([str(models)], {".safetensors"}))
+    prompt = {"1": node("model.safetensors"), "2": node(2, "1"), "3": node(3)}
+    cache = disk_cache(tmp_path / "cache")
+    set_prompt(cache, prompt)
+    for node_id in ("2", "3"):
+        cache.set(node_id, CacheEntry(ui=None, outputs=[[torch.ones(2)]]))
+    cache.flush()
+
+    # Same file name, new contents: what was built from the old weights is not served
+    checkpoint.write_bytes(b"new weights!")
+    restarted = disk_cache(tmp_path / "cache")
+    set_prompt(restarted, prompt)
+    assert restarted.get("2") is None and restarted.get("3") is not None
+
+
+def test_executor_reset_keeps_the_disk_store(tmp_path):
+    executor = execution.PromptExecutor(None, cache_args={"disk": str(tmp_path), "disk_size": 1.0})
+    store = executor.disk_store
+    executor.reset()
+    assert isinstance(executor.caches.outputs, DiskCache) and executor.caches.outputs.store is store
+
+
+def test_output_size_counts_each_storage_once():
+    cond = torch.zeros(1, 77, 64)
+    pooled = torch.zeros(1, 64)
+    outputs = [[[[cond, {"pooled_output": pooled, "cond_view": cond[:, :10]}]]], [cond]]
+    assert output_size(outputs) == (cond.numel() + pooled.numel()) * 4
+
+    class Model:
+        def get_ram_usage(self):
+            return 5_000_000
+    model = Model()
+    assert output_size([[model], [model]]) == 5_000_000
+
+
+def test_ram_cache_evicts_to_the_byte_budget():
+    prompt = {str(i): node(i) for i in range(4)}
+    cache = RAMPressureCache(CacheKeySetInputSignature, max_bytes=3_000_000)
+    set_prompt(cache, prompt)
+    for node_id in ("0", "1", "2"):
+        assert cache.get(node_id) is None
+        cache.set(node_id, CacheEntry(ui=None, outputs=[[torch.zeros(250_000)]]))
+    cache.get("0")
+    assert cache.total_bytes == 3_000_000
+    cache.poll(ram_headroom=0)
+    assert cache.stats()["classes"]["DummyNode"] == {"hits": 0, "misses": 3, "evictions": 0}
+
+    # A newer prompt: the entries it does not use are older and go first
+    set_prompt(cache, {"3": node(3), "0": node(0)})
+    assert cache.get("0") is not None and cache.get("3") is None
+    cache.set("3", CacheEntry(ui=None, outputs=[[torch.zeros(250_000)]]))
+    cache.poll(ram_headroom=0)
+    assert cache.total_bytes <= 3_000_000 / 1.1
+    assert cache.get("0") is not None and cache.get("3") is not None
+    assert cache.stats()["classes"]["DummyNode"] == {"hits": 1, "misses": 4, "evictions": 2}
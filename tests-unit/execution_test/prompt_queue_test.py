@@ -0,0 +1,74 @@
+import torch
+
+from comfy.cli_args import args
+if not torch.cuda.is_available():
+    args.cpu = True
+
+import execution  # noqa: E402
+from comfy_execution.jobs import JobStatus  # noqa: E402
+
+
+class DummyServer:
+    def queue_updated(self):
+        pass
+
+
+def queue_item(number, prompt_id, workflow_id="wf"):
+    extra_data = {"create_time": 1000 + number, "extra_pnginfo": {"workflow": {"id": workflow_id}}}
+    return (number, prompt_id, {}, extra_data, [], {"auth_token_comfy_org": "secret"})
+
+
+def finish(queue, status_str="success"):
+    item, item_id = queue.get()
+    status = execution.PromptQueue.ExecutionStatus(status_str=status_str, completed=status_str == "success", messages=[])
+    queue.task_done(item_id, {"outputs": {}, "meta": {}}, status, process_item=lambda prompt: prompt[:5] + prompt[6:])
+    return item
+
+
+def test_jobs_follow_the_queue():
+    queue = execution.PromptQueue(DummyServer())
+    for i in range(4):
+        queue.put(queue_item(i, "p{}".format(i), workflow_id="wf-{}".format(i % 2)))
+    item = finish(queue)
+    assert queue.currently_running == {} and queue.get_history(prompt_id="p0")["p0"]["prompt"] == item[:5]
+    finish(queue, "error")
+    queue.get()
+    queue.delete_queue_item(lambda a: a[1] == "p3")
+
+    jobs, total, _ = queue.get_jobs()
+    assert [(j["id"], j["status"]) for j in jobs] == [
+        ("p2", JobStatus.IN_PROGRESS), ("p1", JobStatus.FAILED), ("p0", JobStatus.COMPLETED)]
+    assert queue.get_jobs(workflow_id="wf-1")[1] == 1
+    assert "outputs" in queue.get_job("p0") and queue.get_job("p3") is None
+
+    # Queued again while the first run is in the history
+    queue.put(queue_item(5, "p0"))
+    assert queue.get_job("p0")["status"] == JobStatus.COMPLETED
+    queue.wipe_queue()
+    queue.delete_history_item("p1")
+    assert [j["id"] for j in queue.get_jobs()[0]] == ["p2", "p0"]
+    queue.wipe_history()
+    assert queue.get_jobs()[1] == 1
+
+
+def test_history_windows():
+    queue = execution.PromptQueue(DummyServer())
+    for i in range(10):
+        queue.put(queue_item(i, "p{}".format(i)))
+        finish(queue)
+    assert list(queue.get_history(max_items=3)) == ["p7", "p8", "p9"]
+    assert list(queue.get_history(max_items=2, offset=1)) == ["p1", "p2"]
+    assert list(queue.get_history(max_items=4, offset=8)) == ["p8", "p9"]
+    assert list(queue.get_history(offset=7)) == ["p7", "p8", "p9"]
+    assert len(queue.get_history()) == 10 and queue.get_history(offset=100) == {}
+
+
+def test_history_prompts_do_not_pick_up_executor_state():
+    queue = execution.PromptQueue(DummyServer())
+    prompt = {"1": {"class_type": "LoadImage", "inputs": {"image": "a.png"}}}
+    queue.put((0, "p1", prompt, {"create_time": 1000}, ["1"], {}))
+    (item, item_id) = queue.get()
+    # What IsChangedCache.get does while the prompt runs
+    item[2]["1"]["is_changed"] = float("NaN")
+    queue.task_done(item_id, {"outputs": {}, "meta": {}}, None, process_item=lambda p: p[:5] + p[6:])
+    assert queue.get_history(prompt_id="p1")["p1"]["prompt"][2] == {"1": {"class_type": "LoadImage", "inputs": {"image": "a.png"}}}
@@ -0,0 +1,123 @@
+import json
+import threading
+import time
+
+import pytest
+
+import simple_generator
+from simple_generator import BatchQueue, GeneratorStore
+
+
+@pytest.fixture
+def submitted(monkeypatch, tmp_path):
+    calls = []
+    lock = threading.Lock()
+
+    def fake_submit(prompt_json, user=None, priority=None):
+        workflow = json.loads(prompt_json)
+        with lock:
+            calls.append(workflow)
+            return {"prompt_id": f"pid-{len(calls)}"}
+
+    monkeypatch.setattr(simple_generator, "submit_prompt", fake_submit)
+    monkeypatch.setattr(simple_generator, "unload_ollama_model", lambda: calls.append("unload"))
+    monkeypatch.setattr(simple_generator.event_listener.connected, "is_set", lambda: True)
+    monkeypatch.setattr(simple_generator, "generator_store", GeneratorStore(str(tmp_path / "test.db")))
+    return calls
+
+
+def wait_submitted(queue, batch_id):
+    deadline = time.time() + 5
+    while queue.batches[batch_id]['submitting'] and time.time() < deadline:
+        time.sleep(0.01)
+
+
+def test_groups_by_model_stack(submitted):
+    queue = BatchQueue(window=2)
+    result = queue.create({
+        "resolution": 768,
+        "jobs": [
+            {"prompt": "a", "mode": "lightning"},
+            {"prompt": "b", "model": "zimage"},
+            {"prompt": "c", "mode": "normal"},
+            {"prompt": "d", "mode": "lightning", "seed": 7},
+            {"prompt": "e", "model": "zimage"},
+        ],
+    })
+    assert result["total"] == 5 and result["groups"] == 3
+    wait_submitted(queue, result["batch_id"])
+
+    assert submitted.count("unload") == 1
+    workflows = [w for w in submitted if w != "unload"]
+    # Only Z-Image has a node "1"; only Qwen lightning has the LoRA node "12"
+    stacks = ["zimage" if "1" in w else "lightning" if "12" in w else "normal" for w in workflows]
+    # Each model stack is submitted as one contiguous run
+    assert stacks[:2] == ["lightning", "lightning"]
+    assert stacks[2:4] == ["zimage", "zimage"]
+    assert stacks[4] == "normal"
+    assert all(w["7"]["inputs"]["width"] == 768 for w in workflows)
+
+    status = queue.status(result["batch_id"], include_jobs=True)
+    assert status["queued"] == 5 and status["submitted"] == 5
+    assert next(j for j in status["jobs"] if j["prompt"] == "d")["seed"] == 7
+
+
+def test_progress_follows_events(submitted):
+    queue = BatchQueue()
+    result = queue.create({"prompts": ["x", "y"]})
+    wait_submitted(queue, result["batch_id"])
+    jobs = queue.status(result["batch_id"], include_jobs=True)["jobs"]
+    first, second = jobs[0]["prompt_id"], jobs[1]["prompt_id"]
+
+    queue.handle_event("execution_start", {"prompt_id": first})
+    queue.handle_event("executing", {"prompt_id": first, "node": None})
+    queue.handle_event("execution_start", {"prompt_id": second})
+    queue.handle_event("execution_error", {"prompt_id": second, "exception_message": "OOM"})
+    queue.handle_event("executing", {"prompt_id": second, "node": None})
+
+    status = queue.status(result["batch_id"], include_jobs=True)
+    assert status["completed"] == 1 and status["failed"] == 1
+    assert status["done"] and status["progress"] == 1.0
+    assert status["jobs"][1]["error"] == "OOM"
+
+
+def test_reconcile_without_events(submitted, monkeypatch):
+    queue = BatchQueue()
+    result = queue.create({"prompts": ["x", "y", "z"]})
+    wait_submitted(queue, result["batch_id"])
+    first, second, third = [j["prompt_id"] for j in queue.status(result["batch_id"], include_jobs=True)["jobs"]]
+
+    def fetch_history_entry(prompt_id):
+        # An event settles the job while its history is being fetched
+        queue.handle_event("execution_error", {"prompt_id": second, "exception_message": "OOM"})
+        return {"outputs": {}, "status": {"status_str": "success"}}
+
+    monkeypatch.setattr(simple_generator.event_listener.connected, "is_set", lambda: False)
+    monkeypatch.setattr(simple_generator.comfy_client, "get_json", lambda path, timeout=None: {
+        "queue_running": [[0, first]], "queue_pending": []})
+    monkeypatch.setattr(simple_generator, "fetch_history_entry", fetch_history_entry)
+    status = queue.status(result["batch_id"], include_jobs=True)
+    assert [j["status"] for j in status["jobs"]] == ["running", "failed", "completed"]
+    assert status["jobs"][1]["error"] == "OOM"
+
+
+def test_jobs_that_finished_before_they_were_tracked(submitted, monkeypatch):
+    # pid-1 is taken by the unload call the fixture records
+    entries = {
+        "pid-2": {"outputs": {}, "status": {"status_str": "success"}},
+        "pid-3": {"outputs": {}, "status": {"status_str": "error", "messages": [["execution_error", "OOM"]]}},
+    }
+    monkeypatch.setattr(simple_generator.event_listener, "is_finished", lambda prompt_id: True)
+    monkeypatch.setattr(simple_generator, "fetch_history_entry", entries.get)
+    queue = BatchQueue(window=1)
+    result = queue.create({"prompts": ["x", "y"]})
+    wait_submitted(queue, result["batch_id"])
+    jobs = queue.status(result["batch_id"], include_jobs=True)["jobs"]
+    assert [(j["status"], j["error"]) for j in jobs] == [("completed", None), ("failed", "OOM")]
+
+
+def test_rejects_bad_requests():
+    queue = BatchQueue()
+    assert "error" in queue.create({})
+    assert "error" in queue.create({"jobs": ["not an object"]})
+    assert queue.status("missing") is None
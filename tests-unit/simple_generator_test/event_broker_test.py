@@ -0,0 +1,113 @@
+import io
+import json
+import struct
+import time
+
+import simple_generator
+from simple_generator import ComfyEventListener, EventBroker, ProgressTracker, RequestHandler
+
+
+def make_broker():
+    tracker = ProgressTracker({})
+    tracker.register("p1", mode="lightning", model="qwen")
+    return tracker, EventBroker(tracker)
+
+
+def test_publishes_only_to_subscribers():
+    tracker, broker = make_broker()
+    subscriber = broker.subscribe("p1")
+    other = broker.subscribe("p2")
+    tracker.handle_event("execution_start", {"prompt_id": "p1"})
+    broker.handle_event("execution_start", {"prompt_id": "p1"})
+    event, data = subscriber.get_nowait()
+    assert event == "progress"
+    assert data["status"] == "loading"
+    assert other.empty()
+
+
+def test_finished_event():
+    _, broker = make_broker()
+    subscriber = broker.subscribe("p1")
+    broker.handle_event("executing", {"prompt_id": "p1", "node": None})
+    assert subscriber.get_nowait() == ("finished", None)
+
+
+def test_unsubscribe():
+    _, broker = make_broker()
+    subscriber = broker.subscribe("p1")
+    broker.unsubscribe("p1", subscriber)
+    assert not broker.has_subscribers("p1")
+
+
+def test_slow_subscriber_drops_events():
+    tracker = ProgressTracker({})
+    broker = EventBroker(tracker, max_queue=2)
+    subscriber = broker.subscribe("p1")
+    for _ in range(5):
+        broker.publish("p1", "progress", {})
+    assert subscriber.qsize() == 2
+
+
+def test_preview_with_metadata_is_routed_by_prompt_id():
+    _, broker = make_broker()
+    subscriber = broker.subscribe("p1")
+    listener = ComfyEventListener("http://127.0.0.1:8188", "client")
+    listener.add_preview_handler(broker.handle_preview)
+    metadata = json.dumps({"prompt_id": "p1", "image_type": "image/png"}).encode()
+    listener._handle_binary(struct.pack(">I", 4) + struct.pack(">I", len(metadata)) + metadata + b"PNGDATA")
+    event, data = subscriber.get_nowait()
+    assert event == "preview"
+    assert data["image"].startswith("data:image/png;base64,")
+
+
+def test_legacy_preview_uses_executing_prompt():
+    _, broker = make_broker()
+    subscriber = broker.subscribe("p1")
+    listener = ComfyEventListener("http://127.0.0.1:8188", "client")
+    listener.add_preview_handler(broker.handle_preview)
+    listener._handle_message({"type": "execution_start", "data": {"prompt_id": "p1"}})
+    listener._handle_binary(struct.pack(">I", 1) + struct.pack(">I", 1) + b"JPEGDATA")
+    event, data = subscriber.get_nowait()
+    assert data["image"].startswith("data:image/jpeg;base64,")
+
+
+def test_wait_returns_at_once_after_a_reconnect():
+    listener = ComfyEventListener("http://127.0.0.1:8188", "client")
+    listener.connected.set()
+    connection = listener.connection
+    # The websocket dropped and came back after the caller checked /history
+    listener.connection += 1
+    started = time.time()
+    assert listener.wait("p1", 5, connection) is False
+    assert time.time() - started < 1
+    listener._mark_finished("p1")
+    assert listener.wait("p1", 5, connection) is True
+
+
+def test_event_stream_rechecks_history_after_a_reconnect(monkeypatch):
+    _, broker = make_broker()
+    listener = ComfyEventListener("http://127.0.0.1:8188", "client")
+    listener.connected.set()
+    fetches = []
+
+    def fetch_history_entry(prompt_id):
+        fetches.append(prompt_id)
+        if len(fetches) == 1:
+            # The websocket drops and comes back while the job finishes
+            listener.connection += 1
+            return None
+        return {"outputs": {}, "status": {"status_str": "success"}}
+
+    monkeypatch.setattr(simple_generator, "event_broker", broker)
+    monkeypatch.setattr(simple_generator, "event_listener", listener)
+    monkeypatch.setattr(simple_generator, "fetch_history_entry", fetch_history_entry)
+    monkeypatch.setattr(simple_generator, "get_progress", lambda prompt_id: {"status": "generating"})
+    monkeypatch.setattr(simple_generator, "job_result", lambda prompt_id, entry: {"success": True})
+    handler = RequestHandler.__new__(RequestHandler)
+    handler.wfile = io.BytesIO()
+    handler.send_response = handler.send_header = lambda *args: None
+    handler.end_headers = lambda: None
+    started = time.time()
+    handler.stream_events("p1", timeout=60)
+    assert time.time() - started < 5 and len(fetches) == 2
+    assert handler.wfile.getvalue().decode().endswith('event: done\ndata: {"success": true}\n\n')
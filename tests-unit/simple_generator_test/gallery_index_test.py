@@ -0,0 +1,105 @@
+import os
+import time
+
+import pytest
+from PIL import Image
+
+import simple_generator
+from simple_generator import GalleryIndex, gallery_page, get_thumbnail, image_model_mode
+
+
+def make_png(directory, name, mtime, size=(64, 48)):
+    path = directory / name
+    Image.new('RGB', size, (200, 10, 10)).save(path)
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+@pytest.fixture
+def gallery(tmp_path):
+    output = tmp_path / "output"
+    output.mkdir()
+    names = ["qwen_lightning_00001_.png", "qwen_normal_00001_.png", "qwen_edit_00001_.png",
+             "zimage_turbo_00001_.png", "qwen_lightning_00002_.png"]
+    for i, name in enumerate(names):
+        make_png(output, name, 1000 + i)
+    (output / "notes.txt").write_text("x")
+    return GalleryIndex(str(tmp_path / "test.db"), str(output)), output
+
+
+def test_classification():
+    assert image_model_mode("qwen_lightning_00001_.png") == ("qwen", "lightning")
+    assert image_model_mode("qwen_upscale_00001_.png") == ("qwen", "edit")
+    assert image_model_mode("zimage_turbo_00001_.png") == ("zimage", "normal")
+
+
+def test_cursor_pagination(gallery):
+    index, _ = gallery
+    first = index.page(limit=2)
+    assert first['total'] == 5
+    assert [i['filename'] for i in first['images']] == ["qwen_lightning_00002_.png", "zimage_turbo_00001_.png"]
+    second = index.page(cursor=first['next_cursor'], limit=2)
+    third = index.page(cursor=second['next_cursor'], limit=2)
+    assert third['next_cursor'] is None
+    seen = [i['filename'] for page in (first, second, third) for i in page['images']]
+    assert len(seen) == len(set(seen)) == 5
+
+
+def test_filters(gallery):
+    index, _ = gallery
+    assert index.page(mode='lightning')['total'] == 2
+    assert [i['filename'] for i in index.page(model='zimage')['images']] == ["zimage_turbo_00001_.png"]
+    assert index.page(since=1003)['total'] == 2
+    assert index.page(names=["qwen_edit_00001_.png", "missing.png"])['total'] == 1
+
+
+def test_refresh_tracks_directory_changes(gallery):
+    index, output = gallery
+    assert index.page()['total'] == 5
+    os.remove(output / "qwen_normal_00001_.png")
+    make_png(output, "qwen_lightning_00003_.png", 2000)
+    assert index.refresh(force=True) == (1, 1)
+    images = index.page()['images']
+    assert images[0]['filename'] == "qwen_lightning_00003_.png"
+    assert "qwen_normal_00001_.png" not in [i['filename'] for i in images]
+
+
+def test_files_still_being_written_are_restated(gallery):
+    index, output = gallery
+    path = make_png(output, "qwen_lightning_00004_.png", time.time(), size=(8, 8))
+    assert index.refresh(force=True) == (6, 0)
+    # Rewriting a file in place does not change the directory mtime
+    Image.new('RGB', (256, 256), (1, 2, 3)).save(path)
+    index._last_check = 0
+    index.refresh()
+    assert index.page(limit=1)['images'][0]['size'] == path.stat().st_size
+
+    os.utime(path, (3000, 3000))
+    index._last_check = 0
+    index.refresh()
+    index._last_check = 0
+    assert index.refresh() == (0, 0) and index.page(limit=1)['images'][0]['timestamp'] == 3000
+
+
+def test_names_with_commas(gallery, monkeypatch):
+    index, output = gallery
+    make_png(output, "qwen_a,b_00001_.png", 1500)
+    monkeypatch.setattr(simple_generator, "gallery_index", index)
+    page = gallery_page({"name": ["qwen_a,b_00001_.png", "qwen_edit_00001_.png"]})
+    assert [i['filename'] for i in page['images']] == ["qwen_a,b_00001_.png", "qwen_edit_00001_.png"]
+
+
+def test_thumbnail_cache(tmp_path, monkeypatch):
+    output = tmp_path / "output"
+    output.mkdir()
+    monkeypatch.setattr(simple_generator, "OUTPUT_DIR", str(output))
+    monkeypatch.setattr(simple_generator, "THUMB_DIR", str(tmp_path / "thumbs"))
+    make_png(output, "big.png", 1000, size=(1024, 512))
+    thumb = get_thumbnail("big.png", 160)
+    with Image.open(thumb) as img:
+        assert img.format == "WEBP"
+        assert img.size == (160, 80)
+    # Cached until the source changes
+    assert get_thumbnail("big.png", 160) == thumb
+    assert get_thumbnail("../big.png") is None
+    assert get_thumbnail("missing.png") is None
@@ -0,0 +1,150 @@
+import json
+import threading
+
+import pytest
+
+from simple_generator import GeneratorStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return GeneratorStore(str(tmp_path / "test.db"))
+
+
+def test_history_deduplicates_and_orders(store):
+    first = store.add_history({"prompt": "a red fox", "mode": "lightning", "resolution": 512, "timestamp": 1000})
+    store.add_history({"prompt": "blue whale", "mode": "normal", "resolution": 768, "timestamp": 2000})
+    # Re-using a prompt moves it to the top and keeps its id
+    assert store.add_history({"prompt": "a red fox", "mode": "normal", "timestamp": 3000}) == first
+    page = store.history()
+    assert page["total"] == 2
+    assert [h["prompt"] for h in page["history"]] == ["a red fox", "blue whale"]
+    assert page["history"][0]["mode"] == "normal"
+    with pytest.raises(ValueError):
+        store.add_history({"prompt": "  "})
+
+
+def test_history_is_unlimited_and_searchable(store):
+    for i in range(60):
+        store.add_history({"prompt": f"castle number {i}", "mode": "lightning", "timestamp": i})
+    store.add_history({"prompt": 'dragon "over" mountains', "mode": "normal", "timestamp": 100})
+    assert store.history()["total"] == 61
+    assert [h["prompt"] for h in store.history(limit=2, offset=1)["history"]] == ["castle number 59", "castle number 58"]
+    assert store.history("drag")["history"][0]["prompt"] == 'dragon "over" mountains'
+    assert store.history("castle 42")["total"] == 1
+    assert store.history('"over" normal')["total"] == 1
+    assert store.history("submarine")["total"] == 0
+
+
+def test_delete_history(store):
+    keep = store.add_history({"prompt": "keep", "timestamp": 1})
+    drop = store.add_history({"prompt": "drop", "timestamp": 2})
+    assert store.history_id_at(0) == drop
+    assert store.delete_history(drop)
+    assert not store.delete_history(drop)
+    assert [h["id"] for h in store.history()["history"]] == [keep]
+    # Deleted prompts disappear from search too
+    assert store.history("drop")["total"] == 0
+
+
+def test_favorites(store):
+    store.set_favorite("a.png")
+    store.set_favorite("b.png")
+    store.set_favorite("a.png")
+    assert store.favorites() == ["a.png", "b.png"]
+    store.set_favorite("a.png", False)
+    store.replace_favorites(["b.png", "c.png"])
+    assert sorted(store.favorites()) == ["b.png", "c.png"]
+
+
+def test_concurrent_writes_are_not_lost(store):
+    def writer(n):
+        for i in range(25):
+            store.add_history({"prompt": f"writer {n} prompt {i}"})
+            store.set_favorite(f"{n}_{i}.png")
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert store.history()["total"] == 200
+    assert len(store.favorites()) == 200
+
+
+def test_imports_json_files_once(tmp_path):
+    history_file = tmp_path / "prompt_history.json"
+    favorites_file = tmp_path / "favorites.json"
+    history_file.write_text(json.dumps([{"prompt": "newest", "mode": "lightning"}, {"prompt": "oldest", "mode": "normal"}]))
+    favorites_file.write_text(json.dumps(["x.png"]))
+    store = GeneratorStore(str(tmp_path / "test.db"), str(history_file), str(favorites_file))
+    assert [h["prompt"] for h in store.history()["history"]] == ["newest", "oldest"]
+    assert store.favorites() == ["x.png"]
+
+    store.delete_history(store.history_id_at(0))
+    reopened = GeneratorStore(str(tmp_path / "test.db"), str(history_file), str(favorites_file))
+    assert [h["prompt"] for h in reopened.history()["history"]] == ["oldest"]
+
+
+def test_generation_log_follows_events(store):
+    store.record_generation("pid-1", "image", prompt="cat", seed=7, model="qwen", mode="lightning",
+                            resolution=768, aspect="square", batch_id="b1")
+    store.handle_event("execution_start", {"prompt_id": "pid-1"})
+    assert store.generation("pid-1")["status"] == "running"
+    store.handle_event("executing", {"prompt_id": "pid-1", "node": None})
+    generation = store.generation("pid-1")
+    assert generation["status"] == "done"
+    assert generation["seed"] == 7 and generation["resolution"] == 768
+    assert generation["params"]["batch_id"] == "b1"
+    assert generation["queued_at"] <= generation["started_at"] <= generation["finished_at"]
+
+    store.record_generation("pid-2", "video", prompt="waves", resolution="480p")
+    store.handle_event("execution_error", {"prompt_id": "pid-2"})
+    store.handle_event("executing", {"prompt_id": "pid-2", "node": None})
+    assert store.generation("pid-2")["status"] == "error"
+    assert store.generation("pid-2")["resolution"] == "480p"
+    assert store.generation("missing") is None
+
+
+def test_events_before_the_job_is_recorded(store):
+    # A cached job can finish before submit_prompt returns and the row is written
+    store.handle_event("execution_start", {"prompt_id": "fast"})
+    store.handle_event("executed", {"prompt_id": "fast", "node": "9", "output": {"images": [
+        {"filename": "fast_00001_.png", "subfolder": "", "type": "output"}]}})
+    store.handle_event("execution_success", {"prompt_id": "fast"})
+    store.handle_event("executing", {"prompt_id": "fast", "node": None})
+    store.record_generation("fast", "image", prompt="cat", seed=1)
+    generation = store.generation("fast")
+    assert generation["status"] == "done" and generation["started_at"] <= generation["finished_at"]
+    assert store.image_meta("fast_00001_.png")["prompt_id"] == "fast"
+
+    # Recording it again keeps the progress
+    store.record_generation("fast", "image", prompt="cat", seed=2)
+    assert store.generation("fast")["status"] == "done" and store.generation("fast")["seed"] == 2
+    assert store.generation("fast")["started_at"] == generation["started_at"]
+
+
+def test_outputs_map_back_to_generation(store):
+    store.record_generation("pid-1", "image", prompt="cat", seed=7, model="qwen", sampler="euler")
+    store.handle_event("execution_start", {"prompt_id": "pid-1"})
+    # Previews go to temp/ and are not outputs
+    store.handle_event("executed", {"prompt_id": "pid-1", "node": "9", "output": {"images": [
+        {"filename": "qwen_lightning_00001_.png", "subfolder": "", "type": "output"},
+        {"filename": "preview_00001_.png", "subfolder": "", "type": "temp"}]}})
+    store.handle_event("executing", {"prompt_id": "pid-1", "node": None})
+
+    meta = store.image_meta("qwen_lightning_00001_.png")
+    assert meta["prompt_id"] == "pid-1" and meta["prompt"] == "cat" and meta["seed"] == 7
+    assert meta["duration"] >= 0
+    assert store.image_meta("preview_00001_.png") is None
+
+
+def test_outputs_from_history_and_bulk_lookup(store):
+    store.record_generation("pid-v", "video", prompt="waves", model="wan")
+    store.record_outputs("pid-v", {"12": {"videos": [{"filename": "wan_00001_.webm", "subfolder": "video", "type": "output"}]},
+                                   "13": {"text": ["ignored"]}})
+    # Jobs this server did not queue are not indexed
+    store.record_outputs("someone-else", {"9": {"images": [{"filename": "other.png", "type": "output"}]}})
+    metas = store.image_metas(["video/wan_00001_.webm", "other.png", "missing.png"])
+    assert list(metas) == ["video/wan_00001_.webm"]
+    assert metas["video/wan_00001_.webm"]["kind"] == "video"
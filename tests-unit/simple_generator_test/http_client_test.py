@@ -0,0 +1,73 @@
+import json
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from simple_generator import HTTPStatusError, PooledHTTPClient
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/missing':
+            self._reply(404, {"error": "not found"})
+        else:
+            self._reply(200, {"path": self.path})
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self._reply(200, {"echo": payload})
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_reuses_connections(server):
+    client = PooledHTTPClient(server)
+    assert client.post_json("/prompt", {"a": 1}) == {"echo": {"a": 1}}
+    for _ in range(5):
+        assert client.get_json("/history/x") == {"path": "/history/x"}
+    stats = client.stats()
+    assert stats['connections_opened'] == 1
+    assert stats['connections_reused'] == 5
+    client.close()
+
+
+def test_error_status_raises(server):
+    client = PooledHTTPClient(server)
+    with pytest.raises(HTTPStatusError) as exc:
+        client.get_json("/missing")
+    assert exc.value.status == 404
+    # The connection stays usable after an error response
+    assert client.get_json("/ok") == {"path": "/ok"}
+    assert client.stats()['connections_opened'] == 1
+
+
+def test_stale_connection_is_retried(server):
+    client = PooledHTTPClient(server)
+    client.get_json("/a")
+    # Simulate the server dropping an idle keep-alive connection
+    client._idle.queue[-1].sock.shutdown(socket.SHUT_RDWR)
+    assert client.get_json("/b") == {"path": "/b"}
+    assert client.stats()['retries'] == 1
@@ -0,0 +1,82 @@
+import base64
+import os
+import time
+
+import pytest
+
+import simple_generator
+from simple_generator import MultipartFileBody, cleanup_input_files, decode_image_to_file
+
+
+@pytest.fixture
+def input_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(simple_generator, "INPUT_DIR", str(tmp_path))
+    return tmp_path
+
+
+def data_url(payload):
+    return "data:image/png;base64," + base64.b64encode(payload).decode()
+
+
+def test_decode_streams_to_hashed_file(input_dir):
+    payload = os.urandom(300 * 1024 + 7)
+    path, filename = decode_image_to_file(data_url(payload), "edit_input_")
+    assert filename.startswith("edit_input_") and filename.endswith(".png")
+    with open(path, "rb") as f:
+        assert f.read() == payload
+    assert os.listdir(input_dir) == [filename]
+
+
+def test_same_image_is_deduplicated(input_dir):
+    payload = b"\x89PNG" + os.urandom(1000)
+    first = decode_image_to_file(data_url(payload), "3d_input_")
+    second = decode_image_to_file(data_url(payload), "3d_input_")
+    assert first == second
+    assert len(os.listdir(input_dir)) == 1
+
+
+def test_invalid_base64(input_dir):
+    with pytest.raises(ValueError):
+        decode_image_to_file("data:image/png;base64,abc", "edit_input_")
+    assert os.listdir(input_dir) == []
+
+
+def test_rejects_empty_and_non_base64_data(input_dir):
+    for image_data in ("", "data:image/png;base64,", "data:image/png;base64,  \n", "data:image/png;base64,iVBO!!==",
+                       "data:image/png;base64,iVBORw0K#ABC"):
+        with pytest.raises(ValueError):
+            decode_image_to_file(image_data, "edit_input_")
+    assert os.listdir(input_dir) == []
+
+
+def test_extension_follows_the_decoded_format(input_dir):
+    jpeg = b"\xff\xd8\xff\xe0" + os.urandom(100)
+    encoded = base64.b64encode(jpeg).decode()
+    wrapped = "data:image/png;base64," + " ".join(encoded[i:i + 20] for i in range(0, len(encoded), 20))
+    path, filename = decode_image_to_file(wrapped, "edit_input_")
+    assert filename.endswith(".jpg")
+    with open(path, "rb") as f:
+        assert f.read() == jpeg
+    webp = b"RIFF\x10\x00\x00\x00WEBPVP8 " + os.urandom(16)
+    assert decode_image_to_file(data_url(webp), "edit_input_")[1].endswith(".webp")
+    assert decode_image_to_file(data_url(b"GIF89a" + os.urandom(16)), "edit_input_")[1].endswith(".gif")
+
+
+def test_multipart_body_is_reiterable(input_dir):
+    path = input_dir / "video_input_x.png"
+    path.write_bytes(os.urandom(200 * 1024))
+    body = MultipartFileBody(str(path), "video_input_x.png")
+    first = b"".join(body)
+    assert len(first) == len(body)
+    assert b"".join(body) == first
+    assert body.boundary in body.content_type
+
+
+def test_cleanup_removes_only_stale_inputs(input_dir):
+    old_time = time.time() - 2 * simple_generator.INPUT_MAX_AGE
+    for name in ("edit_input_old.png", "unrelated.png"):
+        (input_dir / name).write_bytes(b"x")
+        os.utime(input_dir / name, (old_time, old_time))
+    (input_dir / "video_input_new.png").write_bytes(b"x")
+    assert cleanup_input_files(force=True) == 1
+    assert sorted(os.listdir(input_dir)) == ["unrelated.png", "video_input_new.png"]
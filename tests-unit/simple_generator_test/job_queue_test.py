@@ -0,0 +1,126 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import simple_generator
+from simple_generator import ComfyEventListener, JobQueue, PooledHTTPClient, ProgressTracker
+
+
+class FakeComfy(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    running = []
+    pending = []
+    requests = []
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, data):
+        body = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/queue':
+            self._reply({"queue_running": [[0, p] for p in self.running],
+                         "queue_pending": [[0, p] for p in self.pending]})
+        else:
+            self._reply({})
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.requests.append((self.path, payload))
+        if self.path == '/queue':
+            FakeComfy.pending = [p for p in self.pending if p not in payload.get('delete', [])]
+        self._reply({})
+
+
+@pytest.fixture
+def jobs(monkeypatch):
+    FakeComfy.running = []
+    FakeComfy.pending = []
+    FakeComfy.requests = []
+    monkeypatch.setattr(simple_generator, "app_settings", {})
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), FakeComfy)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{httpd.server_address[1]}"
+    monkeypatch.setattr(simple_generator, "comfy_client", PooledHTTPClient(url))
+    listener = ComfyEventListener(url, "test")
+    job_queue = JobQueue(ProgressTracker({}), simple_generator.comfy_client, listener)
+    listener.add_handler(job_queue.tracker.handle_event)
+    yield job_queue
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def queue_job(job_queue, prompt_id, user, priority=None):
+    slot, number = job_queue.assign(user, priority)
+    job_queue.submitted(prompt_id, user, priority, slot, number)
+    return number
+
+
+def test_users_share_the_queue(jobs):
+    numbers = {f"a{i}": queue_job(jobs, f"a{i}", "alice") for i in range(3)}
+    numbers["b0"] = queue_job(jobs, "b0", "bob")
+    numbers["urgent"] = queue_job(jobs, "urgent", "alice", "high")
+    assert sorted(numbers, key=numbers.get) == ["urgent", "a0", "b0", "a1", "a2"]
+
+    # The running job moves the clock: bob's next job goes after it
+    jobs.handle_event("execution_start", {"prompt_id": "a1"})
+    assert queue_job(jobs, "b1", "bob") > numbers["a1"]
+
+
+def test_user_priority_setting(jobs, monkeypatch):
+    monkeypatch.setattr(simple_generator, "app_settings", {"user_priorities": {"batch-box": "low"}})
+    background = queue_job(jobs, "bg", "batch-box")
+    assert queue_job(jobs, "fg", "alice") < background
+    assert queue_job(jobs, "bg-high", "batch-box", "high") < background
+
+
+def test_listing(jobs):
+    for prompt_id, user in (("a0", "alice"), ("b0", "bob"), ("a1", "alice")):
+        queue_job(jobs, prompt_id, user)
+    jobs.tracker.handle_event("execution_start", {"prompt_id": "a0"})
+    listing = jobs.jobs()
+    assert [j["prompt_id"] for j in listing["jobs"]] == ["a1", "b0", "a0"]
+    assert {j["prompt_id"]: j.get("position") for j in listing["jobs"]} == {"a0": None, "b0": 1, "a1": 2}
+    assert [j["prompt_id"] for j in jobs.jobs(user="alice", status="queued")["jobs"]] == ["a1"]
+
+
+def test_cancel_pending_job(jobs):
+    queue_job(jobs, "p1", "alice")
+    FakeComfy.pending = ["p1"]
+    assert jobs.cancel("p1", "bob")[0] == 403
+    assert jobs.cancel("p1", "alice") == (200, {"success": True, "status": "cancelled"})
+    assert FakeComfy.requests == [("/queue", {"delete": ["p1"]})]
+    assert jobs.is_cancelled("p1") and jobs.listener.is_finished("p1")
+    assert jobs.tracker.snapshot("p1")["status"] == "interrupted"
+    assert jobs.cancel("p1")[0] == 409
+
+
+def test_cancel_running_job_is_targeted(jobs):
+    queue_job(jobs, "p1", "alice")
+    jobs.tracker.handle_event("execution_start", {"prompt_id": "p1"})
+    FakeComfy.running = ["p1"]
+    assert jobs.cancel("p1") == (200, {"success": True, "status": "interrupting"})
+    assert FakeComfy.requests == [("/interrupt", {"prompt_id": "p1"})]
+    assert not jobs.is_cancelled("p1")
+    assert jobs.cancel("missing")[0] == 404
+
+
+def test_retention():
+    tracker = ProgressTracker({}, max_jobs=3)
+    for i in range(5):
+        tracker.register(f"p{i}")
+        if i != 1:
+            tracker.handle_event("executing", {"prompt_id": f"p{i}", "node": None})
+    tracker.register("p5")
+    # Finished jobs go oldest first; the unfinished p1 is kept
+    assert list(tracker.states) == ["p1", "p4", "p5"]
+    assert tracker.evicted == 3
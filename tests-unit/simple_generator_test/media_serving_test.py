@@ -0,0 +1,83 @@
+import http.client
+import os
+import threading
+
+import pytest
+
+import simple_generator
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    output = tmp_path / "output"
+    output.mkdir()
+    (tmp_path / "secret.txt").write_text("secret")
+    payload = os.urandom(100 * 1024)
+    (output / "clip_00001_.webm").write_bytes(payload)
+    monkeypatch.setattr(simple_generator, "OUTPUT_DIR", str(output))
+    httpd = simple_generator.GeneratorHTTPServer(('127.0.0.1', 0), simple_generator.RequestHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield httpd.server_address[1], payload
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def fetch(port, path, method='GET', headers=None):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    try:
+        conn.request(method, path, headers=headers or {})
+        response = conn.getresponse()
+        return response, response.read()
+    finally:
+        conn.close()
+
+
+def test_full_file_with_cache_headers(server):
+    port, payload = server
+    response, body = fetch(port, '/output/clip_00001_.webm?t=1')
+    assert response.status == 200 and body == payload
+    assert response.getheader('Content-Type') == 'video/webm'
+    assert response.getheader('Accept-Ranges') == 'bytes'
+    assert 'immutable' in response.getheader('Cache-Control')
+
+    etag, last_modified = response.getheader('ETag'), response.getheader('Last-Modified')
+    response, body = fetch(port, '/output/clip_00001_.webm', headers={'If-None-Match': etag})
+    assert response.status == 304 and body == b''
+    response, _ = fetch(port, '/output/clip_00001_.webm', headers={'If-Modified-Since': last_modified})
+    assert response.status == 304
+
+
+def test_byte_ranges(server):
+    port, payload = server
+    response, body = fetch(port, '/output/clip_00001_.webm', headers={'Range': 'bytes=1000-1999'})
+    assert response.status == 206 and body == payload[1000:2000]
+    assert response.getheader('Content-Range') == f'bytes 1000-1999/{len(payload)}'
+
+    response, body = fetch(port, '/output/clip_00001_.webm', headers={'Range': 'bytes=-10'})
+    assert response.status == 206 and body == payload[-10:]
+    response, body = fetch(port, '/output/clip_00001_.webm', headers={'Range': 'bytes=5000-'})
+    assert body == payload[5000:]
+
+    response, _ = fetch(port, '/output/clip_00001_.webm', headers={'Range': f'bytes={len(payload)}-'})
+    assert response.status == 416
+    assert response.getheader('Content-Range') == f'bytes */{len(payload)}'
+
+    # An invalid range (last byte before the first) is ignored
+    response, body = fetch(port, '/output/clip_00001_.webm', headers={'Range': 'bytes=5-3'})
+    assert response.status == 200 and body == payload
+
+    # A stale If-Range falls back to the whole file
+    response, body = fetch(port, '/output/clip_00001_.webm', headers={'Range': 'bytes=0-9', 'If-Range': '"stale"'})
+    assert response.status == 200 and body == payload
+
+
+def test_head_and_confinement(server):
+    port, payload = server
+    response, body = fetch(port, '/output/clip_00001_.webm', 'HEAD')
+    assert response.status == 200 and body == b''
+    assert response.getheader('Content-Length') == str(len(payload))
+
+    for path in ('/output/../secret.txt', '/output/%2e%2e/secret.txt', '/output/missing.png'):
+        assert fetch(port, path)[0].status == 404
+    # HEAD never falls through to the inherited file server
+    assert fetch(port, '/simple_generator.py', 'HEAD')[0].status == 404
@@ -0,0 +1,86 @@
+import json
+import os
+import time
+
+import pytest
+
+from mock_comfyui import start_mock_comfyui
+from simple_generator import ComfyEventListener, PooledHTTPClient, ProgressTracker, build_prompt_body
+
+WORKFLOW = {
+    "5": {"class_type": "UnetLoaderGGUF", "inputs": {"unet_name": "model.gguf"}},
+    "8": {"class_type": "KSampler", "inputs": {"model": ["5", 0], "seed": 1}},
+    "11": {"class_type": "SaveImage", "inputs": {"images": ["8", 0], "filename_prefix": "qwen_lightning"}},
+}
+
+
+@pytest.fixture
+def mock(tmp_path):
+    mock, url, stop = start_mock_comfyui(output_dir=str(tmp_path), step_time=0.05, seed=0)
+    client = PooledHTTPClient(url)
+    yield mock, url, client
+    client.close()
+    stop()
+
+
+def queue(client, number=None):
+    body = build_prompt_body(json.dumps(WORKFLOW), number)
+    _, _, data = client.request('POST', '/prompt', body=body, headers={'Content-Type': 'application/json'})
+    return json.loads(data)['prompt_id']
+
+
+def wait_idle(client, timeout=10):
+    for _ in range(int(timeout / 0.05)):
+        queue_info = client.get_json('/queue')
+        if not queue_info['queue_running'] and not queue_info['queue_pending']:
+            return
+        time.sleep(0.05)
+
+
+def test_runs_in_number_order_and_writes_outputs(mock):
+    server, _, client = mock
+    first = queue(client, 5)
+    later, sooner, dropped = queue(client, 3), queue(client, 1), queue(client, 9)
+    client.post_json('/queue', {"delete": [dropped]})
+    wait_idle(client)
+    assert list(server.history) == [first, sooner, later]
+
+    entry = client.get_json(f'/history/{sooner}')[sooner]
+    assert entry['status']['status_str'] == 'success'
+    image = entry['outputs']['11']['images'][0]
+    assert image['filename'].startswith('qwen_lightning_')
+    assert os.path.isfile(os.path.join(server.output_dir, image['filename']))
+    assert [m[0] for m in entry['status']['messages']] == ['execution_start', 'execution_cached', 'execution_success']
+
+
+def test_failure_injection(mock):
+    server, _, client = mock
+    server.fail_rate = 1.0
+    prompt_id = queue(client)
+    wait_idle(client)
+    entry = client.get_json(f'/history/{prompt_id}')[prompt_id]
+    assert entry['status']['status_str'] == 'error' and entry['outputs'] == {}
+    assert server.stats['failed'] == 1
+
+
+def test_events_drive_the_generator_listener(mock):
+    pytest.importorskip("websocket")
+    _, url, client = mock
+    from simple_generator import CLIENT_ID
+
+    tracker = ProgressTracker({})
+    previews = []
+    listener = ComfyEventListener(url, CLIENT_ID)
+    listener.add_handler(tracker.handle_event)
+    listener.add_preview_handler(lambda prompt_id, mime_type, image: previews.append(prompt_id))
+    listener.start()
+    try:
+        assert listener.connected.wait(5)
+        prompt_id = queue(client)
+        assert listener.wait(prompt_id, 10)
+        snapshot = tracker.snapshot(prompt_id)
+        assert snapshot['status'] == 'done' and snapshot['total_steps'] == 4
+        assert set(snapshot['node_timings']) == set(WORKFLOW)
+        assert previews == [prompt_id] * 4
+    finally:
+        listener.stop()
@@ -0,0 +1,78 @@
+import json
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from simple_generator import OllamaArbiter, PooledHTTPClient
+
+
+class FakeOllama(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    loaded = set()
+    requests = []
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, data):
+        body = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.requests.append(('GET', self.path, None))
+        self._reply({"models": [{"name": m, "model": m} for m in self.loaded]})
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.requests.append(('POST', self.path, payload))
+        if payload.get('keep_alive') == 0:
+            self.loaded.discard(payload['model'])
+        self._reply({"done": True})
+
+
+@pytest.fixture
+def ollama():
+    FakeOllama.loaded = set()
+    FakeOllama.requests = []
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), FakeOllama)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield OllamaArbiter(PooledHTTPClient(f"http://127.0.0.1:{httpd.server_address[1]}")), FakeOllama
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_unknown_state_checks_ps_once(ollama):
+    arbiter, server = ollama
+    arbiter.release('tiny').join()
+    assert server.requests == [('GET', '/api/ps', None)]
+    assert arbiter.resident is False
+    # Nothing resident: later jobs do no work at all
+    assert arbiter.release('tiny') is None
+    assert len(server.requests) == 1
+
+
+def test_unloads_after_refine(ollama):
+    arbiter, server = ollama
+    server.loaded.add('tiny')
+    arbiter.mark_used('tiny')
+    arbiter.release('other-default').join()
+    assert server.requests == [('POST', '/api/generate', {"model": "tiny", "keep_alive": 0})]
+    assert arbiter.stats() == {"resident": False, "model": None, "unloads": 1}
+    assert arbiter.release('tiny') is None
+
+
+def test_ollama_not_running():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    arbiter = OllamaArbiter(PooledHTTPClient(f"http://127.0.0.1:{port}"))
+    arbiter.mark_used('tiny')
+    arbiter.release('tiny').join()
+    assert arbiter.resident is False
@@ -0,0 +1,85 @@
+from simple_generator import ProgressTracker
+
+
+def make_tracker():
+    tracker = ProgressTracker({})
+    tracker.register("p1", mode="lightning", model="qwen", resolution=512, aspect="square")
+    return tracker
+
+
+def test_unknown_prompt():
+    tracker = ProgressTracker({})
+    assert tracker.snapshot("missing")["status"] == "unknown"
+
+
+def test_queued_until_execution_starts():
+    tracker = make_tracker()
+    assert tracker.snapshot("p1")["status"] == "queued"
+    tracker.handle_event("execution_start", {"prompt_id": "p1"})
+    assert tracker.snapshot("p1")["status"] == "loading"
+
+
+def test_real_steps_from_progress_state():
+    tracker = make_tracker()
+    tracker.handle_event("execution_start", {"prompt_id": "p1"})
+    tracker.handle_event("executing", {"prompt_id": "p1", "node": "8"})
+    tracker.handle_event("progress_state", {"prompt_id": "p1", "nodes": {
+        "3": {"value": 1, "max": 1, "state": "finished"},
+        "8": {"value": 2, "max": 4, "state": "running"},
+    }})
+    snapshot = tracker.snapshot("p1")
+    assert snapshot["status"] == "generating"
+    assert snapshot["current_step"] == 2
+    assert snapshot["total_steps"] == 4
+    assert snapshot["current_node"] == "8"
+
+
+def test_node_timings_and_done():
+    tracker = make_tracker()
+    tracker.handle_event("execution_start", {"prompt_id": "p1"})
+    tracker.handle_event("executing", {"prompt_id": "p1", "node": "3"})
+    tracker.handle_event("executing", {"prompt_id": "p1", "node": "8"})
+    tracker.handle_event("executing", {"prompt_id": "p1", "node": None})
+    snapshot = tracker.snapshot("p1")
+    assert snapshot["status"] == "done"
+    assert set(snapshot["node_timings"]) == {"3", "8"}
+
+
+def test_error_is_sticky():
+    tracker = make_tracker()
+    tracker.handle_event("execution_error", {"prompt_id": "p1", "exception_message": "OOM"})
+    tracker.handle_event("executing", {"prompt_id": "p1", "node": None})
+    snapshot = tracker.snapshot("p1")
+    assert snapshot["status"] == "error"
+    assert snapshot["message"] == "OOM"
+
+
+def test_eta_from_learned_step_time():
+    tracker = make_tracker()
+    key = ProgressTracker.profile_key(tracker.states["p1"])
+    tracker.step_times[key] = 2.0
+    tracker.handle_event("execution_start", {"prompt_id": "p1"})
+    tracker.handle_event("progress", {"prompt_id": "p1", "value": 1, "max": 4})
+    assert 0 < tracker.snapshot("p1")["eta_seconds"] <= 6.0
+
+
+def test_register_keeps_early_events():
+    tracker = ProgressTracker({})
+    # The websocket can report execution_start before /prompt returns
+    tracker.handle_event("execution_start", {"prompt_id": "p2"})
+    tracker.register("p2", mode="normal", model="qwen")
+    assert tracker.snapshot("p2")["status"] == "loading"
+
+
+def test_polled_status_keeps_real_steps():
+    tracker = make_tracker()
+    tracker.poll_status("p1", "loading")
+    assert tracker.snapshot("p1")["status"] == "loading"
+    tracker.handle_event("progress", {"prompt_id": "p1", "value": 3, "max": 8})
+    # ComfyUI still lists the prompt as running after the websocket dropped
+    tracker.poll_status("p1", "loading")
+    snapshot = tracker.snapshot("p1")
+    assert (snapshot["status"], snapshot["current_step"], snapshot["total_steps"]) == ("generating", 3, 8)
+    tracker.poll_status("p1", "done")
+    tracker.poll_status("p1", "loading")
+    assert tracker.snapshot("p1")["progress"] == 1.0
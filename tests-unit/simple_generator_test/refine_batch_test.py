@@ -0,0 +1,95 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import simple_generator
+from simple_generator import OllamaArbiter, PooledHTTPClient, RefineBatcher, RefineCache
+
+
+class SlowOllama(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    delay = 0.3
+    active = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        with self.lock:
+            SlowOllama.active += 1
+            SlowOllama.peak = max(SlowOllama.peak, SlowOllama.active)
+        time.sleep(self.delay)
+        with self.lock:
+            SlowOllama.active -= 1
+        text = f"{payload['messages'][0]['content'][:20]} @ {payload['options']['temperature']}"
+        body = json.dumps({"message": {"content": text}, "done": True}).encode()
+        try:
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except BrokenPipeError:
+            pass  # the client timed out
+
+
+@pytest.fixture
+def ollama(tmp_path, monkeypatch):
+    SlowOllama.delay = 0.3
+    SlowOllama.peak = 0
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), SlowOllama)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    client = PooledHTTPClient(f"http://127.0.0.1:{httpd.server_address[1]}")
+    monkeypatch.setattr(simple_generator, "ollama_client", client)
+    monkeypatch.setattr(simple_generator, "ollama_arbiter", OllamaArbiter(client))
+    monkeypatch.setattr(simple_generator, "refine_cache", RefineCache(str(tmp_path / "test.db")))
+    yield SlowOllama
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_modes_run_concurrently(ollama):
+    batcher = RefineBatcher(workers=3)
+    status, result = batcher.run({"prompt": "a cat", "modes": ["refine", "expand", "style"]})
+    assert status == 200 and result["success"]
+    assert [v["mode"] for v in result["variants"]] == ["refine", "expand", "style"]
+    assert ollama.peak == 3
+    # Three 0.3 s calls side by side, not one after another
+    assert result["elapsed_ms"] < 800
+    assert all(250 <= v["latency_ms"] < 800 for v in result["variants"])
+    assert batcher.stats()["in_flight"] == 0
+
+
+def test_temperature_variants_are_bounded_by_pool(ollama):
+    batcher = RefineBatcher(workers=2)
+    status, result = batcher.run({"prompt": "a cat", "mode": "style", "variants": 4})
+    assert status == 200
+    assert [v["temperature"] for v in result["variants"]] == [0.7, 0.9, 1.1, 0.5]
+    assert len({v["refined"] for v in result["variants"]}) == 4
+    assert ollama.peak == 2
+
+
+def test_backpressure_and_timeouts(ollama):
+    ollama.delay = 0.5
+    batcher = RefineBatcher(workers=1, backlog=2)
+    assert batcher.run({"prompt": "a cat", "modes": ["refine", "expand", "style"]})[0] == 503
+    status, result = batcher.run({"prompt": "a dog", "modes": ["refine", "expand"]}, timeout=0.3)
+    assert status == 200 and not result["success"]
+    assert all(v["error"] == "Timed out" for v in result["variants"])
+    assert batcher.stats()["rejected"] == 1
+
+
+def test_rejects_bad_requests():
+    batcher = RefineBatcher()
+    assert batcher.run({"modes": ["refine"]})[0] == 400
+    assert batcher.run({"prompt": "x", "modes": ["sing"]})[0] == 400
+    assert batcher.run({"prompt": "x", "variants": 20})[0] == 400
+    assert batcher.run({"prompt": "x", "modes": ["refine"], "variants": "3"})[0] == 400
+    assert batcher.run({"prompt": "x", "variants": True})[0] == 400
+    assert batcher.run({"prompt": "x"})[0] == 400
@@ -0,0 +1,98 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import simple_generator
+from simple_generator import OllamaArbiter, PooledHTTPClient, RefineCache
+
+
+class FakeOllamaChat(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    calls = []
+    words = ["A ", "misty ", "forest ", "at ", "dawn"]
+    delay = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.calls.append(payload)
+        if not payload['stream']:
+            body = json.dumps({"message": {"content": '"' + ''.join(self.words) + '"'}, "done": True}).encode()
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        lines = [{"message": {"content": word}, "done": False} for word in self.words] + [{"done": True}]
+        for line in lines:
+            data = json.dumps(line).encode() + b"\n"
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+            time.sleep(self.delay)
+        self.wfile.write(b"0\r\n\r\n")
+
+
+@pytest.fixture
+def ollama(tmp_path, monkeypatch):
+    FakeOllamaChat.calls = []
+    FakeOllamaChat.delay = 0.0
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), FakeOllamaChat)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    client = PooledHTTPClient(f"http://127.0.0.1:{httpd.server_address[1]}")
+    monkeypatch.setattr(simple_generator, "ollama_client", client)
+    monkeypatch.setattr(simple_generator, "ollama_arbiter", OllamaArbiter(client))
+    monkeypatch.setattr(simple_generator, "refine_cache", RefineCache(str(tmp_path / "test.db")))
+    yield FakeOllamaChat, client
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_repeat_refinement_is_cached(ollama):
+    server, _ = ollama
+    first = simple_generator.refine_prompt_ai("a forest", "refine")
+    assert first == {"success": True, "refined": "A misty forest at dawn", "provider": "ollama"}
+    # Same prompt up to case and whitespace: no second model call
+    again = simple_generator.refine_prompt_ai("  A   Forest ", "refine")
+    assert again["cached"] and again["refined"] == first["refined"]
+    assert len(server.calls) == 1
+    simple_generator.refine_prompt_ai("a forest", "expand")
+    simple_generator.refine_prompt_ai("a forest", "refine", fresh=True)
+    assert len(server.calls) == 3
+
+
+def test_stream_relays_deltas_before_completion(ollama):
+    server, client = ollama
+    server.delay = 0.1
+    started = time.perf_counter()
+    events = simple_generator.refine_prompt_stream("a forest", "refine")
+    event, data = next(events)
+    assert event == "delta" and data == {"text": "A "}
+    assert time.perf_counter() - started < 0.3
+    rest = list(events)
+    assert [e for e, _ in rest].count("delta") == 4
+    assert rest[-1] == ("done", {"success": True, "refined": "A misty forest at dawn", "provider": "ollama"})
+    # The stream was read to the end, so its connection is reused
+    assert client.stats()["idle_connections"] == 1
+    assert list(simple_generator.refine_prompt_stream("a forest", "refine"))[0][1]["cached"]
+
+
+def test_disk_cache_survives_restart(tmp_path):
+    cache = RefineCache(str(tmp_path / "test.db"), max_entries=2)
+    keys = [RefineCache.key(f"prompt {i}", "refine", "ollama", "m") for i in range(3)]
+    for i, key in enumerate(keys):
+        cache.put(key, f"refined {i}")
+    assert list(cache.entries) == keys[1:]
+    # Evicted from memory but still on disk
+    assert cache.get(keys[0]) == "refined 0"
+    assert RefineCache(str(tmp_path / "test.db")).get(keys[2]) == "refined 2"
+    assert RefineCache(str(tmp_path / "test.db")).get("missing") is None
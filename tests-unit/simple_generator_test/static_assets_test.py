@@ -0,0 +1,72 @@
+import gzip
+import http.client
+import threading
+
+import pytest
+
+import simple_generator
+from simple_generator import HTML_PAGE, StaticAsset, build_static_assets
+
+
+@pytest.fixture(scope="module")
+def port():
+    httpd = simple_generator.GeneratorHTTPServer(('127.0.0.1', 0), simple_generator.RequestHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield httpd.server_address[1]
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def fetch(port, path, headers=None, method='GET'):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    try:
+        conn.request(method, path, headers=headers or {})
+        response = conn.getresponse()
+        return response, response.read()
+    finally:
+        conn.close()
+
+
+def test_page_is_split_into_fingerprinted_assets():
+    index, assets = build_static_assets(HTML_PAGE)
+    shell = index.variants['identity'].decode()
+    assert '<style>' not in shell
+    assert sorted(path.rsplit('.', 1)[1] for path in assets) == ['css', 'js']
+    for path, asset in assets.items():
+        assert f'app.{asset.digest}.' in path
+        assert path in shell
+        assert asset.variants['identity'].decode() in HTML_PAGE
+
+
+def test_negotiation():
+    asset = StaticAsset(b'x' * 1000, 'text/plain')
+    assert asset.negotiate('gzip, deflate') == 'gzip'
+    assert asset.negotiate('gzip;q=0, deflate') == 'identity'
+    assert asset.negotiate(None) == 'identity'
+    assert asset.negotiate('*') in ('gzip', 'br')
+    assert asset.negotiate('*, gzip;q=0') != 'gzip'
+    assert asset.negotiate('br;q=0, *, gzip;q=0') == 'identity'
+    assert len(set(asset.etags.values())) == len(asset.variants)
+
+
+def test_index_gzip_and_revalidation(port):
+    response, body = fetch(port, '/', {'Accept-Encoding': 'gzip'})
+    assert response.status == 200
+    assert response.getheader('Content-Encoding') == 'gzip'
+    assert response.getheader('Cache-Control') == 'no-cache'
+    assert gzip.decompress(body) == simple_generator.INDEX_ASSET.variants['identity']
+
+    response, body = fetch(port, '/', {'Accept-Encoding': 'gzip', 'If-None-Match': response.getheader('ETag')})
+    assert response.status == 304 and body == b''
+
+    response, body = fetch(port, '/', method='HEAD')
+    assert response.status == 200 and body == b''
+    assert response.getheader('Content-Encoding') is None
+
+
+def test_static_assets_are_immutable(port):
+    for path, asset in simple_generator.STATIC_ASSETS.items():
+        response, body = fetch(port, path)
+        assert response.status == 200 and body == asset.variants['identity']
+        assert 'immutable' in response.getheader('Cache-Control')
+    assert fetch(port, '/static/app.missing.js')[0].status == 404
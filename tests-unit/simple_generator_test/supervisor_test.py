@@ -0,0 +1,71 @@
+import os
+import socket
+import sys
+
+import pytest
+
+from simple_generator import COMFYUI_READY_LINE, ComfySupervisor, PooledHTTPClient
+
+MOCK_COMFYUI = os.path.join(os.path.dirname(__file__), "..", "..", "mock_comfyui.py")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def test_stages_and_prewarm(tmp_path):
+    pytest.importorskip("aiohttp")
+    port = free_port()
+    client = PooledHTTPClient(f"http://127.0.0.1:{port}")
+
+    def probe():
+        try:
+            client.request('GET', '/system_stats', timeout=2)
+            return True
+        except Exception:
+            return False
+
+    warmed = []
+    supervisor = ComfySupervisor(
+        [sys.executable, MOCK_COMFYUI, "--port", str(port), "--output-dir", str(tmp_path)],
+        probe=probe, prewarm=lambda: warmed.append(supervisor.stage), startup_timeout=30, echo=False)
+    supervisor.start()
+    try:
+        assert supervisor.wait_server_up()
+        assert supervisor.ready.wait(10)
+        assert warmed == ['warming'] and supervisor.stage == 'ready'
+        status = supervisor.status()
+        assert status['restarts'] == 0 and status['startup_time'] is not None
+        assert any("Mock ComfyUI on" in line for line in status['log_tail'])
+    finally:
+        supervisor.stop()
+        client.close()
+    assert supervisor.process.poll() is not None
+
+
+def test_restarts_a_crashing_backend_then_gives_up():
+    supervisor = ComfySupervisor(
+        [sys.executable, "-c", "import sys; print('boom'); sys.exit(3)"],
+        probe=lambda: False, max_restarts=2, restart_delay=0.01, echo=False)
+    supervisor.start()
+    assert not supervisor.wait_server_up()
+    status = supervisor.status()
+    assert status['stage'] == 'failed' and status['restarts'] == 2
+    assert status['last_exit'] == 3 and status['last_error'] == 'exited during startup'
+    assert status['log_tail'].count('boom') == 3
+
+
+def test_ready_line_without_a_server_does_not_spin():
+    probes = []
+    supervisor = ComfySupervisor(
+        [sys.executable, "-c", f"import time; print({COMFYUI_READY_LINE!r}, flush=True); time.sleep(30)"],
+        probe=lambda: probes.append(1) and False, startup_timeout=2, max_restarts=0, echo=False)
+    supervisor.start()
+    try:
+        assert not supervisor.wait_server_up()
+    finally:
+        supervisor.stop()
+    assert supervisor.status()['last_error'] == 'not reachable after 2s'
+    assert len(probes) < 10
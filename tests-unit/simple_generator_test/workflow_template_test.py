@@ -0,0 +1,118 @@
+import json
+
+import pytest
+
+import simple_generator
+from simple_generator import (
+    WorkflowRegistry,
+    WorkflowTemplate,
+    build_prompt_body,
+    get_3d_workflow,
+    get_audio_workflow,
+    get_edit_workflow,
+    get_hunyuan_workflow,
+    get_ltx_workflow,
+    get_video_workflow,
+    get_workflow,
+    get_zimage_workflow,
+    validate_workflow,
+    workflow_templates,
+)
+
+
+def test_qwen_matches_builder():
+    for mode in ('lightning', 'normal'):
+        expected, _ = get_workflow(mode, 768, 'landscape', 42, 'ugly', 'heun', 'karras')
+        expected["4"]["inputs"]["text"] = 'a "quoted" cat\n'
+        rendered = workflow_templates.render(
+            'qwen', {'mode': mode, 'resolution': 768, 'aspect': 'landscape'},
+            prompt='a "quoted" cat\n', negative_prompt='ugly', seed=42, sampler='heun', scheduler='karras')
+        assert json.loads(rendered) == expected
+
+
+def test_zimage_matches_builder():
+    expected, _ = get_zimage_workflow(1024, 'portrait', 7)
+    expected["2"]["inputs"]["text"] = 'city'
+    assert workflow_templates.template('zimage', resolution=1024, aspect='portrait').build(prompt='city', seed=7) == expected
+
+
+@pytest.mark.parametrize("angles,upscale", [(False, False), (True, False), (False, True), (True, True)])
+def test_edit_matches_builder(angles, upscale):
+    expected, _ = get_edit_workflow('make it red', seed=3, use_angles_lora=angles, use_upscale_lora=upscale)
+    expected["1"]["inputs"]["image"] = 'edit_input_x.png'
+    rendered = workflow_templates.template('edit', use_angles_lora=angles, use_upscale_lora=upscale).build(
+        image='edit_input_x.png', prompt='make it red', seed=3)
+    assert rendered == expected
+
+
+@pytest.mark.parametrize("image", [None, 'video_input_x.png'])
+def test_video_matches_builders(image):
+    mode = 'i2v' if image else 't2v'
+    for name, builder in (('wan', get_video_workflow), ('hunyuan', get_hunyuan_workflow)):
+        expected, _ = builder('waves', mode=mode, resolution='720p', length=49, seed=5, start_image=image)
+        values = {'prompt': 'waves', 'seed': 5, 'length': 49, 'image': image}
+        if name == 'wan':
+            values['negative_prompt'] = None
+        assert workflow_templates.template(name, mode=mode, resolution='720p').build(**values) == expected
+    expected, _ = get_ltx_workflow('waves', resolution='576p', length=49, seed=5, negative_prompt='noisy')
+    rendered = workflow_templates.template('ltx', resolution='576p').build(
+        prompt='waves', seed=5, length=49, negative_prompt='noisy')
+    assert rendered == expected
+
+
+def test_audio_and_3d_match_builders():
+    expected, _ = get_audio_workflow('lofi', lyrics='la', duration=30, lyrics_strength=0.5, seed=9, format='mp3')
+    rendered = workflow_templates.template('audio', format='mp3').build(
+        tags='lofi', lyrics='la', lyrics_strength=0.5, seconds=30.0, seed=9)
+    assert rendered == expected
+    expected, _ = get_3d_workflow('3d_input_x.png', resolution=384, algorithm='basic', threshold=0.5, seed=1)
+    rendered = workflow_templates.template('3d', resolution=384).build(
+        image='3d_input_x.png', algorithm='basic', threshold=0.5, seed=1)
+    assert rendered == expected
+
+
+def test_unknown_slot_rejected():
+    template = WorkflowTemplate('t', {"1": {"class_type": "A", "inputs": {"x": 1}}}, {'x': [('1', 'x')]})
+    assert template.build() == {"1": {"class_type": "A", "inputs": {"x": 1}}}
+    with pytest.raises(KeyError):
+        template.render(y=2)
+
+
+def test_prompt_body():
+    body = json.loads(build_prompt_body('{"1": {"class_type": "A", "inputs": {}}}'))
+    assert body["prompt"] == {"1": {"class_type": "A", "inputs": {}}}
+    assert body["client_id"] == simple_generator.CLIENT_ID
+    assert "preview_method" in body["extra_data"]
+
+
+def test_validate_workflow():
+    object_info = {
+        "Loader": {"input": {"required": {"name": [["a.safetensors"]]}}},
+        "Encode": {"input": {"required": {"text": ["STRING", {}], "clip": ["CLIP"]},
+                             "optional": {"mode": ["COMBO", {"options": ["x", "y"]}]}}},
+    }
+    workflow = {
+        "1": {"class_type": "Loader", "inputs": {"name": "b.safetensors"}},
+        "2": {"class_type": "Encode", "inputs": {"text": "hi", "mode": "z", "extra": 1}},
+        "3": {"class_type": "Missing", "inputs": {}},
+    }
+    problems = validate_workflow(workflow, object_info)
+    assert any("'b.safetensors' is not available" in p for p in problems)
+    assert any("missing input clip" in p for p in problems)
+    assert any("mode 'z'" in p for p in problems)
+    assert any("unknown input extra" in p for p in problems)
+    assert any("unknown node type Missing" in p for p in problems)
+    # Slot values are filled per request and not checked against options
+    assert not validate_workflow({"1": workflow["1"]}, object_info, {("1", "name")})
+
+
+def test_api_format_file_overrides_builder(tmp_path):
+    override = {"1": {"class_type": "CLIPTextEncode", "inputs": {"text": "", "clip": ["2", 0]}}}
+    (tmp_path / "custom.json").write_text(json.dumps(override))
+    (tmp_path / "ui.json").write_text(json.dumps({"nodes": [], "links": []}))
+    registry = WorkflowRegistry(workflows_dir=str(tmp_path))
+    registry.register('custom', lambda: {"9": {"class_type": "X", "inputs": {}}}, {'prompt': [('1', 'text')]})
+    registry.register('ui', lambda: {"9": {"class_type": "X", "inputs": {"t": ""}}}, {'prompt': [('9', 't')]})
+    assert registry.template('custom').build(prompt='hello')["1"]["inputs"]["text"] == 'hello'
+    # UI-format exports are ignored in favour of the built-in graph
+    assert registry.template('ui').build(prompt='hi') == {"9": {"class_type": "X", "inputs": {"t": "hi"}}}
@@ -1,12 +1,14 @@
 """Unit tests for comfy_execution/jobs.py"""
 
 from comfy_execution.jobs import (
+    JobIndex,
     JobStatus,
     is_previewable,
     normalize_queue_item,
     normalize_history_item,
     get_outputs_summary,
     apply_sorting,
+    get_all_jobs,
 )
 
 
@@ -395,3 +397,82 @@ class TestNormalizeHistoryItem:
             'prompt': {'nodes': {'1': {}}},
             'extra_data': {'create_time': 1234567890, 'client_id': 'abc'},
         }
+
+
+def _history_item(prompt_id, create_time, workflow_id=None, status_str='success', duration=1000):
+    extra_data = {'create_time': create_time}
+    if workflow_id is not None:
+        extra_data['extra_pnginfo'] = {'workflow': {'id': workflow_id}}
+    return {
+        'prompt': (0, prompt_id, {}, extra_data, []),
+        'status': {
+            'status_str': status_str,
+            'completed': status_str == 'success',
+            'messages': [
+                ('execution_start', {'timestamp': create_time}),
+                ('execution_success' if status_str == 'success' else 'execution_error', {'timestamp': create_time + duration}),
+            ]
+        },
+        'outputs': {},
+    }
+
+
+class TestJobIndex:
+    """Unit tests for JobIndex"""
+
+    def _index(self):
+        history = {}
+        for i in range(20):
+            history['h{}'.format(i)] = _history_item(
+                'h{}'.format(i), 1000 + i * 10, workflow_id='wf-{}'.format(i % 2),
+                status_str='error' if i % 5 == 0 else 'success', duration=(i * 7) % 13 * 100)
+        queued = [(i, 'q{}'.format(i), {}, {'create_time': 1500 + i}, []) for i in range(3)]
+        running = [(99, 'r0', {}, {'create_time': 1005}, [])]
+        index = JobIndex()
+        for prompt_id, item in history.items():
+            index.set(normalize_history_item(prompt_id, item))
+        for item in queued:
+            index.set(normalize_queue_item(item, JobStatus.PENDING))
+        for item in running:
+            index.set(normalize_queue_item(item, JobStatus.IN_PROGRESS))
+        return index, (running, queued, history)
+
+    def test_matches_get_all_jobs(self):
+        """Queries should return what get_all_jobs computes from scratch."""
+        index, sources = self._index()
+        for kwargs in [
+            {},
+            {'sort_order': 'asc'},
+            {'status_filter': [JobStatus.FAILED, JobStatus.PENDING]},
+            {'workflow_id': 'wf-1', 'limit': 4, 'offset': 2},
+            {'sort_by': 'execution_duration', 'status_filter': [JobStatus.COMPLETED], 'sort_order': 'asc'},
+        ]:
+            jobs, total, _ = index.query(**kwargs)
+            expected, expected_total = get_all_jobs(*sources, **kwargs)
+            assert total == expected_total
+            assert [j['id'] for j in jobs] == [j['id'] for j in expected], kwargs
+
+    def test_cursor_pagination_visits_every_job_once(self):
+        """Following next_cursor should walk the whole ordering without gaps or repeats."""
+        index, sources = self._index()
+        for sort_order in ('asc', 'desc'):
+            seen, cursor = [], None
+            while True:
+                jobs, total, cursor = index.query(sort_by='execution_duration', sort_order=sort_order, limit=3, cursor=cursor)
+                seen += [j['id'] for j in jobs]
+                if cursor is None:
+                    break
+            ordered, _, _ = index.query(sort_by='execution_duration', sort_order=sort_order)
+            assert seen == [j['id'] for j in ordered] and len(seen) == total == 24
+
+    def test_status_change_and_removal(self):
+        """Re-adding a job moves it to its new status; removed jobs disappear from every index."""
+        index, _ = self._index()
+        index.set(normalize_history_item('r0', _history_item('r0', 1005, workflow_id='wf-0')))
+        jobs, total, _ = index.query(status_filter=[JobStatus.IN_PROGRESS])
+        assert total == 0 and index.get('r0')['status'] == JobStatus.COMPLETED
+        index.remove('h2')
+        index.clear({JobStatus.PENDING})
+        jobs, total, _ = index.query(workflow_id='wf-0')
+        assert 'h2' not in [j['id'] for j in jobs] and total == 10
+        assert len(index) == 20